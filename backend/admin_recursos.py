@@ -6,20 +6,17 @@ from fastapi import APIRouter, HTTPException, UploadFile, File, Form, status
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import os
-import requests
 import uuid
+import asyncio
+from bulkhead import storage_bulkhead
 from storage_client import storage_client
+from supabase_rest import supabase_request
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Configuración Supabase
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
-
 # ============================================
 # MODELOS
 # ============================================
@@ -58,40 +55,6 @@ class RecursoUpdate(BaseModel):
     publicado: Optional[bool] = None
     destacado: Optional[bool] = None
 
-# ============================================
-# UTILIDADES
-# ============================================
-
-def supabase_request(method: str, endpoint: str, data: dict = None, params: dict = None):
-    """Hace petición a Supabase REST API"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-        elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
-        elif method == 'DELETE':
-            response = requests.delete(url, headers=headers, params=params, timeout=10)
-        
-        response.raise_for_status()
-        
-        if method == 'DELETE':
-            return {"success": True}
-        
-        return response.json()
-    except Exception as e:
-        logger.error(f"Supabase request error: {e}")
-        return None
-
 # ============================================
 # ENDPOINTS - CRUD RECURSOS
 # ============================================
@@ -129,7 +92,7 @@ async def listar_recursos_admin(
             params['titulo'] = f'ilike.*{search}*'
         
         # Obtener recursos
-        recursos = supabase_request('GET', 'recursos', params=params)
+        recursos = await supabase_request('GET', 'recursos', params=params)
         
         if recursos is None:
             raise HTTPException(status_code=500, detail="Error al obtener recursos")
@@ -163,7 +126,7 @@ async def listar_recursos_admin(
 async def obtener_recurso_admin(recurso_id: str):
     """Obtiene un recurso específico con todos los detalles"""
     try:
-        recursos = supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
+        recursos = await supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
         
         if not recursos or len(recursos) == 0:
             raise HTTPException(status_code=404, detail="Recurso no encontrado")
@@ -185,7 +148,7 @@ async def crear_recurso_admin(recurso: RecursoCreate):
         recurso_data = recurso.dict()
         
         # Crear recurso
-        response = supabase_request('POST', 'recursos', data=recurso_data)
+        response = await supabase_request('POST', 'recursos', data=recurso_data)
         
         if not response:
             raise HTTPException(status_code=500, detail="Error al crear recurso")
@@ -205,7 +168,7 @@ async def actualizar_recurso_admin(recurso_id: str, recurso: RecursoUpdate):
     """Actualiza un recurso existente"""
     try:
         # Verificar que existe
-        existe = supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
+        existe = await supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
         if not existe or len(existe) == 0:
             raise HTTPException(status_code=404, detail="Recurso no encontrado")
         
@@ -216,7 +179,7 @@ async def actualizar_recurso_admin(recurso_id: str, recurso: RecursoUpdate):
             raise HTTPException(status_code=400, detail="No hay datos para actualizar")
         
         # Actualizar
-        response = supabase_request('PATCH', f'recursos?id=eq.{recurso_id}', data=update_data)
+        response = await supabase_request('PATCH', f'recursos?id=eq.{recurso_id}', data=update_data)
         
         if not response:
             raise HTTPException(status_code=500, detail="Error al actualizar recurso")
@@ -236,7 +199,7 @@ async def eliminar_recurso_admin(recurso_id: str):
     """Elimina un recurso y su archivo asociado si existe"""
     try:
         # Obtener recurso para ver si tiene archivo
-        recurso = supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
+        recurso = await supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
         
         if not recurso or len(recurso) == 0:
             raise HTTPException(status_code=404, detail="Recurso no encontrado")
@@ -249,13 +212,14 @@ async def eliminar_recurso_admin(recurso_id: str):
                 # Formato típico: https://xxx.supabase.co/storage/v1/object/public/bucket/path
                 if '/public/' in archivo_url:
                     file_path = archivo_url.split('/public/')[-1]
-                    storage_client.delete_file(file_path)
+                    async with storage_bulkhead.slot():
+                        await asyncio.to_thread(storage_client.delete_file, file_path)
                     logger.info(f"Archivo eliminado: {file_path}")
             except Exception as e:
                 logger.warning(f"Error eliminando archivo: {e}")
         
         # Eliminar recurso de la base de datos
-        response = supabase_request('DELETE', f'recursos?id=eq.{recurso_id}')
+        response = await supabase_request('DELETE', f'recursos?id=eq.{recurso_id}')
         
         logger.info(f"Recurso eliminado: {recurso_id}")
         return {"success": True, "message": "Recurso eliminado correctamente"}
@@ -305,12 +269,14 @@ async def subir_archivo_recurso(
         unique_filename = f"{uuid.uuid4()}_{file.filename}"
         file_path = f"{folder}/{unique_filename}"
         
-        # Subir a Supabase Storage
-        result = storage_client.upload_file(
-            file_path=file_path,
-            file_content=content,
-            content_type=file.content_type
-        )
+        # Subir a Supabase Storage (cliente síncrono: en un hilo, con cupo limitado)
+        async with storage_bulkhead.slot():
+            result = await asyncio.to_thread(
+                storage_client.upload_file,
+                file_path=file_path,
+                file_content=content,
+                content_type=file.content_type
+            )
         
         return {
             "success": True,
@@ -335,7 +301,8 @@ async def subir_archivo_recurso(
 async def eliminar_archivo_storage(file_path: str):
     """Elimina un archivo del storage"""
     try:
-        storage_client.delete_file(file_path)
+        async with storage_bulkhead.slot():
+            await asyncio.to_thread(storage_client.delete_file, file_path)
         return {"success": True, "message": "Archivo eliminado correctamente"}
     except Exception as e:
         logger.error(f"Error eliminando archivo: {e}")
@@ -351,27 +318,27 @@ async def obtener_estadisticas_recursos():
     """Obtiene estadísticas generales de recursos"""
     try:
         # Total de recursos
-        todos = supabase_request('GET', 'recursos', params={'select': 'id'})
+        todos = await supabase_request('GET', 'recursos', params={'select': 'id'})
         total_recursos = len(todos) if todos else 0
         
         # Por tipo
         stats_tipo = {}
         for tipo in ['guia', 'template', 'video', 'articulo', 'herramienta', 'caso_estudio']:
-            recursos_tipo = supabase_request('GET', 'recursos', params={'tipo': f'eq.{tipo}', 'select': 'id'})
+            recursos_tipo = await supabase_request('GET', 'recursos', params={'tipo': f'eq.{tipo}', 'select': 'id'})
             stats_tipo[tipo] = len(recursos_tipo) if recursos_tipo else 0
         
         # Por fase
         stats_fase = {}
         for fase in [1, 2, 3, 4, 5]:
-            recursos_fase = supabase_request('GET', 'recursos', params={'fase_relacionada': f'eq.{fase}', 'select': 'id'})
+            recursos_fase = await supabase_request('GET', 'recursos', params={'fase_relacionada': f'eq.{fase}', 'select': 'id'})
             stats_fase[f'fase_{fase}'] = len(recursos_fase) if recursos_fase else 0
         
         # Publicados vs borradores
-        publicados = supabase_request('GET', 'recursos', params={'publicado': 'eq.true', 'select': 'id'})
-        borradores = supabase_request('GET', 'recursos', params={'publicado': 'eq.false', 'select': 'id'})
+        publicados = await supabase_request('GET', 'recursos', params={'publicado': 'eq.true', 'select': 'id'})
+        borradores = await supabase_request('GET', 'recursos', params={'publicado': 'eq.false', 'select': 'id'})
         
         # Destacados
-        destacados = supabase_request('GET', 'recursos', params={'destacado': 'eq.true', 'select': 'id'})
+        destacados = await supabase_request('GET', 'recursos', params={'destacado': 'eq.true', 'select': 'id'})
         
         return {
             "total_recursos": total_recursos,
@@ -392,14 +359,14 @@ async def obtener_recursos_populares(limit: int = 10):
     """Obtiene los recursos más vistos/descargados"""
     try:
         # Recursos más vistos
-        mas_vistos = supabase_request(
+        mas_vistos = await supabase_request(
             'GET',
             'recursos',
             params={'order': 'vistas.desc', 'limit': limit, 'select': 'id,titulo,vistas,tipo'}
         )
         
         # Recursos más descargados
-        mas_descargados = supabase_request(
+        mas_descargados = await supabase_request(
             'GET',
             'recursos',
             params={'order': 'descargas.desc', 'limit': limit, 'select': 'id,titulo,descargas,tipo'}
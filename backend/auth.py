@@ -1,101 +1,215 @@
-import hashlib
-import secrets
-import requests
 import os
+import secrets
+import time
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional, Tuple
+
+import jwt
+from fastapi import Depends, Header, HTTPException
+
+from supabase_rest import supabase_rest
+from dataloader import load_one
+from user_cache import HIT, NEGATIVE, user_cache
+from passwords import password_hasher
+from last_access import last_access_buffer
+
+# Signed session tokens (HS256). Without SESSION_SECRET a random secret is used:
+# tokens stop being valid on restart and are not shared between workers
+SESSION_SECRET = os.environ.get('SESSION_SECRET') or secrets.token_urlsafe(32)
+SESSION_ALGORITHM = 'HS256'
+SESSION_TTL_SECONDS = int(float(os.environ.get('SESSION_TTL_HOURS', '24')) * 3600)
+
+async def hash_password(password: str) -> str:
+    """Hash password with bcrypt (process pool, off the event loop)"""
+    return await password_hasher.hash(password)
+
+async def verify_password(password: str, hashed: str) -> Tuple[bool, bool]:
+    """Verify password against hash; returns (valid, needs_rehash) for legacy SHA-256 or old cost"""
+    return await password_hasher.verify(password, hashed)
+
+class SessionDenylist:
+    """
+    Revoked sessions, kept in memory only until the tokens would expire anyway
+
+    - revoke(jti, exp): a single token (logout)
+    - revoke_user(user_id): every token issued to the user until now (role or
+      plan change, deactivation), so stale claims stop being accepted
+    """
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+    def __init__(self, ttl_seconds: int = SESSION_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._tokens: Dict[str, float] = {}   # jti -> exp
+        self._users: Dict[str, float] = {}    # user_id -> revoked_at
 
-def hash_password(password: str) -> str:
-    """Hash password using SHA-256"""
-    return hashlib.sha256(password.encode()).hexdigest()
+    def _prune(self):
+        now = time.time()
+        self._tokens = {jti: exp for jti, exp in self._tokens.items() if exp > now}
+        self._users = {uid: at for uid, at in self._users.items() if at + self.ttl_seconds > now}
 
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify password against hash"""
-    return hash_password(password) == hashed
+    def revoke(self, jti: str, exp: float):
+        self._prune()
+        self._tokens[jti] = exp
 
-def generate_session_token() -> str:
-    """Generate a random session token"""
-    return secrets.token_urlsafe(32)
+    def revoke_user(self, user_id: str):
+        self._prune()
+        self._users[str(user_id)] = time.time()
+
+    def is_revoked(self, claims: dict) -> bool:
+        if claims['jti'] in self._tokens:
+            return True
+        revoked_at = self._users.get(claims['sub'])
+        return revoked_at is not None and claims['iat'] <= revoked_at
+
+    def __len__(self) -> int:
+        return len(self._tokens) + len(self._users)
+
+
+session_denylist = SessionDenylist()
+
+
+def generate_session_token(user: dict) -> str:
+    """Signed session token carrying user id, email, name, role and plan"""
+    now = time.time()
+    claims = {
+        'sub': str(user['id']),
+        'email': user.get('email'),
+        'nombre': user.get('nombre_completo'),
+        'rol': user.get('rol'),
+        'plan': user.get('plan_actual'),
+        'iat': now,
+        'exp': int(now + SESSION_TTL_SECONDS),
+        'jti': secrets.token_hex(8),
+    }
+    return jwt.encode(claims, SESSION_SECRET, algorithm=SESSION_ALGORITHM)
+
+def decode_session_token(token: str) -> Optional[dict]:
+    """Verify a session token locally (no network); None if invalid, expired or revoked"""
+    try:
+        claims = jwt.decode(
+            token,
+            SESSION_SECRET,
+            algorithms=[SESSION_ALGORITHM],
+            options={'require': ['sub', 'iat', 'exp', 'jti']}
+        )
+    except jwt.InvalidTokenError:
+        return None
+    if session_denylist.is_revoked(claims):
+        return None
+    return claims
+
+async def get_session(authorization: Optional[str] = Header(None)) -> Optional[dict]:
+    """Dependency: claims of the Bearer session token, None when no token is sent"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(' ')
+    claims = decode_session_token(token.strip()) if scheme.lower() == 'bearer' else None
+    if claims is None:
+        raise HTTPException(
+            status_code=401,
+            detail="Invalid or expired session token",
+            headers={'WWW-Authenticate': 'Bearer'}
+        )
+    return claims
+
+async def require_session(session: Optional[dict] = Depends(get_session)) -> dict:
+    """Dependency: the request must carry a valid session token"""
+    if session is None:
+        raise HTTPException(status_code=401, detail="Not authenticated", headers={'WWW-Authenticate': 'Bearer'})
+    return session
+
+def require_role(*roles: str):
+    """Dependency factory: valid session whose role is one of `roles`"""
+    async def dependency(session: dict = Depends(require_session)) -> dict:
+        if session.get('rol') not in roles:
+            raise HTTPException(status_code=403, detail="Insufficient permissions")
+        return session
+    return dependency
+
+# Admin panel and sales module (sales_schema.sql RLS: admins only)
+require_admin = require_role('admin')
+
+EMAIL_ALREADY_REGISTERED = "Email already registered"
 
 async def create_user_in_supabase(user_data: dict) -> tuple:
-    """Create user in Supabase using REST API"""
+    """
+    Create user in Supabase using REST API (single INSERT)
+
+    The unique email constraint decides duplicates: a 23505 conflict returns
+    (None, EMAIL_ALREADY_REGISTERED). The progreso row is created by the
+    crear_progreso_al_registrar trigger in the same transaction.
+    """
     try:
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/users",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest.post(
+            'users',
             json=user_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 201:
-            return response.json()[0], None
+            created = response.json()[0]
+            user_cache.put(created)
+            return created, None
+        if response.status_code == 409 and '23505' in response.text:
+            # The email exists: drop any cached "unknown email"
+            user_cache.invalidate(email=user_data.get('email'))
+            return None, EMAIL_ALREADY_REGISTERED
         else:
             return None, response.text
     except Exception as e:
         return None, str(e)
 
 async def get_user_by_email(email: str) -> Optional[dict]:
-    """Get user from Supabase by email"""
+    """Get user by email (cached, including unknown emails for a short time)"""
+    result, user = user_cache.get_by_email(email)
+    if result in (HIT, NEGATIVE):
+        return user
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?email=eq.{email}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
-        )
+        response = await supabase_rest.get('users', params={'email': f'eq.{email}'})
         
         if response.status_code == 200:
             users = response.json()
-            return users[0] if users else None
+            if users:
+                user_cache.put(users[0])
+                return users[0]
+            user_cache.put_missing(email)
+            return None
         return None
     except Exception as e:
         print(f"Error getting user: {e}")
         return None
 
 async def get_user_by_id(user_id: str) -> Optional[dict]:
-    """Get user from Supabase by ID"""
+    """Get user by ID (cached)"""
+    result, user = user_cache.get_by_id(user_id)
+    if result == HIT:
+        return user
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            users = response.json()
-            return users[0] if users else None
-        return None
+        user = await load_one('users', user_id)
+        if user:
+            user_cache.put(user)
+        return user
     except Exception as e:
         print(f"Error getting user: {e}")
         return None
 
 async def update_user_last_access(user_id: str):
-    """Update user's last access time"""
+    """Record user's last access time (written to Supabase in batches, see last_access.py)"""
+    ultimo_acceso = datetime.utcnow().isoformat()
+    last_access_buffer.record(user_id, ultimo_acceso)
+    user_cache.update(user_id, {'ultimo_acceso': ultimo_acceso})
+    return True
+
+async def update_user_password_hash(user_id: str, password_hash: str):
+    """Replace the stored password hash (rehash on login)"""
     try:
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            json={'ultimo_acceso': datetime.utcnow().isoformat()},
-            timeout=10
+        response = await supabase_rest.patch(
+            'users',
+            params={'id': f'eq.{user_id}'},
+            json={'password_hash': password_hash}
         )
+        if response.status_code == 204:
+            user_cache.update(user_id, {'password_hash': password_hash})
         return response.status_code == 204
     except Exception as e:
-        print(f"Error updating last access: {e}")
+        print(f"Error updating password hash: {e}")
         return False
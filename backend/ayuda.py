@@ -6,14 +6,11 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import os
-import requests
+from supabase_rest import supabase_request
+from dataloader import clear_loader, load_one
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
-
 # ============================================
 # MODELOS
 # ============================================
@@ -45,34 +42,6 @@ class TicketCreate(BaseModel):
 class TicketMensajeCreate(BaseModel):
     mensaje: str
 
-# ============================================
-# UTILIDADES
-# ============================================
-
-def supabase_request(method: str, endpoint: str, data: dict = None, params: dict = None):
-    """Hace petición a Supabase REST API"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-        elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
-        
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error en petición Supabase: {e}")
-        return None
-
 # ============================================
 # ENDPOINTS - FAQs
 # ============================================
@@ -81,7 +50,7 @@ def supabase_request(method: str, endpoint: str, data: dict = None, params: dict
 async def obtener_categorias_faq():
     """Obtiene todas las categorías de FAQs activas"""
     try:
-        categorias = supabase_request(
+        categorias = await supabase_request(
             'GET',
             'faq_categorias',
             params={'activa': 'eq.true', 'order': 'orden.asc'}
@@ -90,14 +59,20 @@ async def obtener_categorias_faq():
         if categorias is None:
             raise HTTPException(status_code=500, detail="Error al obtener categorías")
         
-        # Contar FAQs por categoría
-        for cat in categorias:
-            faqs = supabase_request(
+        # Contar FAQs por categoría (una sola consulta para todas)
+        conteo = {}
+        if categorias:
+            ids = ','.join(cat['id'] for cat in categorias)
+            faqs = await supabase_request(
                 'GET',
                 'faqs',
-                params={'categoria_id': f"eq.{cat['id']}", 'visible': 'eq.true', 'select': 'id'}
+                params={'categoria_id': f'in.({ids})', 'visible': 'eq.true', 'select': 'categoria_id'}
             )
-            cat['faqs_count'] = len(faqs) if faqs else 0
+            for faq in faqs or []:
+                conteo[faq['categoria_id']] = conteo.get(faq['categoria_id'], 0) + 1
+        
+        for cat in categorias:
+            cat['faqs_count'] = conteo.get(cat['id'], 0)
         
         return categorias
     
@@ -120,7 +95,7 @@ async def obtener_faqs(categoria_id: Optional[str] = None, search: Optional[str]
         if search:
             params['or'] = f'(pregunta.ilike.*{search}*,respuesta.ilike.*{search}*)'
         
-        faqs = supabase_request('GET', 'faqs', params=params)
+        faqs = await supabase_request('GET', 'faqs', params=params)
         
         if faqs is None:
             raise HTTPException(status_code=500, detail="Error al obtener FAQs")
@@ -139,14 +114,14 @@ async def registrar_vista_faq(faq_id: str):
     """Incrementa el contador de vistas de un FAQ"""
     try:
         # Obtener FAQ actual
-        faq = supabase_request('GET', 'faqs', params={'id': f'eq.{faq_id}'})
+        faq = await supabase_request('GET', 'faqs', params={'id': f'eq.{faq_id}'})
         
         if not faq or len(faq) == 0:
             raise HTTPException(status_code=404, detail="FAQ no encontrado")
         
         # Incrementar vistas
         vistas_actuales = faq[0].get('vistas', 0)
-        supabase_request(
+        await supabase_request(
             'PATCH',
             f'faqs?id=eq.{faq_id}',
             data={'vistas': vistas_actuales + 1}
@@ -166,7 +141,7 @@ async def valorar_faq(faq_id: str, util: bool):
     """Registra si un FAQ fue útil o no"""
     try:
         # Obtener FAQ actual
-        faq = supabase_request('GET', 'faqs', params={'id': f'eq.{faq_id}'})
+        faq = await supabase_request('GET', 'faqs', params={'id': f'eq.{faq_id}'})
         
         if not faq or len(faq) == 0:
             raise HTTPException(status_code=404, detail="FAQ no encontrado")
@@ -175,7 +150,7 @@ async def valorar_faq(faq_id: str, util: bool):
         campo = 'util_si' if util else 'util_no'
         valor_actual = faq[0].get(campo, 0)
         
-        supabase_request(
+        await supabase_request(
             'PATCH',
             f'faqs?id=eq.{faq_id}',
             data={campo: valor_actual + 1}
@@ -207,13 +182,13 @@ async def crear_ticket(user_id: str, ticket: TicketCreate):
             'estado': 'abierto'
         }
         
-        response = supabase_request('POST', 'tickets_soporte', data=ticket_data)
+        response = await supabase_request('POST', 'tickets_soporte', data=ticket_data)
         
         if not response:
             raise HTTPException(status_code=500, detail="Error al crear ticket")
         
         # Crear notificación para el usuario
-        supabase_request('POST', 'notificaciones', data={
+        await supabase_request('POST', 'notificaciones', data={
             'user_id': user_id,
             'tipo': 'ticket_creado',
             'titulo': 'Ticket de soporte creado',
@@ -239,19 +214,25 @@ async def obtener_tickets(user_id: str, estado: Optional[str] = None):
         if estado:
             params['estado'] = f'eq.{estado}'
         
-        tickets = supabase_request('GET', 'tickets_soporte', params=params)
+        tickets = await supabase_request('GET', 'tickets_soporte', params=params)
         
         if tickets is None:
             raise HTTPException(status_code=500, detail="Error al obtener tickets")
         
-        # Contar mensajes por ticket
-        for ticket in tickets:
-            mensajes = supabase_request(
+        # Contar mensajes por ticket (una sola consulta para todos)
+        conteo = {}
+        if tickets:
+            ids = ','.join(ticket['id'] for ticket in tickets)
+            mensajes = await supabase_request(
                 'GET',
                 'tickets_mensajes',
-                params={'ticket_id': f"eq.{ticket['id']}", 'select': 'id'}
+                params={'ticket_id': f'in.({ids})', 'select': 'ticket_id'}
             )
-            ticket['mensajes_count'] = len(mensajes) if mensajes else 0
+            for mensaje in mensajes or []:
+                conteo[mensaje['ticket_id']] = conteo.get(mensaje['ticket_id'], 0) + 1
+        
+        for ticket in tickets:
+            ticket['mensajes_count'] = conteo.get(ticket['id'], 0)
         
         return tickets
     
@@ -267,25 +248,25 @@ async def obtener_ticket_detalle(ticket_id: str, user_id: str):
     """Obtiene el detalle de un ticket con sus mensajes"""
     try:
         # Obtener ticket
-        ticket = supabase_request('GET', 'tickets_soporte', params={'id': f'eq.{ticket_id}'})
+        ticket = await load_one('tickets_soporte', ticket_id)
         
-        if not ticket or len(ticket) == 0:
+        if not ticket:
             raise HTTPException(status_code=404, detail="Ticket no encontrado")
         
         # Verificar que el ticket pertenece al usuario
-        if ticket[0]['user_id'] != user_id:
+        if ticket['user_id'] != user_id:
             raise HTTPException(status_code=403, detail="No tienes acceso a este ticket")
         
         # Obtener mensajes
-        mensajes = supabase_request(
+        mensajes = await supabase_request(
             'GET',
             'tickets_mensajes',
             params={'ticket_id': f'eq.{ticket_id}', 'order': 'created_at.asc'}
         )
         
-        ticket[0]['mensajes'] = mensajes if mensajes else []
+        ticket['mensajes'] = mensajes if mensajes else []
         
-        return ticket[0]
+        return ticket
     
     except HTTPException:
         raise
@@ -299,12 +280,12 @@ async def crear_mensaje_ticket(ticket_id: str, user_id: str, mensaje: TicketMens
     """Crea un nuevo mensaje en un ticket"""
     try:
         # Verificar que el ticket existe y pertenece al usuario
-        ticket = supabase_request('GET', 'tickets_soporte', params={'id': f'eq.{ticket_id}'})
+        ticket = await load_one('tickets_soporte', ticket_id)
         
-        if not ticket or len(ticket) == 0:
+        if not ticket:
             raise HTTPException(status_code=404, detail="Ticket no encontrado")
         
-        if ticket[0]['user_id'] != user_id:
+        if ticket['user_id'] != user_id:
             raise HTTPException(status_code=403, detail="No tienes acceso a este ticket")
         
         # Crear mensaje
@@ -315,17 +296,18 @@ async def crear_mensaje_ticket(ticket_id: str, user_id: str, mensaje: TicketMens
             'es_staff': False
         }
         
-        response = supabase_request('POST', 'tickets_mensajes', data=mensaje_data)
+        response = await supabase_request('POST', 'tickets_mensajes', data=mensaje_data)
         
         if not response:
             raise HTTPException(status_code=500, detail="Error al crear mensaje")
         
         # Actualizar timestamp del ticket
-        supabase_request(
+        await supabase_request(
             'PATCH',
             f'tickets_soporte?id=eq.{ticket_id}',
             data={'updated_at': datetime.utcnow().isoformat()}
         )
+        clear_loader('tickets_soporte', ticket_id)
         
         return response[0]
     
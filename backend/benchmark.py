@@ -0,0 +1,560 @@
+"""
+Benchmark de carga end-to-end para /api
+Genera tráfico mixto (login, diagnóstico, recursos, notificaciones, dashboards
+admin y exportaciones CSV) y registra por ruta p50/p95/p99, throughput, tasa de
+error y llamadas a Supabase en un archivo JSON.
+
+En proceso (por defecto) la app corre con httpx.ASGITransport contra
+fake_postgrest con latencia inyectada, así que no necesita red ni Supabase:
+    python benchmark.py run --concurrency 20 --duration 30 --latency 0.02 -o base.json
+
+Contra una app ya levantada:
+    python benchmark.py run --base-url http://localhost:8001 --email x@y.com --password ...
+(los escenarios admin y sales necesitan que ese usuario sea admin; si no, registran 403)
+
+Comparar dos corridas (exit code 1 si hay regresiones):
+    python benchmark.py compare base.json nuevo.json --threshold 0.10
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+# Llamadas upstream hechas durante la petición en curso (solo modo en proceso)
+_upstream_calls: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    'benchmark_upstream_calls', default=None
+)
+
+
+# ============================================
+# ESCENARIOS
+# ============================================
+
+@dataclass
+class Scenario:
+    name: str
+    weight: int
+    run: Callable[[httpx.AsyncClient, dict, random.Random], Awaitable[httpx.Response]]
+
+
+def _diagnostico_payload(rng: random.Random, email: str) -> dict:
+    """Respuesta de diagnóstico completa con un scoring plausible"""
+    def dimension(puntos):
+        nivel = 'ALTO' if puntos >= 80 else 'MEDIO' if puntos >= 50 else 'BAJO'
+        return {'puntos': puntos, 'nivel': nivel, 'categoria': nivel.capitalize()}
+
+    urgencia, madurez, capacidad = (rng.randint(0, 100) for _ in range(3))
+    return {
+        'nombre_completo': 'Benchmark Usuario', 'email': email, 'telefono': '+505 8888 0000',
+        'organizacion': f'Empresa {rng.randint(1, 9999)}', 'puesto': 'Gerente',
+        'pais': 'Nicaragua', 'departamento': 'Managua', 'anios_experiencia': '5-10',
+        'p1_sector': 'financiero', 'p2_tamano': 'grande', 'p3_motivacion': 'regulacion',
+        'p4_plazo': '6_meses', 'p5_publica_info': 'no', 'p6_materialidad': 'parcial',
+        'p7_familiaridad': 'basica', 'p8_riesgos_clima': 'no', 'p9_huella_carbono': 'no',
+        'p10_liderazgo': 'parcial', 'p11_junta': 'no', 'p12_personas_dedicadas': '1',
+        'p13_presupuesto': 'bajo', 'p14_recopilacion': 'manual', 'p15_control_interno': 'no',
+        'p16_datos_auditables': 'no', 'p17_rastreo_impacto': 'no',
+        'p18_obstaculo': 'conocimiento', 'p19_apoyo_valioso': ['capacitacion', 'consultoria'],
+        'p20_inversion': '10k_25k',
+        'scoring': {
+            'urgencia': dimension(urgencia),
+            'madurez': dimension(madurez),
+            'capacidad': dimension(capacidad),
+            'arquetipo': {
+                'codigo': f"{rng.choice('ABC')}{rng.randint(1, 3)}", 'nombre': 'Benchmark',
+                'descripcion': 'Arquetipo generado por el benchmark',
+                'recomendacion': 'N/A'
+            }
+        }
+    }
+
+
+def _user(ctx: dict, rng: random.Random) -> dict:
+    return rng.choice(ctx['users'])
+
+
+def _admin_recurso(ctx: dict, rng: random.Random) -> str:
+    return rng.choice(ctx['recursos'])['id']
+
+
+async def _login(c, ctx, rng):
+    user = _user(ctx, rng)
+    return await c.post('/api/auth/login', json={'email': user['email'], 'password': ctx['password']})
+
+
+async def _diagnostico(c, ctx, rng):
+    user = _user(ctx, rng)
+    return await c.post('/api/diagnostico', params={'user_id': user['id']},
+                        json=_diagnostico_payload(rng, user['email']))
+
+
+async def _recursos(c, ctx, rng):
+    return await c.get('/api/recursos', params={'user_id': _user(ctx, rng)['id']})
+
+
+async def _recurso_detalle(c, ctx, rng):
+    return await c.get(f'/api/recursos/{_admin_recurso(ctx, rng)}',
+                       params={'user_id': _user(ctx, rng)['id']})
+
+
+async def _favoritos(c, ctx, rng):
+    return await c.get(f"/api/favoritos/{_user(ctx, rng)['id']}")
+
+
+async def _progreso(c, ctx, rng):
+    return await c.get(f"/api/progreso/{_user(ctx, rng)['id']}")
+
+
+async def _notificaciones(c, ctx, rng):
+    return await c.get('/api/notificaciones', params={'user_id': _user(ctx, rng)['id']})
+
+
+async def _notificaciones_stats(c, ctx, rng):
+    return await c.get('/api/notificaciones/stats', params={'user_id': _user(ctx, rng)['id']})
+
+
+async def _ayuda_categorias(c, ctx, rng):
+    return await c.get('/api/ayuda/categorias')
+
+
+async def _soporte_tickets(c, ctx, rng):
+    return await c.get('/api/soporte/tickets', params={'user_id': _user(ctx, rng)['id']})
+
+
+async def _admin_estadisticas(c, ctx, rng):
+    return await c.get('/api/admin/estadisticas/general')
+
+
+async def _admin_recursos_stats(c, ctx, rng):
+    return await c.get('/api/admin/recursos/stats/resumen')
+
+
+async def _admin_usuarios(c, ctx, rng):
+    return await c.get('/api/admin/usuarios', params={'limit': 50})
+
+
+async def _sales_stats(c, ctx, rng):
+    return await c.get('/api/sales/stats')
+
+
+async def _sales_oportunidades(c, ctx, rng):
+    return await c.get('/api/sales/oportunidades')
+
+
+async def _export_usuarios(c, ctx, rng):
+    return await c.get('/api/admin/reportes/usuarios/export')
+
+
+async def _export_recursos(c, ctx, rng):
+    return await c.get('/api/admin/reportes/recursos/export')
+
+
+# Pesos aproximados al tráfico real: el cliente sondea notificaciones y
+# navega recursos; los dashboards admin y exportaciones son poco frecuentes
+SCENARIOS: List[Scenario] = [
+    Scenario('POST /api/auth/login', 8, _login),
+    Scenario('POST /api/diagnostico', 3, _diagnostico),
+    Scenario('GET /api/recursos', 15, _recursos),
+    Scenario('GET /api/recursos/{id}', 10, _recurso_detalle),
+    Scenario('GET /api/favoritos/{user_id}', 5, _favoritos),
+    Scenario('GET /api/progreso/{user_id}', 6, _progreso),
+    Scenario('GET /api/notificaciones', 10, _notificaciones),
+    Scenario('GET /api/notificaciones/stats', 15, _notificaciones_stats),
+    Scenario('GET /api/ayuda/categorias', 4, _ayuda_categorias),
+    Scenario('GET /api/soporte/tickets', 4, _soporte_tickets),
+    Scenario('GET /api/admin/estadisticas/general', 3, _admin_estadisticas),
+    Scenario('GET /api/admin/recursos/stats/resumen', 3, _admin_recursos_stats),
+    Scenario('GET /api/admin/usuarios', 3, _admin_usuarios),
+    Scenario('GET /api/sales/stats', 3, _sales_stats),
+    Scenario('GET /api/sales/oportunidades', 3, _sales_oportunidades),
+    Scenario('GET /api/admin/reportes/usuarios/export', 1, _export_usuarios),
+    Scenario('GET /api/admin/reportes/recursos/export', 1, _export_recursos),
+]
+
+
+# ============================================
+# MÉTRICAS
+# ============================================
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil con interpolación lineal (mismo criterio que numpy por defecto)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.status: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.upstream: Dict[str, List[int]] = defaultdict(list)
+
+    def record(self, route: str, elapsed: float, status: str, upstream: Optional[int]):
+        self.latencies[route].append(elapsed * 1000)
+        self.status[route][status] += 1
+        if not status.isdigit() or int(status) >= 400:
+            self.errors[route] += 1
+        if upstream is not None:
+            self.upstream[route].append(upstream)
+
+    def summary(self, wall_time: float) -> dict:
+        routes = {}
+        for route, lat in sorted(self.latencies.items()):
+            upstream = self.upstream.get(route) or []
+            routes[route] = {
+                'requests': len(lat),
+                'errors': self.errors[route],
+                'error_rate': round(self.errors[route] / len(lat), 4),
+                'status': dict(self.status[route]),
+                'rps': round(len(lat) / wall_time, 2) if wall_time else 0.0,
+                'mean_ms': round(sum(lat) / len(lat), 2),
+                'p50_ms': round(percentile(lat, 50), 2),
+                'p95_ms': round(percentile(lat, 95), 2),
+                'p99_ms': round(percentile(lat, 99), 2),
+                'max_ms': round(max(lat), 2),
+                'upstream_calls_mean': round(sum(upstream) / len(upstream), 2) if upstream else None,
+                'upstream_calls_max': max(upstream) if upstream else None,
+            }
+
+        all_lat = [v for lat in self.latencies.values() for v in lat]
+        total = len(all_lat)
+        errors = sum(self.errors.values())
+        upstream_all = [v for up in self.upstream.values() for v in up]
+        return {
+            'totals': {
+                'requests': total,
+                'errors': errors,
+                'error_rate': round(errors / total, 4) if total else 0.0,
+                'rps': round(total / wall_time, 2) if wall_time else 0.0,
+                'p50_ms': round(percentile(all_lat, 50), 2),
+                'p95_ms': round(percentile(all_lat, 95), 2),
+                'p99_ms': round(percentile(all_lat, 99), 2),
+                'upstream_calls': sum(upstream_all) if upstream_all else None,
+                'wall_time_s': round(wall_time, 2),
+            },
+            'routes': routes,
+        }
+
+
+# ============================================
+# ENTORNO EN PROCESO
+# ============================================
+
+class _CountingApp:
+    """Envuelve el servidor falso y cuenta las llamadas de la petición actual"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        calls = _upstream_calls.get()
+        if calls is not None and scope['type'] == 'http':
+            calls.append(scope['path'])
+        await self.app(scope, receive, send)
+
+
+async def _setup_in_process(args):
+    """Levanta server.app en memoria con fake_postgrest y datos de demo"""
+    os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    os.environ.setdefault('DB_NAME', 'clarisa_benchmark')
+    os.environ.setdefault('SUPABASE_URL', 'http://fake-supabase')
+    os.environ.setdefault('SUPABASE_KEY', 'benchmark')
+    os.environ.setdefault('SUPABASE_SERVICE_KEY', 'benchmark')
+    # Todo el tráfico sale de una sola IP: sin esto el benchmark mediría 429s
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'false')
+
+    import server
+    from auth import generate_session_token
+    # El log INFO de httpx por petición distorsiona las mediciones
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    from fake_postgrest import FAKE_BASE_URL, FakePostgrest, seed_demo_data
+    from supabase_rest import supabase_rest, supabase_rest_admin
+
+    if args.mongomock:
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--mongomock requiere 'pip install mongomock-motor'")
+        server.db = AsyncMongoMockClient()[os.environ['DB_NAME']]
+
+    fake = FakePostgrest(latency=args.latency, jitter=args.jitter, seed=args.seed)
+    data = seed_demo_data(
+        fake.store, usuarios=args.usuarios, oportunidades=args.oportunidades, seed=args.seed
+    )
+    counting = _CountingApp(fake)
+    for rest in (supabase_rest, supabase_rest_admin):
+        await rest.configure(base_url=FAKE_BASE_URL, transport=httpx.ASGITransport(app=counting))
+
+    ctx = {
+        'users': [{'id': u['id'], 'email': u['email']} for u in data['users']],
+        # Solo recursos visibles para un cliente gratuito, como los que lista /api/recursos
+        'recursos': [
+            {'id': r['id']} for r in data['recursos']
+            if r['publicado'] and r['acceso_requerido'] in ('gratuito', 'todos')
+        ],
+        'password': 'password123',
+        # El usuario 0 del seed es admin: las rutas admin y sales exigen su sesión
+        'session_token': generate_session_token(data['users'][0]),
+    }
+    transport = httpx.ASGITransport(app=server.app)
+    return transport, 'http://benchmark', ctx
+
+
+async def _setup_remote(args, client: httpx.AsyncClient) -> dict:
+    """Obtiene user_id y recursos reales haciendo login contra la app remota"""
+    if not args.email or not args.password:
+        sys.exit('--base-url requiere --email y --password de un usuario existente')
+    response = await client.post('/api/auth/login', json={'email': args.email, 'password': args.password})
+    if response.status_code != 200:
+        sys.exit(f'Login falló ({response.status_code}): {response.text}')
+    user = response.json()['user']
+    recursos = await client.get('/api/recursos', params={'user_id': user['id']})
+    return {
+        'users': [{'id': user['id'], 'email': args.email}],
+        'recursos': [{'id': r['id']} for r in recursos.json()] if recursos.status_code == 200 else [],
+        'password': args.password,
+        'session_token': response.json().get('session_token'),
+    }
+
+
+# ============================================
+# EJECUCIÓN
+# ============================================
+
+async def _execute(client, scenario: Scenario, ctx: dict, rng: random.Random, recorder: Optional[Recorder]):
+    calls: list = []
+    token = _upstream_calls.set(calls)
+    start = time.perf_counter()
+    try:
+        response = await scenario.run(client, ctx, rng)
+        await response.aread()
+        status = str(response.status_code)
+    except Exception as e:
+        response = None
+        status = type(e).__name__
+    finally:
+        elapsed = time.perf_counter() - start
+        _upstream_calls.reset(token)
+
+    if recorder is None:
+        return
+    upstream = len(calls) if calls else None
+    if response is not None and 'X-Upstream-Calls' in response.headers:
+        upstream = int(response.headers['X-Upstream-Calls'])
+    recorder.record(scenario.name, elapsed, status, upstream)
+
+
+async def run_benchmark(args) -> dict:
+    scenarios = SCENARIOS
+    if args.scenarios:
+        wanted = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+        scenarios = [s for s in SCENARIOS if any(w in s.name for w in wanted)]
+        if not scenarios:
+            sys.exit(f'Ningún escenario coincide con: {args.scenarios}')
+
+    if args.base_url:
+        transport, base_url = None, args.base_url.rstrip('/')
+    else:
+        transport, base_url, ctx = await _setup_in_process(args)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(
+        transport=transport, base_url=base_url, timeout=args.timeout, limits=limits
+    ) as client:
+        if args.base_url:
+            ctx = await _setup_remote(args, client)
+        if ctx.get('session_token'):
+            client.headers['Authorization'] = f"Bearer {ctx['session_token']}"
+        if not ctx['recursos']:
+            scenarios = [s for s in scenarios if '{id}' not in s.name]
+
+        weights = [s.weight for s in scenarios]
+        recorder = Recorder()
+        remaining = {'warmup': args.warmup, 'requests': args.requests}
+
+        async def warmup(n: int):
+            rng = random.Random(-args.seed * 1000 - n - 1)
+            while remaining['warmup'] > 0:
+                remaining['warmup'] -= 1
+                await _execute(client, rng.choices(scenarios, weights=weights)[0], ctx, rng, None)
+
+        async def worker(n: int):
+            rng = random.Random(args.seed * 1000 + n)
+            while True:
+                if args.requests:
+                    if remaining['requests'] <= 0:
+                        return
+                    remaining['requests'] -= 1
+                elif time.perf_counter() >= deadline:
+                    return
+                scenario = rng.choices(scenarios, weights=weights)[0]
+                await _execute(client, scenario, ctx, rng, recorder)
+
+        # El warmup se ejecuta antes de medir para no contar conexiones en frío
+        await asyncio.gather(*(warmup(n) for n in range(args.concurrency)))
+
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(*(worker(n) for n in range(args.concurrency)))
+        wall_time = time.perf_counter() - start
+
+    result = recorder.summary(wall_time)
+    result['config'] = {
+        'mode': 'remote' if args.base_url else 'in-process',
+        'base_url': args.base_url,
+        'concurrency': args.concurrency,
+        'duration_s': None if args.requests else args.duration,
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'latency_s': None if args.base_url else args.latency,
+        'jitter_s': None if args.base_url else args.jitter,
+        'seed': args.seed,
+        'scenarios': [s.name for s in scenarios],
+    }
+    result['meta'] = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    return result
+
+
+def print_summary(result: dict):
+    header = f"{'ruta':<44} {'n':>6} {'err%':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'upstream':>9}"
+    print(header)
+    print('-' * len(header))
+    for route, r in result['routes'].items():
+        upstream = '-' if r['upstream_calls_mean'] is None else f"{r['upstream_calls_mean']:.1f}"
+        print(f"{route:<44} {r['requests']:>6} {r['error_rate'] * 100:>5.1f}% "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {upstream:>9}")
+    t = result['totals']
+    print('-' * len(header))
+    print(f"total: {t['requests']} peticiones en {t['wall_time_s']}s ({t['rps']} rps), "
+          f"errores {t['error_rate'] * 100:.1f}%, p50 {t['p50_ms']}ms, p95 {t['p95_ms']}ms, p99 {t['p99_ms']}ms")
+
+
+# ============================================
+# COMPARACIÓN
+# ============================================
+
+def compare_results(base: dict, new: dict, threshold: float = 0.10,
+                    min_delta_ms: float = 1.0, error_delta: float = 0.01) -> List[dict]:
+    """
+    Compara dos corridas ruta por ruta y devuelve las regresiones
+
+    Latencia: p50/p95/p99 empeoran más que threshold (relativo) y más que
+    min_delta_ms (absoluto, para ignorar ruido en rutas de pocos ms).
+    Errores: la tasa sube más de error_delta. Upstream: el promedio de llamadas
+    a Supabase por petición sube más que threshold.
+    """
+    regresiones = []
+    for route, old in base.get('routes', {}).items():
+        cur = new.get('routes', {}).get(route)
+        if cur is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms'):
+            delta = cur[metric] - old[metric]
+            if old[metric] and delta > min_delta_ms and delta / old[metric] > threshold:
+                regresiones.append({
+                    'route': route, 'metric': metric, 'base': old[metric], 'new': cur[metric],
+                    'change': round(delta / old[metric], 4)
+                })
+        if cur['error_rate'] - old['error_rate'] > error_delta:
+            regresiones.append({
+                'route': route, 'metric': 'error_rate', 'base': old['error_rate'],
+                'new': cur['error_rate'], 'change': round(cur['error_rate'] - old['error_rate'], 4)
+            })
+        old_up, cur_up = old.get('upstream_calls_mean'), cur.get('upstream_calls_mean')
+        if old_up is not None and cur_up is not None and cur_up > old_up * (1 + threshold):
+            regresiones.append({
+                'route': route, 'metric': 'upstream_calls_mean', 'base': old_up,
+                'new': cur_up, 'change': round(cur_up - old_up, 2)
+            })
+    return regresiones
+
+
+def _compare_command(args) -> int:
+    with open(args.base) as f:
+        base = json.load(f)
+    with open(args.new) as f:
+        new = json.load(f)
+
+    regresiones = compare_results(base, new, args.threshold, args.min_delta_ms, args.error_delta)
+    for route in sorted(set(base['routes']) | set(new['routes'])):
+        old, cur = base['routes'].get(route), new['routes'].get(route)
+        if old and cur:
+            print(f"{route:<44} p95 {old['p95_ms']:>8.1f} -> {cur['p95_ms']:>8.1f}   "
+                  f"p99 {old['p99_ms']:>8.1f} -> {cur['p99_ms']:>8.1f}")
+        else:
+            print(f"{route:<44} {'solo en base' if old else 'solo en nuevo'}")
+
+    if not regresiones:
+        print('\nSin regresiones')
+        return 0
+    print(f'\n{len(regresiones)} regresiones:')
+    for r in regresiones:
+        print(f"  {r['route']}: {r['metric']} {r['base']} -> {r['new']} ({r['change']:+})")
+    return 1
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark de carga para la API de Clarisa')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run = sub.add_parser('run', help='ejecutar el benchmark')
+    run.add_argument('--base-url', help='app remota; si se omite corre en proceso con fake_postgrest')
+    run.add_argument('--email', help='usuario para modo remoto')
+    run.add_argument('--password', help='contraseña para modo remoto')
+    run.add_argument('-c', '--concurrency', type=int, default=10)
+    run.add_argument('-d', '--duration', type=float, default=30.0, help='segundos de medición')
+    run.add_argument('-n', '--requests', type=int, default=0, help='número fijo de peticiones (ignora --duration)')
+    run.add_argument('--warmup', type=int, default=50, help='peticiones de calentamiento sin medir')
+    run.add_argument('--timeout', type=float, default=30.0)
+    run.add_argument('--scenarios', help='filtro por nombre, separado por comas (ej. recursos,login)')
+    run.add_argument('--latency', type=float, default=0.02, help='latencia inyectada por llamada a Supabase (s)')
+    run.add_argument('--jitter', type=float, default=0.01, help='latencia extra aleatoria (s)')
+    run.add_argument('--usuarios', type=int, default=50)
+    run.add_argument('--oportunidades', type=int, default=200)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--mongomock', action='store_true', help='usar mongomock-motor en lugar de MONGO_URL')
+    run.add_argument('-o', '--output', help='archivo JSON de resultados')
+
+    cmp = sub.add_parser('compare', help='comparar dos archivos de resultados')
+    cmp.add_argument('base')
+    cmp.add_argument('new')
+    cmp.add_argument('--threshold', type=float, default=0.10, help='empeoramiento relativo tolerado')
+    cmp.add_argument('--min-delta-ms', type=float, default=1.0)
+    cmp.add_argument('--error-delta', type=float, default=0.01)
+
+    args = parser.parse_args(argv)
+    if args.command == 'compare':
+        return _compare_command(args)
+
+    result = asyncio.run(run_benchmark(args))
+    print_summary(result)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+        print(f'Resultados guardados en {args.output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Bulkheads: límite de concurrencia por dependencia con cola acotada y prioridades
+Supabase REST, Storage, MongoDB y Postgres directo tienen cada uno su propio
+cupo de operaciones simultáneas. Cuando el cupo está lleno se espera en una
+cola ordenada por prioridad (auth y diagnóstico antes que reportes admin); si
+la cola también está llena, o la espera supera BULKHEAD_QUEUE_TIMEOUT, se
+responde 503 + Retry-After de inmediato en lugar de acumular latencia.
+
+    async with storage_bulkhead.slot():
+        await asyncio.to_thread(storage_client.upload_file, ...)
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from fastapi import HTTPException
+
+from metrics import bulkhead_in_flight, bulkhead_queued, bulkhead_rejected_total, bulkhead_wait
+from resilience import mark_unavailable
+
+QUEUE_TIMEOUT = float(os.environ.get('BULKHEAD_QUEUE_TIMEOUT', '5'))
+
+# Prioridades: menor número = se atiende antes
+CRITICAL, NORMAL, LOW = 0, 1, 2
+PRIORITY_NAMES = {CRITICAL: 'critical', NORMAL: 'normal', LOW: 'low'}
+
+# Fracción de la cola que puede ocupar cada prioridad: las peticiones de baja
+# prioridad se descartan antes y dejan lugar a las críticas
+QUEUE_SHARE = {CRITICAL: 1.0, NORMAL: 0.75, LOW: 0.5}
+
+# (método o None, prefijo de ruta, prioridad); gana la primera coincidencia
+PRIORITY_ROUTES = [
+    (None, '/api/auth/', CRITICAL),
+    ('POST', '/api/diagnostico', CRITICAL),
+    (None, '/api/admin/reportes/', LOW),
+    (None, '/api/admin/estadisticas/', LOW),
+    ('POST', '/api/admin/recursos/upload-file', LOW),
+]
+
+
+class Overloaded(HTTPException):
+    """La dependencia no tiene cupo ni lugar en la cola; se responde 503 sin esperar"""
+
+    def __init__(self, dependency: str, retry_after: float):
+        self.dependency = dependency
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(
+            status_code=503,
+            detail=f"Servidor ocupado ({dependency}), intente nuevamente en unos segundos",
+            headers={'Retry-After': str(self.retry_after)}
+        )
+
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar('clarisa_request_priority', default=NORMAL)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+def route_priority(method: str, path: str) -> int:
+    for route_method, prefix, priority in PRIORITY_ROUTES:
+        if (route_method is None or route_method == method) and path.startswith(prefix):
+            return priority
+    return NORMAL
+
+
+class Bulkhead:
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float = QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        # heap de [prioridad, orden de llegada, futuro]
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+        # Duración media de una operación (EWMA), para estimar Retry-After
+        self._hold = 0.0
+        self._update_gauges()
+
+    def _update_gauges(self):
+        bulkhead_in_flight.labels(self.name).set(self.active)
+        bulkhead_queued.labels(self.name).set(len(self._waiters))
+
+    def _queue_limit(self, priority: int) -> int:
+        return int(self.max_queue * QUEUE_SHARE[priority])
+
+    def retry_after(self) -> float:
+        """Tiempo estimado hasta que se vacíe la cola actual"""
+        return (len(self._waiters) + 1) * (self._hold or 1.0) / self.max_concurrent
+
+    def _reject(self, priority: int, reason: str):
+        bulkhead_rejected_total.labels(self.name, PRIORITY_NAMES[priority], reason).inc()
+        error = Overloaded(self.name, self.retry_after())
+        mark_unavailable(error)
+        raise error
+
+    @asynccontextmanager
+    async def slot(self, priority: Optional[int] = None):
+        """Ocupa un cupo mientras dura el bloque; lanza Overloaded si no lo consigue"""
+        if priority is None:
+            priority = current_priority()
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            self._update_gauges()
+        else:
+            await self._wait(priority)
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self._hold = 0.8 * self._hold + 0.2 * elapsed if self._hold else elapsed
+            self._release()
+
+    async def _wait(self, priority: int):
+        if len(self._waiters) >= self._queue_limit(priority) and not self._evict_below(priority):
+            self._reject(priority, 'queue_full')
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), future]
+        heapq.heappush(self._waiters, entry)
+        self._update_gauges()
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._remove(entry)
+            self._reject(priority, 'timeout')
+        except Overloaded:
+            # Desplazado de la cola por una operación más prioritaria
+            self._reject(priority, 'evicted')
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # El cupo llegó justo al cancelar: devolverlo
+                self._release()
+            else:
+                self._remove(entry)
+            raise
+        bulkhead_wait.labels(self.name, PRIORITY_NAMES[priority]).observe(time.monotonic() - start)
+
+    def _evict_below(self, priority: int) -> bool:
+        """Saca de la cola la última operación de menor prioridad que `priority`"""
+        candidates = [e for e in self._waiters if e[0] > priority]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda e: (e[0], e[1]))
+        self._remove(victim)
+        victim[2].set_exception(Overloaded(self.name, self.retry_after()))
+        return True
+
+    def _remove(self, entry: list):
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            self._update_gauges()
+
+    def _release(self):
+        # El cupo pasa directo al siguiente en espera (active no cambia)
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                self._update_gauges()
+                return
+        self.active -= 1
+        self._update_gauges()
+
+
+def _bulkhead(name: str, concurrency: int, queue: int) -> Bulkhead:
+    prefix = f'BULKHEAD_{name.upper()}'
+    return Bulkhead(
+        name,
+        int(os.environ.get(f'{prefix}_CONCURRENCY', str(concurrency))),
+        int(os.environ.get(f'{prefix}_QUEUE', str(queue))),
+    )
+
+
+supabase_bulkhead = _bulkhead('supabase', concurrency=64, queue=256)
+# Subidas de hasta 50 MB: pocas a la vez para no acaparar ancho de banda y memoria
+storage_bulkhead = _bulkhead('storage', concurrency=4, queue=8)
+mongo_bulkhead = _bulkhead('mongo', concurrency=64, queue=256)
+postgres_bulkhead = _bulkhead('postgres', concurrency=10, queue=50)
+
+
+class PriorityMiddleware:
+    """Asigna la prioridad de la petición según su ruta (ver PRIORITY_ROUTES)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = _priority.set(route_priority(scope['method'], scope['path']))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _priority.reset(token)
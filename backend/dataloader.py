@@ -0,0 +1,159 @@
+"""
+DataLoader por petición para búsquedas por id
+Junta todas las búsquedas de una misma tabla hechas en el mismo tick del event
+loop y las resuelve con una sola consulta id=in.(...). Los resultados quedan
+cacheados durante la petición, así que pedir dos veces el mismo id no vuelve
+a ir a Supabase.
+
+    user = await load_one('users', user_id)
+    recursos = await load_many('recursos', recurso_ids)   # una sola consulta
+"""
+import asyncio
+import contextvars
+import logging
+from typing import Dict, Hashable, Iterable, List, Optional
+
+from supabase_rest import SupabaseRestClient, supabase_rest, supabase_rest_admin
+
+logger = logging.getLogger(__name__)
+
+# Máximo de ids por consulta para no superar el largo de URL de PostgREST
+MAX_BATCH_SIZE = 100
+
+# Tabla -> cliente con el que se consulta (el mismo que usaba cada módulo)
+LOADER_CLIENTS: Dict[str, SupabaseRestClient] = {
+    'users': supabase_rest,
+    'recursos': supabase_rest,
+    'oportunidades': supabase_rest_admin,
+    'tickets_soporte': supabase_rest_admin,
+}
+
+
+class DataLoader:
+    """Agrupa búsquedas por `key` en una tabla y las despacha en lote"""
+
+    def __init__(self, rest: SupabaseRestClient, table: str, key: str = 'id'):
+        self.rest = rest
+        self.table = table
+        self.key = key
+        self._cache: Dict[Hashable, asyncio.Future] = {}
+        self._queue: List[Hashable] = []
+        self._scheduled = False
+        self._tasks: set = set()
+
+    def load(self, key: Hashable) -> 'asyncio.Future[Optional[dict]]':
+        """Futuro con la fila cuyo `key` coincide (None si no existe)"""
+        if key in self._cache:
+            return self._cache[key]
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[key] = future
+        self._queue.append(key)
+        if not self._scheduled:
+            self._scheduled = True
+            # Despachar cuando todas las corrutinas listas de este tick hayan encolado sus ids
+            loop.call_soon(self._start_dispatch)
+        return future
+
+    async def load_many(self, keys: Iterable[Hashable]) -> List[Optional[dict]]:
+        return list(await asyncio.gather(*(self.load(k) for k in keys)))
+
+    def prime(self, key: Hashable, row: Optional[dict]):
+        """Guarda una fila ya conocida (por ejemplo, recién creada) sin consultarla"""
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(row)
+        self._cache[key] = future
+
+    def clear(self, key: Optional[Hashable] = None):
+        """Invalida un id (o todo) tras una escritura"""
+        if key is None:
+            self._cache = {k: f for k, f in self._cache.items() if not f.done()}
+        elif key in self._cache and self._cache[key].done():
+            del self._cache[key]
+
+    def _start_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        keys, self._queue, self._scheduled = self._queue, [], False
+        for start in range(0, len(keys), MAX_BATCH_SIZE):
+            await self._fetch(keys[start:start + MAX_BATCH_SIZE])
+
+    async def _fetch(self, keys: List[Hashable]):
+        try:
+            response = await self.rest.get(
+                self.table,
+                params={self.key: f"in.({','.join(str(k) for k in keys)})"}
+            )
+            response.raise_for_status()
+            rows = {str(row.get(self.key)): row for row in response.json()}
+        except Exception as e:
+            logger.error(f"Error cargando {self.table} en lote: {e}")
+            for k in keys:
+                future = self._cache.pop(k, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+            return
+
+        for k in keys:
+            future = self._cache.get(k)
+            if future is not None and not future.done():
+                future.set_result(rows.get(str(k)))
+
+
+# Loaders de la petición en curso; DataLoaderMiddleware crea un dict nuevo por petición
+_loaders: contextvars.ContextVar[Optional[Dict[str, DataLoader]]] = contextvars.ContextVar(
+    'clarisa_dataloaders', default=None
+)
+
+
+def get_loader(table: str) -> DataLoader:
+    """
+    Loader de `table` para la petición actual
+
+    Fuera de una petición HTTP (scripts, tareas en segundo plano) devuelve un
+    loader nuevo en cada llamada: solo agrupa lo pedido con ese mismo loader.
+    """
+    loaders = _loaders.get()
+    if loaders is None:
+        return DataLoader(LOADER_CLIENTS[table], table)
+    if table not in loaders:
+        loaders[table] = DataLoader(LOADER_CLIENTS[table], table)
+    return loaders[table]
+
+
+# Se devuelven copias: los handlers suelen modificar la fila (p. ej. quitar password_hash)
+async def load_one(table: str, key: Hashable) -> Optional[dict]:
+    row = await get_loader(table).load(key)
+    return dict(row) if row is not None else None
+
+
+async def load_many(table: str, keys: Iterable[Hashable]) -> List[Optional[dict]]:
+    rows = await get_loader(table).load_many(keys)
+    return [dict(row) if row is not None else None for row in rows]
+
+
+def clear_loader(table: str, key: Optional[Hashable] = None):
+    loaders = _loaders.get()
+    if loaders is not None and table in loaders:
+        loaders[table].clear(key)
+
+
+class DataLoaderMiddleware:
+    """Da a cada petición HTTP su propio juego de loaders (y de caché)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        token = _loaders.set({})
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _loaders.reset(token)
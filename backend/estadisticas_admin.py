@@ -3,15 +3,13 @@ API endpoints para estadísticas del Dashboard Admin
 Proporciona métricas clave para monitoreo y análisis
 """
 from fastapi import APIRouter, HTTPException
-import requests
-import os
 from datetime import datetime, timedelta
+from supabase_rest import supabase_rest
+import pg_backend
+from pg_backend import pg_enabled
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-
 @router.get("/admin/estadisticas/general")
 async def get_estadisticas_generales():
     """
@@ -22,16 +20,15 @@ async def get_estadisticas_generales():
     - Diagnósticos del último mes
     """
     try:
+        if pg_enabled('estadisticas_general'):
+            return await pg_backend.estadisticas_generales()
+        
         stats = {}
         
         # Total de usuarios - usar la misma consulta que para roles
-        response_roles = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?select=rol",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response_roles = await supabase_rest.get(
+            'users',
+            params={'select': 'rol'}
         )
         
         if response_roles.status_code == 200:
@@ -48,14 +45,10 @@ async def get_estadisticas_generales():
         
         # Usuarios activos (último mes)
         fecha_hace_mes = (datetime.now() - timedelta(days=30)).isoformat()
-        response_activos = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?ultimo_acceso=gte.{fecha_hace_mes}&select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response_activos = await supabase_rest.get(
+            'users',
+            params={'ultimo_acceso': f'gte.{fecha_hace_mes}', 'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response_activos.status_code == 200:
@@ -66,14 +59,10 @@ async def get_estadisticas_generales():
         
         # Total de diagnósticos (si la tabla existe)
         try:
-            response_diag = requests.get(
-                f"{SUPABASE_URL}/rest/v1/diagnosticos?select=count",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'count=exact'
-                },
-                timeout=10
+            response_diag = await supabase_rest.get(
+                'diagnosticos',
+                params={'select': 'count'},
+                headers={'Prefer': 'count=exact'}
             )
             
             if response_diag.status_code == 200:
@@ -86,14 +75,10 @@ async def get_estadisticas_generales():
         
         # Diagnósticos del último mes
         try:
-            response_diag_mes = requests.get(
-                f"{SUPABASE_URL}/rest/v1/diagnosticos?created_at=gte.{fecha_hace_mes}&select=count",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'count=exact'
-                },
-                timeout=10
+            response_diag_mes = await supabase_rest.get(
+                'diagnosticos',
+                params={'created_at': f'gte.{fecha_hace_mes}', 'select': 'count'},
+                headers={'Prefer': 'count=exact'}
             )
             
             if response_diag_mes.status_code == 200:
@@ -120,17 +105,16 @@ async def get_estadisticas_recursos():
     - Recursos más vistos
     """
     try:
+        if pg_enabled('estadisticas_recursos'):
+            return await pg_backend.estadisticas_recursos()
+        
         stats = {}
         
         # Total de recursos
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos?select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'recursos',
+            params={'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response.status_code == 200:
@@ -140,13 +124,9 @@ async def get_estadisticas_recursos():
             stats['total_recursos'] = 0
         
         # Recursos por tipo
-        response_tipos = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos?select=tipo",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response_tipos = await supabase_rest.get(
+            'recursos',
+            params={'select': 'tipo'}
         )
         
         if response_tipos.status_code == 200:
@@ -160,13 +140,9 @@ async def get_estadisticas_recursos():
             stats['recursos_por_tipo'] = {}
         
         # Recursos por fase
-        response_fases = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos?select=fase",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response_fases = await supabase_rest.get(
+            'recursos',
+            params={'select': 'fase'}
         )
         
         if response_fases.status_code == 200:
@@ -180,13 +156,9 @@ async def get_estadisticas_recursos():
             stats['recursos_por_fase'] = {}
         
         # Recursos más vistos (top 5)
-        response_vistos = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos?select=titulo,vistas&order=vistas.desc&limit=5",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response_vistos = await supabase_rest.get(
+            'recursos',
+            params={'select': 'titulo,vistas', 'order': 'vistas.desc', 'limit': '5'}
         )
         
         if response_vistos.status_code == 200:
@@ -210,17 +182,16 @@ async def get_estadisticas_soporte():
     - Tiempo promedio de resolución
     """
     try:
+        if pg_enabled('estadisticas_soporte'):
+            return await pg_backend.estadisticas_soporte()
+        
         stats = {}
         
         # Total de tickets
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/tickets?select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'tickets',
+            params={'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response.status_code == 200:
@@ -230,13 +201,9 @@ async def get_estadisticas_soporte():
             stats['total_tickets'] = 0
         
         # Tickets por estado
-        response_estados = requests.get(
-            f"{SUPABASE_URL}/rest/v1/tickets?select=estado",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response_estados = await supabase_rest.get(
+            'tickets',
+            params={'select': 'estado'}
         )
         
         if response_estados.status_code == 200:
@@ -250,13 +217,9 @@ async def get_estadisticas_soporte():
             stats['tickets_por_estado'] = {}
         
         # Tickets por prioridad
-        response_prioridad = requests.get(
-            f"{SUPABASE_URL}/rest/v1/tickets?select=prioridad",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response_prioridad = await supabase_rest.get(
+            'tickets',
+            params={'select': 'prioridad'}
         )
         
         if response_prioridad.status_code == 200:
@@ -271,14 +234,10 @@ async def get_estadisticas_soporte():
         
         # Tickets del último mes
         fecha_hace_mes = (datetime.now() - timedelta(days=30)).isoformat()
-        response_mes = requests.get(
-            f"{SUPABASE_URL}/rest/v1/tickets?created_at=gte.{fecha_hace_mes}&select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response_mes = await supabase_rest.get(
+            'tickets',
+            params={'created_at': f'gte.{fecha_hace_mes}', 'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response_mes.status_code == 200:
@@ -302,18 +261,17 @@ async def get_estadisticas_actividad():
     - Tickets abiertos (última semana)
     """
     try:
+        if pg_enabled('estadisticas_actividad'):
+            return await pg_backend.estadisticas_actividad()
+        
         stats = {}
         fecha_hace_semana = (datetime.now() - timedelta(days=7)).isoformat()
         
         # Nuevos usuarios última semana
-        response_usuarios = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?created_at=gte.{fecha_hace_semana}&select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response_usuarios = await supabase_rest.get(
+            'users',
+            params={'created_at': f'gte.{fecha_hace_semana}', 'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response_usuarios.status_code == 200:
@@ -324,14 +282,10 @@ async def get_estadisticas_actividad():
         
         # Nuevos diagnósticos última semana
         try:
-            response_diag = requests.get(
-                f"{SUPABASE_URL}/rest/v1/diagnosticos?created_at=gte.{fecha_hace_semana}&select=count",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'count=exact'
-                },
-                timeout=10
+            response_diag = await supabase_rest.get(
+                'diagnosticos',
+                params={'created_at': f'gte.{fecha_hace_semana}', 'select': 'count'},
+                headers={'Prefer': 'count=exact'}
             )
             
             if response_diag.status_code == 200:
@@ -343,14 +297,10 @@ async def get_estadisticas_actividad():
             stats['nuevos_diagnosticos_semana'] = 0
         
         # Nuevos tickets última semana
-        response_tickets = requests.get(
-            f"{SUPABASE_URL}/rest/v1/tickets?created_at=gte.{fecha_hace_semana}&select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response_tickets = await supabase_rest.get(
+            'tickets',
+            params={'created_at': f'gte.{fecha_hace_semana}', 'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response_tickets.status_code == 200:
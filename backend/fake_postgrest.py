@@ -0,0 +1,773 @@
+"""
+Servidor PostgREST/Supabase falso en memoria
+Sustituto local de /rest/v1 para medir latencia y comportamiento del backend
+sin red: filtros eq./gte./ilike./in./or=, order, limit/offset, select=count,
+Prefer count=exact + Content-Range, return=representation, upserts y RPCs.
+
+Uso en proceso (sin sockets):
+    fake = FakePostgrest(latency=0.02)
+    seed_demo_data(fake.store)
+    await fake.install()        # redirige supabase_rest y supabase_rest_admin
+
+Uso standalone:
+    python fake_postgrest.py --port 54321 --latency 0.02 --seed
+"""
+import asyncio
+import copy
+import json
+import random
+import re
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.routing import Route
+
+FAKE_BASE_URL = 'http://fake-supabase/rest/v1'
+
+# Columnas con valor por defecto (según los *_schema.sql)
+TABLE_DEFAULTS: Dict[str, dict] = {
+    'users': {
+        'suscripcion_activa': False, 'onboarding_completado': False,
+        'progreso_general': 0, 'ultimo_acceso': None, 'updated_at': None
+    },
+    'diagnosticos': {},
+    'recursos': {
+        'vistas': 0, 'descargas': 0, 'publicado': True, 'destacado': False,
+        'acceso_requerido': 'gratuito', 'tags': [], 'updated_at': None
+    },
+    'recursos_usuario': {
+        'visto': False, 'descargado': False, 'completado': False, 'calificacion': None
+    },
+    'recursos_favoritos': {},
+    'user_logros': {},
+    'notificaciones': {'leida': False, 'leida_at': None, 'link': None},
+    'faq_categorias': {'orden': 0, 'activa': True},
+    'faqs': {'orden': 0, 'visible': True, 'vistas': 0, 'util_si': 0, 'util_no': 0},
+    'tickets_soporte': {
+        'prioridad': 'normal', 'estado': 'abierto', 'asignado_a': None,
+        'updated_at': None, 'resuelto_at': None
+    },
+    'tickets_mensajes': {'es_staff': False},
+    'progreso_usuario': {
+        'porcentaje_total': 0,
+        'fase1_diagnostico_completado': False, 'fase1_porcentaje': 0, 'fase1_fecha_completado': None,
+        'fase2_materialidad_completado': False, 'fase2_porcentaje': 0, 'fase2_fecha_completado': None,
+        'fase3_riesgos_completado': False, 'fase3_porcentaje': 0, 'fase3_fecha_completado': None,
+        'fase4_medicion_completado': False, 'fase4_porcentaje': 0, 'fase4_fecha_completado': None,
+        'fase5_reporte_completado': False, 'fase5_porcentaje': 0, 'fase5_fecha_completado': None,
+        'updated_at': None
+    },
+    'acciones_progreso': {'puntos': 10},
+    'oportunidades': {
+        'etapa_pipeline': 'nuevo_lead', 'valor_estimado_usd': 0, 'probabilidad_cierre': 10,
+        'estado': 'activo', 'ultima_actividad': None, 'proxima_accion': None,
+        'fecha_estimada_cierre': None, 'notas': None, 'updated_at': None
+    },
+    'actividades': {'completada': False, 'fecha_completada': None, 'resultado': None},
+}
+
+# Restricciones UNIQUE (según los *_schema.sql)
+UNIQUE_CONSTRAINTS: Dict[str, List[tuple]] = {
+    'users': [('email',)],
+    'recursos_favoritos': [('user_id', 'recurso_id')],
+    'user_logros': [('user_id', 'logro_codigo')],
+    'recursos_usuario': [('user_id', 'recurso_id')],
+    'progreso_usuario': [('user_id',)],
+}
+
+# Columna de "completado" de cada fase en progreso_usuario
+FASE_COMPLETADO = {
+    1: 'fase1_diagnostico_completado',
+    2: 'fase2_materialidad_completado',
+    3: 'fase3_riesgos_completado',
+    4: 'fase4_medicion_completado',
+    5: 'fase5_reporte_completado',
+}
+
+
+def _crear_progreso_nuevo_usuario(store: 'TableStore', user: dict):
+    """
+    Trigger crear_progreso_al_registrar (progreso_schema.sql)
+
+    El fake no modela RLS: inserta siempre. En Postgres esto solo funciona
+    porque la función es SECURITY DEFINER; sin eso el INSERT con la anon key
+    choca con la RLS de progreso_usuario y el registro entero se revierte.
+    """
+    store.insert('progreso_usuario', [{'user_id': user['id']}], resolution='ignore-duplicates')
+
+
+# Triggers AFTER INSERT (seed() no los dispara, igual que una carga directa)
+AFTER_INSERT_TRIGGERS: Dict[str, List[Callable]] = {
+    'users': [_crear_progreso_nuevo_usuario],
+}
+
+RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'or', 'and', 'on_conflict', 'columns'}
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class PostgrestError(Exception):
+    """Error con el formato JSON de PostgREST"""
+
+    def __init__(self, status: int, code: str, message: str, details: Optional[str] = None):
+        super().__init__(message)
+        self.status = status
+        self.body = {'code': code, 'message': message, 'details': details, 'hint': None}
+
+
+# ============================================
+# STORE EN MEMORIA
+# ============================================
+
+class TableStore:
+    """Tablas en memoria: nombre -> lista de filas (dict)"""
+
+    def __init__(self, seed: int = 0, strict: bool = True):
+        self.tables: Dict[str, List[dict]] = {name: [] for name in TABLE_DEFAULTS}
+        self.strict = strict
+        self._rng = random.Random(seed)
+
+    def new_id(self) -> str:
+        return str(uuid.UUID(int=self._rng.getrandbits(128), version=4))
+
+    def table(self, name: str) -> List[dict]:
+        if name not in self.tables:
+            if self.strict:
+                raise PostgrestError(
+                    404, '42P01', f'relation "public.{name}" does not exist'
+                )
+            self.tables[name] = []
+        return self.tables[name]
+
+    def _build_row(self, name: str, data: dict) -> dict:
+        row = copy.deepcopy(TABLE_DEFAULTS.get(name, {}))
+        row.setdefault('created_at', _now())
+        row.update(copy.deepcopy(data))
+        # updated_at tiene DEFAULT NOW() en todos los esquemas
+        if 'updated_at' in row and row['updated_at'] is None:
+            row['updated_at'] = row['created_at']
+        if not row.get('id'):
+            row['id'] = self.new_id()
+        return row
+
+    def _find_conflict(self, name: str, row: dict, columns: Optional[tuple] = None) -> Optional[dict]:
+        constraints = [columns] if columns else UNIQUE_CONSTRAINTS.get(name, []) + [('id',)]
+        for existing in self.tables[name]:
+            for cols in constraints:
+                if all(existing.get(c) == row.get(c) for c in cols):
+                    return existing
+        return None
+
+    def insert(
+        self,
+        name: str,
+        rows: List[dict],
+        resolution: Optional[str] = None,
+        on_conflict: Optional[tuple] = None
+    ) -> List[dict]:
+        """Inserta filas; resolution = merge-duplicates | ignore-duplicates para upserts"""
+        table = self.table(name)
+        result = []
+        for data in rows:
+            row = self._build_row(name, data)
+            existing = self._find_conflict(name, row, on_conflict)
+            if existing is not None:
+                if resolution == 'merge-duplicates':
+                    existing.update(copy.deepcopy(data))
+                    result.append(existing)
+                    continue
+                if resolution == 'ignore-duplicates':
+                    continue
+                raise PostgrestError(
+                    409, '23505',
+                    f'duplicate key value violates unique constraint "{name}_key"',
+                    f'Key already exists in {name}.'
+                )
+            table.append(row)
+            result.append(row)
+            for trigger in AFTER_INSERT_TRIGGERS.get(name, ()):
+                trigger(self, row)
+        return result
+
+    def seed(self, name: str, rows: List[dict]) -> List[dict]:
+        """Carga filas sin validar restricciones (para poblar datos de prueba)"""
+        self.tables.setdefault(name, [])
+        built = [self._build_row(name, r) for r in rows]
+        self.tables[name].extend(built)
+        return built
+
+
+# ============================================
+# FILTROS POSTGREST
+# ============================================
+
+def _coerce(raw: str, actual):
+    """Convierte el valor del filtro al tipo de la columna"""
+    if isinstance(actual, bool):
+        return raw.lower() == 'true'
+    if isinstance(actual, (int, float)):
+        try:
+            return float(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _like_regex(pattern: str, flags=0):
+    regex = ''.join('.*' if ch in '*%' else re.escape(ch) for ch in pattern)
+    return re.compile(f'^{regex}$', flags | re.DOTALL)
+
+
+def _split_top_level(text: str) -> List[str]:
+    """Separa por comas que no están dentro de paréntesis"""
+    parts, depth, current = [], 0, ''
+    for ch in text:
+        if ch == '(':
+            depth += 1
+        elif ch == ')':
+            depth -= 1
+        if ch == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+        else:
+            current += ch
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _match(value, expr: str) -> bool:
+    """Evalúa 'op.valor' (con prefijo 'not.' opcional) contra un valor de columna"""
+    negate = False
+    if expr.startswith('not.'):
+        negate, expr = True, expr[4:]
+    op, _, raw = expr.partition('.')
+    # Como en SQL: salvo IS, cualquier comparación con NULL (negada o no) es NULL
+    if value is None and op != 'is':
+        return False
+
+    if op == 'is':
+        target = {'null': None, 'true': True, 'false': False}.get(raw.lower(), raw)
+        result = value is target
+    elif op == 'in':
+        items = [i.strip().strip('"') for i in raw.strip('()').split(',') if i.strip()]
+        result = any(value == _coerce(i, value) for i in items)
+    elif op in ('like', 'ilike'):
+        flags = re.IGNORECASE if op == 'ilike' else 0
+        result = bool(_like_regex(raw, flags).match(str(value)))
+    elif op == 'cs':
+        wanted = [i.strip().strip('"') for i in raw.strip('{}').split(',') if i.strip()]
+        result = isinstance(value, list) and all(w in value for w in wanted)
+    else:
+        target = _coerce(raw, value)
+        if isinstance(target, float) and not isinstance(value, bool):
+            value = float(value)
+        try:
+            result = {
+                'eq': value == target,
+                'neq': value != target,
+                'gt': value > target,
+                'gte': value >= target,
+                'lt': value < target,
+                'lte': value <= target,
+            }[op]
+        except KeyError:
+            raise PostgrestError(400, 'PGRST100', f'operador no soportado: {op}')
+        except TypeError:
+            result = False
+
+    return not result if negate else result
+
+
+def _logic_matcher(text: str, any_of: bool) -> Callable[[dict], bool]:
+    """Construye un predicado para or=(...) / and=(...)"""
+    conditions = []
+    for part in _split_top_level(text.strip()[1:-1]):
+        part = part.strip()
+        if part.startswith(('or(', 'and(')):
+            name, _, rest = part.partition('(')
+            conditions.append(_logic_matcher('(' + rest, name == 'or'))
+            continue
+        column, _, expr = part.partition('.')
+        conditions.append(lambda row, c=column, e=expr: _match(row.get(c), e))
+    combine = any if any_of else all
+    return lambda row: combine(cond(row) for cond in conditions)
+
+
+def build_predicate(params: List[tuple]) -> Callable[[dict], bool]:
+    """Predicado de filtrado a partir de los query params de PostgREST"""
+    checks = []
+    for key, value in params:
+        if key == 'or':
+            checks.append(_logic_matcher(value, any_of=True))
+        elif key == 'and':
+            checks.append(_logic_matcher(value, any_of=False))
+        elif key not in RESERVED_PARAMS:
+            checks.append(lambda row, c=key, e=value: _match(row.get(c), e))
+    return lambda row: all(check(row) for check in checks)
+
+
+def apply_order(rows: List[dict], order: Optional[str]) -> List[dict]:
+    if not order:
+        return rows
+    for term in reversed(order.split(',')):
+        column, *modifiers = term.strip().split('.')
+        desc = 'desc' in modifiers
+        nulls_first = 'nullsfirst' in modifiers or (desc and 'nullslast' not in modifiers)
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+
+def apply_select(rows: List[dict], select: Optional[str]) -> List[dict]:
+    if not select or select.strip() == '*':
+        return rows
+    columns = [c.strip() for c in select.split(',') if c.strip()]
+    if '*' in columns:
+        return rows
+    return [{c: r.get(c) for c in columns} for r in rows]
+
+
+# ============================================
+# RPCs
+# ============================================
+
+def rpc_registrar_accion_progreso(store: TableStore, p_user_id, p_tipo_accion, p_fase,
+                                  p_descripcion=None, p_puntos=10):
+    """Equivalente de registrar_accion_progreso (progreso_schema.sql)"""
+    store.insert('acciones_progreso', [{
+        'user_id': p_user_id,
+        'tipo_accion': p_tipo_accion,
+        'fase': p_fase,
+        'descripcion': p_descripcion,
+        'puntos': p_puntos
+    }])
+
+    total = sum(
+        a.get('puntos') or 0 for a in store.table('acciones_progreso')
+        if a.get('user_id') == p_user_id and a.get('fase') == p_fase
+    )
+    porcentaje = min(total, 100)
+    completada = porcentaje >= 100
+
+    for progreso in store.table('progreso_usuario'):
+        if progreso.get('user_id') != p_user_id:
+            continue
+        progreso[f'fase{p_fase}_porcentaje'] = porcentaje
+        if p_fase in FASE_COMPLETADO:
+            progreso[FASE_COMPLETADO[p_fase]] = completada
+        fecha_col = f'fase{p_fase}_fecha_completado'
+        if completada and not progreso.get(fecha_col):
+            progreso[fecha_col] = _now()
+        progreso['porcentaje_total'] = sum(
+            progreso.get(f'fase{i}_porcentaje') or 0 for i in range(1, 6)
+        ) // 5
+        progreso['ultima_actualizacion'] = _now()
+    return None
+
+
+def rpc_actualizar_ultimo_acceso(store: TableStore, accesos):
+    """Equivalente de actualizar_ultimo_acceso (supabase_schema.sql)"""
+    por_id = {a['id']: a['ultimo_acceso'] for a in accesos}
+    filas = 0
+    for user in store.table('users'):
+        ultimo = por_id.get(user['id'])
+        if ultimo is None:
+            continue
+        user['ultimo_acceso'] = max(user.get('ultimo_acceso') or ultimo, ultimo)
+        user['updated_at'] = _now()
+        filas += 1
+    return filas
+
+
+def rpc_kanban_oportunidades(store: TableStore, p_por_columna: int = 20):
+    """Equivalente de kanban_oportunidades (sales_schema.sql)"""
+    from sales import COLUMNAS_OPORTUNIDAD
+    columnas = COLUMNAS_OPORTUNIDAD['tarjeta'].split(',')
+    grupos: Dict[str, List[dict]] = {}
+    for opp in store.table('oportunidades'):
+        if opp.get('estado') == 'activo':
+            grupos.setdefault(opp['etapa_pipeline'], []).append(opp)
+    resultado = []
+    for etapa, filas in grupos.items():
+        filas.sort(key=lambda o: (o['fecha_creacion'], o['id']), reverse=True)
+        resultado.append({
+            'etapa': etapa,
+            'total': len(filas),
+            'valor_total': sum(o.get('valor_estimado_usd') or 0 for o in filas),
+            'tarjetas': [{c: o.get(c) for c in columnas} for o in filas[:p_por_columna + 1]],
+        })
+    return resultado
+
+
+def rpc_registrar_actividad(store: TableStore, p_actividad: dict):
+    """Equivalente de registrar_actividad (sales_schema.sql)"""
+    campos = ('oportunidad_id', 'creado_por', 'tipo', 'titulo', 'descripcion',
+              'fecha_programada', 'fecha_completada', 'completada', 'resultado')
+    datos = {c: p_actividad.get(c) for c in campos}
+    datos['completada'] = bool(datos['completada'])
+    actividad = store.insert('actividades', [datos])[0]
+    ultima_actividad = None
+    for opp in store.table('oportunidades'):
+        if opp['id'] == actividad['oportunidad_id']:
+            opp['ultima_actividad'] = ultima_actividad = _now()
+            opp['updated_at'] = ultima_actividad
+    return {**actividad, 'ultima_actividad': ultima_actividad}
+
+
+DEFAULT_RPCS: Dict[str, Callable] = {
+    'registrar_accion_progreso': rpc_registrar_accion_progreso,
+    'actualizar_ultimo_acceso': rpc_actualizar_ultimo_acceso,
+    'kanban_oportunidades': rpc_kanban_oportunidades,
+    'registrar_actividad': rpc_registrar_actividad,
+}
+
+
+# ============================================
+# SERVIDOR ASGI
+# ============================================
+
+class FakePostgrest:
+    """
+    App ASGI que imita /rest/v1 de Supabase sobre un TableStore
+
+    latency/jitter (segundos) se inyectan en cada petición, con un RNG con
+    semilla para que las corridas sean reproducibles.
+    """
+
+    def __init__(
+        self,
+        store: Optional[TableStore] = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        seed: int = 0
+    ):
+        self.store = store or TableStore(seed=seed)
+        self.latency = latency
+        self.jitter = jitter
+        self.rpcs: Dict[str, Callable] = dict(DEFAULT_RPCS)
+        self.calls: Counter = Counter()
+        self._rng = random.Random(seed)
+        self.app = Starlette(routes=[
+            Route('/rest/v1/rpc/{function}', self._rpc, methods=['POST']),
+            Route('/rest/v1/{table}', self._table,
+                  methods=['GET', 'HEAD', 'POST', 'PATCH', 'DELETE']),
+        ])
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+    def transport(self) -> httpx.ASGITransport:
+        return httpx.ASGITransport(app=self)
+
+    async def install(self, *clients):
+        """Redirige los clientes compartidos (por defecto ambos) a este servidor"""
+        if not clients:
+            from supabase_rest import supabase_rest, supabase_rest_admin
+            clients = (supabase_rest, supabase_rest_admin)
+        # Los datos cacheados en el proceso son de otro store
+        from pipeline_stats import pipeline_stats
+        from user_cache import user_cache
+        user_cache.clear()
+        pipeline_stats.reset()
+        for rest in clients:
+            await rest.configure(base_url=FAKE_BASE_URL, transport=self.transport())
+
+    def reset_calls(self):
+        self.calls.clear()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    async def _delay(self):
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _prefer(request: Request) -> Dict[str, str]:
+        prefs = {}
+        for item in request.headers.get('prefer', '').split(','):
+            key, _, value = item.strip().partition('=')
+            if key:
+                prefs[key] = value
+        return prefs
+
+    @staticmethod
+    def _json(data, status: int = 200, headers: Optional[dict] = None) -> Response:
+        return Response(
+            json.dumps(data, default=str),
+            status_code=status,
+            media_type='application/json',
+            headers=headers
+        )
+
+    async def _body(self, request: Request):
+        raw = await request.body()
+        return json.loads(raw) if raw else {}
+
+    async def _table(self, request: Request) -> Response:
+        name = request.path_params['table']
+        self.calls[(request.method, name)] += 1
+        await self._delay()
+        try:
+            handler = {
+                'GET': self._select, 'HEAD': self._select,
+                'POST': self._insert, 'PATCH': self._update, 'DELETE': self._delete,
+            }[request.method]
+            return await handler(request, name)
+        except PostgrestError as e:
+            return self._json(e.body, e.status)
+
+    async def _rpc(self, request: Request) -> Response:
+        function = request.path_params['function']
+        self.calls[('POST', f'rpc/{function}')] += 1
+        await self._delay()
+        if function not in self.rpcs:
+            return self._json(
+                {'code': 'PGRST202', 'message': f'Could not find the function public.{function}'},
+                404
+            )
+        try:
+            result = self.rpcs[function](self.store, **(await self._body(request)))
+        except PostgrestError as e:
+            return self._json(e.body, e.status)
+        if result is None:
+            return Response(status_code=204)
+        return self._json(result)
+
+    async def _select(self, request: Request, name: str) -> Response:
+        params = list(request.query_params.multi_items())
+        query = dict(params)
+        rows = [r for r in self.store.table(name) if build_predicate(params)(r)]
+        rows = apply_order(rows, query.get('order'))
+        total = len(rows)
+
+        offset = int(query.get('offset', 0))
+        limit = query.get('limit')
+        page = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+
+        select = query.get('select')
+        if select and select.strip() == 'count':
+            body = [{'count': total}]
+        else:
+            body = apply_select(page, select)
+
+        exact = self._prefer(request).get('count') == 'exact'
+        if page:
+            content_range = f'{offset}-{offset + len(page) - 1}/{total if exact else "*"}'
+        else:
+            content_range = f'*/{total if exact else "*"}'
+
+        if request.method == 'HEAD':
+            return Response(status_code=200, headers={'Content-Range': content_range})
+        return self._json(body, 200, headers={'Content-Range': content_range})
+
+    async def _insert(self, request: Request, name: str) -> Response:
+        body = await self._body(request)
+        rows = body if isinstance(body, list) else [body]
+        prefer = self._prefer(request)
+        on_conflict = request.query_params.get('on_conflict')
+        inserted = self.store.insert(
+            name,
+            rows,
+            resolution=prefer.get('resolution'),
+            on_conflict=tuple(c.strip() for c in on_conflict.split(',')) if on_conflict else None
+        )
+        if prefer.get('return') == 'representation':
+            select = request.query_params.get('select')
+            return self._json(apply_select(copy.deepcopy(inserted), select), 201)
+        return Response(status_code=201)
+
+    async def _update(self, request: Request, name: str) -> Response:
+        data = await self._body(request)
+        predicate = build_predicate(list(request.query_params.multi_items()))
+        updated = []
+        for row in self.store.table(name):
+            if predicate(row):
+                row.update(copy.deepcopy(data))
+                updated.append(row)
+        if self._prefer(request).get('return') == 'representation':
+            return self._json(copy.deepcopy(updated), 200)
+        return Response(status_code=204)
+
+    async def _delete(self, request: Request, name: str) -> Response:
+        predicate = build_predicate(list(request.query_params.multi_items()))
+        table = self.store.table(name)
+        deleted = [r for r in table if predicate(r)]
+        table[:] = [r for r in table if not predicate(r)]
+        if self._prefer(request).get('return') == 'representation':
+            return self._json(deleted, 200)
+        return Response(status_code=204)
+
+
+# ============================================
+# DATOS DE PRUEBA
+# ============================================
+
+TIPOS_RECURSO = ['guia', 'template', 'video', 'articulo', 'herramienta', 'caso_estudio']
+CATEGORIAS_RECURSO = ['diagnostico', 'materialidad', 'riesgos', 'medicion', 'reporte', 'general']
+ETAPAS = ['nuevo_lead', 'calificado', 'contacto_inicial', 'diagnostico_profundo',
+          'consultoria_activa', 'preparando_solucion', 'negociacion']
+PRIORIDADES = ['A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3']
+
+
+def seed_demo_data(
+    store: TableStore,
+    usuarios: int = 50,
+    recursos: int = 40,
+    oportunidades: int = 200,
+    notificaciones_por_usuario: int = 10,
+    seed: int = 0,
+    password_hash: Optional[str] = None
+) -> Dict[str, List[dict]]:
+    """
+    Puebla el store con datos deterministas parecidos a producción
+
+    Todos los usuarios comparten password_hash (por defecto el de 'password123')
+    para que el benchmark pueda hacer login con cualquiera de ellos.
+    """
+    rng = random.Random(seed)
+    if password_hash is None:
+        import hashlib
+        password_hash = hashlib.sha256(b'password123').hexdigest()
+
+    base = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def fecha(dias: int) -> str:
+        return (base + timedelta(days=rng.uniform(0, dias))).isoformat()
+
+    users = store.seed('users', [{
+        'email': 'admin@clarisa.com' if i == 0 else f'usuario{i}@test.com',
+        'password_hash': password_hash,
+        'nombre_completo': f'Usuario {i}',
+        'organizacion': f'Organización {i % 17}',
+        'rol': 'admin' if i == 0 else rng.choice(['cliente_gratuito', 'cliente_pagado']),
+        'plan_actual': rng.choice(['gratuito', 'basico', 'pro']),
+        'pais': rng.choice(['Costa Rica', 'México', 'Colombia', 'Chile', 'Perú']),
+        'fecha_registro': fecha(300),
+        'ultimo_acceso': fecha(300),
+        'created_at': fecha(300),
+    } for i in range(usuarios)])
+
+    store.seed('progreso_usuario', [{'user_id': u['id']} for u in users])
+
+    recursos_rows = store.seed('recursos', [{
+        'titulo': f'Recurso {i}: guía NIIF S{1 + i % 2}',
+        'descripcion': 'Material de apoyo para la implementación de NIIF S1/S2. ' * 3,
+        'tipo': rng.choice(TIPOS_RECURSO),
+        'categoria': rng.choice(CATEGORIAS_RECURSO),
+        'contenido': 'Lorem ipsum ' * 200,
+        'nivel_dificultad': rng.choice(['basico', 'intermedio', 'avanzado']),
+        'tags': ['niif', 's1' if i % 2 else 's2'],
+        'acceso_requerido': rng.choice(['gratuito', 'gratuito', 'pagado', 'todos']),
+        'fase_relacionada': rng.randint(1, 5),
+        'vistas': rng.randint(0, 500),
+        'descargas': rng.randint(0, 200),
+        'publicado': rng.random() > 0.1,
+        'destacado': rng.random() > 0.8,
+        'created_at': fecha(300),
+    } for i in range(recursos)])
+
+    for u in users:
+        muestra = rng.sample(recursos_rows, k=min(len(recursos_rows), rng.randint(0, 8)))
+        store.seed('recursos_usuario', [{
+            'user_id': u['id'], 'recurso_id': r['id'],
+            'visto': True, 'completado': rng.random() > 0.5, 'descargado': rng.random() > 0.7
+        } for r in muestra])
+        store.seed('recursos_favoritos', [{
+            'user_id': u['id'], 'recurso_id': r['id'], 'created_at': fecha(300)
+        } for r in muestra[:rng.randint(0, 5)]])
+        store.seed('notificaciones', [{
+            'user_id': u['id'],
+            'tipo': rng.choice(['nuevo_recurso', 'recordatorio', 'sistema']),
+            'titulo': f'Notificación {n}',
+            'mensaje': 'Tienes novedades en tu plan de implementación.',
+            'leida': rng.random() > 0.4,
+            'created_at': fecha(300),
+        } for n in range(notificaciones_por_usuario)])
+        tickets = store.seed('tickets_soporte', [{
+            'user_id': u['id'],
+            'asunto': f'Consulta {n}',
+            'categoria': rng.choice(['tecnico', 'facturacion', 'contenido', 'general']),
+            'descripcion': 'Necesito ayuda con la plataforma.',
+            'created_at': fecha(300),
+        } for n in range(rng.randint(0, 3))])
+        for t in tickets:
+            store.seed('tickets_mensajes', [{
+                'ticket_id': t['id'], 'user_id': u['id'], 'mensaje': f'Mensaje {m}',
+                'created_at': fecha(300)
+            } for m in range(rng.randint(1, 4))])
+
+    categorias = store.seed('faq_categorias', [{
+        'nombre': nombre, 'orden': i
+    } for i, nombre in enumerate(['General', 'NIIF S1', 'NIIF S2', 'Plataforma', 'Facturación'])])
+    for c in categorias:
+        store.seed('faqs', [{
+            'categoria_id': c['id'],
+            'pregunta': f'¿Pregunta {n} sobre {c["nombre"]}?',
+            'respuesta': 'Respuesta detallada. ' * 10,
+            'orden': n,
+        } for n in range(rng.randint(3, 8))])
+
+    oportunidades_rows = []
+    for i in range(oportunidades):
+        u = users[1 + i % max(1, usuarios - 1)] if usuarios > 1 else users[0]
+        urg, mad, cap = rng.randint(0, 100), rng.randint(0, 100), rng.randint(0, 100)
+        oportunidades_rows.append({
+            'user_id': u['id'],
+            'nombre_cliente': u['nombre_completo'],
+            'email_cliente': u['email'],
+            'organizacion': u['organizacion'],
+            'arquetipo_niif': rng.choice(PRIORIDADES),
+            'prioridad': rng.choice(PRIORIDADES),
+            'scoring_urgencia': urg,
+            'scoring_madurez': mad,
+            'scoring_capacidad': cap,
+            'scoring_total': (urg + mad + cap) // 3,
+            'etapa_pipeline': rng.choice(ETAPAS),
+            'valor_estimado_usd': float(rng.choice([1500, 3000, 5000, 7500, 10000, 15000, 25000, 35000, 50000])),
+            'probabilidad_cierre': rng.randint(5, 95),
+            'estado': rng.choice(['activo', 'activo', 'activo', 'ganado', 'perdido', 'nutricion']),
+            'notas': 'Notas de seguimiento comercial. ' * 20,
+            'fecha_creacion': fecha(300),
+        })
+    opps = store.seed('oportunidades', oportunidades_rows)
+    for o in opps:
+        store.seed('actividades', [{
+            'oportunidad_id': o['id'], 'creado_por': users[0]['id'],
+            'tipo': rng.choice(['llamada', 'email', 'reunion', 'tarea', 'nota', 'whatsapp']),
+            'titulo': f'Actividad {n}', 'created_at': fecha(300)
+        } for n in range(rng.randint(0, 4))])
+
+    return {'users': users, 'recursos': recursos_rows, 'oportunidades': opps}
+
+
+if __name__ == '__main__':
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Servidor PostgREST falso en memoria')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=54321)
+    parser.add_argument('--latency', type=float, default=0.0, help='latencia inyectada (s)')
+    parser.add_argument('--jitter', type=float, default=0.0, help='latencia extra aleatoria (s)')
+    parser.add_argument('--seed', action='store_true', help='poblar con datos de demo')
+    args = parser.parse_args()
+
+    fake = FakePostgrest(latency=args.latency, jitter=args.jitter)
+    if args.seed:
+        seed_demo_data(fake.store)
+    print(f"SUPABASE_URL=http://{args.host}:{args.port}")
+    uvicorn.run(fake, host=args.host, port=args.port, log_level='warning')
@@ -4,15 +4,12 @@ Permite a los usuarios guardar y gestionar sus recursos favoritos
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import requests
-import os
 from datetime import datetime
+from supabase_rest import supabase_rest
+from dataloader import load_many
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-
 
 class AgregarFavorito(BaseModel):
     user_id: str
@@ -28,13 +25,9 @@ async def obtener_favoritos(user_id: str):
         print(f"[FAVORITOS] Obteniendo favoritos para user_id: {user_id}")
         
         # Obtener IDs de recursos favoritos
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos_favoritos?user_id=eq.{user_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'recursos_favoritos',
+            params={'user_id': f'eq.{user_id}'}
         )
         
         print(f"[FAVORITOS] Status de recursos_favoritos: {response.status_code}")
@@ -54,43 +47,16 @@ async def obtener_favoritos(user_id: str):
             recurso_ids = [f.get('recurso_id') for f in favoritos]
             print(f"[FAVORITOS] IDs de recursos a buscar: {recurso_ids}")
             
-            # Obtener recursos uno por uno para asegurar compatibilidad
-            print(f"[FAVORITOS] Iniciando búsqueda de {len(recurso_ids)} recursos")
-            recursos = []
-            for i, recurso_id in enumerate(recurso_ids):
-                try:
-                    print(f"[FAVORITOS] Buscando recurso {i+1}/{len(recurso_ids)}: {recurso_id}")
-                    url = f"{SUPABASE_URL}/rest/v1/recursos?id=eq.{recurso_id}"
-                    print(f"[FAVORITOS] URL: {url}")
-                    
-                    recursos_response = requests.get(
-                        url,
-                        headers={
-                            'apikey': SUPABASE_KEY,
-                            'Authorization': f'Bearer {SUPABASE_KEY}'
-                        },
-                        timeout=10
-                    )
-                    
-                    print(f"[FAVORITOS] Status para {recurso_id}: {recursos_response.status_code}")
-                    
-                    if recursos_response.status_code == 200:
-                        found = recursos_response.json()
-                        print(f"[FAVORITOS] Datos recibidos: {found}")
-                        if found:
-                            recursos.extend(found)
-                            print(f"[FAVORITOS] Recurso agregado, total ahora: {len(recursos)}")
-                except Exception as e:
-                    print(f"[FAVORITOS] ERROR buscando recurso {recurso_id}: {str(e)}")
-                    import traceback
-                    print(f"[FAVORITOS] Traceback: {traceback.format_exc()}")
+            # Obtener todos los recursos en una sola consulta
+            recursos = [r for r in await load_many('recursos', recurso_ids) if r]
             
             print(f"[FAVORITOS] Total recursos encontrados: {len(recursos)}")
             
             # Combinar datos
+            recursos_por_id = {r['id']: r for r in recursos}
             favoritos_completos = []
             for fav in favoritos:
-                recurso = next((r for r in recursos if r['id'] == fav['recurso_id']), None)
+                recurso = recursos_por_id.get(fav['recurso_id'])
                 if recurso:
                     favoritos_completos.append({
                         'favorito_id': fav.get('id'),
@@ -129,13 +95,9 @@ async def agregar_favorito(datos: AgregarFavorito):
         
         # Verificar si ya está en favoritos
         try:
-            check_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/recursos_favoritos?user_id=eq.{datos.user_id}&recurso_id=eq.{datos.recurso_id}",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}'
-                },
-                timeout=10
+            check_response = await supabase_rest.get(
+                'recursos_favoritos',
+                params={'user_id': f'eq.{datos.user_id}', 'recurso_id': f'eq.{datos.recurso_id}'}
             )
             
             print(f"[FAVORITOS POST] Check existing status: {check_response.status_code}")
@@ -162,16 +124,10 @@ async def agregar_favorito(datos: AgregarFavorito):
         print(f"[FAVORITOS POST] Datos a insertar: {favorito_data}")
         
         try:
-            response = requests.post(
-                f"{SUPABASE_URL}/rest/v1/recursos_favoritos",
-                headers={
-                    'Content-Type': 'application/json',
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'return=representation'
-                },
+            response = await supabase_rest.post(
+                'recursos_favoritos',
                 json=favorito_data,
-                timeout=10
+                headers={'Prefer': 'return=representation'}
             )
             
             print(f"[FAVORITOS POST] Insert status: {response.status_code}")
@@ -208,13 +164,9 @@ async def quitar_favorito(user_id: str, recurso_id: str):
     Quita un recurso de favoritos
     """
     try:
-        response = requests.delete(
-            f"{SUPABASE_URL}/rest/v1/recursos_favoritos?user_id=eq.{user_id}&recurso_id=eq.{recurso_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response = await supabase_rest.delete(
+            'recursos_favoritos',
+            params={'user_id': f'eq.{user_id}', 'recurso_id': f'eq.{recurso_id}'}
         )
         
         if response.status_code in [200, 204]:
@@ -244,13 +196,9 @@ async def verificar_favorito(user_id: str, recurso_id: str):
     Verifica si un recurso está en favoritos
     """
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos_favoritos?user_id=eq.{user_id}&recurso_id=eq.{recurso_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'recursos_favoritos',
+            params={'user_id': f'eq.{user_id}', 'recurso_id': f'eq.{recurso_id}'}
         )
         
         if response.status_code == 200:
@@ -4,16 +4,12 @@ Gestiona logros, badges y puntos de los usuarios
 """
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-import requests
-import os
 from datetime import datetime
 from typing import List, Optional
+from supabase_rest import supabase_rest
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-
 
 class OtorgarLogro(BaseModel):
     user_id: str
@@ -95,13 +91,9 @@ async def obtener_logros_usuario(user_id: str):
     Obtiene los logros obtenidos por un usuario específico
     """
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/user_logros?user_id=eq.{user_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'user_logros',
+            params={'user_id': f'eq.{user_id}'}
         )
         
         if response.status_code == 200:
@@ -157,13 +149,9 @@ async def otorgar_logro(user_id: str, datos: OtorgarLogro):
         
         # Verificar si ya tiene el logro
         try:
-            check_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/user_logros?user_id=eq.{user_id}&logro_codigo=eq.{logro_codigo}",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}'
-                },
-                timeout=10
+            check_response = await supabase_rest.get(
+                'user_logros',
+                params={'user_id': f'eq.{user_id}', 'logro_codigo': f'eq.{logro_codigo}'}
             )
             
             if check_response.status_code == 200:
@@ -184,16 +172,10 @@ async def otorgar_logro(user_id: str, datos: OtorgarLogro):
         }
         
         try:
-            response = requests.post(
-                f"{SUPABASE_URL}/rest/v1/user_logros",
-                headers={
-                    'Content-Type': 'application/json',
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'return=representation'
-                },
+            response = await supabase_rest.post(
+                'user_logros',
                 json=logro_data,
-                timeout=10
+                headers={'Prefer': 'return=representation'}
             )
             
             if response.status_code == 201:
@@ -243,13 +225,9 @@ async def obtener_estadisticas_usuario(user_id: str):
         
         # Obtener logros
         try:
-            logros_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/user_logros?user_id=eq.{user_id}",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}'
-                },
-                timeout=10
+            logros_response = await supabase_rest.get(
+                'user_logros',
+                params={'user_id': f'eq.{user_id}'}
             )
             
             if logros_response.status_code == 200:
@@ -286,14 +264,10 @@ async def obtener_estadisticas_usuario(user_id: str):
         
         # Obtener recursos favoritos
         try:
-            favoritos_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/recursos_favoritos?user_id=eq.{user_id}&select=count",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'count=exact'
-                },
-                timeout=10
+            favoritos_response = await supabase_rest.get(
+                'recursos_favoritos',
+                params={'user_id': f'eq.{user_id}', 'select': 'count'},
+                headers={'Prefer': 'count=exact'}
             )
             
             if favoritos_response.status_code == 200:
@@ -304,14 +278,10 @@ async def obtener_estadisticas_usuario(user_id: str):
         
         # Obtener tickets
         try:
-            tickets_response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/tickets?user_id=eq.{user_id}&select=count",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'count=exact'
-                },
-                timeout=10
+            tickets_response = await supabase_rest.get(
+                'tickets',
+                params={'user_id': f'eq.{user_id}', 'select': 'count'},
+                headers={'Prefer': 'count=exact'}
             )
             
             if tickets_response.status_code == 200:
@@ -0,0 +1,150 @@
+"""
+Idempotencia del envío de diagnósticos
+Un doble clic o un reintento del navegador repetía el insert en Mongo y la
+oportunidad de venta. Cada envío se identifica por:
+- la cabecera Idempotency-Key (por email), o
+- si no viene, un hash de email + respuestas dentro de IDEMPOTENCY_WINDOW_SECONDS.
+
+La clave se reserva con un insert en diagnostico_idempotencia (_id = clave,
+índice TTL sobre `expira`). Quien la reserva procesa el diagnóstico y guarda
+la respuesta; los repetidos devuelven esa misma respuesta sin escribir nada.
+Una reserva en_proceso con más de IDEMPOTENCY_LEASE_SECONDS se da por
+abandonada (el proceso murió a mitad) y la toma el siguiente reintento.
+Con Idempotency-Key se guarda además la huella de las respuestas: la misma
+clave con otro contenido es un error del cliente (422), no un repetido.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_WINDOW_SECONDS = float(os.environ.get('IDEMPOTENCY_WINDOW_SECONDS', '600'))
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.environ.get('IDEMPOTENCY_KEY_TTL_SECONDS', '86400'))
+# Cuánto espera un repetido a que termine el envío original antes de responder 409
+IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', '5'))
+# Tiempo máximo de un envío en curso; pasado esto su reserva se puede tomar
+IDEMPOTENCY_LEASE_SECONDS = float(os.environ.get('IDEMPOTENCY_LEASE_SECONDS', '60'))
+
+EN_PROCESO, COMPLETADO = 'en_proceso', 'completado'
+
+
+class EnvioEnProceso(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=409,
+            detail="Este diagnóstico ya se está procesando",
+            headers={'Retry-After': '2'}
+        )
+
+
+class ClaveReutilizada(HTTPException):
+    def __init__(self):
+        super().__init__(
+            status_code=422,
+            detail="La Idempotency-Key ya se usó con un diagnóstico distinto"
+        )
+
+
+def clave_por_cabecera(email: str, idempotency_key: str) -> str:
+    return 'key:' + hashlib.sha256(f'{email.lower()}\n{idempotency_key}'.encode()).hexdigest()
+
+
+def clave_por_contenido(email: str, respuestas: dict) -> str:
+    return 'hash:' + hashlib.sha256(f'{email.lower()}\n{_serializar(respuestas)}'.encode()).hexdigest()
+
+
+def huella_por_contenido(respuestas: dict) -> str:
+    """Hash de las respuestas que se guarda junto a una Idempotency-Key"""
+    return hashlib.sha256(_serializar(respuestas).encode()).hexdigest()
+
+
+def _serializar(respuestas: dict) -> str:
+    return json.dumps(respuestas, sort_keys=True, ensure_ascii=False, default=str)
+
+
+class IdempotencyStore:
+    def __init__(self, get_db: Callable):
+        # get_db y no db: el benchmark y los scripts reemplazan server.db
+        self.get_db = get_db
+
+    @property
+    def coleccion(self):
+        return self.get_db().diagnostico_idempotencia
+
+    async def ensure_indexes(self):
+        await self.coleccion.create_index('expira', expireAfterSeconds=0)
+
+    async def reservar(
+        self,
+        clave: str,
+        diagnostico_id: str,
+        ttl_seconds: float,
+        huella: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        None si la clave quedó reservada para este envío; si no, la respuesta
+        original. Si el original sigue en curso tras IDEMPOTENCY_WAIT_SECONDS: 409.
+        Si la clave se reservó con otra huella: 422
+        """
+        ahora = datetime.now(timezone.utc)
+        try:
+            await self.coleccion.insert_one({
+                '_id': clave,
+                'estado': EN_PROCESO,
+                'diagnostico_id': diagnostico_id,
+                'huella': huella,
+                'respuesta': None,
+                'created_at': ahora,
+                'expira': ahora + timedelta(seconds=ttl_seconds),
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        espera, limite = 0.05, asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+        while True:
+            ahora = datetime.now(timezone.utc)
+            existente = await self.coleccion.find_one({'_id': clave})
+            if existente is not None and existente['expira'].replace(tzinfo=timezone.utc) <= ahora:
+                # Vencida pero el monitor TTL de Mongo (cada ~60 s) aún no la borró
+                await self.coleccion.delete_one({'_id': clave, 'expira': existente['expira']})
+                existente = None
+            if existente is None:
+                # El envío original falló y liberó la clave (o venció): este lo procesa
+                return await self.reservar(clave, diagnostico_id, ttl_seconds, huella)
+            if huella is not None and existente.get('huella') not in (None, huella):
+                raise ClaveReutilizada()
+            if existente['estado'] == COMPLETADO:
+                return existente['respuesta']
+            inicio = existente['created_at'].replace(tzinfo=timezone.utc)
+            if inicio + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS) <= ahora:
+                # Reserva abandonada: se toma solo si nadie la tomó antes (compare-and-set)
+                tomada = await self.coleccion.update_one(
+                    {'_id': clave, 'estado': EN_PROCESO, 'created_at': existente['created_at']},
+                    {'$set': {'diagnostico_id': diagnostico_id, 'huella': huella, 'created_at': ahora}}
+                )
+                if tomada.modified_count:
+                    return None
+                continue
+            if asyncio.get_running_loop().time() >= limite:
+                raise EnvioEnProceso()
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, 0.5)
+
+    async def completar(self, clave: str, respuesta: dict):
+        await self.coleccion.update_one({'_id': clave}, {'$set': {'estado': COMPLETADO, 'respuesta': respuesta}})
+
+    async def liberar(self, clave: str):
+        """El envío falló: se borra la reserva para que un reintento lo procese"""
+        try:
+            await self.coleccion.delete_one({'_id': clave, 'estado': EN_PROCESO})
+        except Exception as e:
+            logger.error(f"Error liberando clave de idempotencia: {e}")
@@ -0,0 +1,42 @@
+"""
+Cursores opacos para paginación keyset
+El cursor guarda la clave de orden de la última fila entregada (p. ej.
+timestamp e id) en base64 url-safe; el cliente lo devuelve tal cual para pedir
+la página siguiente. A diferencia de offset, el costo no crece con la página.
+
+El cursor viene del cliente: si sus valores se interpolan en un filtro de
+PostgREST (or=(...)) hay que decodificarlo con decode_fecha_id_cursor, que
+solo deja pasar una fecha ISO y un UUID.
+"""
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Tuple
+
+from fastapi import HTTPException
+
+
+def encode_cursor(*values) -> str:
+    raw = json.dumps(list(values), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, size: int = 2) -> list:
+    """Valores de la clave de orden; 400 si el cursor no es uno de los nuestros"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(v, str) for v in values):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return values
+
+
+def decode_fecha_id_cursor(cursor: str) -> Tuple[str, str]:
+    """(fecha, id) validados y re-serializados; 400 si no son una fecha ISO y un UUID"""
+    fecha, fila_id = decode_cursor(cursor)
+    try:
+        return datetime.fromisoformat(fecha).isoformat(), str(uuid.UUID(fila_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
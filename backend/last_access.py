@@ -0,0 +1,124 @@
+"""
+Write-behind de ultimo_acceso
+El login ya no espera un PATCH a Supabase: el acceso se anota en memoria y se
+escribe en lote (una sola llamada a rpc/actualizar_ultimo_acceso) cada
+LAST_ACCESS_FLUSH_SECONDS o al juntar LAST_ACCESS_FLUSH_SIZE usuarios. El único
+consumidor es el conteo de usuarios activos del mes, que tolera segundos de atraso.
+
+Si la función no existe en la base (supabase_schema.sql sin aplicar) se usa un
+PATCH id=in.(...) con el acceso más reciente del lote.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Dict, Optional
+
+from metrics import last_access_flushes_total, last_access_pending, last_access_written_total
+from supabase_rest import SupabaseRestClient, supabase_rest_admin
+
+logger = logging.getLogger(__name__)
+
+LAST_ACCESS_FLUSH_SECONDS = float(os.environ.get('LAST_ACCESS_FLUSH_SECONDS', '10'))
+LAST_ACCESS_FLUSH_SIZE = int(os.environ.get('LAST_ACCESS_FLUSH_SIZE', '500'))
+# Máximo de ids por PATCH id=in.(...) en el modo de respaldo
+FALLBACK_BATCH_SIZE = 100
+
+
+class LastAccessBuffer:
+    def __init__(self, rest: SupabaseRestClient, flush_seconds: float = LAST_ACCESS_FLUSH_SECONDS,
+                 flush_size: int = LAST_ACCESS_FLUSH_SIZE):
+        self.rest = rest
+        self.flush_seconds = flush_seconds
+        self.flush_size = flush_size
+        # user_id -> último acceso (ISO); un usuario que entra varias veces ocupa una sola entrada
+        self._pending: Dict[str, str] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._rpc_available = True
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def record(self, user_id: str, ultimo_acceso: str):
+        self._pending[str(user_id)] = max(self._pending.get(str(user_id), ultimo_acceso), ultimo_acceso)
+        last_access_pending.set(len(self._pending))
+        self._ensure_task()
+        if len(self._pending) >= self.flush_size:
+            self._wakeup.set()
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            # Contexto vacío: la tarea no debe heredar los loaders ni las métricas de la petición
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Escribe lo pendiente; si falla o se cancela se conserva para el próximo intento"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self._write(batch)
+            last_access_flushes_total.labels('ok').inc()
+            last_access_written_total.inc(len(batch))
+        except asyncio.CancelledError:
+            # stop() cancela la tarea a mitad de escritura: el lote vuelve a pendientes
+            self._restore(batch)
+            raise
+        except Exception as e:
+            logger.error(f"Error escribiendo ultimo_acceso de {len(batch)} usuarios: {e}")
+            last_access_flushes_total.labels('error').inc()
+            self._restore(batch)
+        last_access_pending.set(len(self._pending))
+
+    def _restore(self, batch: Dict[str, str]):
+        for user_id, ultimo in batch.items():
+            self._pending[user_id] = max(self._pending.get(user_id, ultimo), ultimo)
+        last_access_pending.set(len(self._pending))
+
+    async def _write(self, batch: Dict[str, str]):
+        if self._rpc_available:
+            response = await self.rest.post(
+                'rpc/actualizar_ultimo_acceso',
+                json={'accesos': [{'id': uid, 'ultimo_acceso': ts} for uid, ts in batch.items()]}
+            )
+            if response.status_code != 404:
+                response.raise_for_status()
+                return
+            logger.warning("rpc/actualizar_ultimo_acceso no existe; usando PATCH por lotes")
+            self._rpc_available = False
+
+        ids = list(batch)
+        for start in range(0, len(ids), FALLBACK_BATCH_SIZE):
+            chunk = ids[start:start + FALLBACK_BATCH_SIZE]
+            response = await self.rest.patch(
+                'users',
+                params={'id': f"in.({','.join(chunk)})"},
+                json={'ultimo_acceso': max(batch[uid] for uid in chunk)}
+            )
+            response.raise_for_status()
+
+    async def stop(self):
+        """Detiene el flush periódico y escribe lo pendiente (apagado del servidor)"""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        await self.flush()
+
+
+last_access_buffer = LastAccessBuffer(supabase_rest_admin)
@@ -0,0 +1,330 @@
+"""
+Métricas Prometheus del backend
+Middleware ASGI que mide cada petición por ruta (duración, CPU del handler) y
+hook para el cliente REST que acumula las llamadas a Supabase hechas durante
+esa petición (cantidad, tiempo, bytes). Se exponen en /metrics.
+
+La cabecera X-Upstream-Calls de cada respuesta indica cuántas llamadas a
+Supabase hizo la petición (útil para depurar N+1 desde el navegador).
+"""
+import contextvars
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+UPSTREAM_HEADER = 'X-Upstream-Calls'
+UPSTREAM_TIME_HEADER = 'X-Upstream-Time-Ms'
+
+# Buckets de latencia en segundos (5ms - 10s)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 10.0)
+CALLS_BUCKETS = (0, 1, 2, 3, 4, 5, 8, 10, 15, 20, 30, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+http_requests_total = Counter(
+    'clarisa_http_requests_total',
+    'Peticiones HTTP atendidas',
+    ['method', 'route', 'status']
+)
+http_request_duration = Histogram(
+    'clarisa_http_request_duration_seconds',
+    'Duración total de la petición',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS
+)
+handler_cpu = Histogram(
+    'clarisa_http_handler_cpu_seconds',
+    'CPU del handler: solo los tramos síncronos de la petición entre awaits (sin otras peticiones del loop)',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS
+)
+request_upstream_calls = Histogram(
+    'clarisa_http_request_upstream_calls',
+    'Llamadas a Supabase por petición',
+    ['method', 'route'],
+    buckets=CALLS_BUCKETS
+)
+request_upstream_time = Histogram(
+    'clarisa_http_request_upstream_seconds',
+    'Tiempo acumulado esperando a Supabase por petición',
+    ['method', 'route'],
+    buckets=LATENCY_BUCKETS
+)
+upstream_requests_total = Counter(
+    'clarisa_upstream_requests_total',
+    'Llamadas a Supabase',
+    ['route', 'table', 'method', 'status']
+)
+upstream_duration = Histogram(
+    'clarisa_upstream_duration_seconds',
+    'Duración de cada llamada a Supabase',
+    ['table', 'method'],
+    buckets=LATENCY_BUCKETS
+)
+upstream_sent_bytes = Counter(
+    'clarisa_upstream_sent_bytes_total',
+    'Bytes enviados a Supabase',
+    ['route']
+)
+upstream_received_bytes = Counter(
+    'clarisa_upstream_received_bytes_total',
+    'Bytes recibidos de Supabase',
+    ['route']
+)
+upstream_response_size = Histogram(
+    'clarisa_upstream_response_bytes',
+    'Tamaño de cada respuesta de Supabase',
+    ['table'],
+    buckets=BYTES_BUCKETS
+)
+upstream_coalesced_total = Counter(
+    'clarisa_upstream_coalesced_total',
+    'Llamadas a Supabase ahorradas por singleflight (compartieron una llamada en vuelo)',
+    ['route', 'table']
+)
+breaker_state = Gauge(
+    'clarisa_upstream_breaker_state',
+    'Estado del circuit breaker por tabla (0 cerrado, 1 semiabierto, 2 abierto)',
+    ['table']
+)
+breaker_rejections_total = Counter(
+    'clarisa_upstream_breaker_rejections_total',
+    'Llamadas rechazadas sin ir a Supabase porque el circuito estaba abierto',
+    ['table']
+)
+upstream_retries_total = Counter(
+    'clarisa_upstream_retries_total',
+    'Reintentos de lecturas a Supabase',
+    ['table']
+)
+upstream_timeout_seconds = Gauge(
+    'clarisa_upstream_timeout_seconds',
+    'Timeout adaptativo vigente por tabla',
+    ['table']
+)
+bulkhead_in_flight = Gauge(
+    'clarisa_bulkhead_in_flight',
+    'Operaciones en curso por dependencia',
+    ['dependency']
+)
+bulkhead_queued = Gauge(
+    'clarisa_bulkhead_queued',
+    'Operaciones esperando un cupo por dependencia',
+    ['dependency']
+)
+bulkhead_wait = Histogram(
+    'clarisa_bulkhead_wait_seconds',
+    'Espera en cola antes de obtener cupo',
+    ['dependency', 'priority'],
+    buckets=LATENCY_BUCKETS
+)
+bulkhead_rejected_total = Counter(
+    'clarisa_bulkhead_rejected_total',
+    'Operaciones descartadas (cola llena, desplazadas o espera agotada)',
+    ['dependency', 'priority', 'reason']
+)
+
+user_cache_requests_total = Counter(
+    'clarisa_user_cache_requests_total',
+    'Búsquedas en la caché de usuarios (hit, negative = email inexistente cacheado, miss)',
+    ['key', 'result']
+)
+user_cache_hit_ratio = Gauge(
+    'clarisa_user_cache_hit_ratio',
+    'Proporción de búsquedas de usuario resueltas sin ir a Supabase desde el arranque'
+)
+user_cache_size = Gauge(
+    'clarisa_user_cache_size',
+    'Usuarios en la caché'
+)
+last_access_pending = Gauge(
+    'clarisa_last_access_pending',
+    'Accesos de usuario en memoria pendientes de escribir'
+)
+last_access_flushes_total = Counter(
+    'clarisa_last_access_flushes_total',
+    'Escrituras en lote de ultimo_acceso',
+    ['result']
+)
+last_access_written_total = Counter(
+    'clarisa_last_access_written_total',
+    'Usuarios cuyo ultimo_acceso se escribió en lote'
+)
+rate_limited_total = Counter(
+    'clarisa_rate_limited_total',
+    'Peticiones rechazadas con 429 por el rate limiter',
+    ['rule', 'scope']
+)
+rate_limit_buckets = Gauge(
+    'clarisa_rate_limit_buckets',
+    'Token buckets activos en memoria'
+)
+outbox_steps_total = Counter(
+    'clarisa_outbox_steps_total',
+    'Pasos del outbox de diagnósticos ejecutados',
+    ['step', 'result']
+)
+outbox_lag = Histogram(
+    'clarisa_outbox_lag_seconds',
+    'Tiempo desde el envío del diagnóstico hasta completar sus efectos',
+    buckets=(0.1, 0.5, 1, 5, 30, 60, 300, 1800, 3600)
+)
+
+@dataclass
+class RequestStats:
+    scope: Optional[dict] = None
+    upstream_calls: int = 0
+    upstream_seconds: float = 0.0
+    sent_bytes: int = 0
+    received_bytes: int = 0
+    coalesced_calls: int = 0
+    cpu_seconds: float = 0.0
+
+    @property
+    def route(self) -> str:
+        return _route_label(self.scope) if self.scope is not None else 'unmatched'
+
+
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    'clarisa_request_stats', default=None
+)
+
+
+def current_request_stats() -> Optional[RequestStats]:
+    """Estadísticas de la petición en curso (None fuera de una petición HTTP)"""
+    return _request_stats.get()
+
+
+def table_label(path: str) -> str:
+    """'faqs?id=eq.1' -> 'faqs', 'rpc/registrar_accion_progreso' se mantiene"""
+    return path.split('?', 1)[0].strip('/') or '/'
+
+
+def observe_upstream(
+    path: str,
+    method: str,
+    status: str,
+    elapsed: float,
+    sent_bytes: int = 0,
+    received_bytes: int = 0
+):
+    """Registra una llamada a Supabase (la invoca SupabaseRestClient.request)"""
+    stats = _request_stats.get()
+    route = stats.route if stats else 'background'
+    table = table_label(path)
+
+    upstream_requests_total.labels(route, table, method, status).inc()
+    upstream_duration.labels(table, method).observe(elapsed)
+    upstream_sent_bytes.labels(route).inc(sent_bytes)
+    upstream_received_bytes.labels(route).inc(received_bytes)
+    upstream_response_size.labels(table).observe(received_bytes)
+
+    if stats is not None:
+        stats.upstream_calls += 1
+        stats.upstream_seconds += elapsed
+        stats.sent_bytes += sent_bytes
+        stats.received_bytes += received_bytes
+
+
+def observe_coalesced(path: str):
+    """Registra una llamada que reutilizó el resultado de otra idéntica en vuelo"""
+    stats = _request_stats.get()
+    route = stats.route if stats else 'background'
+    upstream_coalesced_total.labels(route, table_label(path)).inc()
+    if stats is not None:
+        stats.coalesced_calls += 1
+
+
+def _route_label(scope) -> str:
+    # FastAPI deja la ruta que hizo match en el scope; se usa la plantilla
+    # (/api/recursos/{recurso_id}) para no crear una serie por cada id
+    route = scope.get('route')
+    return getattr(route, 'path', None) or 'unmatched'
+
+
+class _CpuTimed:
+    """
+    Envuelve la corrutina de la petición y mide thread_time en cada paso
+    (send/throw), es decir, solo mientras corren sus tramos síncronos. Lo que
+    el loop ejecuta de otras peticiones entre un await y el siguiente no se
+    suma. Las tareas que la petición lanza aparte (create_task) no se cuentan.
+    """
+
+    def __init__(self, coro, stats: RequestStats):
+        self._coro = coro
+        self._stats = stats
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def send(self, value):
+        start = time.thread_time()
+        try:
+            return self._coro.send(value)
+        finally:
+            self._stats.cpu_seconds += time.thread_time() - start
+
+    def throw(self, *args):
+        start = time.thread_time()
+        try:
+            return self._coro.throw(*args)
+        finally:
+            self._stats.cpu_seconds += time.thread_time() - start
+
+    def close(self):
+        return self._coro.close()
+
+
+class MetricsMiddleware:
+    """Middleware ASGI puro (no BaseHTTPMiddleware) para no romper streaming"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] == '/metrics':
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope=scope)
+        token = _request_stats.set(stats)
+        status = {'code': 500}
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+                headers = list(message.get('headers', []))
+                headers.append((UPSTREAM_HEADER.lower().encode(), str(stats.upstream_calls).encode()))
+                headers.append((
+                    UPSTREAM_TIME_HEADER.lower().encode(),
+                    f'{stats.upstream_seconds * 1000:.1f}'.encode()
+                ))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await _CpuTimed(self.app(scope, receive, send_wrapper), stats)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+
+            method = scope['method']
+            route = stats.route
+            http_requests_total.labels(method, route, str(status['code'])).inc()
+            http_request_duration.labels(method, route).observe(elapsed)
+            handler_cpu.labels(method, route).observe(stats.cpu_seconds)
+            request_upstream_calls.labels(method, route).observe(stats.upstream_calls)
+            request_upstream_time.labels(method, route).observe(stats.upstream_seconds)
+
+
+def metrics_payload():
+    """(body, content_type) en formato de exposición de Prometheus"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -6,14 +6,10 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import os
-import requests
+from supabase_rest import supabase_request
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
-
 # ============================================
 # MODELOS
 # ============================================
@@ -28,34 +24,6 @@ class NotificacionResponse(BaseModel):
     created_at: str
     leida_at: Optional[str] = None
 
-# ============================================
-# UTILIDADES
-# ============================================
-
-def supabase_request(method: str, endpoint: str, data: dict = None, params: dict = None):
-    """Hace petición a Supabase REST API"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-        elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
-        
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error en petición Supabase: {e}")
-        return None
-
 # ============================================
 # ENDPOINTS
 # ============================================
@@ -77,7 +45,7 @@ async def obtener_notificaciones(
         if solo_no_leidas:
             params['leida'] = 'eq.false'
         
-        notificaciones = supabase_request('GET', 'notificaciones', params=params)
+        notificaciones = await supabase_request('GET', 'notificaciones', params=params)
         
         if notificaciones is None:
             raise HTTPException(status_code=500, detail="Error al obtener notificaciones")
@@ -95,7 +63,7 @@ async def obtener_notificaciones(
 async def marcar_notificacion_leida(notif_id: str, user_id: str):
     """Marca una notificación como leída"""
     try:
-        response = supabase_request(
+        response = await supabase_request(
             'PATCH',
             f'notificaciones?id=eq.{notif_id}&user_id=eq.{user_id}',
             data={'leida': True, 'leida_at': datetime.utcnow().isoformat()}
@@ -117,7 +85,7 @@ async def marcar_notificacion_leida(notif_id: str, user_id: str):
 async def marcar_todas_leidas(user_id: str):
     """Marca todas las notificaciones del usuario como leídas"""
     try:
-        response = supabase_request(
+        response = await supabase_request(
             'PATCH',
             f'notificaciones?user_id=eq.{user_id}&leida=eq.false',
             data={'leida': True, 'leida_at': datetime.utcnow().isoformat()}
@@ -135,10 +103,10 @@ async def obtener_stats_notificaciones(user_id: str):
     """Obtiene estadísticas de notificaciones del usuario"""
     try:
         # Total de notificaciones
-        todas = supabase_request('GET', 'notificaciones', params={'user_id': f'eq.{user_id}', 'select': 'id'})
+        todas = await supabase_request('GET', 'notificaciones', params={'user_id': f'eq.{user_id}', 'select': 'id'})
         
         # No leídas
-        no_leidas = supabase_request('GET', 'notificaciones', 
+        no_leidas = await supabase_request('GET', 'notificaciones', 
                                      params={'user_id': f'eq.{user_id}', 'leida': 'eq.false', 'select': 'id'})
         
         return {
@@ -170,7 +138,7 @@ async def crear_notificacion(
             'link': link
         }
         
-        response = supabase_request('POST', 'notificaciones', data=notif_data)
+        response = await supabase_request('POST', 'notificaciones', data=notif_data)
         
         if not response:
             raise HTTPException(status_code=500, detail="Error al crear notificación")
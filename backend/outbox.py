@@ -0,0 +1,298 @@
+"""
+Outbox de efectos secundarios del diagnóstico
+submit_diagnostico responde tras el insert en Mongo; la oportunidad de venta y
+el progreso (Fase 1) se anotan en la colección diagnostico_outbox y los ejecuta
+un worker en segundo plano del mismo proceso.
+
+- Una entrada por diagnóstico (_id = id del diagnóstico): encolar dos veces no
+  duplica nada.
+- Cada paso se marca hecho por separado, así un reintento no repite los que ya
+  salieron bien. La oportunidad además se busca por diagnostico_id antes de
+  recrearla cuando la entrada ya se tomó antes.
+- Reintentos con backoff exponencial (OUTBOX_RETRY_SECONDS, hasta
+  OUTBOX_MAX_ATTEMPTS); después la entrada queda 'fallido' y se ve en
+  GET /api/admin/outbox, desde donde se puede reintentar.
+- Una entrada 'procesando' cuyo lease venció (proceso reiniciado a mitad) se
+  vuelve a tomar.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from auth import get_user_by_id
+from metrics import outbox_lag, outbox_steps_total
+from progreso import registrar_diagnostico_completado
+from sales import crear_oportunidad_desde_diagnostico
+from supabase_rest import supabase_rest_admin
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_CONCURRENCY = int(os.environ.get('OUTBOX_CONCURRENCY', '4'))
+OUTBOX_POLL_SECONDS = float(os.environ.get('OUTBOX_POLL_SECONDS', '5'))
+OUTBOX_RETRY_SECONDS = float(os.environ.get('OUTBOX_RETRY_SECONDS', '5'))
+OUTBOX_MAX_RETRY_SECONDS = float(os.environ.get('OUTBOX_MAX_RETRY_SECONDS', '600'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS', '120'))
+
+PENDIENTE, PROCESANDO, HECHO, FALLIDO = 'pendiente', 'procesando', 'hecho', 'fallido'
+
+
+class PasoFallido(Exception):
+    pass
+
+
+# ============================================
+# PASOS
+# ============================================
+
+async def _paso_oportunidad(entrada: dict) -> str:
+    user = await get_user_by_id(entrada['user_id'])
+    if not user:
+        return 'omitido'
+    diagnostico = entrada['diagnostico']
+    if entrada['tomas'] > 1:
+        # Un intento anterior (o un proceso que murió a mitad) pudo crearla
+        response = await supabase_rest_admin.get(
+            'oportunidades', params={'diagnostico_id': f"eq.{diagnostico['id']}", 'select': 'id'}
+        )
+        if response.status_code == 200 and response.json():
+            return HECHO
+    oportunidad = await crear_oportunidad_desde_diagnostico(diagnostico, user)
+    if not oportunidad:
+        raise PasoFallido('no se pudo crear la oportunidad')
+    logger.info(f"Oportunidad creada automáticamente: {oportunidad['id']} para user: {entrada['user_id']}")
+    return HECHO
+
+
+async def _paso_progreso(entrada: dict) -> str:
+    if not await registrar_diagnostico_completado(entrada['user_id']):
+        raise PasoFallido('no se pudo registrar el progreso')
+    logger.info(f"Progreso registrado: Diagnóstico completado para user: {entrada['user_id']}")
+    return HECHO
+
+
+# En orden de ejecución
+PASOS: Dict[str, Callable[[dict], Awaitable[str]]] = {
+    'oportunidad': _paso_oportunidad,
+    'progreso': _paso_progreso,
+}
+
+
+def _ahora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _backoff(intentos: int) -> float:
+    return min(OUTBOX_MAX_RETRY_SECONDS, OUTBOX_RETRY_SECONDS * 2 ** (intentos - 1))
+
+
+# ============================================
+# OUTBOX
+# ============================================
+
+class DiagnosticoOutbox:
+    def __init__(self, get_db: Callable, concurrency: int = OUTBOX_CONCURRENCY,
+                 poll_seconds: float = OUTBOX_POLL_SECONDS):
+        # get_db y no db: el benchmark y los scripts reemplazan server.db
+        self.get_db = get_db
+        self.concurrency = concurrency
+        self.poll_seconds = poll_seconds
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._en_curso: set = set()
+        self._stopping = False
+
+    @property
+    def coleccion(self):
+        return self.get_db().diagnostico_outbox
+
+    async def enqueue(self, diagnostico: dict, user_id: str):
+        """Anota los efectos del diagnóstico; idempotente por id de diagnóstico"""
+        ahora = _ahora()
+        try:
+            await self.coleccion.insert_one({
+                '_id': diagnostico['id'],
+                'user_id': user_id,
+                'diagnostico': diagnostico,
+                'pasos': {paso: PENDIENTE for paso in PASOS},
+                'estado': PENDIENTE,
+                'intentos': 0,
+                'tomas': 0,
+                'ultimo_error': None,
+                'proximo_intento': ahora,
+                'lease_hasta': None,
+                'created_at': ahora,
+                'updated_at': ahora,
+            })
+        except DuplicateKeyError:
+            return
+        self._ensure_task()
+        self._wakeup.set()
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._wakeup = asyncio.Event()
+            # Contexto vacío: el worker no debe heredar los loaders ni las métricas de la petición
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def start(self):
+        """Arranque del servidor: índice de la cola y entradas que quedaron pendientes"""
+        await self.coleccion.create_index([('estado', 1), ('proximo_intento', 1)])
+        self._ensure_task()
+        self._wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            while len(self._en_curso) < self.concurrency:
+                entrada = await self._claim()
+                if entrada is None:
+                    break
+                tarea = asyncio.create_task(self._process(entrada))
+                self._en_curso.add(tarea)
+                tarea.add_done_callback(self._terminada)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _terminada(self, tarea: asyncio.Task):
+        self._en_curso.discard(tarea)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _claim(self) -> Optional[dict]:
+        ahora = _ahora()
+        try:
+            return await self.coleccion.find_one_and_update(
+                {'$or': [
+                    {'estado': PENDIENTE, 'proximo_intento': {'$lte': ahora}},
+                    {'estado': PROCESANDO, 'lease_hasta': {'$lte': ahora}},
+                ]},
+                {
+                    '$set': {
+                        'estado': PROCESANDO,
+                        'lease_hasta': ahora + timedelta(seconds=OUTBOX_LEASE_SECONDS),
+                        'updated_at': ahora,
+                    },
+                    '$inc': {'tomas': 1},
+                },
+                sort=[('proximo_intento', 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            logger.error(f"Error leyendo el outbox de diagnósticos: {e}")
+            return None
+
+    async def _process(self, entrada: dict):
+        pasos = dict(entrada['pasos'])
+        error = None
+        for paso, ejecutar in PASOS.items():
+            if pasos.get(paso) != PENDIENTE:
+                continue
+            try:
+                pasos[paso] = await ejecutar(entrada)
+                outbox_steps_total.labels(paso, pasos[paso]).inc()
+            except Exception as e:
+                error = f'{paso}: {e}'
+                outbox_steps_total.labels(paso, 'error').inc()
+                break
+
+        ahora = _ahora()
+        cambios = {'pasos': pasos, 'lease_hasta': None, 'updated_at': ahora}
+        if error is None:
+            cambios['estado'] = HECHO
+            outbox_lag.observe((ahora - entrada['created_at'].replace(tzinfo=timezone.utc)).total_seconds())
+        else:
+            intentos = entrada['intentos'] + 1
+            cambios.update({
+                'intentos': intentos,
+                'ultimo_error': error,
+                'estado': FALLIDO if intentos >= OUTBOX_MAX_ATTEMPTS else PENDIENTE,
+                'proximo_intento': ahora + timedelta(seconds=_backoff(intentos)),
+            })
+            logger.warning(f"Outbox diagnóstico {entrada['_id']} intento {intentos}: {error}")
+        try:
+            await self.coleccion.update_one({'_id': entrada['_id']}, {'$set': cambios})
+        except Exception as e:
+            # El lease vence y la entrada se reintenta; los pasos hechos se verifican de nuevo
+            logger.error(f"Error actualizando el outbox de diagnósticos: {e}")
+
+    async def drain(self, timeout: float = 10):
+        """Espera a que no queden entradas listas para ejecutar (scripts y pruebas)"""
+        deadline = time.monotonic() + timeout
+        self._ensure_task()
+        while time.monotonic() < deadline:
+            self._wakeup.set()
+            listas = await self.coleccion.count_documents(
+                {'estado': {'$in': [PENDIENTE, PROCESANDO]}, 'proximo_intento': {'$lte': _ahora()}}
+            )
+            if not listas and not self._en_curso:
+                return
+            await asyncio.sleep(0.05)
+
+    async def stop(self):
+        """Apagado: deja terminar los pasos en curso; lo pendiente sigue en Mongo"""
+        if self._task is not None and not self._task.done():
+            # wait_for puede tragarse el cancel si el evento se activa a la vez: el flag lo cubre
+            self._stopping = True
+            self._wakeup.set()
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._stopping = False
+        self._task = None
+        if self._en_curso:
+            await asyncio.wait(self._en_curso, timeout=OUTBOX_LEASE_SECONDS)
+
+
+# ============================================
+# ADMIN
+# ============================================
+
+def build_router(outbox: DiagnosticoOutbox) -> APIRouter:
+    router = APIRouter()
+
+    @router.get("/admin/outbox")
+    async def listar_outbox(
+        estado: Optional[str] = Query(None, description="pendiente, procesando, hecho o fallido"),
+        limit: int = Query(50, ge=1, le=200)
+    ):
+        """Resumen por estado y entradas pendientes o fallidas del outbox de diagnósticos"""
+        resumen = {PENDIENTE: 0, PROCESANDO: 0, HECHO: 0, FALLIDO: 0}
+        async for fila in outbox.coleccion.aggregate([{'$group': {'_id': '$estado', 'total': {'$sum': 1}}}]):
+            resumen[fila['_id']] = fila['total']
+
+        filtro = {'estado': estado} if estado else {'estado': {'$in': [PENDIENTE, PROCESANDO, FALLIDO]}}
+        entradas = []
+        cursor = outbox.coleccion.find(filtro, {'diagnostico': 0}).sort('created_at', -1).limit(limit)
+        async for entrada in cursor:
+            entrada['diagnostico_id'] = entrada.pop('_id')
+            entradas.append(entrada)
+        return {'resumen': resumen, 'entradas': entradas}
+
+    @router.post("/admin/outbox/{diagnostico_id}/reintentar")
+    async def reintentar_outbox(diagnostico_id: str):
+        """Vuelve a poner en cola una entrada fallida (o adelanta un reintento pendiente)"""
+        result = await outbox.coleccion.update_one(
+            {'_id': diagnostico_id, 'estado': {'$in': [PENDIENTE, FALLIDO]}},
+            {'$set': {'estado': PENDIENTE, 'proximo_intento': _ahora(), 'intentos': 0, 'updated_at': _ahora()}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Entrada de outbox no encontrada o en proceso")
+        outbox._ensure_task()
+        outbox._wakeup.set()
+        return {'mensaje': 'Entrada puesta en cola', 'diagnostico_id': diagnostico_id}
+
+    return router
@@ -0,0 +1,208 @@
+"""
+Hashing de contraseñas con bcrypt fuera del event loop
+- bcrypt corre en un pool de procesos acotado (PASSWORD_HASH_WORKERS) detrás
+  de un bulkhead: si la cola se llena el login responde 503 + Retry-After en
+  lugar de frenar al resto de las peticiones.
+- Costo configurable con BCRYPT_ROUNDS.
+- Los hashes SHA-256 heredados (64 hex, sin sal) se siguen aceptando y
+  needs_rehash=True indica que hay que reemplazarlos tras un login correcto.
+  Lo mismo si el hash bcrypt tiene un costo distinto al configurado.
+
+Calibración del costo (mide login real a la tasa pico esperada):
+    python passwords.py calibrate --rate 20 --budget-ms 300 --costs 10-13
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import os
+import random
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import List, Optional, Tuple
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', '12'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', '64'))
+
+# bcrypt solo usa los primeros 72 bytes
+BCRYPT_MAX_BYTES = 72
+
+_LEGACY_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+_BCRYPT = re.compile(r'^\$2[aby]\$(\d{2})\$')
+
+
+# ============================================
+# FUNCIONES DEL PROCESO HIJO (sin estado, picklables)
+# ============================================
+
+def _bcrypt_hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode()[:BCRYPT_MAX_BYTES], bcrypt.gensalt(rounds)).decode()
+
+
+def _bcrypt_verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode()[:BCRYPT_MAX_BYTES], hashed.encode())
+    except ValueError:
+        return False
+
+
+# ============================================
+# FORMATOS
+# ============================================
+
+def legacy_sha256(password: str) -> str:
+    """Formato anterior: SHA-256 sin sal (solo para verificar hashes existentes)"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def is_legacy_hash(hashed: str) -> bool:
+    return bool(_LEGACY_SHA256.match(hashed or ''))
+
+
+def bcrypt_cost(hashed: str) -> Optional[int]:
+    match = _BCRYPT.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+def needs_rehash(hashed: str, rounds: int = BCRYPT_ROUNDS) -> bool:
+    return bcrypt_cost(hashed) != rounds
+
+
+# ============================================
+# POOL
+# ============================================
+
+class PasswordHasher:
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, rounds: int = BCRYPT_ROUNDS,
+                 queue: int = PASSWORD_HASH_QUEUE):
+        from bulkhead import Bulkhead
+
+        self.workers = workers
+        self.rounds = rounds
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.bulkhead = Bulkhead('password_hash', max_concurrent=workers, max_queue=queue)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: el proceso ya tiene hilos (to_thread, Motor) y fork no es seguro
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=get_context('spawn'))
+        return self._executor
+
+    async def _run(self, fn, *args):
+        async with self.bulkhead.slot():
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_bcrypt_hash, password, self.rounds)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, bool]:
+        """(válida, hay que rehashear)"""
+        if not hashed:
+            return False, False
+        if is_legacy_hash(hashed):
+            # Barato: no hace falta salir del event loop
+            return hmac.compare_digest(legacy_sha256(password), hashed), True
+        if bcrypt_cost(hashed) is None:
+            return False, False
+        valid = await self._run(_bcrypt_verify, password, hashed)
+        return valid, valid and needs_rehash(hashed, self.rounds)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+
+# ============================================
+# CALIBRACIÓN
+# ============================================
+
+def _percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else 0.0
+
+
+async def _measure_cost(rounds: int, rate: float, duration: float, workers: int, seed: int) -> dict:
+    """Logins (verify) con llegadas de Poisson a `rate` por segundo durante `duration`"""
+    hasher = PasswordHasher(workers=workers, rounds=rounds, queue=10 ** 6)
+    try:
+        hashed = await hasher.hash('calibracion')
+        await asyncio.gather(*(hasher.verify('calibracion', hashed) for _ in range(workers)))  # calentar procesos
+
+        rng = random.Random(seed)
+        latencies: List[float] = []
+
+        async def one():
+            start = time.perf_counter()
+            await hasher.verify('calibracion', hashed)
+            latencies.append(time.perf_counter() - start)
+
+        tasks = []
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            tasks.append(asyncio.ensure_future(one()))
+            await asyncio.sleep(rng.expovariate(rate))
+        await asyncio.gather(*tasks)
+    finally:
+        hasher.shutdown()
+
+    return {
+        'rounds': rounds,
+        'logins': len(latencies),
+        'p50_ms': _percentile(latencies, 0.50) * 1000,
+        'p99_ms': _percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies) * 1000,
+    }
+
+
+def calibrate(args) -> int:
+    first, _, last = args.costs.partition('-')
+    costs = range(int(first), int(last or first) + 1)
+    print(f'{args.rate:g} logins/s durante {args.duration:g}s, {args.workers} procesos, '
+          f'presupuesto p99 {args.budget_ms:g} ms\n')
+    print(f"{'costo':>5} {'logins':>7} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+    elegido = None
+    for rounds in costs:
+        r = asyncio.run(_measure_cost(rounds, args.rate, args.duration, args.workers, args.seed))
+        ok = r['p99_ms'] <= args.budget_ms
+        print(f"{r['rounds']:>5} {r['logins']:>7} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f} {r['max_ms']:>9.1f}"
+              f"  {'OK' if ok else 'excede'}")
+        if ok:
+            elegido = rounds
+        else:
+            # Un costo mayor solo puede ser más lento
+            break
+
+    if elegido is None:
+        print('\nNingún costo cumple el presupuesto: más procesos o menos tasa pico')
+        return 1
+    print(f'\nRecomendado: BCRYPT_ROUNDS={elegido} (hashes actuales usan {BCRYPT_ROUNDS})')
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Hashing de contraseñas')
+    sub = parser.add_subparsers(dest='command', required=True)
+    cal = sub.add_parser('calibrate', help='Elegir BCRYPT_ROUNDS según p99 de login a la tasa pico')
+    cal.add_argument('--rate', type=float, default=20, help='Logins por segundo en el pico')
+    cal.add_argument('--budget-ms', type=float, default=300, help='p99 máximo aceptable del hashing')
+    cal.add_argument('--costs', default='10-14', help='Rango de costos a probar (p. ej. 10-14)')
+    cal.add_argument('--duration', type=float, default=5, help='Segundos por costo')
+    cal.add_argument('--workers', type=int, default=PASSWORD_HASH_WORKERS)
+    cal.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    return calibrate(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
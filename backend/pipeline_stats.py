@@ -0,0 +1,184 @@
+"""
+Estadísticas del pipeline de ventas mantenidas en memoria
+/api/sales/stats descargaba todas las oportunidades activas en cada petición.
+Ahora los agregados (conteo, valor y valor ponderado por etapa y prioridad) se
+ajustan con la fila que devuelve Supabase en cada alta o actualización
+(crear_oportunidad_desde_diagnostico, update_oportunidad) y leerlos no cuesta
+llamadas.
+
+Para calcular el delta se guarda la contribución de cada oportunidad activa
+(id -> etapa, prioridad, valor, ponderado), así una actualización resta lo
+anterior y suma lo nuevo sin pedir la fila vieja. Cada
+PIPELINE_STATS_RECONCILE_SECONDS se reconstruye todo desde Supabase para
+corregir cambios hechos por fuera del backend (SQL, scripts de seed).
+"""
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from supabase_rest import SupabaseRestClient, supabase_rest_admin
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_STATS_RECONCILE_SECONDS = float(os.environ.get('PIPELINE_STATS_RECONCILE_SECONDS', '300'))
+
+_COLUMNAS = 'id,estado,etapa_pipeline,prioridad,valor_estimado_usd,probabilidad_cierre'
+
+Contribucion = Tuple[str, str, float, float]
+
+
+def _contribucion(row: dict) -> Optional[Contribucion]:
+    """Lo que aporta la fila a los agregados; None si no está activa"""
+    if row.get('estado') != 'activo':
+        return None
+    valor = float(row.get('valor_estimado_usd') or 0)
+    return (
+        row['etapa_pipeline'],
+        row['prioridad'],
+        valor,
+        valor * float(row.get('probabilidad_cierre') or 0) / 100,
+    )
+
+
+class PipelineStats:
+    def __init__(self, rest: SupabaseRestClient, reconcile_seconds: float = PIPELINE_STATS_RECONCILE_SECONDS):
+        self.rest = rest
+        self.reconcile_seconds = reconcile_seconds
+        self._por_id: Dict[str, Contribucion] = {}
+        # (etapa, prioridad) -> [conteo, valor, ponderado]
+        self._grupos: Dict[Tuple[str, str], List[float]] = {}
+        self._ready = False
+        self._lock: Optional[asyncio.Lock] = None
+        # Filas que llegan mientras se reconstruye; se vuelven a aplicar al terminar
+        self._durante_rebuild: Optional[List[dict]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # ---------- deltas ----------
+
+    def _sumar(self, c: Contribucion, signo: int):
+        grupo = self._grupos.setdefault((c[0], c[1]), [0, 0.0, 0.0])
+        grupo[0] += signo
+        grupo[1] += signo * c[2]
+        grupo[2] += signo * c[3]
+        if grupo[0] <= 0:
+            del self._grupos[(c[0], c[1])]
+
+    def _aplicar(self, row: dict):
+        oportunidad_id = str(row['id'])
+        anterior = self._por_id.pop(oportunidad_id, None)
+        if anterior is not None:
+            self._sumar(anterior, -1)
+        nueva = _contribucion(row)
+        if nueva is not None:
+            self._por_id[oportunidad_id] = nueva
+            self._sumar(nueva, 1)
+
+    def apply(self, row: Optional[dict]):
+        """Ajusta los agregados con el estado actual de una oportunidad (alta o actualización)"""
+        if not row or 'id' not in row:
+            return
+        if self._durante_rebuild is not None:
+            self._durante_rebuild.append(row)
+        if self._ready:
+            try:
+                self._aplicar(row)
+            except KeyError:
+                # Representación incompleta: la próxima reconciliación lo corrige
+                logger.warning(f"Fila de oportunidad sin etapa/prioridad: {row.get('id')}")
+
+    # ---------- reconstrucción ----------
+
+    async def rebuild(self, si_falta: bool = False):
+        """Recalcula todo desde Supabase (una consulta con solo las columnas necesarias)"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if si_falta and self._ready:
+                # Otra petición ya lo construyó mientras esta esperaba el lock
+                return
+            self._durante_rebuild = []
+            try:
+                response = await self.rest.get(
+                    'oportunidades', params={'estado': 'eq.activo', 'select': _COLUMNAS}
+                )
+                response.raise_for_status()
+                filas = response.json()
+                pendientes = self._durante_rebuild
+            finally:
+                self._durante_rebuild = None
+
+            anterior = self.snapshot() if self._ready else None
+            self._por_id, self._grupos = {}, {}
+            for row in filas + pendientes:
+                self._aplicar(row)
+            self._ready = True
+
+            actual = self.snapshot()
+            if anterior is not None and (
+                anterior['total_oportunidades'] != actual['total_oportunidades']
+                or anterior['valor_total_pipeline_usd'] != actual['valor_total_pipeline_usd']
+            ):
+                logger.warning(
+                    f"Estadísticas del pipeline corregidas al reconciliar: "
+                    f"{anterior['total_oportunidades']} -> {actual['total_oportunidades']} oportunidades"
+                )
+
+    def _ensure_task(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run(), context=contextvars.Context())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reconcile_seconds)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Error reconciliando estadísticas del pipeline: {e}")
+
+    # ---------- lectura ----------
+
+    def snapshot(self) -> dict:
+        """Misma salida que antes calculaba sales.get_pipeline_stats"""
+        por_etapa, valor_por_etapa, por_prioridad = {}, {}, {}
+        total, valor_total, ponderado = 0, 0.0, 0.0
+        for (etapa, prioridad), (conteo, valor, pond) in self._grupos.items():
+            por_etapa[etapa] = por_etapa.get(etapa, 0) + conteo
+            valor_por_etapa[etapa] = valor_por_etapa.get(etapa, 0) + valor
+            por_prioridad[prioridad] = por_prioridad.get(prioridad, 0) + conteo
+            total += conteo
+            valor_total += valor
+            ponderado += pond
+        return {
+            'total_oportunidades': total,
+            'valor_total_pipeline_usd': round(valor_total, 2),
+            'valor_ponderado_usd': round(ponderado, 2),
+            'por_etapa': por_etapa,
+            'valor_por_etapa': {k: round(v, 2) for k, v in valor_por_etapa.items()},
+            'por_prioridad': por_prioridad
+        }
+
+    async def get(self) -> dict:
+        if not self._ready:
+            await self.rebuild(si_falta=True)
+        self._ensure_task()
+        return self.snapshot()
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    def reset(self):
+        """Descarta los agregados (otro store de datos, p. ej. FakePostgrest.install)"""
+        self._por_id, self._grupos, self._ready = {}, {}, False
+        self._lock = None
+
+
+pipeline_stats = PipelineStats(supabase_rest_admin)
@@ -5,11 +5,7 @@ Sistema de tracking de progreso S1/S2
 from typing import Optional, List, Dict
 from pydantic import BaseModel
 from datetime import datetime
-import requests
-import os
-
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
+from supabase_rest import supabase_rest_admin
 
 # ============================================
 # PYDANTIC MODELS
@@ -51,13 +47,9 @@ class AccionProgreso(BaseModel):
 async def obtener_progreso_usuario(user_id: str) -> Optional[Dict]:
     """Obtiene el progreso del usuario"""
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/progreso_usuario?user_id=eq.{user_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response = await supabase_rest_admin.get(
+            'progreso_usuario',
+            params={'user_id': f'eq.{user_id}'}
         )
         
         if response.status_code == 200:
@@ -76,19 +68,13 @@ async def obtener_progreso_usuario(user_id: str) -> Optional[Dict]:
 async def inicializar_progreso_usuario(user_id: str) -> Optional[Dict]:
     """Inicializa el progreso para un nuevo usuario"""
     try:
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/progreso_usuario",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest_admin.post(
+            'progreso_usuario',
             json={
                 'user_id': user_id,
                 'porcentaje_total': 0
             },
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 201:
@@ -110,21 +96,15 @@ async def registrar_accion(user_id: str, accion: AccionProgreso) -> bool:
                 return False
         
         # Registrar la acción
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/acciones_progreso",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
+        response = await supabase_rest_admin.post(
+            'acciones_progreso',
             json={
                 'user_id': user_id,
                 'tipo_accion': accion.tipo_accion,
                 'fase': accion.fase,
                 'descripcion': accion.descripcion,
                 'puntos': accion.puntos
-            },
-            timeout=10
+            }
         )
         
         if response.status_code != 201:
@@ -132,21 +112,15 @@ async def registrar_accion(user_id: str, accion: AccionProgreso) -> bool:
             return False
         
         # Llamar a la función de Supabase para actualizar el progreso
-        rpc_response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/rpc/registrar_accion_progreso",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
+        rpc_response = await supabase_rest_admin.post(
+            'rpc/registrar_accion_progreso',
             json={
                 'p_user_id': user_id,
                 'p_tipo_accion': accion.tipo_accion,
                 'p_fase': accion.fase,
                 'p_descripcion': accion.descripcion,
                 'p_puntos': accion.puntos
-            },
-            timeout=10
+            }
         )
         
         return rpc_response.status_code == 200 or rpc_response.status_code == 204
@@ -160,19 +134,12 @@ async def registrar_accion(user_id: str, accion: AccionProgreso) -> bool:
 async def obtener_acciones_usuario(user_id: str, fase: Optional[int] = None) -> List[Dict]:
     """Obtiene las acciones del usuario, opcionalmente filtradas por fase"""
     try:
-        url = f"{SUPABASE_URL}/rest/v1/acciones_progreso?user_id=eq.{user_id}&order=created_at.desc"
+        params = {'user_id': f'eq.{user_id}', 'order': 'created_at.desc'}
         
         if fase:
-            url += f"&fase=eq.{fase}"
+            params['fase'] = f'eq.{fase}'
         
-        response = requests.get(
-            url,
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
-        )
+        response = await supabase_rest_admin.get('acciones_progreso', params=params)
         
         if response.status_code == 200:
             return response.json()
@@ -99,6 +99,34 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql;
 
+-- ============================================
+-- Trigger: crear el progreso junto con el usuario
+-- El registro hace un solo INSERT en users; la fila de progreso se crea en la
+-- misma transacción
+-- El INSERT en users llega con el rol anon y progreso_usuario tiene RLS sin
+-- política de INSERT: la función corre como su dueño (SECURITY DEFINER, dueño
+-- de la tabla, al que no aplica RLS) con search_path fijo. Nadie la ejecuta
+-- directamente; solo el trigger.
+-- ============================================
+CREATE OR REPLACE FUNCTION crear_progreso_nuevo_usuario()
+RETURNS TRIGGER
+SECURITY DEFINER
+SET search_path = public
+AS $$
+BEGIN
+    PERFORM inicializar_progreso_usuario(NEW.id);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION crear_progreso_nuevo_usuario() FROM PUBLIC, anon, authenticated;
+
+DROP TRIGGER IF EXISTS crear_progreso_al_registrar ON public.users;
+CREATE TRIGGER crear_progreso_al_registrar
+    AFTER INSERT ON public.users
+    FOR EACH ROW
+    EXECUTE FUNCTION crear_progreso_nuevo_usuario();
+
 -- ============================================
 -- Función: Registrar acción y actualizar progreso
 -- ============================================
@@ -0,0 +1,244 @@
+"""
+Detector de N+1: presupuesto de llamadas a Supabase por endpoint
+Cada endpoint declara cuántas llamadas upstream puede hacer por petición. El
+chequeo levanta la app contra fake_postgrest, ejecuta cada endpoint con un
+resultado pequeño y otro grande, y falla si:
+  - alguna corrida supera el presupuesto declarado, o
+  - el número de llamadas crece con el tamaño del resultado (N+1).
+
+Las llamadas se leen de la cabecera X-Upstream-Calls que agrega
+MetricsMiddleware, así que el mismo helper sirve en tests:
+    assert_query_budget(response, 'GET', '/api/favoritos/{user_id}')
+tests/test_query_budget.py corre todos los presupuestos con pytest.
+
+Uso:
+    python query_budget.py            # exit code 1 si hay violaciones
+"""
+import asyncio
+import logging
+import os
+import sys
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from metrics import UPSTREAM_HEADER
+
+# Tamaños de resultado para comparar (pequeño, grande)
+SIZES = (1, 12)
+
+
+# ============================================
+# SEMBRADO POR ENDPOINT
+# ============================================
+
+def _grow_favoritos(store, ctx: dict, n: int):
+    store.seed('recursos_favoritos', [
+        {'user_id': ctx['user_id'], 'recurso_id': r['id']} for r in ctx['recursos'][:n]
+    ])
+
+
+def _grow_categorias(store, ctx: dict, n: int):
+    categorias = store.seed('faq_categorias', [{'nombre': f'Categoría {i}', 'orden': i} for i in range(n)])
+    for cat in categorias:
+        store.seed('faqs', [{
+            'categoria_id': cat['id'], 'pregunta': f'¿Pregunta {i}?', 'respuesta': 'Respuesta', 'orden': i
+        } for i in range(3)])
+
+
+def _grow_tickets(store, ctx: dict, n: int):
+    tickets = store.seed('tickets_soporte', [{
+        'user_id': ctx['user_id'], 'asunto': f'Consulta {i}', 'categoria': 'general',
+        'descripcion': 'Ayuda'
+    } for i in range(n)])
+    for ticket in tickets:
+        store.seed('tickets_mensajes', [{
+            'ticket_id': ticket['id'], 'user_id': ctx['user_id'], 'mensaje': f'Mensaje {i}'
+        } for i in range(2)])
+
+
+def _grow_recursos_usuario(store, ctx: dict, n: int):
+    store.seed('recursos_usuario', [
+        {'user_id': ctx['user_id'], 'recurso_id': r['id'], 'visto': True} for r in ctx['recursos'][:n]
+    ])
+
+
+def _grow_notificaciones(store, ctx: dict, n: int):
+    store.seed('notificaciones', [{
+        'user_id': ctx['user_id'], 'tipo': 'sistema', 'titulo': f'Notificación {i}',
+        'mensaje': 'Novedades', 'leida': i % 2 == 0
+    } for i in range(n)])
+
+
+def _grow_oportunidades(store, ctx: dict, n: int):
+    store.seed('oportunidades', [{
+        'user_id': ctx['user_id'], 'nombre_cliente': 'Cliente', 'email_cliente': 'cliente@test.com',
+        'organizacion': f'Empresa {i}', 'arquetipo_niif': 'B2', 'prioridad': 'B2',
+        'scoring_urgencia': 50, 'scoring_madurez': 50, 'scoring_capacidad': 50, 'scoring_total': 50
+    } for i in range(n)])
+
+
+def _grow_actividades(store, ctx: dict, n: int):
+    _grow_oportunidades(store, ctx, 1)
+    ctx['oportunidad_id'] = store.tables['oportunidades'][-1]['id']
+    store.seed('actividades', [{
+        'oportunidad_id': ctx['oportunidad_id'], 'creado_por': ctx['user_id'],
+        'tipo': 'nota', 'titulo': f'Actividad {i}'
+    } for i in range(n)])
+
+
+# ============================================
+# PRESUPUESTOS
+# ============================================
+
+@dataclass
+class QueryBudget:
+    method: str
+    route: str
+    max_calls: int
+    # (ctx) -> (url, kwargs de httpx)
+    request: Callable[[dict], Tuple[str, dict]]
+    # Agrega n filas al resultado del endpoint; None si el resultado no depende de datos
+    grow: Optional[Callable] = None
+
+
+QUERY_BUDGETS: List[QueryBudget] = [
+    QueryBudget('GET', '/api/favoritos/{user_id}', 2,
+                lambda ctx: (f"/api/favoritos/{ctx['user_id']}", {}), _grow_favoritos),
+    QueryBudget('GET', '/api/ayuda/categorias', 2,
+                lambda ctx: ('/api/ayuda/categorias', {}), _grow_categorias),
+    QueryBudget('GET', '/api/soporte/tickets', 2,
+                lambda ctx: ('/api/soporte/tickets', {'params': {'user_id': ctx['user_id']}}), _grow_tickets),
+    QueryBudget('GET', '/api/recursos', 2,
+                lambda ctx: ('/api/recursos', {'params': {'user_id': ctx['user_id']}}), _grow_recursos_usuario),
+    QueryBudget('GET', '/api/notificaciones', 1,
+                lambda ctx: ('/api/notificaciones', {'params': {'user_id': ctx['user_id']}}), _grow_notificaciones),
+    QueryBudget('GET', '/api/notificaciones/stats', 2,
+                lambda ctx: ('/api/notificaciones/stats', {'params': {'user_id': ctx['user_id']}}),
+                _grow_notificaciones),
+    QueryBudget('GET', '/api/sales/oportunidades', 1,
+                lambda ctx: ('/api/sales/oportunidades', {}), _grow_oportunidades),
+    QueryBudget('POST', '/api/sales/actividades', 1,
+                lambda ctx: ('/api/sales/actividades', {'json': {
+                    'oportunidad_id': ctx['oportunidad_id'], 'creado_por': ctx['user_id'],
+                    'tipo': 'llamada', 'titulo': 'Llamada de seguimiento'
+                }}), _grow_actividades),
+    QueryBudget('POST', '/api/auth/login', 2,
+                lambda ctx: ('/api/auth/login', {'json': {'email': ctx['email'], 'password': 'password123'}})),
+    QueryBudget('POST', '/api/auth/register', 1,
+                lambda ctx: ('/api/auth/register', {'json': {
+                    'email': 'registro@test.com', 'password': 'password123', 'nombre_completo': 'Registro'
+                }})),
+    QueryBudget('GET', '/api/admin/estadisticas/general', 4,
+                lambda ctx: ('/api/admin/estadisticas/general', {})),
+    QueryBudget('GET', '/api/admin/recursos/stats/resumen', 15,
+                lambda ctx: ('/api/admin/recursos/stats/resumen', {})),
+]
+
+_BUDGETS_BY_ROUTE: Dict[Tuple[str, str], QueryBudget] = {(b.method, b.route): b for b in QUERY_BUDGETS}
+
+
+def upstream_calls(response: httpx.Response) -> int:
+    """Llamadas a Supabase que hizo la petición (cabecera de MetricsMiddleware)"""
+    value = response.headers.get(UPSTREAM_HEADER)
+    if value is None:
+        raise AssertionError(f'La respuesta no trae {UPSTREAM_HEADER}; ¿está activo MetricsMiddleware?')
+    return int(value)
+
+
+def assert_query_budget(response: httpx.Response, method: str, route: str):
+    """Falla si la petición hizo más llamadas upstream que su presupuesto declarado"""
+    budget = _BUDGETS_BY_ROUTE.get((method, route))
+    if budget is None:
+        raise AssertionError(f'{method} {route} no tiene presupuesto declarado en QUERY_BUDGETS')
+    calls = upstream_calls(response)
+    if calls > budget.max_calls:
+        raise AssertionError(
+            f'{method} {route}: {calls} llamadas a Supabase (presupuesto {budget.max_calls})'
+        )
+
+
+# ============================================
+# CHEQUEO
+# ============================================
+
+async def request_budgeted(budget: QueryBudget, size: int) -> httpx.Response:
+    """Ejecuta el endpoint sobre un store nuevo con `size` filas"""
+    import server
+    from auth import generate_session_token
+    from fake_postgrest import FakePostgrest, seed_demo_data
+
+    fake = FakePostgrest()
+    data = seed_demo_data(fake.store, usuarios=2, recursos=max(SIZES), oportunidades=0,
+                          notificaciones_por_usuario=0)
+    # Usuario nuevo sin datos previos, para que el tamaño del resultado sea exactamente `size`
+    user = fake.store.seed('users', [{
+        'email': 'presupuesto@test.com', 'password_hash': data['users'][0]['password_hash'],
+        'nombre_completo': 'Presupuesto', 'rol': 'cliente_gratuito'
+    }])[0]
+    fake.store.seed('progreso_usuario', [{'user_id': user['id']}])
+    ctx = {'user_id': user['id'], 'email': user['email'], 'recursos': data['recursos']}
+    if budget.grow:
+        budget.grow(fake.store, ctx, size)
+    await fake.install()
+
+    url, kwargs = budget.request(ctx)
+    # Sesión del admin del seed: las rutas admin y sales la exigen
+    kwargs.setdefault('headers', {})['Authorization'] = f"Bearer {generate_session_token(data['users'][0])}"
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url='http://budget') as client:
+        return await client.request(budget.method, url, **kwargs)
+
+
+async def _measure(budget: QueryBudget, size: int) -> Tuple[int, int]:
+    """(status, llamadas) del endpoint con `size` filas"""
+    response = await request_budgeted(budget, size)
+    return response.status_code, upstream_calls(response)
+
+
+async def check_budgets(budgets: List[QueryBudget] = QUERY_BUDGETS) -> List[dict]:
+    """Mide cada endpoint y devuelve un resultado por presupuesto (campo 'errors' vacío = OK)"""
+    resultados = []
+    for budget in budgets:
+        sizes = SIZES if budget.grow else SIZES[:1]
+        medidas = [await _measure(budget, size) for size in sizes]
+        errors = []
+        for size, (status, calls) in zip(sizes, medidas):
+            if status >= 400:
+                errors.append(f'HTTP {status} con {size} filas')
+            if calls > budget.max_calls:
+                errors.append(f'{calls} llamadas con {size} filas (presupuesto {budget.max_calls})')
+        if len(medidas) > 1 and medidas[-1][1] > medidas[0][1]:
+            errors.append(
+                f'N+1: {medidas[0][1]} llamadas con {sizes[0]} filas, {medidas[-1][1]} con {sizes[-1]}'
+            )
+        resultados.append({
+            'method': budget.method, 'route': budget.route, 'budget': budget.max_calls,
+            'calls': [calls for _, calls in medidas], 'errors': errors
+        })
+    return resultados
+
+
+def main() -> int:
+    for key, value in (('MONGO_URL', 'mongodb://localhost:27017'), ('DB_NAME', 'clarisa_budget'),
+                       ('SUPABASE_URL', 'http://fake-supabase'), ('SUPABASE_KEY', 'budget'),
+                       ('SUPABASE_SERVICE_KEY', 'budget'), ('RATE_LIMIT_ENABLED', 'false')):
+        os.environ.setdefault(key, value)
+    logging.disable(logging.INFO)
+
+    resultados = asyncio.run(check_budgets())
+    fallos = 0
+    for r in resultados:
+        estado = 'OK' if not r['errors'] else 'FALLA'
+        calls = ' -> '.join(str(c) for c in r['calls'])
+        print(f"{estado:<6} {r['method']:<5} {r['route']:<42} presupuesto {r['budget']:>3}  llamadas {calls}")
+        for error in r['errors']:
+            print(f'         {error}')
+        fallos += bool(r['errors'])
+
+    print(f'\n{len(resultados) - fallos}/{len(resultados)} endpoints dentro del presupuesto')
+    return 1 if fallos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
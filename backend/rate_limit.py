@@ -0,0 +1,209 @@
+"""
+Rate limiting de endpoints públicos y de auth con token buckets en memoria
+Se aplica en un middleware antes de llegar al handler, así que una ráfaga de
+credential stuffing o de diagnósticos de bots se rechaza con 429 sin tocar
+Supabase ni Mongo.
+
+Cada regla limita por IP, por email (del body JSON o del query string) y por
+ruta en total. Límites como "capacidad/segundos", sobreescribibles por entorno:
+    RATE_LIMIT_LOGIN_IP=20/60  RATE_LIMIT_LOGIN_EMAIL=5/300  RATE_LIMIT_ENABLED=false
+
+Una petición consume un token de cada bucket solo si todos lo permiten: un
+email bloqueado no gasta el cupo de la IP ni el de la ruta.
+
+Los buckets viven en un OrderedDict acotado (RATE_LIMIT_MAX_BUCKETS); al
+llenarse se descartan los menos usados, que en la práctica ya están llenos.
+
+Detrás de un ingress o balanceador propio hay que fijar RATE_LIMIT_PROXY_HOPS
+(1 = un proxy que agrega la IP del cliente a X-Forwarded-For). Por defecto es 0
+y se usa la IP de la conexión: sin proxy, X-Forwarded-For lo escribe el cliente
+y bastaría con cambiarlo en cada petición para saltarse el límite por IP.
+"""
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from fastapi.responses import JSONResponse
+
+from metrics import rate_limit_buckets, rate_limited_total
+
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get('RATE_LIMIT_MAX_BUCKETS', '100000'))
+# Proxies propios delante del backend: la IP del cliente es la entrada N desde
+# la derecha de X-Forwarded-For (0 = usar la IP de la conexión)
+RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', '0'))
+# Solo se lee el body de peticiones pequeñas para buscar el email
+MAX_BODY_BYTES = 16384
+
+IP, EMAIL, ROUTE = 'ip', 'email', 'route'
+
+
+def _limit(name: str, scope: str, default: str) -> Optional[Tuple[int, float]]:
+    """(capacidad, segundos) desde RATE_LIMIT_<NAME>_<SCOPE>; vacío u 'off' desactiva"""
+    value = os.environ.get(f'RATE_LIMIT_{name.upper()}_{scope.upper()}', default).strip()
+    if not value or value.lower() == 'off':
+        return None
+    capacity, _, seconds = value.partition('/')
+    return int(capacity), float(seconds or 1)
+
+
+@dataclass
+class RateLimitRule:
+    name: str
+    method: str
+    path: str
+    limits: Dict[str, Tuple[int, float]] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, name: str, method: str, path: str, **defaults: str) -> 'RateLimitRule':
+        limits = {scope: _limit(name, scope, value) for scope, value in defaults.items()}
+        return cls(name, method, path, {s: l for s, l in limits.items() if l})
+
+
+RATE_LIMIT_RULES: List[RateLimitRule] = [
+    RateLimitRule.build('login', 'POST', '/api/auth/login', ip='20/60', email='10/300', route='600/60'),
+    RateLimitRule.build('register', 'POST', '/api/auth/register', ip='5/600', email='3/600', route='120/60'),
+    RateLimitRule.build('check_email', 'GET', '/api/auth/check-email', ip='30/60', route='600/60'),
+    RateLimitRule.build('diagnostico', 'POST', '/api/diagnostico', ip='10/600', email='5/600', route='300/60'),
+]
+
+_RULES_BY_ROUTE = {(r.method, r.path): r for r in RATE_LIMIT_RULES}
+
+
+class TokenBuckets:
+    """Token buckets por clave: [tokens, última actualización] en un LRU acotado"""
+
+    def __init__(self, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self._buckets: 'OrderedDict[tuple, list]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _refill(self, key: tuple, capacity: int, per_seconds: float) -> list:
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(capacity), now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * capacity / per_seconds)
+            bucket[1] = now
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def take(self, key: tuple, capacity: int, per_seconds: float) -> float:
+        """Consume un token; devuelve 0 si se permitió o los segundos hasta el próximo token"""
+        return self.take_all([(key, capacity, per_seconds)])[0]
+
+    def take_all(self, limits: List[Tuple[tuple, int, float]]) -> List[float]:
+        """
+        Consume un token de cada bucket solo si todos tienen uno
+        Devuelve, por bucket, 0 o los segundos hasta su próximo token.
+        """
+        buckets = [self._refill(key, capacity, seconds) for key, capacity, seconds in limits]
+        waits = [
+            0.0 if bucket[0] >= 1 else (1 - bucket[0]) * seconds / capacity
+            for bucket, (_, capacity, seconds) in zip(buckets, limits)
+        ]
+        if not any(waits):
+            for bucket in buckets:
+                bucket[0] -= 1
+        return waits
+
+    def clear(self):
+        self._buckets.clear()
+
+
+token_buckets = TokenBuckets()
+
+
+def client_ip(scope) -> str:
+    if RATE_LIMIT_PROXY_HOPS > 0:
+        for name, value in scope.get('headers', []):
+            if name == b'x-forwarded-for':
+                hops = [h.strip() for h in value.decode('latin-1').split(',') if h.strip()]
+                if hops:
+                    return hops[-min(RATE_LIMIT_PROXY_HOPS, len(hops))]
+    client = scope.get('client')
+    return client[0] if client else 'desconocido'
+
+
+def _email_from(scope, body: bytes) -> Optional[str]:
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    email = (query.get('email') or [None])[0]
+    if email is None and body:
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return None
+        email = payload.get('email') if isinstance(payload, dict) else None
+    return email.strip().lower() if isinstance(email, str) and email.strip() else None
+
+
+class RateLimitMiddleware:
+    """Responde 429 + Retry-After antes del handler cuando se agota algún bucket"""
+
+    def __init__(self, app, buckets: TokenBuckets = token_buckets):
+        self.app = app
+        self.buckets = buckets
+
+    async def __call__(self, scope, receive, send):
+        rule = _RULES_BY_ROUTE.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if not RATE_LIMIT_ENABLED or rule is None:
+            await self.app(scope, receive, send)
+            return
+
+        body = b''
+        if EMAIL in rule.limits and scope['method'] == 'POST':
+            body, receive = await self._buffer_body(receive)
+
+        keys = {IP: client_ip(scope), ROUTE: ''}
+        email = _email_from(scope, body) if EMAIL in rule.limits else None
+        if email:
+            keys[EMAIL] = email
+
+        scopes = [s for s in rule.limits if s in keys]
+        waits = self.buckets.take_all([
+            ((rule.name, s, keys[s]), *rule.limits[s]) for s in scopes
+        ])
+        for limited_scope, wait in zip(scopes, waits):
+            if wait > 0:
+                rate_limited_total.labels(rule.name, limited_scope).inc()
+        retry_after = max(waits, default=0.0)
+        rate_limit_buckets.set(len(self.buckets))
+
+        if retry_after > 0:
+            response = JSONResponse(
+                status_code=429,
+                content={'detail': 'Demasiadas solicitudes, intente nuevamente más tarde'},
+                headers={'Retry-After': str(max(1, int(retry_after + 0.999)))}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _buffer_body(receive):
+        """Lee el body (si es pequeño) y devuelve un receive que lo vuelve a entregar"""
+        messages, size = [], 0
+        while True:
+            message = await receive()
+            messages.append(message)
+            size += len(message.get('body', b''))
+            if message['type'] != 'http.request' or not message.get('more_body') or size > MAX_BODY_BYTES:
+                break
+        body = b''.join(m.get('body', b'') for m in messages) if size <= MAX_BODY_BYTES else b''
+
+        async def replay():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        return body, replay
@@ -7,15 +7,10 @@ from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime
-import os
-import requests
+from supabase_rest import supabase_request
 
 router = APIRouter()
 
-# Configuración Supabase
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
-
 # ============================================
 # MODELOS
 # ============================================
@@ -60,30 +55,6 @@ class CalificarRecursoRequest(BaseModel):
 # UTILIDADES
 # ============================================
 
-def supabase_request(method: str, endpoint: str, data: dict = None, params: dict = None):
-    """Hace una petición a Supabase REST API"""
-    url = f"{SUPABASE_URL}/rest/v1/{endpoint}"
-    headers = {
-        'apikey': SUPABASE_KEY,
-        'Authorization': f'Bearer {SUPABASE_KEY}',
-        'Content-Type': 'application/json',
-        'Prefer': 'return=representation'
-    }
-    
-    try:
-        if method == 'GET':
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-        elif method == 'POST':
-            response = requests.post(url, headers=headers, json=data, timeout=10)
-        elif method == 'PATCH':
-            response = requests.patch(url, headers=headers, json=data, timeout=10)
-        
-        response.raise_for_status()
-        return response.json()
-    except Exception as e:
-        print(f"Error en petición Supabase: {e}")
-        return None
-
 def verificar_acceso_recurso(recurso: dict, user_rol: str) -> bool:
     """Verifica si el usuario tiene acceso al recurso"""
     acceso = recurso.get('acceso_requerido', 'gratuito')
@@ -127,13 +98,13 @@ async def obtener_recursos(
             params['destacado'] = 'eq.true'
         
         # Obtener recursos
-        recursos = supabase_request('GET', 'recursos', params=params)
+        recursos = await supabase_request('GET', 'recursos', params=params)
         
         if recursos is None:
             raise HTTPException(status_code=500, detail="Error al obtener recursos de Supabase")
         
         # Obtener interacciones del usuario
-        user_interacciones = supabase_request('GET', 'recursos_usuario', params={'user_id': f'eq.{user_id}'})
+        user_interacciones = await supabase_request('GET', 'recursos_usuario', params={'user_id': f'eq.{user_id}'})
         interacciones_dict = {}
         if user_interacciones:
             for interaccion in user_interacciones:
@@ -171,7 +142,7 @@ async def obtener_recurso_detalle(
     """
     try:
         # Obtener recurso
-        recursos = supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}', 'publicado': 'eq.true'})
+        recursos = await supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}', 'publicado': 'eq.true'})
         
         if not recursos or len(recursos) == 0:
             raise HTTPException(status_code=404, detail="Recurso no encontrado")
@@ -183,7 +154,7 @@ async def obtener_recurso_detalle(
             raise HTTPException(status_code=403, detail="No tienes acceso a este recurso")
         
         # Obtener interacción del usuario
-        interacciones = supabase_request('GET', 'recursos_usuario', 
+        interacciones = await supabase_request('GET', 'recursos_usuario', 
                                        params={'user_id': f'eq.{user_id}', 'recurso_id': f'eq.{recurso_id}'})
         
         interaccion = interacciones[0] if interacciones and len(interacciones) > 0 else {}
@@ -215,7 +186,7 @@ async def marcar_accion_recurso(
         accion = body.accion
         
         # Verificar que existe el recurso
-        recursos = supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
+        recursos = await supabase_request('GET', 'recursos', params={'id': f'eq.{recurso_id}'})
         if not recursos or len(recursos) == 0:
             raise HTTPException(status_code=404, detail="Recurso no encontrado")
         
@@ -229,7 +200,7 @@ async def marcar_accion_recurso(
             datos['fecha_visto'] = datetime.utcnow().isoformat()
             
             # Incrementar contador de vistas
-            supabase_request('PATCH', f'recursos?id=eq.{recurso_id}', 
+            await supabase_request('PATCH', f'recursos?id=eq.{recurso_id}', 
                            data={'vistas': (recurso.get('vistas', 0) + 1)})
             
         elif accion == 'descargado':
@@ -237,7 +208,7 @@ async def marcar_accion_recurso(
             datos['fecha_descargado'] = datetime.utcnow().isoformat()
             
             # Incrementar contador de descargas
-            supabase_request('PATCH', f'recursos?id=eq.{recurso_id}', 
+            await supabase_request('PATCH', f'recursos?id=eq.{recurso_id}', 
                            data={'descargas': (recurso.get('descargas', 0) + 1)})
             
         elif accion == 'completado':
@@ -248,16 +219,16 @@ async def marcar_accion_recurso(
         
         # Upsert en recursos_usuario
         # Primero intentar obtener el registro existente
-        existente = supabase_request('GET', 'recursos_usuario', 
+        existente = await supabase_request('GET', 'recursos_usuario', 
                                     params={'user_id': f'eq.{user_id}', 'recurso_id': f'eq.{recurso_id}'})
         
         if existente and len(existente) > 0:
             # Actualizar
-            supabase_request('PATCH', f'recursos_usuario?user_id=eq.{user_id}&recurso_id=eq.{recurso_id}', 
+            await supabase_request('PATCH', f'recursos_usuario?user_id=eq.{user_id}&recurso_id=eq.{recurso_id}', 
                            data=datos)
         else:
             # Insertar
-            supabase_request('POST', 'recursos_usuario', data=datos)
+            await supabase_request('POST', 'recursos_usuario', data=datos)
         
         return {"success": True, "message": f"Acción '{accion}' registrada correctamente"}
     
@@ -289,16 +260,16 @@ async def calificar_recurso(
         }
         
         # Verificar si existe
-        existente = supabase_request('GET', 'recursos_usuario', 
+        existente = await supabase_request('GET', 'recursos_usuario', 
                                     params={'user_id': f'eq.{user_id}', 'recurso_id': f'eq.{recurso_id}'})
         
         if existente and len(existente) > 0:
             # Actualizar
-            supabase_request('PATCH', f'recursos_usuario?user_id=eq.{user_id}&recurso_id=eq.{recurso_id}', 
+            await supabase_request('PATCH', f'recursos_usuario?user_id=eq.{user_id}&recurso_id=eq.{recurso_id}', 
                            data=datos)
         else:
             # Insertar
-            supabase_request('POST', 'recursos_usuario', data=datos)
+            await supabase_request('POST', 'recursos_usuario', data=datos)
         
         return {"success": True, "message": "Calificación guardada correctamente"}
     
@@ -316,11 +287,11 @@ async def obtener_stats_recursos(user_id: str):
     """
     try:
         # Obtener total de recursos publicados
-        recursos = supabase_request('GET', 'recursos', params={'publicado': 'eq.true', 'select': 'id'})
+        recursos = await supabase_request('GET', 'recursos', params={'publicado': 'eq.true', 'select': 'id'})
         total_recursos = len(recursos) if recursos else 0
         
         # Obtener interacciones del usuario
-        interacciones = supabase_request('GET', 'recursos_usuario', params={'user_id': f'eq.{user_id}'})
+        interacciones = await supabase_request('GET', 'recursos_usuario', params={'user_id': f'eq.{user_id}'})
         
         recursos_vistos = 0
         recursos_completados = 0
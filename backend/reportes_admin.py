@@ -4,18 +4,16 @@ Permite exportar datos a CSV y generar reportes personalizados
 """
 from fastapi import APIRouter, HTTPException, Query
 from fastapi.responses import StreamingResponse
-import requests
-import os
 import csv
 import io
 from datetime import datetime, timedelta
 from typing import Optional
+from supabase_rest import supabase_rest
+import pg_backend
+from pg_backend import pg_enabled
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-
 
 def generar_csv(datos, columnas):
     """
@@ -34,6 +32,23 @@ def generar_csv(datos, columnas):
     return output.getvalue()
 
 
+async def _obtener_filas(tabla, params, funcion, nombre):
+    """
+    Filas a exportar: por Postgres directo si `funcion` está habilitada en
+    PG_BACKEND_FUNCTIONS, si no por PostgREST
+    """
+    if pg_enabled(funcion):
+        return await pg_backend.select(tabla, params)
+
+    response = await supabase_rest.get(tabla, params=params)
+    if response.status_code != 200:
+        raise HTTPException(
+            status_code=response.status_code,
+            detail=f"Error al obtener {nombre}: {response.text}"
+        )
+    return response.json()
+
+
 @router.get("/admin/reportes/usuarios/export")
 async def exportar_usuarios(
     rol: Optional[str] = Query(None),
@@ -50,65 +65,49 @@ async def exportar_usuarios(
         params = []
         
         if rol:
-            params.append(f"rol=eq.{rol}")
+            params.append(('rol', f'eq.{rol}'))
         
         if plan:
-            params.append(f"plan_actual=eq.{plan}")
+            params.append(('plan_actual', f'eq.{plan}'))
         
         if fecha_desde:
-            params.append(f"created_at=gte.{fecha_desde}")
+            params.append(('created_at', f'gte.{fecha_desde}'))
         
         if fecha_hasta:
             # Agregar un día para incluir todo el día hasta
             fecha_hasta_dt = datetime.fromisoformat(fecha_hasta.replace('Z', '')) + timedelta(days=1)
-            params.append(f"created_at=lt.{fecha_hasta_dt.isoformat()}")
+            params.append(('created_at', f'lt.{fecha_hasta_dt.isoformat()}'))
+        
+        params.append(('order', 'created_at.desc'))
         
-        query_string = "&".join(params) if params else ""
-        url = f"{SUPABASE_URL}/rest/v1/users?{query_string}&order=created_at.desc"
+        usuarios = await _obtener_filas('users', params, 'exportar_usuarios', 'usuarios')
         
-        response = requests.get(
-            url,
+        # Si formato es JSON, retornar directamente
+        if formato == "json":
+            return usuarios
+        
+        # Definir columnas para el CSV
+        columnas = [
+            'id', 'email', 'nombre_completo', 'organizacion', 'rol', 
+            'plan_actual', 'suscripcion_activa', 'pais', 'puesto',
+            'fecha_registro', 'ultimo_acceso', 'progreso_general'
+        ]
+        
+        # Generar CSV
+        csv_content = generar_csv(usuarios, columnas)
+        
+        # Crear nombre de archivo
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"usuarios_{timestamp}.csv"
+        
+        # Retornar como descarga
+        return StreamingResponse(
+            iter([csv_content]),
+            media_type="text/csv",
             headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+                "Content-Disposition": f"attachment; filename={filename}"
+            }
         )
-        
-        if response.status_code == 200:
-            usuarios = response.json()
-            
-            # Si formato es JSON, retornar directamente
-            if formato == "json":
-                return usuarios
-            
-            # Definir columnas para el CSV
-            columnas = [
-                'id', 'email', 'nombre_completo', 'organizacion', 'rol', 
-                'plan_actual', 'suscripcion_activa', 'pais', 'puesto',
-                'fecha_registro', 'ultimo_acceso', 'progreso_general'
-            ]
-            
-            # Generar CSV
-            csv_content = generar_csv(usuarios, columnas)
-            
-            # Crear nombre de archivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"usuarios_{timestamp}.csv"
-            
-            # Retornar como descarga
-            return StreamingResponse(
-                iter([csv_content]),
-                media_type="text/csv",
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}"
-                }
-            )
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error al obtener usuarios: {response.text}"
-            )
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -129,59 +128,43 @@ async def exportar_recursos(
         params = []
         
         if tipo:
-            params.append(f"tipo=eq.{tipo}")
+            params.append(('tipo', f'eq.{tipo}'))
         
         if fase:
-            params.append(f"fase=eq.{fase}")
+            params.append(('fase', f'eq.{fase}'))
         
         if acceso:
-            params.append(f"acceso=eq.{acceso}")
+            params.append(('acceso', f'eq.{acceso}'))
+        
+        params.append(('order', 'created_at.desc'))
         
-        query_string = "&".join(params) if params else ""
-        url = f"{SUPABASE_URL}/rest/v1/recursos?{query_string}&order=created_at.desc"
+        recursos = await _obtener_filas('recursos', params, 'exportar_recursos', 'recursos')
         
-        response = requests.get(
-            url,
+        # Si formato es JSON, retornar directamente
+        if formato == "json":
+            return recursos
+        
+        # Definir columnas para el CSV
+        columnas = [
+            'id', 'titulo', 'descripcion', 'tipo', 'fase', 'acceso',
+            'url_contenido', 'vistas', 'descargas', 'created_at', 'updated_at'
+        ]
+        
+        # Generar CSV
+        csv_content = generar_csv(recursos, columnas)
+        
+        # Crear nombre de archivo
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"recursos_{timestamp}.csv"
+        
+        # Retornar como descarga
+        return StreamingResponse(
+            iter([csv_content]),
+            media_type="text/csv",
             headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+                "Content-Disposition": f"attachment; filename={filename}"
+            }
         )
-        
-        if response.status_code == 200:
-            recursos = response.json()
-            
-            # Si formato es JSON, retornar directamente
-            if formato == "json":
-                return recursos
-            
-            # Definir columnas para el CSV
-            columnas = [
-                'id', 'titulo', 'descripcion', 'tipo', 'fase', 'acceso',
-                'url_contenido', 'vistas', 'descargas', 'created_at', 'updated_at'
-            ]
-            
-            # Generar CSV
-            csv_content = generar_csv(recursos, columnas)
-            
-            # Crear nombre de archivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"recursos_{timestamp}.csv"
-            
-            # Retornar como descarga
-            return StreamingResponse(
-                iter([csv_content]),
-                media_type="text/csv",
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}"
-                }
-            )
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error al obtener recursos: {response.text}"
-            )
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -204,66 +187,50 @@ async def exportar_tickets(
         params = []
         
         if estado:
-            params.append(f"estado=eq.{estado}")
+            params.append(('estado', f'eq.{estado}'))
         
         if prioridad:
-            params.append(f"prioridad=eq.{prioridad}")
+            params.append(('prioridad', f'eq.{prioridad}'))
         
         if categoria:
-            params.append(f"categoria=eq.{categoria}")
+            params.append(('categoria', f'eq.{categoria}'))
         
         if fecha_desde:
-            params.append(f"created_at=gte.{fecha_desde}")
+            params.append(('created_at', f'gte.{fecha_desde}'))
         
         if fecha_hasta:
             fecha_hasta_dt = datetime.fromisoformat(fecha_hasta.replace('Z', '')) + timedelta(days=1)
-            params.append(f"created_at=lt.{fecha_hasta_dt.isoformat()}")
+            params.append(('created_at', f'lt.{fecha_hasta_dt.isoformat()}'))
         
-        query_string = "&".join(params) if params else ""
-        url = f"{SUPABASE_URL}/rest/v1/tickets?{query_string}&order=created_at.desc"
+        params.append(('order', 'created_at.desc'))
         
-        response = requests.get(
-            url,
+        tickets = await _obtener_filas('tickets', params, 'exportar_tickets', 'tickets')
+        
+        # Si formato es JSON, retornar directamente
+        if formato == "json":
+            return tickets
+        
+        # Definir columnas para el CSV
+        columnas = [
+            'id', 'user_id', 'asunto', 'categoria', 'estado', 'prioridad',
+            'created_at', 'updated_at', 'cerrado_at'
+        ]
+        
+        # Generar CSV
+        csv_content = generar_csv(tickets, columnas)
+        
+        # Crear nombre de archivo
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = f"tickets_{timestamp}.csv"
+        
+        # Retornar como descarga
+        return StreamingResponse(
+            iter([csv_content]),
+            media_type="text/csv",
             headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+                "Content-Disposition": f"attachment; filename={filename}"
+            }
         )
-        
-        if response.status_code == 200:
-            tickets = response.json()
-            
-            # Si formato es JSON, retornar directamente
-            if formato == "json":
-                return tickets
-            
-            # Definir columnas para el CSV
-            columnas = [
-                'id', 'user_id', 'asunto', 'categoria', 'estado', 'prioridad',
-                'created_at', 'updated_at', 'cerrado_at'
-            ]
-            
-            # Generar CSV
-            csv_content = generar_csv(tickets, columnas)
-            
-            # Crear nombre de archivo
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"tickets_{timestamp}.csv"
-            
-            # Retornar como descarga
-            return StreamingResponse(
-                iter([csv_content]),
-                media_type="text/csv",
-                headers={
-                    "Content-Disposition": f"attachment; filename={filename}"
-                }
-            )
-        else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error al obtener tickets: {response.text}"
-            )
             
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -313,13 +280,13 @@ async def obtener_actividad_detallada(
         # Obtener datos reales para el período
         if tipo == 'usuarios' or not tipo:
             # Contar usuarios por día
-            response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/users?created_at=gte.{fecha_desde_dt.isoformat()}&created_at=lt.{fecha_hasta_dt.isoformat()}&select=created_at",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}'
-                },
-                timeout=10
+            response = await supabase_rest.get(
+                'users',
+                params=[
+                    ('created_at', f'gte.{fecha_desde_dt.isoformat()}'),
+                    ('created_at', f'lt.{fecha_hasta_dt.isoformat()}'),
+                    ('select', 'created_at')
+                ]
             )
             
             if response.status_code == 200:
@@ -347,14 +314,10 @@ async def obtener_resumen_reportes():
         resumen = {}
         
         # Total de usuarios
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'users',
+            params={'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response.status_code == 200:
@@ -364,14 +327,10 @@ async def obtener_resumen_reportes():
             resumen['total_usuarios'] = 0
         
         # Total de recursos
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/recursos?select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'recursos',
+            params={'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response.status_code == 200:
@@ -381,14 +340,10 @@ async def obtener_resumen_reportes():
             resumen['total_recursos'] = 0
         
         # Total de tickets
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/tickets?select=count",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'tickets',
+            params={'select': 'count'},
+            headers={'Prefer': 'count=exact'}
         )
         
         if response.status_code == 200:
@@ -399,14 +354,10 @@ async def obtener_resumen_reportes():
         
         # Total de diagnósticos
         try:
-            response = requests.get(
-                f"{SUPABASE_URL}/rest/v1/diagnosticos?select=count",
-                headers={
-                    'apikey': SUPABASE_KEY,
-                    'Authorization': f'Bearer {SUPABASE_KEY}',
-                    'Prefer': 'count=exact'
-                },
-                timeout=10
+            response = await supabase_rest.get(
+                'diagnosticos',
+                params={'select': 'count'},
+                headers={'Prefer': 'count=exact'}
             )
             
             if response.status_code == 200:
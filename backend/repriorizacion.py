@@ -0,0 +1,307 @@
+"""
+Re-priorización por lotes del pipeline de ventas
+calcular_prioridad, calcular_valor_estimado y calcular_probabilidad_inicial
+(sales.py) solo corren al crear la oportunidad. Si ventas cambia los umbrales
+(UMBRAL_NIVEL_ALTO/MEDIO) o las tablas de valor y probabilidad, este job
+recalcula las oportunidades activas ya guardadas:
+    python repriorizacion.py run --dry-run          # diff sin escribir
+    python repriorizacion.py run                    # solo prioridad
+    python repriorizacion.py run --campos prioridad,valor,probabilidad
+    python repriorizacion.py bench -n 1000000
+
+Por defecto solo se recalcula la prioridad. Valor y probabilidad los edita
+ventas a mano (PATCH /sales/oportunidades/{id}) y el job no distingue un valor
+calculado de uno negociado: --campos valor,probabilidad los pisa todos, así que
+hay que pedirlo explícitamente y revisar antes el --dry-run.
+
+- Lee por páginas keyset sobre id solo las columnas de scoring, etapa y
+  los valores actuales.
+- La prioridad depende únicamente del nivel (bajo/medio/alto) de cada eje: la
+  tabla de 27 combinaciones, la de valor por prioridad y la de probabilidad
+  por prioridad y etapa se arman llamando a las funciones de sales.py, así que
+  el lote no puede diferir del cálculo uno a uno. El resto es indexado NumPy.
+- Solo escribe las filas que cambian: se agrupan por valores nuevos y cada
+  grupo es un PATCH con id=in.(...) (no un upsert: PostgREST exigiría las
+  columnas NOT NULL de la fila completa).
+- Las etapas cerradas no se tocan. La función SQL calcular_prioridad
+  (sales_schema.sql) tiene sus propios umbrales y hay que cambiarla aparte.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+from sales import (  # noqa: E402
+    AJUSTE_PROBABILIDAD_ETAPA,
+    ETAPAS_PIPELINE,
+    UMBRAL_NIVEL_ALTO,
+    UMBRAL_NIVEL_MEDIO,
+    EtapaPipelineEnum,
+    calcular_prioridad,
+    calcular_probabilidad_inicial,
+    calcular_valor_estimado,
+)
+from pipeline_stats import pipeline_stats  # noqa: E402
+from supabase_rest import SupabaseRestClient, supabase_rest_admin  # noqa: E402
+
+PRIORIDADES = ('A1', 'A2', 'A3', 'B1', 'B2', 'B3', 'C1', 'C2', 'C3')
+
+# Campo lógico -> columna de oportunidades
+CAMPOS = {
+    'prioridad': 'prioridad',
+    'valor': 'valor_estimado_usd',
+    'probabilidad': 'probabilidad_cierre',
+}
+
+ETAPAS_CERRADAS = (EtapaPipelineEnum.CERRADO_GANADO, EtapaPipelineEnum.CERRADO_PERDIDO)
+
+_COLUMNAS = 'id,etapa_pipeline,scoring_urgencia,scoring_madurez,scoring_capacidad,' + ','.join(CAMPOS.values())
+
+# Ids por PATCH: mantiene la URL por debajo de ~8 KB
+IDS_POR_PATCH = 200
+
+
+# ============================================
+# CÁLCULO POR LOTES
+# ============================================
+
+class Tablas:
+    """Tablas de búsqueda construidas con las funciones escalares de sales.py"""
+
+    def __init__(self):
+        representantes = (0, UMBRAL_NIVEL_MEDIO, UMBRAL_NIVEL_ALTO)
+        indice = {p: i for i, p in enumerate(PRIORIDADES)}
+        # [nivel urgencia, nivel madurez, nivel capacidad] -> índice de prioridad
+        self.prioridad = np.array([
+            [[indice[calcular_prioridad(u, m, c)] for c in representantes] for m in representantes]
+            for u in representantes
+        ], dtype=np.int8)
+        self.valor = np.array([calcular_valor_estimado(p) for p in PRIORIDADES])
+        # La última columna es la de etapas sin ajuste (en_nutricion, desconocidas)
+        etapas = list(dict.fromkeys(ETAPAS_PIPELINE + list(AJUSTE_PROBABILIDAD_ETAPA)))
+        self.etapas = {e: i for i, e in enumerate(etapas)}
+        self.sin_ajuste = len(self.etapas)
+        columnas = list(self.etapas) + ['']
+        self.probabilidad = np.array(
+            [[calcular_probabilidad_inicial(p, e) for e in columnas] for p in PRIORIDADES], dtype=np.int16
+        )
+
+    def indice_etapas(self, etapas: List[str]) -> np.ndarray:
+        return np.array([self.etapas.get(e, self.sin_ajuste) for e in etapas], dtype=np.intp)
+
+
+def _niveles(puntos: np.ndarray) -> np.ndarray:
+    return np.select([puntos >= UMBRAL_NIVEL_ALTO, puntos >= UMBRAL_NIVEL_MEDIO], [2, 1], 0)
+
+
+def calcular_lote(tablas: Tablas, urgencia: np.ndarray, madurez: np.ndarray,
+                  capacidad: np.ndarray, etapas: np.ndarray) -> Dict[str, np.ndarray]:
+    """Índice de prioridad, valor y probabilidad para cada fila"""
+    prioridad = tablas.prioridad[_niveles(urgencia), _niveles(madurez), _niveles(capacidad)]
+    return {
+        'prioridad': prioridad,
+        'valor': tablas.valor[prioridad],
+        'probabilidad': tablas.probabilidad[prioridad, etapas],
+    }
+
+
+def cambios_lote(tablas: Tablas, filas: List[dict], campos: Tuple[str, ...]) -> List[Tuple[dict, dict]]:
+    """(fila, {columna: valor nuevo}) de las filas en las que algún campo cambia"""
+    if not filas:
+        return []
+    puntos = np.array(
+        [(f['scoring_urgencia'], f['scoring_madurez'], f['scoring_capacidad']) for f in filas], dtype=np.int16
+    )
+    nuevos = calcular_lote(
+        tablas, puntos[:, 0], puntos[:, 1], puntos[:, 2],
+        tablas.indice_etapas([f['etapa_pipeline'] for f in filas])
+    )
+    valores = {
+        'prioridad': [PRIORIDADES[i] for i in nuevos['prioridad'].tolist()],
+        'valor': nuevos['valor'].tolist(),
+        'probabilidad': nuevos['probabilidad'].tolist(),
+    }
+    cambios = []
+    for n, fila in enumerate(filas):
+        distintos = {}
+        for campo in campos:
+            columna, nuevo = CAMPOS[campo], valores[campo][n]
+            actual = fila.get(columna)
+            if campo == 'prioridad':
+                igual = actual == nuevo
+            else:
+                igual = actual is not None and float(actual) == nuevo
+            if not igual:
+                distintos[columna] = nuevo
+        if distintos:
+            cambios.append((fila, distintos))
+    return cambios
+
+
+# ============================================
+# JOB
+# ============================================
+
+async def _escribir(rest: SupabaseRestClient, cambios: List[Tuple[dict, dict]]) -> int:
+    """Un PATCH por combinación de valores nuevos (y por cada IDS_POR_PATCH ids)"""
+    grupos: Dict[tuple, List[str]] = {}
+    for fila, distintos in cambios:
+        grupos.setdefault(tuple(sorted(distintos.items())), []).append(str(fila['id']))
+
+    escritos = 0
+    for valores, ids in grupos.items():
+        for i in range(0, len(ids), IDS_POR_PATCH):
+            response = await rest.patch(
+                'oportunidades',
+                params={'id': f"in.({','.join(ids[i:i + IDS_POR_PATCH])})"},
+                json=dict(valores),
+                headers={'Prefer': 'return=representation'}
+            )
+            response.raise_for_status()
+            for row in response.json():
+                pipeline_stats.apply(row)
+                escritos += 1
+    return escritos
+
+
+async def repriorizar_oportunidades(rest: SupabaseRestClient = supabase_rest_admin, batch_size: int = 1000,
+                                    dry_run: bool = False, campos: Tuple[str, ...] = ('prioridad',)) -> dict:
+    """
+    Recalcula las oportunidades activas y escribe solo las que cambian
+    Devuelve los totales, las transiciones de prioridad y (en dry-run) el diff por fila
+    """
+    tablas = Tablas()
+    totales = {'leidas': 0, 'cambiadas': 0, 'escritas': 0}
+    transiciones: Counter = Counter()
+    diff: List[dict] = []
+    ultimo_id: Optional[str] = None
+
+    while True:
+        params = [
+            ('estado', 'eq.activo'),
+            ('etapa_pipeline', f"not.in.({','.join(ETAPAS_CERRADAS)})"),
+            ('select', _COLUMNAS),
+            ('order', 'id.asc'),
+            ('limit', str(batch_size)),
+        ]
+        if ultimo_id is not None:
+            params.append(('id', f'gt.{ultimo_id}'))
+        response = await rest.get('oportunidades', params=params)
+        response.raise_for_status()
+        filas = response.json()
+        if not filas:
+            break
+
+        cambios = cambios_lote(tablas, filas, campos)
+        totales['leidas'] += len(filas)
+        totales['cambiadas'] += len(cambios)
+        for fila, distintos in cambios:
+            if 'prioridad' in distintos:
+                transiciones[(fila['prioridad'], distintos['prioridad'])] += 1
+            if dry_run:
+                diff.append({
+                    'id': fila['id'],
+                    **{columna: (fila.get(columna), nuevo) for columna, nuevo in distintos.items()}
+                })
+        if cambios and not dry_run:
+            totales['escritas'] += await _escribir(rest, cambios)
+
+        if len(filas) < batch_size:
+            break
+        ultimo_id = filas[-1]['id']
+
+    return {**totales, 'transiciones': dict(transiciones), 'diff': diff}
+
+
+# ============================================
+# CLI
+# ============================================
+
+def _campos(valor: str) -> Tuple[str, ...]:
+    campos = tuple(c.strip() for c in valor.split(',') if c.strip())
+    desconocidos = [c for c in campos if c not in CAMPOS]
+    if desconocidos or not campos:
+        raise argparse.ArgumentTypeError(f"campos válidos: {', '.join(CAMPOS)}")
+    return campos
+
+
+def run(args) -> int:
+    async def ejecutar():
+        try:
+            return await repriorizar_oportunidades(
+                batch_size=args.batch_size, dry_run=args.dry_run, campos=args.campos
+            )
+        finally:
+            await supabase_rest_admin.aclose()
+
+    start = time.perf_counter()
+    resultado = asyncio.run(ejecutar())
+    for fila in resultado['diff']:
+        detalle = ', '.join(f'{columna}: {antes} -> {nuevo}' for columna, (antes, nuevo)
+                            in fila.items() if columna != 'id')
+        print(f"{fila['id']}  {detalle}")
+    for (antes, nuevo), total in sorted(resultado['transiciones'].items()):
+        print(f'prioridad {antes} -> {nuevo}: {total}')
+    print(f"{resultado['leidas']} oportunidades leídas, {resultado['cambiadas']} con cambios, "
+          f"{resultado['escritas']} actualizadas en {time.perf_counter() - start:.1f}s"
+          f"{' (dry-run)' if args.dry_run else ''}")
+    return 0
+
+
+def bench(args) -> int:
+    rng = np.random.default_rng(args.seed)
+    tablas = Tablas()
+    etapas_posibles = list(tablas.etapas) + ['en_nutricion']
+    urgencia, madurez, capacidad = (rng.integers(0, 101, args.n) for _ in range(3))
+    etapas = [etapas_posibles[i] for i in rng.integers(0, len(etapas_posibles), args.n)]
+
+    start = time.perf_counter()
+    indices = tablas.indice_etapas(etapas)
+    resultado = calcular_lote(tablas, urgencia, madurez, capacidad, indices)
+    t_lote = time.perf_counter() - start
+
+    muestra = rng.choice(args.n, min(args.n, 20000), replace=False).tolist()
+    start = time.perf_counter()
+    distintos = 0
+    for i in muestra:
+        prioridad = calcular_prioridad(int(urgencia[i]), int(madurez[i]), int(capacidad[i]))
+        distintos += (
+            PRIORIDADES[resultado['prioridad'][i]] != prioridad
+            or resultado['valor'][i] != calcular_valor_estimado(prioridad)
+            or resultado['probabilidad'][i] != calcular_probabilidad_inicial(prioridad, etapas[i])
+        )
+    t_escalar = (time.perf_counter() - start) * args.n / len(muestra)
+
+    print(f'{args.n} oportunidades: lote {t_lote:.3f}s ({args.n / t_lote:,.0f}/s), '
+          f'uno a uno ~{t_escalar:.1f}s (estimado)')
+    print(f'Verificación contra el cálculo uno a uno: {distintos} diferencias en {len(muestra)}')
+    return 1 if distintos else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Re-priorización de oportunidades de venta')
+    sub = parser.add_subparsers(dest='command', required=True)
+    rep = sub.add_parser('run', help='Recalcular la prioridad (y opcionalmente valor y probabilidad) de las oportunidades activas')
+    rep.add_argument('--batch-size', type=int, default=1000)
+    rep.add_argument('--dry-run', action='store_true', help='Mostrar el diff sin escribir')
+    rep.add_argument('--campos', type=_campos, default=('prioridad',),
+                     help='Subconjunto de prioridad,valor,probabilidad (por defecto solo prioridad; '
+                          'valor y probabilidad pisan las ediciones manuales de ventas)')
+    ben = sub.add_parser('bench', help='Medir el cálculo por lotes con oportunidades sintéticas')
+    ben.add_argument('-n', type=int, default=1000000)
+    ben.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    return run(args) if args.command == 'run' else bench(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,243 @@
+"""
+Resiliencia para las llamadas a Supabase
+- Circuit breaker por tabla: tras varias fallas seguidas deja de llamar a esa
+  tabla por un tiempo y falla rápido con 503 + Retry-After.
+- Reintentos con backoff y jitter solo para lecturas idempotentes (GET/HEAD),
+  limitados por un presupuesto global para no amplificar una caída.
+- Timeouts adaptativos por tabla a partir del p99 observado.
+"""
+import contextvars
+import os
+import random
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from metrics import breaker_rejections_total, breaker_state, upstream_retries_total, upstream_timeout_seconds
+
+# Circuit breaker
+BREAKER_FAILURES = int(os.environ.get('SUPABASE_BREAKER_FAILURES', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('SUPABASE_BREAKER_RESET', '30'))
+
+# Reintentos
+RETRY_MAX = int(os.environ.get('SUPABASE_RETRY_MAX', '2'))
+RETRY_BACKOFF = float(os.environ.get('SUPABASE_RETRY_BACKOFF', '0.05'))
+# Cada petición original aporta RETRY_BUDGET_RATIO reintentos; además se
+# recuperan RETRY_BUDGET_PER_SECOND por segundo hasta RETRY_BUDGET_MAX
+RETRY_BUDGET_RATIO = float(os.environ.get('SUPABASE_RETRY_BUDGET_RATIO', '0.1'))
+RETRY_BUDGET_PER_SECOND = float(os.environ.get('SUPABASE_RETRY_BUDGET_PER_SECOND', '1'))
+RETRY_BUDGET_MAX = float(os.environ.get('SUPABASE_RETRY_BUDGET_MAX', '20'))
+
+# Timeouts adaptativos: p99 * multiplicador, entre MIN y SUPABASE_TIMEOUT
+TIMEOUT_MIN = float(os.environ.get('SUPABASE_TIMEOUT_MIN', '1'))
+TIMEOUT_MULTIPLIER = float(os.environ.get('SUPABASE_TIMEOUT_MULTIPLIER', '3'))
+TIMEOUT_MIN_SAMPLES = 20
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD')
+RETRYABLE_STATUS = (502, 503, 504)
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+_STATE_VALUE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class SupabaseUnavailable(HTTPException):
+    """El circuito de la tabla está abierto; se responde 503 sin llamar a Supabase"""
+
+    def __init__(self, table: str, retry_after: float):
+        self.table = table
+        self.retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(
+            status_code=503,
+            detail=f"Servicio de datos no disponible temporalmente ({table})",
+            headers={'Retry-After': str(self.retry_after)}
+        )
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.max_failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        breaker_state.labels(name).set(_STATE_VALUE[CLOSED])
+
+    def _set_state(self, state: str):
+        self.state = state
+        breaker_state.labels(self.name).set(_STATE_VALUE[state])
+
+    def before_call(self):
+        """Lanza SupabaseUnavailable si el circuito no admite la llamada"""
+        if self.state == CLOSED:
+            return
+        remaining = self.opened_at + self.reset_seconds - time.monotonic()
+        if self.state == OPEN and remaining <= 0:
+            self._set_state(HALF_OPEN)
+        # Una sola llamada de prueba; el resto sigue fallando rápido. Si la prueba
+        # nunca terminó (p. ej. se canceló) se permite otra tras reset_seconds
+        probe_stale = time.monotonic() - self._probe_started > self.reset_seconds
+        if self.state == HALF_OPEN and (not self._probe_in_flight or probe_stale):
+            self._probe_in_flight = True
+            self._probe_started = time.monotonic()
+            return
+        breaker_rejections_total.labels(self.name).inc()
+        raise SupabaseUnavailable(self.name, max(remaining, 1))
+
+    def record_success(self):
+        self.failures = 0
+        self._probe_in_flight = False
+        if self.state != CLOSED:
+            self._set_state(CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+
+class RetryBudget:
+    """Token bucket global de reintentos"""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, per_second: float = RETRY_BUDGET_PER_SECOND,
+                 maximum: float = RETRY_BUDGET_MAX):
+        self.ratio = ratio
+        self.per_second = per_second
+        self.maximum = maximum
+        self.tokens = maximum
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.maximum, self.tokens + (now - self._updated) * self.per_second)
+        self._updated = now
+
+    def deposit(self):
+        self._refill()
+        self.tokens = min(self.maximum, self.tokens + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AdaptiveTimeout:
+    """Timeout por tabla = p99 de las últimas respuestas exitosas * multiplicador"""
+
+    def __init__(self, name: str, ceiling: float, window: int = 256):
+        self.name = name
+        self.ceiling = ceiling
+        self.samples: Deque[float] = deque(maxlen=window)
+        self._current = ceiling
+        self._since_update = 0
+
+    @property
+    def current(self) -> float:
+        return self._current
+
+    def observe(self, elapsed: float):
+        self.samples.append(elapsed)
+        self._since_update += 1
+        # Recalcular cada 16 muestras para no ordenar la ventana en cada llamada
+        if len(self.samples) >= TIMEOUT_MIN_SAMPLES and self._since_update >= 16:
+            self._since_update = 0
+            ordered = sorted(self.samples)
+            p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+            self._current = min(self.ceiling, max(TIMEOUT_MIN, p99 * TIMEOUT_MULTIPLIER))
+            upstream_timeout_seconds.labels(self.name).set(self._current)
+
+
+class ResiliencePolicy:
+    """Estado compartido de breakers, timeouts y presupuesto de reintentos"""
+
+    def __init__(self, timeout_ceiling: float):
+        self.timeout_ceiling = timeout_ceiling
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.timeouts: Dict[str, AdaptiveTimeout] = {}
+        self.retry_budget = RetryBudget()
+
+    def breaker(self, table: str) -> CircuitBreaker:
+        if table not in self.breakers:
+            self.breakers[table] = CircuitBreaker(table)
+        return self.breakers[table]
+
+    def timeout(self, table: str) -> AdaptiveTimeout:
+        if table not in self.timeouts:
+            self.timeouts[table] = AdaptiveTimeout(table, self.timeout_ceiling)
+        return self.timeouts[table]
+
+    def can_retry(self, method: str, table: str) -> bool:
+        if method not in IDEMPOTENT_METHODS:
+            return False
+        if self.retry_budget.try_withdraw():
+            upstream_retries_total.labels(table).inc()
+            return True
+        return False
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """Full jitter: uniforme entre 0 y base * 2^intento"""
+        return random.uniform(0, RETRY_BACKOFF * (2 ** attempt))
+
+
+# La petición en curso tocó un circuito abierto o una dependencia saturada; ver UnavailableMiddleware
+_unavailable: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    'clarisa_upstream_unavailable', default=None
+)
+
+
+def mark_unavailable(error: HTTPException):
+    """Circuito abierto o dependencia saturada (bulkhead.Overloaded)"""
+    rejected = _unavailable.get()
+    if rejected is not None:
+        rejected.append(error)
+
+
+class UnavailableMiddleware:
+    """
+    Convierte en 503 + Retry-After cualquier respuesta de una petición que
+    chocó con un circuito abierto o fue descartada por un bulkhead
+
+    Muchos handlers atrapan Exception y devuelven 500 o una lista vacía; sin
+    esto el cliente recibiría datos incompletos como si fueran válidos.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        rejected: list = []
+        token = _unavailable.set(rejected)
+        replaced = {'done': False}
+
+        async def send_wrapper(message):
+            # Si la respuesta ya empezó a enviarse (streaming) se deja pasar tal cual
+            if message['type'] == 'http.response.start' and rejected:
+                replaced['done'] = True
+                error = rejected[0]
+                response = JSONResponse(
+                    status_code=503, content={'detail': error.detail}, headers=error.headers
+                )
+                await response(scope, receive, send)
+                return
+            if not replaced['done']:
+                await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _unavailable.reset(token)
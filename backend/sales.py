@@ -2,15 +2,16 @@
 Sales Module - Backend Logic
 Gestión de oportunidades de venta y pipeline
 """
-from typing import Optional, List
+import asyncio
+from typing import Optional, List, Tuple
 from pydantic import BaseModel, Field, EmailStr
 from datetime import datetime, date
-import requests
-import os
-import json
-
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')  # Usar SERVICE_KEY para bypassear RLS en backend
+from supabase_rest import supabase_rest_admin  # Usar SERVICE_KEY para bypassear RLS en backend
+from dataloader import clear_loader, load_one
+import pg_backend
+from pg_backend import pg_enabled
+from pipeline_stats import pipeline_stats
+from keyset import decode_fecha_id_cursor, encode_cursor
 
 # ============================================
 # PYDANTIC MODELS
@@ -39,6 +40,20 @@ class EtapaPipelineEnum:
     CERRADO_PERDIDO = "cerrado_perdido"
     EN_NUTRICION = "en_nutricion"
 
+# Orden de las columnas del kanban
+ETAPAS_PIPELINE = [
+    EtapaPipelineEnum.NUEVO_LEAD,
+    EtapaPipelineEnum.CALIFICADO,
+    EtapaPipelineEnum.CONTACTO_INICIAL,
+    EtapaPipelineEnum.DIAGNOSTICO_PROFUNDO,
+    EtapaPipelineEnum.CONSULTORIA_ACTIVA,
+    EtapaPipelineEnum.PREPARANDO_SOLUCION,
+    EtapaPipelineEnum.NEGOCIACION,
+    EtapaPipelineEnum.CERRADO_GANADO,
+    EtapaPipelineEnum.CERRADO_PERDIDO,
+    EtapaPipelineEnum.EN_NUTRICION,
+]
+
 class EstadoOportunidadEnum:
     ACTIVO = "activo"
     GANADO = "ganado"
@@ -125,6 +140,44 @@ class Actividad(ActividadBase):
 # HELPER FUNCTIONS
 # ============================================
 
+# Umbrales de nivel (0-100) y tablas de valor y probabilidad. Si cambian,
+# recalcular las oportunidades existentes con `python repriorizacion.py`
+UMBRAL_NIVEL_ALTO = 67
+UMBRAL_NIVEL_MEDIO = 34
+
+VALOR_BASE_PRIORIDAD = {
+    'A1': 50000.0,  # Cliente premium
+    'A2': 35000.0,
+    'A3': 25000.0,
+    'B1': 15000.0,
+    'B2': 10000.0,
+    'B3': 7500.0,
+    'C1': 5000.0,
+    'C2': 3000.0,
+    'C3': 1500.0,
+}
+VALOR_BASE_POR_DEFECTO = 5000.0
+
+# Probabilidad base por prioridad
+PROBABILIDAD_BASE = {
+    'A1': 60, 'A2': 50, 'A3': 40,
+    'B1': 30, 'B2': 25, 'B3': 20,
+    'C1': 15, 'C2': 10, 'C3': 5
+}
+PROBABILIDAD_BASE_POR_DEFECTO = 10
+
+# Ajuste por etapa
+AJUSTE_PROBABILIDAD_ETAPA = {
+    'nuevo_lead': 1.0,
+    'calificado': 1.2,
+    'contacto_inicial': 1.3,
+    'diagnostico_profundo': 1.5,
+    'consultoria_activa': 1.7,
+    'preparando_solucion': 1.8,
+    'negociacion': 1.9,
+}
+PROBABILIDAD_MAXIMA = 95  # Hasta que se cierre
+
 def calcular_prioridad(urgencia: int, madurez: int, capacidad: int) -> str:
     """
     Calcula la prioridad basada en scoring
@@ -133,9 +186,9 @@ def calcular_prioridad(urgencia: int, madurez: int, capacidad: int) -> str:
     C1-C3: Baja prioridad (nutrición)
     """
     # Clasificar niveles
-    nivel_urgencia = 'U' if urgencia >= 67 else ('M' if urgencia >= 34 else 'B')
-    nivel_madurez = 'H' if madurez >= 67 else ('M' if madurez >= 34 else 'L')
-    nivel_capacidad = 'H' if capacidad >= 67 else ('M' if capacidad >= 34 else 'L')
+    nivel_urgencia = 'U' if urgencia >= UMBRAL_NIVEL_ALTO else ('M' if urgencia >= UMBRAL_NIVEL_MEDIO else 'B')
+    nivel_madurez = 'H' if madurez >= UMBRAL_NIVEL_ALTO else ('M' if madurez >= UMBRAL_NIVEL_MEDIO else 'L')
+    nivel_capacidad = 'H' if capacidad >= UMBRAL_NIVEL_ALTO else ('M' if capacidad >= UMBRAL_NIVEL_MEDIO else 'L')
     
     # Matriz de priorización
     # A = Alta prioridad (Urgente + Alta madurez/capacidad)
@@ -170,43 +223,14 @@ def calcular_valor_estimado(prioridad: str, organizacion: Optional[str] = None)
     Estima valor potencial basado en prioridad
     Esto es una heurística inicial que puede refinarse
     """
-    base_values = {
-        'A1': 50000.0,  # Cliente premium
-        'A2': 35000.0,
-        'A3': 25000.0,
-        'B1': 15000.0,
-        'B2': 10000.0,
-        'B3': 7500.0,
-        'C1': 5000.0,
-        'C2': 3000.0,
-        'C3': 1500.0,
-    }
-    return base_values.get(prioridad, 5000.0)
+    return VALOR_BASE_PRIORIDAD.get(prioridad, VALOR_BASE_POR_DEFECTO)
 
 def calcular_probabilidad_inicial(prioridad: str, etapa: str) -> int:
     """
     Calcula probabilidad inicial de cierre
     """
-    # Probabilidad base por prioridad
-    prob_base = {
-        'A1': 60, 'A2': 50, 'A3': 40,
-        'B1': 30, 'B2': 25, 'B3': 20,
-        'C1': 15, 'C2': 10, 'C3': 5
-    }
-    
-    # Ajuste por etapa
-    ajustes_etapa = {
-        'nuevo_lead': 1.0,
-        'calificado': 1.2,
-        'contacto_inicial': 1.3,
-        'diagnostico_profundo': 1.5,
-        'consultoria_activa': 1.7,
-        'preparando_solucion': 1.8,
-        'negociacion': 1.9,
-    }
-    
-    prob = prob_base.get(prioridad, 10) * ajustes_etapa.get(etapa, 1.0)
-    return min(int(prob), 95)  # Max 95% hasta que se cierre
+    prob = PROBABILIDAD_BASE.get(prioridad, PROBABILIDAD_BASE_POR_DEFECTO) * AJUSTE_PROBABILIDAD_ETAPA.get(etapa, 1.0)
+    return min(int(prob), PROBABILIDAD_MAXIMA)
 
 # ============================================
 # CRUD OPERATIONS - OPORTUNIDADES
@@ -217,16 +241,10 @@ async def guardar_diagnostico_supabase(diagnostico_data: dict) -> Optional[dict]
     Guarda diagnóstico en Supabase (tabla diagnosticos)
     """
     try:
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/diagnosticos",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest_admin.post(
+            'diagnosticos',
             json=diagnostico_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 201:
@@ -272,20 +290,16 @@ async def crear_oportunidad_desde_diagnostico(diagnostico: dict, user: dict) ->
         }
         
         # Crear en Supabase
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/oportunidades",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest_admin.post(
+            'oportunidades',
             json=oportunidad_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 201:
-            return response.json()[0]
+            oportunidad = response.json()[0]
+            pipeline_stats.apply(oportunidad)
+            return oportunidad
         else:
             print(f"Error creating oportunidad: {response.status_code} - {response.text}")
             return None
@@ -294,55 +308,137 @@ async def crear_oportunidad_desde_diagnostico(diagnostico: dict, user: dict) ->
         print(f"Error in crear_oportunidad_desde_diagnostico: {e}")
         return None
 
-async def get_oportunidades(
+# Columnas de la tarjeta del kanban (OportunidadCard); 'detalle' trae la fila completa con notas
+COLUMNAS_OPORTUNIDAD = {
+    'tarjeta': (
+        'id,nombre_cliente,email_cliente,organizacion,arquetipo_niif,etapa_pipeline,prioridad,estado,'
+        'valor_estimado_usd,probabilidad_cierre,fecha_estimada_cierre,fecha_creacion,ultima_actividad,'
+        'scoring_urgencia,scoring_madurez,scoring_capacidad'
+    ),
+    'detalle': '*',
+}
+
+
+async def get_oportunidades_pagina(
     prioridad: Optional[str] = None,
     etapa: Optional[str] = None,
-    estado: Optional[str] = None
-) -> List[dict]:
-    """Obtiene lista de oportunidades con filtros opcionales"""
-    try:
-        url = f"{SUPABASE_URL}/rest/v1/oportunidades?order=fecha_creacion.desc"
-        
-        if prioridad:
-            url += f"&prioridad=eq.{prioridad}"
-        if etapa:
-            url += f"&etapa_pipeline=eq.{etapa}"
-        if estado:
-            url += f"&estado=eq.{estado}"
-        
-        response = requests.get(
-            url,
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+    estado: Optional[str] = None,
+    vista: str = 'detalle',
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str], Optional[int]]:
+    """
+    Una página de oportunidades ordenadas por (fecha_creacion, id) descendente
+    Devuelve (filas, cursor de la siguiente página o None, total o None).
+    El total sale del Content-Range de la primera página (sin consulta extra).
+    """
+    params = [
+        ('select', COLUMNAS_OPORTUNIDAD[vista]),
+        ('order', 'fecha_creacion.desc,id.desc'),
+        # Una fila de más indica si hay otra página
+        ('limit', limit + 1),
+    ]
+    if prioridad:
+        params.append(('prioridad', f'eq.{prioridad}'))
+    if etapa:
+        params.append(('etapa_pipeline', f'eq.{etapa}'))
+    if estado:
+        params.append(('estado', f'eq.{estado}'))
+    headers = {}
+    if cursor:
+        # Validado: los valores se interpolan en el filtro or=(...)
+        fecha, oportunidad_id = decode_fecha_id_cursor(cursor)
+        params.append(('or', f'(fecha_creacion.lt.{fecha},and(fecha_creacion.eq.{fecha},id.lt.{oportunidad_id}))'))
+    else:
+        headers['Prefer'] = 'count=exact'
+
+    response = await supabase_rest_admin.get('oportunidades', params=params, headers=headers)
+    response.raise_for_status()
+    filas = response.json()
+
+    total = None
+    content_range = response.headers.get('Content-Range', '')
+    if not cursor and '/' in content_range and content_range.split('/')[-1].isdigit():
+        total = int(content_range.split('/')[-1])
+
+    siguiente = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        siguiente = encode_cursor(filas[-1]['fecha_creacion'], filas[-1]['id'])
+    return filas, siguiente, total
+
+# Si kanban_oportunidades no existe en la base (sales_schema.sql sin aplicar) se arma con varias consultas
+_kanban_rpc_disponible = True
+
+
+async def _kanban_grupos(por_columna: int) -> List[dict]:
+    """[{etapa, total, valor_total, tarjetas (hasta por_columna + 1)}] de las etapas con oportunidades"""
+    global _kanban_rpc_disponible
+    if _kanban_rpc_disponible:
+        response = await supabase_rest_admin.post(
+            'rpc/kanban_oportunidades', json={'p_por_columna': por_columna}
         )
-        
-        if response.status_code == 200:
+        if response.status_code != 404:
+            response.raise_for_status()
             return response.json()
-        return []
-        
-    except Exception as e:
-        print(f"Error in get_oportunidades: {e}")
-        return []
+        print("rpc/kanban_oportunidades no existe; usando una consulta por columna")
+        _kanban_rpc_disponible = False
+
+    # Totales de las estadísticas en memoria y una página por etapa no vacía, en paralelo
+    stats = await pipeline_stats.get()
+    etapas = [e for e in stats['por_etapa'] if stats['por_etapa'][e] > 0]
+    paginas = await asyncio.gather(*(
+        supabase_rest_admin.get('oportunidades', params={
+            'select': COLUMNAS_OPORTUNIDAD['tarjeta'],
+            'estado': f'eq.{EstadoOportunidadEnum.ACTIVO}',
+            'etapa_pipeline': f'eq.{etapa}',
+            'order': 'fecha_creacion.desc,id.desc',
+            'limit': por_columna + 1,
+        })
+        for etapa in etapas
+    ))
+    grupos = []
+    for etapa, response in zip(etapas, paginas):
+        response.raise_for_status()
+        grupos.append({
+            'etapa': etapa,
+            'total': stats['por_etapa'][etapa],
+            'valor_total': stats['valor_por_etapa'].get(etapa, 0),
+            'tarjetas': response.json(),
+        })
+    return grupos
+
+
+async def get_kanban(por_columna: int = 20) -> dict:
+    """
+    Tablero del pipeline activo en una sola respuesta acotada
+    Por etapa: total, valor total, las primeras `por_columna` tarjetas y el cursor
+    para seguir con /sales/oportunidades?estado=activo&etapa=...&vista=tarjeta&cursor=...
+    """
+    grupos = {g['etapa']: g for g in await _kanban_grupos(por_columna)}
+    etapas = ETAPAS_PIPELINE + [e for e in grupos if e not in ETAPAS_PIPELINE]
+
+    columnas = []
+    for etapa in etapas:
+        grupo = grupos.get(etapa, {})
+        tarjetas = grupo.get('tarjetas') or []
+        cursor = None
+        if len(tarjetas) > por_columna:
+            tarjetas = tarjetas[:por_columna]
+            cursor = encode_cursor(tarjetas[-1]['fecha_creacion'], tarjetas[-1]['id'])
+        columnas.append({
+            'etapa': etapa,
+            'total': grupo.get('total', 0),
+            'valor_total': round(float(grupo.get('valor_total') or 0), 2),
+            'tarjetas': tarjetas,
+            'cursor': cursor,
+        })
+    return {'por_columna': por_columna, 'columnas': columnas}
 
 async def get_oportunidad_by_id(oportunidad_id: str) -> Optional[dict]:
     """Obtiene una oportunidad por ID"""
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/oportunidades?id=eq.{oportunidad_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
-        )
-        
-        if response.status_code == 200:
-            oportunidades = response.json()
-            return oportunidades[0] if oportunidades else None
-        return None
+        return await load_one('oportunidades', oportunidad_id)
         
     except Exception as e:
         print(f"Error in get_oportunidad_by_id: {e}")
@@ -359,20 +455,18 @@ async def update_oportunidad(oportunidad_id: str, update_data: dict) -> Optional
             if isinstance(update_data['fecha_estimada_cierre'], date):
                 update_data['fecha_estimada_cierre'] = update_data['fecha_estimada_cierre'].isoformat()
         
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/oportunidades?id=eq.{oportunidad_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest_admin.patch(
+            'oportunidades',
+            params={'id': f'eq.{oportunidad_id}'},
             json=update_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 200:
+            clear_loader('oportunidades', oportunidad_id)
             result = response.json()
+            if result:
+                pipeline_stats.apply(result[0])
             return result[0] if result else None
         return None
         
@@ -384,33 +478,50 @@ async def update_oportunidad(oportunidad_id: str, update_data: dict) -> Optional
 # CRUD OPERATIONS - ACTIVIDADES
 # ============================================
 
+# Si registrar_actividad no existe en la base (sales_schema.sql sin aplicar) se hace insert + PATCH
+_actividad_rpc_disponible = True
+
 async def crear_actividad(actividad_data: dict) -> Optional[dict]:
-    """Crea una nueva actividad"""
+    """
+    Crea una nueva actividad y actualiza ultima_actividad de la oportunidad
+    Devuelve la actividad con la nueva `ultima_actividad`
+    """
+    global _actividad_rpc_disponible
     try:
         # Convertir objetos datetime a string ISO
         if 'fecha_programada' in actividad_data and actividad_data['fecha_programada']:
             if isinstance(actividad_data['fecha_programada'], datetime):
                 actividad_data['fecha_programada'] = actividad_data['fecha_programada'].isoformat()
         
-        response = requests.post(
-            f"{SUPABASE_URL}/rest/v1/actividades",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        if _actividad_rpc_disponible:
+            # Insert y actualización de la oportunidad en una sola llamada y transacción
+            response = await supabase_rest_admin.post(
+                'rpc/registrar_actividad',
+                json={'p_actividad': actividad_data}
+            )
+            if response.status_code == 200:
+                clear_loader('oportunidades', actividad_data['oportunidad_id'])
+                return response.json()
+            if response.status_code != 404:
+                print(f"Error creating actividad: {response.status_code} - {response.text}")
+                return None
+            print("rpc/registrar_actividad no existe; usando insert + actualización de la oportunidad")
+            _actividad_rpc_disponible = False
+        
+        response = await supabase_rest_admin.post(
+            'actividades',
             json=actividad_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 201:
             actividad = response.json()[0]
             # Actualizar última actividad en oportunidad
-            await update_oportunidad(
+            oportunidad = await update_oportunidad(
                 actividad_data['oportunidad_id'],
                 {'ultima_actividad': datetime.utcnow().isoformat()}
             )
+            actividad['ultima_actividad'] = oportunidad['ultima_actividad'] if oportunidad else None
             return actividad
         else:
             print(f"Error creating actividad: {response.status_code} - {response.text}")
@@ -425,13 +536,9 @@ async def crear_actividad(actividad_data: dict) -> Optional[dict]:
 async def get_actividades_by_oportunidad(oportunidad_id: str) -> List[dict]:
     """Obtiene todas las actividades de una oportunidad"""
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/actividades?oportunidad_id=eq.{oportunidad_id}&order=created_at.desc",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        response = await supabase_rest_admin.get(
+            'actividades',
+            params={'oportunidad_id': f'eq.{oportunidad_id}', 'order': 'created_at.desc'}
         )
         
         if response.status_code == 200:
@@ -458,16 +565,11 @@ async def update_actividad(actividad_id: str, update_data: dict) -> Optional[dic
             if isinstance(update_data['fecha_completada'], datetime):
                 update_data['fecha_completada'] = update_data['fecha_completada'].isoformat()
         
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/actividades?id=eq.{actividad_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest_admin.patch(
+            'actividades',
+            params={'id': f'eq.{actividad_id}'},
             json=update_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
         
         if response.status_code == 200:
@@ -486,38 +588,12 @@ async def update_actividad(actividad_id: str, update_data: dict) -> Optional[dic
 async def get_pipeline_stats() -> dict:
     """Obtiene estadísticas del pipeline"""
     try:
-        oportunidades = await get_oportunidades(estado=EstadoOportunidadEnum.ACTIVO)
+        # Con Postgres directo la agregación se hace en la base (un solo GROUP BY)
+        if pg_enabled('get_pipeline_stats'):
+            return await pg_backend.pipeline_stats()
         
-        # Contar por etapa
-        stats_por_etapa = {}
-        valor_por_etapa = {}
-        
-        for opp in oportunidades:
-            etapa = opp['etapa_pipeline']
-            stats_por_etapa[etapa] = stats_por_etapa.get(etapa, 0) + 1
-            valor_por_etapa[etapa] = valor_por_etapa.get(etapa, 0) + opp['valor_estimado_usd']
-        
-        # Contar por prioridad
-        stats_por_prioridad = {}
-        for opp in oportunidades:
-            prioridad = opp['prioridad']
-            stats_por_prioridad[prioridad] = stats_por_prioridad.get(prioridad, 0) + 1
-        
-        # Valor total del pipeline
-        valor_total = sum(opp['valor_estimado_usd'] for opp in oportunidades)
-        valor_ponderado = sum(
-            opp['valor_estimado_usd'] * (opp['probabilidad_cierre'] / 100)
-            for opp in oportunidades
-        )
-        
-        return {
-            'total_oportunidades': len(oportunidades),
-            'valor_total_pipeline_usd': round(valor_total, 2),
-            'valor_ponderado_usd': round(valor_ponderado, 2),
-            'por_etapa': stats_por_etapa,
-            'valor_por_etapa': {k: round(v, 2) for k, v in valor_por_etapa.items()},
-            'por_prioridad': stats_por_prioridad
-        }
+        # Agregados mantenidos en memoria con cada alta/actualización (pipeline_stats.py)
+        return await pipeline_stats.get()
         
     except Exception as e:
         print(f"Error in get_pipeline_stats: {e}")
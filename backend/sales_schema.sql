@@ -67,6 +67,9 @@ CREATE INDEX IF NOT EXISTS idx_oportunidades_prioridad ON public.oportunidades(p
 CREATE INDEX IF NOT EXISTS idx_oportunidades_etapa_pipeline ON public.oportunidades(etapa_pipeline);
 CREATE INDEX IF NOT EXISTS idx_oportunidades_estado ON public.oportunidades(estado);
 CREATE INDEX IF NOT EXISTS idx_oportunidades_fecha_creacion ON public.oportunidades(fecha_creacion DESC);
+-- Columnas del kanban y listado paginado por (fecha_creacion, id)
+CREATE INDEX IF NOT EXISTS idx_oportunidades_tablero
+    ON public.oportunidades(estado, etapa_pipeline, fecha_creacion DESC, id DESC);
 
 -- ============================================
 -- Tabla: actividades
@@ -237,9 +240,76 @@ CREATE POLICY "Admin access to actividades"
         )
     );
 
+-- ============================================
+-- Función: tablero kanban del pipeline activo
+-- Por etapa: total, valor y las primeras p_por_columna + 1 tarjetas
+-- (la fila extra le indica al backend que hay más). Un GROUP BY más un
+-- LIMIT por columna que resuelve idx_oportunidades_tablero.
+-- ============================================
+CREATE OR REPLACE FUNCTION kanban_oportunidades(p_por_columna INTEGER DEFAULT 20)
+RETURNS JSONB AS $$
+    SELECT COALESCE(jsonb_agg(jsonb_build_object(
+        'etapa', g.etapa_pipeline,
+        'total', g.total,
+        'valor_total', g.valor_total,
+        'tarjetas', COALESCE(t.tarjetas, '[]'::jsonb)
+    )), '[]'::jsonb)
+    FROM (
+        SELECT etapa_pipeline, COUNT(*) AS total, COALESCE(SUM(valor_estimado_usd), 0) AS valor_total
+        FROM public.oportunidades
+        WHERE estado = 'activo'
+        GROUP BY etapa_pipeline
+    ) g
+    CROSS JOIN LATERAL (
+        SELECT jsonb_agg(to_jsonb(c) ORDER BY c.fecha_creacion DESC, c.id DESC) AS tarjetas
+        FROM (
+            SELECT id, nombre_cliente, email_cliente, organizacion, arquetipo_niif, etapa_pipeline,
+                   prioridad, estado, valor_estimado_usd, probabilidad_cierre, fecha_estimada_cierre,
+                   fecha_creacion, ultima_actividad, scoring_urgencia, scoring_madurez, scoring_capacidad
+            FROM public.oportunidades o
+            WHERE o.estado = 'activo' AND o.etapa_pipeline = g.etapa_pipeline
+            ORDER BY o.fecha_creacion DESC, o.id DESC
+            LIMIT p_por_columna + 1
+        ) c
+    ) t;
+$$ LANGUAGE sql STABLE;
+
+-- ============================================
+-- Función: registrar una actividad y tocar su oportunidad
+-- Inserta la actividad y actualiza oportunidades.ultima_actividad en la
+-- misma transacción; una sola llamada desde el backend. Devuelve la
+-- actividad creada más la nueva ultima_actividad.
+-- ============================================
+CREATE OR REPLACE FUNCTION registrar_actividad(p_actividad JSONB)
+RETURNS JSONB AS $$
+DECLARE
+    v_actividad public.actividades;
+    v_ultima_actividad TIMESTAMP WITH TIME ZONE;
+BEGIN
+    -- Columnas explícitas: id, created_at y updated_at toman sus DEFAULT
+    INSERT INTO public.actividades (
+        oportunidad_id, creado_por, tipo, titulo, descripcion,
+        fecha_programada, fecha_completada, completada, resultado
+    )
+    SELECT oportunidad_id, creado_por, tipo, titulo, descripcion,
+           fecha_programada, fecha_completada, COALESCE(completada, FALSE), resultado
+    FROM jsonb_populate_record(NULL::public.actividades, p_actividad)
+    RETURNING * INTO v_actividad;
+
+    UPDATE public.oportunidades
+    SET ultima_actividad = NOW()
+    WHERE id = v_actividad.oportunidad_id
+    RETURNING ultima_actividad INTO v_ultima_actividad;
+
+    RETURN to_jsonb(v_actividad) || jsonb_build_object('ultima_actividad', v_ultima_actividad);
+END;
+$$ LANGUAGE plpgsql;
+
 -- ============================================
 -- Comentarios para documentación
 -- ============================================
 COMMENT ON TABLE public.oportunidades IS 'Oportunidades de venta generadas automáticamente desde diagnósticos NIIF';
 COMMENT ON TABLE public.actividades IS 'Actividades y tareas de seguimiento para cada oportunidad';
+COMMENT ON FUNCTION kanban_oportunidades IS 'Tablero kanban: total, valor y primeras tarjetas por etapa del pipeline activo';
+COMMENT ON FUNCTION registrar_actividad IS 'Crea una actividad y actualiza ultima_actividad de su oportunidad en una sola transacción';
 COMMENT ON FUNCTION calcular_prioridad IS 'Calcula la prioridad (A1-C3) basada en scoring de urgencia, madurez y capacidad';
@@ -0,0 +1,414 @@
+"""
+Scoring del diagnóstico NIIF S1/S2 en el servidor
+Mismas reglas que frontend/src/utils/scoring.js (calcularScoringCompleto); el
+servidor ya no confía en el scoring que envía el cliente, lo recalcula al
+recibir el diagnóstico.
+
+Si cambian los puntos, los umbrales o la tabla de arquetipos hay que subir
+SCORING_VERSION y re-escorear lo guardado en Mongo. El modo por lotes convierte
+las respuestas a una matriz de puntos y calcula niveles y arquetipos con NumPy:
+    python scoring.py rescore [--dry-run] [--batch-size 20000]
+    python scoring.py bench -n 500000
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+SCORING_VERSION = 1
+
+UMBRAL_ALTO = 80
+UMBRAL_MEDIO = 50
+# Máximo posible de P5-P9; la madurez se normaliza a 100
+MADUREZ_MAX_RAW = 110
+
+NIVELES = ('ALTO', 'MEDIO', 'BAJO')
+ALTO, MEDIO, BAJO = range(3)
+
+# ============================================
+# PUNTOS POR RESPUESTA
+# ============================================
+
+PUNTOS_URGENCIA = {
+    'p3_motivacion': {
+        'Requerimiento regulatorio actual o próximo': 30,
+        'Presión de inversionistas, accionistas o casa matriz': 25,
+        'Acceso a financiamiento sostenible o verde': 20,
+        'Ventaja competitiva y reputación corporativa': 15,
+        'Cadena de suministro lo está solicitando': 20,
+        'Convicción propia de la dirección': 10,
+        'Aún estamos explorando': 0,
+    },
+    'p4_plazo': {
+        'Ya deberíamos haberlo publicado (estamos retrasados)': 40,
+        'Próximos 3-6 meses': 35,
+        '6-12 meses': 20,
+        'Más de 12 meses': 10,
+        'Aún no tenemos plazo definido': 0,
+    },
+    'p18_obstaculo': {
+        'No sabemos por dónde empezar o cómo priorizar': 30,
+        'Falta de recursos humanos o presupuesto': 20,
+        'Complejidad técnica de las normas': 25,
+        'Falta de datos, sistemas o herramientas': 20,
+        'Falta de compromiso interno o prioridad de la dirección': 5,
+        'Falta de conocimiento técnico en el equipo': 25,
+    },
+}
+
+PUNTOS_MADUREZ = {
+    'p5_publica_info': {
+        'Sí, tenemos informe integrado o de sostenibilidad publicado anualmente': 25,
+        'Sí, pero solo internamente o para grupos de interés específicos': 20,
+        'Reportamos parcialmente (solo temas ambientales o sociales)': 15,
+        'No, este será nuestro primer informe': 5,
+        'No lo sé': 0,
+    },
+    'p6_materialidad': {
+        'Sí, tenemos materialidad definida, documentada y aprobada': 25,
+        'Lo hicimos hace más de 2 años (necesita actualización)': 15,
+        'Estamos en proceso de realizarlo': 10,
+        'No, no sabemos cómo hacerlo': 0,
+        '¿Qué es el análisis de materialidad?': 0,
+    },
+    'p7_familiaridad': {
+        'Alto: Hemos tomado cursos y entendemos los requisitos': 20,
+        'Medio: Hemos leído las normas pero tenemos dudas': 15,
+        'Bajo: Solo conocemos lo básico por artículos o menciones': 5,
+        'Nulo: Estamos empezando desde cero': 0,
+    },
+    'p8_riesgos_clima': {
+        'Sí, tenemos registro detallado y cuantificado': 20,
+        'Parcialmente, pero no están cuantificados ni priorizados': 10,
+        'No, aún no los hemos identificado de manera sistemática': 0,
+        'No aplica a nuestro sector': 0,
+    },
+    'p9_huella_carbono': {
+        'Sí, los 3 alcances con verificación externa': 20,
+        'Sí, pero solo Alcance 1 y 2': 15,
+        'Hemos medido alguna vez pero no de forma continua': 10,
+        'No, pero sabemos cómo calcularlo': 5,
+        'No, necesitamos ayuda para empezar': 0,
+    },
+}
+
+PUNTOS_CAPACIDAD = {
+    'p10_liderazgo': {
+        'Dirección General o Gerencia General directamente': 15,
+        'Área específica de Sostenibilidad o Responsabilidad Social': 15,
+        'Área de Riesgos, Cumplimiento o Legal': 10,
+        'Área Financiera o Contable': 10,
+        'Múltiples áreas sin claridad de responsabilidad': 5,
+        'Nadie formalmente asignado': 0,
+    },
+    'p11_junta': {
+        'Sí, hay comité específico y reportes regulares': 15,
+        'Sí, se reporta ocasionalmente en sesiones': 10,
+        'No, pero están solicitando información': 5,
+        'No, no es prioridad aún para el nivel directivo': 0,
+    },
+    'p12_personas_dedicadas': {
+        '3 o más personas con dedicación completa': 15,
+        '1-2 personas con dedicación completa': 10,
+        'Tiempo parcial de varias personas (menos del 50% de su tiempo)': 5,
+        'Nadie dedicado (0 personas asignadas)': 0,
+    },
+    'p13_presupuesto': {
+        'Sí, presupuesto aprobado mayor a $50,000': 15,
+        'Sí, presupuesto aprobado menor a $50,000': 10,
+        'En proceso de aprobación o negociación': 5,
+        'No, aún no hemos presupuestado nada': 0,
+    },
+    'p14_recopilacion': {
+        'Sistema integrado de gestión o plataforma especializada': 10,
+        'Hojas de cálculo centralizadas con proceso definido': 8,
+        'Hojas de cálculo descentralizadas sin proceso estándar': 3,
+        'No recopilamos de manera sistemática': 0,
+        'No lo sé': 0,
+    },
+    'p15_control_interno': {
+        'Sí, con controles y revisiones establecidas similares a datos financieros': 10,
+        'Parcialmente, estamos desarrollándolos': 5,
+        'No, solo tenemos controles para datos financieros': 0,
+        'No lo sé o no estoy seguro': 0,
+    },
+    'p16_datos_auditables': {
+        'Sí, ya tenemos verificación externa de nuestros datos': 10,
+        'Casi, necesitamos mejoras menores en documentación': 7,
+        'No, necesitamos trabajo significativo en calidad y trazabilidad de datos': 3,
+        'No lo sé o no hemos evaluado esto': 0,
+    },
+    'p17_rastreo_impacto': {
+        'Tenemos sistemas que lo permiten con relativa facilidad': 10,
+        'Es posible pero requiere trabajo manual significativo': 5,
+        'Muy difícil, no tenemos esa granularidad de información': 0,
+        'No lo hemos intentado o no sabemos cómo hacerlo': 0,
+    },
+}
+
+CATEGORIAS = {
+    'urgencia': ('CRISIS', 'PLANIFICACIÓN ACTIVA', 'EXPLORACIÓN'),
+    'madurez': ('AVANZADO', 'INTERMEDIO', 'PRINCIPIANTE'),
+    'capacidad': ('LISTOS PARA EJECUTAR', 'NECESITAN APOYO', 'BRECHAS MAYORES'),
+}
+
+ARQUETIPOS = {
+    'A1': {
+        'nombre': 'Crisis sin Recursos',
+        'descripcion': 'Urgencia alta, capacidad y madurez bajas',
+        'recomendacion': 'Sesión Intensiva urgente + Plataforma ($6,000)',
+    },
+    'A2': {
+        'nombre': 'Presión con Base',
+        'descripcion': 'Urgencia alta, capacidad/madurez medias',
+        'recomendacion': 'Membresía Círculo ($497/mes)',
+    },
+    'A3': {
+        'nombre': 'Cerca del Objetivo',
+        'descripcion': 'Urgencia alta, capacidad y madurez altas',
+        'recomendacion': 'Paquete Sesiones Intensivas ($6,500)',
+    },
+    'B1': {
+        'nombre': 'Planificador Novato',
+        'descripcion': 'Urgencia media, capacidad y madurez bajas',
+        'recomendacion': 'Programa de Implementación ($997)',
+    },
+    'B2': {
+        'nombre': 'Planificador Sólido',
+        'descripcion': 'Urgencia media, capacidad/madurez medias',
+        'recomendacion': 'Plataforma Pro ($149/mes)',
+    },
+    'B3': {
+        'nombre': 'Planificador Avanzado',
+        'descripcion': 'Urgencia media, capacidad y madurez altas',
+        'recomendacion': 'Membresía Círculo ($497/mes)',
+    },
+    'C1': {
+        'nombre': 'Explorador Inicial',
+        'descripcion': 'Urgencia baja, capacidad y madurez bajas',
+        'recomendacion': 'Nivel gratuito + recursos educativos',
+    },
+    'C2': {
+        'nombre': 'Explorador con Base',
+        'descripcion': 'Urgencia baja, capacidad/madurez medias',
+        'recomendacion': 'Plataforma Pro ($99/mes)',
+    },
+    'C3': {
+        'nombre': 'Explorador Preparado',
+        'descripcion': 'Urgencia baja, capacidad y madurez altas',
+        'recomendacion': 'Contenido gratuito + seguimiento',
+    },
+}
+
+# Índice de arquetipo = nivel de urgencia * 3 + (número - 1)
+CODIGOS = tuple(f'{letra}{numero}' for letra in 'ABC' for numero in '123')
+
+# Orden de las columnas de la matriz de puntos del modo por lotes
+PREGUNTAS: List[str] = [*PUNTOS_URGENCIA, *PUNTOS_MADUREZ, *PUNTOS_CAPACIDAD]
+_TABLAS = {**PUNTOS_URGENCIA, **PUNTOS_MADUREZ, **PUNTOS_CAPACIDAD}
+_COLS_URGENCIA = [PREGUNTAS.index(p) for p in PUNTOS_URGENCIA]
+_COLS_MADUREZ = [PREGUNTAS.index(p) for p in PUNTOS_MADUREZ]
+_COLS_CAPACIDAD = [PREGUNTAS.index(p) for p in PUNTOS_CAPACIDAD]
+
+
+# ============================================
+# UN DIAGNÓSTICO
+# ============================================
+
+def _nivel(puntos: int) -> int:
+    if puntos >= UMBRAL_ALTO:
+        return ALTO
+    if puntos >= UMBRAL_MEDIO:
+        return MEDIO
+    return BAJO
+
+
+def _normalizar_madurez(raw):
+    """Math.round de JS: .5 redondea hacia arriba (round de Python redondea al par)"""
+    return np.floor(raw * 100 / MADUREZ_MAX_RAW + 0.5)
+
+
+def _dimension(nombre: str, puntos: int, nivel: int) -> dict:
+    return {'puntos': int(puntos), 'nivel': NIVELES[nivel], 'categoria': CATEGORIAS[nombre][nivel]}
+
+
+def _indice_arquetipo(nivel_urgencia: int, nivel_madurez: int, nivel_capacidad: int) -> int:
+    if nivel_capacidad == BAJO and nivel_madurez == BAJO:
+        numero = 0
+    elif nivel_capacidad == MEDIO or nivel_madurez == MEDIO:
+        numero = 1
+    else:
+        numero = 2
+    return nivel_urgencia * 3 + numero
+
+
+def _scoring(urgencia: int, madurez: int, capacidad: int, nu: int, nm: int, nc: int, arquetipo: int) -> dict:
+    codigo = CODIGOS[arquetipo]
+    return {
+        'urgencia': _dimension('urgencia', urgencia, nu),
+        'madurez': _dimension('madurez', madurez, nm),
+        'capacidad': _dimension('capacidad', capacidad, nc),
+        'arquetipo': {'codigo': codigo, **ARQUETIPOS[codigo]},
+    }
+
+
+def calcular_scoring(respuestas: dict) -> dict:
+    """Scoring completo (urgencia, madurez, capacidad, arquetipo) de un diagnóstico"""
+    def suma(tablas):
+        return sum(tabla.get(respuestas.get(pregunta), 0) for pregunta, tabla in tablas.items())
+
+    urgencia = suma(PUNTOS_URGENCIA)
+    madurez = int(_normalizar_madurez(suma(PUNTOS_MADUREZ)))
+    capacidad = suma(PUNTOS_CAPACIDAD)
+    nu, nm, nc = _nivel(urgencia), _nivel(madurez), _nivel(capacidad)
+    return _scoring(urgencia, madurez, capacidad, nu, nm, nc, _indice_arquetipo(nu, nm, nc))
+
+
+# ============================================
+# POR LOTES (NumPy)
+# ============================================
+
+def matriz_puntos(docs: Iterable[dict]) -> np.ndarray:
+    """Matriz (n, len(PREGUNTAS)) con los puntos de cada respuesta; desconocidas valen 0"""
+    filas = [[_TABLAS[p].get(doc.get(p), 0) for p in PREGUNTAS] for doc in docs]
+    return np.array(filas, dtype=np.int16).reshape(len(filas), len(PREGUNTAS))
+
+
+def _niveles(puntos: np.ndarray) -> np.ndarray:
+    return np.select([puntos >= UMBRAL_ALTO, puntos >= UMBRAL_MEDIO], [ALTO, MEDIO], BAJO)
+
+
+def calcular_scoring_lote(puntos: np.ndarray) -> Dict[str, np.ndarray]:
+    """Puntos, niveles e índice de arquetipo de todas las filas de matriz_puntos()"""
+    urgencia = puntos[:, _COLS_URGENCIA].sum(axis=1, dtype=np.int32)
+    madurez = _normalizar_madurez(puntos[:, _COLS_MADUREZ].sum(axis=1, dtype=np.int32)).astype(np.int32)
+    capacidad = puntos[:, _COLS_CAPACIDAD].sum(axis=1, dtype=np.int32)
+    nu, nm, nc = _niveles(urgencia), _niveles(madurez), _niveles(capacidad)
+
+    numero = np.where(
+        (nc == BAJO) & (nm == BAJO), 0,
+        np.where((nc == MEDIO) | (nm == MEDIO), 1, 2)
+    )
+    return {
+        'urgencia': urgencia, 'madurez': madurez, 'capacidad': capacidad,
+        'nivel_urgencia': nu, 'nivel_madurez': nm, 'nivel_capacidad': nc,
+        'arquetipo': nu * 3 + numero,
+    }
+
+
+def scorings_lote(resultado: Dict[str, np.ndarray]) -> List[dict]:
+    """Documentos de scoring a partir de calcular_scoring_lote()"""
+    columnas = zip(*(resultado[k].tolist() for k in (
+        'urgencia', 'madurez', 'capacidad', 'nivel_urgencia', 'nivel_madurez', 'nivel_capacidad', 'arquetipo'
+    )))
+    return [_scoring(*fila) for fila in columnas]
+
+
+# ============================================
+# RE-ESCOREO EN MONGO
+# ============================================
+
+async def rescore_diagnosticos(db, batch_size: int = 20000, dry_run: bool = False) -> dict:
+    """Recalcula el scoring de todos los diagnósticos y escribe solo los que cambian"""
+    from pymongo import UpdateOne
+
+    proyeccion = {p: 1 for p in PREGUNTAS}
+    proyeccion.update({'scoring': 1, 'scoring_version': 1})
+    totales = {'leidos': 0, 'cambiados': 0, 'escritos': 0}
+
+    async def procesar(docs: List[dict]):
+        nuevos = scorings_lote(calcular_scoring_lote(matriz_puntos(docs)))
+        ops = [
+            UpdateOne({'_id': doc['_id']}, {'$set': {'scoring': nuevo, 'scoring_version': SCORING_VERSION}})
+            for doc, nuevo in zip(docs, nuevos)
+            if doc.get('scoring') != nuevo or doc.get('scoring_version') != SCORING_VERSION
+        ]
+        totales['leidos'] += len(docs)
+        totales['cambiados'] += len(ops)
+        if ops and not dry_run:
+            result = await db.diagnosticos.bulk_write(ops, ordered=False)
+            totales['escritos'] += result.modified_count
+
+    lote: List[dict] = []
+    async for doc in db.diagnosticos.find({}, proyeccion, batch_size=batch_size):
+        lote.append(doc)
+        if len(lote) >= batch_size:
+            await procesar(lote)
+            lote = []
+    if lote:
+        await procesar(lote)
+    return totales
+
+
+# ============================================
+# CLI
+# ============================================
+
+def _respuestas_aleatorias(rng: random.Random) -> dict:
+    # Alguna respuesta fuera de la tabla para cubrir el caso "vale 0"
+    return {p: rng.choice([*tabla, 'Otra']) for p, tabla in _TABLAS.items()}
+
+
+def bench(args) -> int:
+    rng = random.Random(args.seed)
+    docs = [_respuestas_aleatorias(rng) for _ in range(args.n)]
+
+    start = time.perf_counter()
+    puntos = matriz_puntos(docs)
+    t_matriz = time.perf_counter() - start
+    start = time.perf_counter()
+    resultado = calcular_scoring_lote(puntos)
+    t_calculo = time.perf_counter() - start
+    start = time.perf_counter()
+    lote = scorings_lote(resultado)
+    t_docs = time.perf_counter() - start
+
+    muestra = rng.sample(range(args.n), min(args.n, 2000))
+    distintos = sum(calcular_scoring(docs[i]) != lote[i] for i in muestra)
+    total = t_matriz + t_calculo + t_docs
+    print(f'{args.n} diagnósticos: matriz {t_matriz:.3f}s, cálculo {t_calculo:.3f}s, '
+          f'documentos {t_docs:.3f}s, total {total:.3f}s ({args.n / total:,.0f}/s)')
+    print(f'Verificación contra el cálculo uno a uno: {distintos} diferencias en {len(muestra)}')
+    return 1 if distintos else 0
+
+
+def rescore(args) -> int:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        start = time.perf_counter()
+        totales = asyncio.run(rescore_diagnosticos(
+            client[os.environ['DB_NAME']], batch_size=args.batch_size, dry_run=args.dry_run
+        ))
+    finally:
+        client.close()
+    print(f"{totales['leidos']} diagnósticos leídos, {totales['cambiados']} con scoring distinto, "
+          f"{totales['escritos']} actualizados en {time.perf_counter() - start:.1f}s"
+          f"{' (dry-run)' if args.dry_run else ''}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Scoring del diagnóstico')
+    sub = parser.add_subparsers(dest='command', required=True)
+    res = sub.add_parser('rescore', help='Recalcular el scoring de los diagnósticos guardados en Mongo')
+    res.add_argument('--batch-size', type=int, default=20000)
+    res.add_argument('--dry-run', action='store_true', help='Solo contar los que cambiarían')
+    ben = sub.add_parser('bench', help='Medir el modo por lotes con diagnósticos sintéticos')
+    ben.add_argument('-n', type=int, default=500000)
+    ben.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    return rescore(args) if args.command == 'rescore' else bench(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,13 @@
-from fastapi import FastAPI, APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, APIRouter, Depends, Header, HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, IndexModel
 import os
+import re
+import json
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
@@ -94,8 +98,8 @@ class DiagnosticoSubmission(BaseModel):
     p19_apoyo_valioso: List[str]
     p20_inversion: str
     
-    # Scoring (calculado en frontend)
-    scoring: Scoring
+    # Scoring: el frontend lo muestra al instante, pero el servidor lo recalcula
+    scoring: Optional[Scoring] = None
     
     # Metadata
     timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -117,66 +121,87 @@ async def root():
 
 
 @api_router.post("/diagnostico", response_model=DiagnosticoResponse)
-async def submit_diagnostico(diagnostico: DiagnosticoSubmission, user_id: Optional[str] = None):
+async def submit_diagnostico(
+    diagnostico: DiagnosticoSubmission,
+    user_id: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None)
+):
+    # Double clicks and retries get the original response without writing again:
+    # keyed by the Idempotency-Key header, or by email + answers within a time window.
+    # A header key also stores a hash of the answers, so reusing it for other answers is a 422
+    respuestas = diagnostico.model_dump(mode='json', exclude={'scoring', 'timestamp', 'id'})
+    respuestas['user_id'] = user_id
+    if idempotency_key:
+        clave, ttl = clave_por_cabecera(diagnostico.email, idempotency_key), IDEMPOTENCY_KEY_TTL_SECONDS
+        huella = huella_por_contenido(respuestas)
+    else:
+        clave, ttl = clave_por_contenido(diagnostico.email, respuestas), IDEMPOTENCY_WINDOW_SECONDS
+        huella = None
+    try:
+        original = await diagnostico_idempotencia.reservar(clave, diagnostico.id, ttl, huella)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error verificando idempotencia del diagnóstico: {e}")
+        clave, original = None, None
+    if original is not None:
+        logger.info(f"Diagnóstico repetido de {diagnostico.email}: se devuelve {original['id']}")
+        return DiagnosticoResponse(**original)
+
     try:
+        # The client's scoring is only a preview: always recompute it server-side
+        scoring = calcular_scoring(diagnostico.model_dump(exclude={'scoring'}))
+        if diagnostico.scoring is not None and diagnostico.scoring.model_dump() != scoring:
+            logger.warning(
+                f"Scoring del cliente distinto al del servidor para {diagnostico.email}: "
+                f"{diagnostico.scoring.arquetipo.codigo} -> {scoring['arquetipo']['codigo']}"
+            )
+        diagnostico.scoring = Scoring(**scoring)
+
         # Convert to dict and serialize datetime to ISO string for MongoDB
         doc = diagnostico.model_dump()
         doc['timestamp'] = doc['timestamp'].isoformat()
-        
-        # Convert scoring to dict for MongoDB
-        doc['scoring'] = {
-            'urgencia': diagnostico.scoring.urgencia.model_dump(),
-            'madurez': diagnostico.scoring.madurez.model_dump(),
-            'capacidad': diagnostico.scoring.capacidad.model_dump(),
-            'arquetipo': diagnostico.scoring.arquetipo.model_dump()
-        }
+        doc['scoring_version'] = SCORING_VERSION
         
         # Add user_id if provided
         if user_id:
             doc['user_id'] = user_id
         
         # Save to MongoDB
-        result = await db.diagnosticos.insert_one(doc)
+        async with mongo_bulkhead.slot():
+            result = await db.diagnosticos.insert_one(doc)
         
         logger.info(f"Diagnóstico guardado: {diagnostico.email} - {diagnostico.organizacion} - Arquetipo: {diagnostico.scoring.arquetipo.codigo}")
         
-        # If user is logged in, create sales opportunity automatically
+        # If user is logged in, the sales opportunity and progress are created in the
+        # background (outbox.py); the response doesn't wait for them
         if user_id:
+            diagnostico_dict = {
+                'id': diagnostico.id,
+                'empresa': diagnostico.organizacion,
+                'scoring': {
+                    'urgencia': {'puntos': diagnostico.scoring.urgencia.puntos},
+                    'madurez': {'puntos': diagnostico.scoring.madurez.puntos},
+                    'capacidad': {'puntos': diagnostico.scoring.capacidad.puntos}
+                },
+                'scoring_total': (
+                    diagnostico.scoring.urgencia.puntos + 
+                    diagnostico.scoring.madurez.puntos + 
+                    diagnostico.scoring.capacidad.puntos
+                ) // 3,
+                'arquetipo': {
+                    'codigo': diagnostico.scoring.arquetipo.codigo,
+                    'nombre': diagnostico.scoring.arquetipo.nombre
+                }
+            }
             try:
-                user = await get_user_by_id(user_id)
-                if user:
-                    # Prepare diagnostico data for opportunity creation
-                    diagnostico_dict = {
-                        'id': diagnostico.id,
-                        'empresa': diagnostico.organizacion,
-                        'scoring': {
-                            'urgencia': {'puntos': diagnostico.scoring.urgencia.puntos},
-                            'madurez': {'puntos': diagnostico.scoring.madurez.puntos},
-                            'capacidad': {'puntos': diagnostico.scoring.capacidad.puntos}
-                        },
-                        'scoring_total': (
-                            diagnostico.scoring.urgencia.puntos + 
-                            diagnostico.scoring.madurez.puntos + 
-                            diagnostico.scoring.capacidad.puntos
-                        ) // 3,
-                        'arquetipo': {
-                            'codigo': diagnostico.scoring.arquetipo.codigo,
-                            'nombre': diagnostico.scoring.arquetipo.nombre
-                        }
-                    }
-                    
-                    oportunidad = await crear_oportunidad_desde_diagnostico(diagnostico_dict, user)
-                    if oportunidad:
-                        logger.info(f"Oportunidad creada automáticamente: {oportunidad['id']} para user: {user_id}")
-                    
-                    # Registrar progreso - Fase 1 completada
-                    await registrar_diagnostico_completado(user_id)
-                    logger.info(f"Progreso registrado: Diagnóstico completado para user: {user_id}")
+                async with mongo_bulkhead.slot():
+                    await diagnostico_outbox.enqueue(diagnostico_dict, user_id)
             except Exception as e:
-                logger.error(f"Error creating opportunity from diagnostico: {e}")
-                # No detenemos el flujo si falla la creación de oportunidad
+                logger.error(f"Error encolando efectos del diagnóstico {diagnostico.id}: {e}")
+                # No detenemos el flujo: el diagnóstico ya quedó guardado
         
-        return DiagnosticoResponse(
+        response = DiagnosticoResponse(
             id=diagnostico.id,
             mensaje="Diagnóstico recibido exitosamente. Recibirás tu informe en 48 horas.",
             timestamp=diagnostico.timestamp.isoformat(),
@@ -184,21 +209,132 @@ async def submit_diagnostico(diagnostico: DiagnosticoSubmission, user_id: Option
         )
     except Exception as e:
         logger.error(f"Error guardando diagnóstico: {str(e)}")
+        if clave:
+            await diagnostico_idempotencia.liberar(clave)
         raise HTTPException(status_code=500, detail="Error procesando diagnóstico")
 
+    if clave:
+        try:
+            await diagnostico_idempotencia.completar(clave, response.model_dump(mode='json'))
+        except Exception as e:
+            logger.error(f"Error guardando respuesta idempotente del diagnóstico {diagnostico.id}: {e}")
+            # Otherwise every retry gets a 409 until the key expires
+            await diagnostico_idempotencia.liberar(clave)
+    return response
+
 
 @api_router.get("/diagnostico/{diagnostico_id}")
 async def get_diagnostico(diagnostico_id: str):
-    diagnostico = await db.diagnosticos.find_one({"id": diagnostico_id}, {"_id": 0})
+    async with mongo_bulkhead.slot():
+        diagnostico = await db.diagnosticos.find_one({"id": diagnostico_id}, {"_id": 0})
     if not diagnostico:
         raise HTTPException(status_code=404, detail="Diagnóstico no encontrado")
     return diagnostico
 
 
-@api_router.get("/diagnosticos")
-async def get_all_diagnosticos():
-    diagnosticos = await db.diagnosticos.find({}, {"_id": 0}).to_list(1000)
-    return diagnosticos
+# Page size limits for /diagnosticos (NDJSON streams walk the collection in pages of the max)
+DIAGNOSTICOS_PAGE_DEFAULT = 100
+DIAGNOSTICOS_PAGE_MAX = 1000
+_FIELD_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$')
+
+
+async def ensure_diagnostico_indexes():
+    """Indexes for lookups by id/email/user/arquetipo and the (timestamp, id) keyset order"""
+    indexes = [
+        IndexModel([('id', ASCENDING)], unique=True, name='id_unique'),
+        IndexModel([('email', ASCENDING)]),
+        IndexModel([('user_id', ASCENDING)]),
+        IndexModel([('timestamp', DESCENDING), ('id', DESCENDING)]),
+        IndexModel([('scoring.arquetipo.codigo', ASCENDING)]),
+    ]
+    try:
+        await db.diagnosticos.create_indexes(indexes)
+    except Exception as e:
+        # Don't block startup (e.g. legacy duplicate ids); queries still work without indexes
+        logger.error(f"Error creando índices de diagnosticos: {e}")
+
+
+def _diagnosticos_query(cursor: Optional[str], email: Optional[str], user_id: Optional[str],
+                        arquetipo: Optional[str]) -> dict:
+    query = {}
+    if email:
+        query['email'] = email
+    if user_id:
+        query['user_id'] = user_id
+    if arquetipo:
+        query['scoring.arquetipo.codigo'] = arquetipo
+    if cursor:
+        timestamp, diagnostico_id = decode_cursor(cursor)
+        query['$or'] = [
+            {'timestamp': {'$lt': timestamp}},
+            {'timestamp': timestamp, 'id': {'$lt': diagnostico_id}},
+        ]
+    return query
+
+
+def _diagnosticos_projection(fields: Optional[str]) -> dict:
+    if not fields:
+        return {'_id': 0}
+    names = [f.strip() for f in fields.split(',') if f.strip()]
+    invalid = [f for f in names if not _FIELD_NAME.match(f)]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Campos inválidos: {', '.join(invalid)}")
+    # id and timestamp are always needed to build the next cursor
+    return {'_id': 0, 'id': 1, 'timestamp': 1, **{f: 1 for f in names}}
+
+
+async def _diagnosticos_page(query: dict, projection: dict, limit: int) -> List[dict]:
+    async with mongo_bulkhead.slot():
+        return await (
+            db.diagnosticos.find(query, projection)
+            .sort([('timestamp', DESCENDING), ('id', DESCENDING)])
+            .limit(limit)
+            .to_list(limit)
+        )
+
+
+from auth import require_admin
+
+
+@api_router.get("/diagnosticos", dependencies=[Depends(require_admin)])
+async def get_all_diagnosticos(
+    limit: int = Query(DIAGNOSTICOS_PAGE_DEFAULT, ge=1, le=DIAGNOSTICOS_PAGE_MAX),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior"),
+    fields: Optional[str] = Query(None, description="Campos a devolver, separados por coma"),
+    email: Optional[str] = None,
+    user_id: Optional[str] = None,
+    arquetipo: Optional[str] = None,
+    format: str = Query("json", pattern="^(json|ndjson)$")
+):
+    """
+    Diagnósticos del más reciente al más antiguo, paginados por (timestamp, id)
+    - json: una página; X-Next-Cursor trae el cursor de la siguiente si hay más
+    - ndjson: recorre todas las páginas desde `cursor`, una línea por diagnóstico
+    """
+    projection = _diagnosticos_projection(fields)
+    query = _diagnosticos_query(cursor, email, user_id, arquetipo)
+
+    if format == "ndjson":
+        async def stream():
+            page_query = query
+            while True:
+                page = await _diagnosticos_page(page_query, projection, DIAGNOSTICOS_PAGE_MAX)
+                for doc in page:
+                    yield json.dumps(doc, default=str, ensure_ascii=False) + "\n"
+                if len(page) < DIAGNOSTICOS_PAGE_MAX:
+                    return
+                last = encode_cursor(page[-1].get('timestamp'), page[-1].get('id'))
+                page_query = _diagnosticos_query(last, email, user_id, arquetipo)
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+    # One extra row tells whether there is a next page without a count query
+    page = await _diagnosticos_page(query, projection, limit + 1)
+    headers = {}
+    if len(page) > limit:
+        page = page[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(page[-1].get('timestamp'), page[-1].get('id'))
+    return JSONResponse(content=jsonable_encoder(page), headers=headers)
 
 
 # ============================================
@@ -210,9 +346,14 @@ from auth import (
     verify_password, 
     generate_session_token,
     create_user_in_supabase,
+    EMAIL_ALREADY_REGISTERED,
     get_user_by_email,
     get_user_by_id,
-    update_user_last_access
+    update_user_last_access,
+    update_user_password_hash,
+    get_session,
+    require_session,
+    session_denylist
 )
 from sales import (
     OportunidadCreate,
@@ -221,8 +362,8 @@ from sales import (
     ActividadCreate,
     ActividadUpdate,
     Actividad,
-    crear_oportunidad_desde_diagnostico,
-    get_oportunidades,
+    get_oportunidades_pagina,
+    get_kanban,
     get_oportunidad_by_id,
     update_oportunidad,
     crear_actividad,
@@ -236,8 +377,28 @@ from progreso import (
     inicializar_progreso_usuario,
     registrar_accion,
     obtener_acciones_usuario,
-    obtener_estadisticas_progreso,
-    registrar_diagnostico_completado
+    obtener_estadisticas_progreso
+)
+from supabase_rest import close_clients as close_supabase_clients
+from pg_backend import close_pool as close_pg_pool
+from passwords import password_hasher
+from last_access import last_access_buffer
+from pipeline_stats import pipeline_stats
+from metrics import MetricsMiddleware, metrics_payload
+from dataloader import DataLoaderMiddleware
+from resilience import UnavailableMiddleware
+from bulkhead import PriorityMiddleware, mongo_bulkhead
+from rate_limit import RateLimitMiddleware
+from keyset import decode_cursor, encode_cursor
+from scoring import SCORING_VERSION, calcular_scoring
+from outbox import DiagnosticoOutbox, build_router as build_outbox_router
+from idempotency import (
+    IDEMPOTENCY_KEY_TTL_SECONDS,
+    IDEMPOTENCY_WINDOW_SECONDS,
+    IdempotencyStore,
+    clave_por_cabecera,
+    clave_por_contenido,
+    huella_por_contenido
 )
 from recursos import router as recursos_router
 from admin_recursos import router as admin_recursos_router
@@ -262,13 +423,8 @@ class AuthResponse(BaseModel):
 async def register(request: RegisterRequest):
     """Register a new user"""
     try:
-        # Check if user already exists
-        existing_user = await get_user_by_email(request.email)
-        if existing_user:
-            raise HTTPException(status_code=400, detail="Email already registered")
-        
         # Hash password
-        hashed_password = hash_password(request.password)
+        hashed_password = await hash_password(request.password)
         
         # Create user data
         user_id = str(uuid.uuid4())
@@ -288,15 +444,17 @@ async def register(request: RegisterRequest):
             'updated_at': datetime.now(timezone.utc).isoformat()
         }
         
-        # Create user in Supabase
+        # Create user in Supabase (one INSERT; the unique email constraint catches duplicates)
         created_user, error = await create_user_in_supabase(user_data)
         
+        if error == EMAIL_ALREADY_REGISTERED:
+            raise HTTPException(status_code=400, detail=error)
         if error:
             logger.error(f"Error creating user in Supabase: {error}")
             raise HTTPException(status_code=500, detail=f"Error creating user: {error}")
         
         # Generate session token
-        session_token = generate_session_token()
+        session_token = generate_session_token(created_user)
         
         # Remove password hash from response
         created_user.pop('password_hash', None)
@@ -324,14 +482,19 @@ async def login(request: LoginRequest):
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
         # Verify password
-        if not verify_password(request.password, user.get('password_hash', '')):
+        valid, needs_rehash = await verify_password(request.password, user.get('password_hash', ''))
+        if not valid:
             raise HTTPException(status_code=401, detail="Invalid email or password")
         
-        # Update last access
+        # Upgrade legacy/old-cost hashes now that we know the plain password
+        if needs_rehash:
+            await update_user_password_hash(user['id'], await hash_password(request.password))
+        
+        # Update last access (buffered, no round trip)
         await update_user_last_access(user['id'])
         
         # Generate session token
-        session_token = generate_session_token()
+        session_token = generate_session_token(user)
         
         # Remove password hash from response
         user.pop('password_hash', None)
@@ -349,9 +512,20 @@ async def login(request: LoginRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/auth/me")
-async def get_current_user(user_id: str):
-    """Get current user by ID"""
+async def get_current_user(user_id: Optional[str] = None, session: Optional[dict] = Depends(get_session)):
+    """Current user: from the session token claims (no lookup), or by ID for older clients"""
     try:
+        if session:
+            return {
+                'id': session['sub'],
+                'email': session.get('email'),
+                'nombre_completo': session.get('nombre'),
+                'rol': session['rol'],
+                'plan_actual': session['plan'],
+            }
+        if not user_id:
+            raise HTTPException(status_code=401, detail="Not authenticated")
+        
         user = await get_user_by_id(user_id)
         
         if not user:
@@ -367,6 +541,22 @@ async def get_current_user(user_id: str):
         logger.error(f"Error getting current user: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/auth/session")
+async def get_current_session(session: dict = Depends(require_session)):
+    """Who the caller is, straight from the token (no database lookup)"""
+    return {
+        'user_id': session['sub'],
+        'rol': session['rol'],
+        'plan': session['plan'],
+        'expires_at': datetime.fromtimestamp(session['exp'], timezone.utc).isoformat()
+    }
+
+@api_router.post("/auth/logout")
+async def logout(session: dict = Depends(require_session)):
+    """Revoke the current session token"""
+    session_denylist.revoke(session['jti'], session['exp'])
+    return {"success": True}
+
 @api_router.get("/auth/check-email")
 async def check_email(email: EmailStr):
     """Check if email exists"""
@@ -382,21 +572,49 @@ async def check_email(email: EmailStr):
 # SALES MODULE ENDPOINTS
 # ============================================
 
-@api_router.get("/sales/oportunidades", response_model=List[dict])
+# Admins only; the role comes from the session token (no user lookup)
+sales_router = APIRouter(dependencies=[Depends(require_admin)])
+
+@sales_router.get("/sales/oportunidades", response_model=List[dict])
 async def list_oportunidades(
     prioridad: Optional[str] = None,
     etapa: Optional[str] = None,
-    estado: Optional[str] = None
+    estado: Optional[str] = None,
+    vista: str = Query("detalle", pattern="^(tarjeta|detalle)$"),
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor de la página anterior")
 ):
-    """Lista todas las oportunidades con filtros opcionales"""
+    """
+    Lista oportunidades con filtros opcionales, de la más reciente a la más antigua
+    - vista=tarjeta: solo las columnas del kanban (sin notas)
+    - X-Next-Cursor: cursor de la siguiente página; X-Total-Count: total (primera página)
+    """
     try:
-        oportunidades = await get_oportunidades(prioridad=prioridad, etapa=etapa, estado=estado)
-        return oportunidades
+        oportunidades, siguiente, total = await get_oportunidades_pagina(
+            prioridad=prioridad, etapa=etapa, estado=estado, vista=vista, limit=limit, cursor=cursor
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting oportunidades: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    headers = {}
+    if siguiente:
+        headers['X-Next-Cursor'] = siguiente
+    if total is not None:
+        headers['X-Total-Count'] = str(total)
+    return JSONResponse(content=oportunidades, headers=headers)
+
+@sales_router.get("/sales/kanban", response_model=dict)
+async def get_sales_kanban(por_columna: int = Query(20, ge=1, le=100)):
+    """Tablero kanban: por etapa, total, valor y las primeras tarjetas con cursor para ver más"""
+    try:
+        return await get_kanban(por_columna)
+    except Exception as e:
+        logger.error(f"Error getting kanban: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/sales/oportunidades/{oportunidad_id}", response_model=dict)
+@sales_router.get("/sales/oportunidades/{oportunidad_id}", response_model=dict)
 async def get_oportunidad(oportunidad_id: str):
     """Obtiene una oportunidad específica por ID"""
     try:
@@ -410,7 +628,7 @@ async def get_oportunidad(oportunidad_id: str):
         logger.error(f"Error getting oportunidad: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.patch("/sales/oportunidades/{oportunidad_id}", response_model=dict)
+@sales_router.patch("/sales/oportunidades/{oportunidad_id}", response_model=dict)
 async def update_oportunidad_endpoint(oportunidad_id: str, update_data: OportunidadUpdate):
     """Actualiza una oportunidad"""
     try:
@@ -432,7 +650,7 @@ async def update_oportunidad_endpoint(oportunidad_id: str, update_data: Oportuni
         logger.error(f"Error updating oportunidad: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/sales/oportunidades/{oportunidad_id}/actividades", response_model=List[dict])
+@sales_router.get("/sales/oportunidades/{oportunidad_id}/actividades", response_model=List[dict])
 async def list_actividades(oportunidad_id: str):
     """Lista todas las actividades de una oportunidad"""
     try:
@@ -442,7 +660,7 @@ async def list_actividades(oportunidad_id: str):
         logger.error(f"Error getting actividades: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.post("/sales/actividades", response_model=dict)
+@sales_router.post("/sales/actividades", response_model=dict)
 async def create_actividad(actividad: ActividadCreate):
     """Crea una nueva actividad"""
     try:
@@ -458,7 +676,7 @@ async def create_actividad(actividad: ActividadCreate):
         logger.error(f"Error creating actividad: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.patch("/sales/actividades/{actividad_id}", response_model=dict)
+@sales_router.patch("/sales/actividades/{actividad_id}", response_model=dict)
 async def update_actividad_endpoint(actividad_id: str, update_data: ActividadUpdate):
     """Actualiza una actividad"""
     try:
@@ -480,7 +698,7 @@ async def update_actividad_endpoint(actividad_id: str, update_data: ActividadUpd
         logger.error(f"Error updating actividad: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/sales/stats", response_model=dict)
+@sales_router.get("/sales/stats", response_model=dict)
 async def get_sales_stats():
     """Obtiene estadísticas del pipeline de ventas"""
     try:
@@ -566,22 +784,24 @@ async def get_estadisticas(user_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 # Include routers
+admin_only = [Depends(require_admin)]
+api_router.include_router(sales_router, tags=["sales"])
 api_router.include_router(recursos_router, tags=["recursos"])
-api_router.include_router(admin_recursos_router, tags=["admin-recursos"])
+api_router.include_router(admin_recursos_router, tags=["admin-recursos"], dependencies=admin_only)
 api_router.include_router(notificaciones_router, tags=["notificaciones"])
 api_router.include_router(ayuda_router, tags=["ayuda"])
 
 # Import estadisticas admin router
 from estadisticas_admin import router as estadisticas_router
-api_router.include_router(estadisticas_router, tags=["estadisticas-admin"])
+api_router.include_router(estadisticas_router, tags=["estadisticas-admin"], dependencies=admin_only)
 
 # Import usuarios admin router
 from usuarios_admin import router as usuarios_admin_router
-api_router.include_router(usuarios_admin_router, tags=["usuarios-admin"])
+api_router.include_router(usuarios_admin_router, tags=["usuarios-admin"], dependencies=admin_only)
 
 # Import reportes admin router
 from reportes_admin import router as reportes_router
-api_router.include_router(reportes_router, tags=["reportes-admin"])
+api_router.include_router(reportes_router, tags=["reportes-admin"], dependencies=admin_only)
 
 # Import gamificacion router
 from gamificacion import router as gamificacion_router
@@ -591,17 +811,54 @@ api_router.include_router(gamificacion_router, tags=["gamificacion"])
 from favoritos import router as favoritos_router
 api_router.include_router(favoritos_router, tags=["favoritos"])
 
+# Outbox de efectos secundarios del diagnóstico (lambda: el benchmark reemplaza db)
+diagnostico_outbox = DiagnosticoOutbox(lambda: db)
+api_router.include_router(build_outbox_router(diagnostico_outbox), tags=["outbox-admin"], dependencies=admin_only)
+diagnostico_idempotencia = IdempotencyStore(lambda: db)
+
 # Include the router in the main app
 app.include_router(api_router)
 
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Métricas en formato Prometheus (latencia por ruta y llamadas a Supabase)"""
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+
+# Debe quedar dentro de CORS para que el 503 lleve las cabeceras CORS
+app.add_middleware(UnavailableMiddleware)
+# Rechaza ráfagas antes del handler (sin llamadas a Supabase ni Mongo)
+app.add_middleware(RateLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Upstream-Calls", "X-Upstream-Time-Ms", "X-Next-Cursor", "X-Total-Count"],
 )
 
+app.add_middleware(DataLoaderMiddleware)
+app.add_middleware(PriorityMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def startup():
+    await ensure_diagnostico_indexes()
+    await diagnostico_idempotencia.ensure_indexes()
+    # Retoma las entradas que quedaron pendientes de la ejecución anterior
+    await diagnostico_outbox.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+    await diagnostico_outbox.stop()
+    await pipeline_stats.stop()
+    client.close()
+    # Escribir los accesos pendientes antes de cerrar los clientes HTTP
+    await last_access_buffer.stop()
+    await close_supabase_clients()
+    close_pg_pool()
+    password_hasher.shutdown()
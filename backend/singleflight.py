@@ -0,0 +1,45 @@
+"""
+Singleflight: coalescencia de llamadas concurrentes idénticas
+Si llega una llamada con la misma clave que otra todavía en vuelo, espera el
+resultado de esa en lugar de repetirla. Todas reciben el mismo resultado (o
+la misma excepción).
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+T = TypeVar('T')
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Ejecuta fn() una sola vez por clave mientras esté en vuelo
+
+        Devuelve (resultado, compartido). compartido=True si se reutilizó la
+        llamada de otro. La llamada corre en su propia tarea, así que cancelar
+        a quien la inició no cancela a los que la comparten.
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future), True
+
+        future = asyncio.ensure_future(fn())
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return await asyncio.shield(future), False
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        # Evita el aviso "exception was never retrieved" si todos cancelaron
+        if not future.cancelled():
+            future.exception()
+
+    def clear(self):
+        self._inflight.clear()
@@ -0,0 +1,256 @@
+"""
+Cliente REST compartido para Supabase (PostgREST)
+Un único httpx.AsyncClient por clave con conexiones keep-alive reutilizadas
+por todos los módulos del backend
+"""
+import asyncio
+import os
+import logging
+import time
+from typing import Optional
+
+import httpx
+
+from bulkhead import supabase_bulkhead
+from metrics import observe_coalesced, observe_upstream, table_label
+from resilience import (
+    RETRY_MAX,
+    RETRYABLE_STATUS,
+    ResiliencePolicy,
+    SupabaseUnavailable,
+    mark_unavailable,
+)
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+SUPABASE_URL = os.environ.get('SUPABASE_URL')
+SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
+SUPABASE_SERVICE_KEY = os.environ.get('SUPABASE_SERVICE_KEY')
+
+# Configuración de conexiones (un único lugar para timeouts y pool)
+SUPABASE_TIMEOUT = float(os.environ.get('SUPABASE_TIMEOUT', '10'))
+SUPABASE_CONNECT_TIMEOUT = float(os.environ.get('SUPABASE_CONNECT_TIMEOUT', '5'))
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get('SUPABASE_MAX_CONNECTIONS', '100'))
+SUPABASE_MAX_KEEPALIVE = int(os.environ.get('SUPABASE_MAX_KEEPALIVE', '20'))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get('SUPABASE_KEEPALIVE_EXPIRY', '30'))
+SUPABASE_HTTP2 = os.environ.get('SUPABASE_HTTP2', 'false').lower() in ('1', 'true', 'yes')
+# Lecturas idénticas concurrentes comparten una sola llamada
+SUPABASE_SINGLEFLIGHT = os.environ.get('SUPABASE_SINGLEFLIGHT', 'true').lower() in ('1', 'true', 'yes')
+
+COALESCE_METHODS = ('GET', 'HEAD')
+
+
+def _http2_disponible() -> bool:
+    """HTTP/2 requiere el paquete h2"""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class SupabaseRestClient:
+    """
+    Cliente asíncrono para la API REST de Supabase
+
+    El httpx.AsyncClient se crea la primera vez que se usa (dentro del event loop)
+    y se reutiliza en todas las peticiones siguientes.
+    """
+
+    def __init__(self, api_key: Optional[str], base_url: Optional[str] = None):
+        self._api_key = api_key
+        self._base_url = base_url or f"{SUPABASE_URL}/rest/v1"
+        self._transport: Optional[httpx.AsyncBaseTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._flights = SingleFlight()
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = SUPABASE_HTTP2
+        if http2 and not _http2_disponible():
+            logger.warning("SUPABASE_HTTP2 activo pero 'h2' no está instalado, usando HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            base_url=self._base_url,
+            headers={
+                'apikey': self._api_key or '',
+                'Authorization': f'Bearer {self._api_key}'
+            },
+            timeout=httpx.Timeout(SUPABASE_TIMEOUT, connect=SUPABASE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=SUPABASE_MAX_CONNECTIONS,
+                max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+                keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY
+            ),
+            http2=http2,
+            transport=self._transport
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def configure(
+        self,
+        base_url: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Cambia el destino del cliente (por ejemplo, un servidor PostgREST local)
+        Cierra el pool actual; el siguiente request crea uno nuevo.
+        """
+        await self.aclose()
+        self._flights.clear()
+        if base_url is not None:
+            self._base_url = base_url
+        self._transport = transport
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params=None,
+        json=None,
+        headers: Optional[dict] = None
+    ) -> httpx.Response:
+        """
+        Hace una petición a la API REST y devuelve la respuesta sin procesar
+
+        Los GET idénticos (misma ruta, params y cabeceras) que coinciden en el
+        tiempo comparten una única llamada; cada uno parsea su propio JSON.
+        """
+        try:
+            if not SUPABASE_SINGLEFLIGHT or method not in COALESCE_METHODS:
+                return await self._send(method, path, params, json, headers)
+
+            key = (method, path, str(httpx.QueryParams(params)), tuple(sorted((headers or {}).items())))
+            response, shared = await self._flights.do(
+                key, lambda: self._send(method, path, params, json, headers)
+            )
+        except SupabaseUnavailable as e:
+            mark_unavailable(e)
+            raise
+        if shared:
+            observe_coalesced(path)
+        return response
+
+    async def _send(self, method: str, path: str, params, json, headers: Optional[dict]) -> httpx.Response:
+        """
+        Envía la petición aplicando circuit breaker, bulkhead, timeout adaptativo
+        y reintentos (solo lecturas, dentro del presupuesto global)
+        """
+        table = table_label(path)
+        breaker = resilience_policy.breaker(table)
+        adaptive = resilience_policy.timeout(table)
+        attempt = 0
+
+        while True:
+            breaker.before_call()
+            timeout = httpx.Timeout(adaptive.current, connect=min(SUPABASE_CONNECT_TIMEOUT, adaptive.current))
+            start = time.perf_counter()
+            try:
+                async with supabase_bulkhead.slot():
+                    response = await self.client.request(
+                        method, path, params=params, json=json, headers=headers, timeout=timeout
+                    )
+            except httpx.TransportError as e:
+                observe_upstream(path, method, type(e).__name__, time.perf_counter() - start)
+                breaker.record_failure()
+                if attempt < RETRY_MAX and resilience_policy.can_retry(method, table):
+                    await asyncio.sleep(resilience_policy.backoff(attempt))
+                    attempt += 1
+                    continue
+                raise
+
+            elapsed = time.perf_counter() - start
+            observe_upstream(
+                path,
+                method,
+                str(response.status_code),
+                elapsed,
+                sent_bytes=len(response.request.content),
+                received_bytes=len(response.content)
+            )
+            if response.status_code in RETRYABLE_STATUS:
+                breaker.record_failure()
+                if attempt < RETRY_MAX and resilience_policy.can_retry(method, table):
+                    await asyncio.sleep(resilience_policy.backoff(attempt))
+                    attempt += 1
+                    continue
+                return response
+
+            breaker.record_success()
+            adaptive.observe(elapsed)
+            if attempt == 0:
+                resilience_policy.retry_budget.deposit()
+            return response
+
+    async def get(self, path: str, params=None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.request('GET', path, params=params, headers=headers)
+
+    async def post(self, path: str, json=None, params=None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.request('POST', path, params=params, json=json, headers=headers)
+
+    async def patch(self, path: str, json=None, params=None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.request('PATCH', path, params=params, json=json, headers=headers)
+
+    async def delete(self, path: str, params=None, headers: Optional[dict] = None) -> httpx.Response:
+        return await self.request('DELETE', path, params=params, headers=headers)
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+        self._client = None
+
+
+# Breakers, timeouts y presupuesto de reintentos compartidos por ambos clientes
+resilience_policy = ResiliencePolicy(timeout_ceiling=SUPABASE_TIMEOUT)
+
+# Cliente público (anon key, respeta RLS)
+supabase_rest = SupabaseRestClient(SUPABASE_KEY)
+
+# Cliente admin (service role key, bypasea RLS)
+supabase_rest_admin = SupabaseRestClient(SUPABASE_SERVICE_KEY)
+
+
+async def supabase_request(
+    method: str,
+    endpoint: str,
+    data: dict = None,
+    params: dict = None,
+    admin: bool = True
+):
+    """
+    Hace una petición a Supabase REST API y devuelve el JSON de la respuesta
+
+    Devuelve None si la petición falla. DELETE y las respuestas 204 (sin
+    cuerpo) devuelven {"success": True}.
+    """
+    rest = supabase_rest_admin if admin else supabase_rest
+
+    try:
+        response = await rest.request(
+            method,
+            endpoint,
+            params=params,
+            json=data,
+            headers={'Prefer': 'return=representation'}
+        )
+        response.raise_for_status()
+
+        if method == 'DELETE' or response.status_code == 204:
+            return {"success": True}
+
+        return response.json()
+    except Exception as e:
+        logger.error(f"Error en petición Supabase: {e}")
+        return None
+
+
+async def close_clients():
+    """Cierra los pools de conexiones (shutdown de la app)"""
+    await supabase_rest.aclose()
+    await supabase_rest_admin.aclose()
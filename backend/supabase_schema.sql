@@ -388,6 +388,27 @@ CREATE TRIGGER update_contenido_updated_at BEFORE UPDATE ON contenido
 CREATE TRIGGER update_tareas_updated_at BEFORE UPDATE ON tareas
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+-- =============================================
+-- ÚLTIMO ACCESO EN LOTE
+-- =============================================
+
+-- El backend junta los accesos en memoria y los escribe con una sola llamada:
+-- accesos = [{"id": "<uuid>", "ultimo_acceso": "<timestamp>"}, ...]
+CREATE OR REPLACE FUNCTION actualizar_ultimo_acceso(accesos JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+    filas INTEGER;
+BEGIN
+    UPDATE users u
+    SET ultimo_acceso = GREATEST(COALESCE(u.ultimo_acceso, a.ultimo_acceso), a.ultimo_acceso)
+    FROM jsonb_to_recordset(accesos) AS a(id UUID, ultimo_acceso TIMESTAMP)
+    WHERE u.id = a.id;
+
+    GET DIAGNOSTICS filas = ROW_COUNT;
+    RETURN filas;
+END;
+$$ LANGUAGE plpgsql;
+
 -- =============================================
 -- INITIAL DATA - Create first admin user
 -- =============================================
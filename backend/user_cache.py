@@ -0,0 +1,131 @@
+"""
+Caché de usuarios por id y por email (LRU + TTL)
+Evita ir a Supabase en cada login, /auth/me, check-email y diagnóstico.
+- Una sola entrada por usuario, indexada por id y por email.
+- Caché negativa: un email inexistente se recuerda poco tiempo.
+- usuarios_admin invalida la entrada en cada escritura; el TTL acota lo que
+  puedan cambiar otros procesos.
+
+Las filas incluyen password_hash (lo necesita el login): siempre se devuelven copias.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from metrics import user_cache_hit_ratio, user_cache_requests_total, user_cache_size
+
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '60'))
+USER_CACHE_NEGATIVE_TTL = float(os.environ.get('USER_CACHE_NEGATIVE_TTL', '10'))
+
+HIT, NEGATIVE, MISS = 'hit', 'negative', 'miss'
+
+
+class UserCache:
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL,
+                 negative_ttl: float = USER_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # id -> (expira, fila); el orden es el de uso (LRU al principio)
+        self._users: 'OrderedDict[str, Tuple[float, dict]]' = OrderedDict()
+        self._ids_by_email: Dict[str, str] = {}
+        # email -> expira, para emails que no existen
+        self._missing: 'OrderedDict[str, float]' = OrderedDict()
+        self.hits = 0
+        self.lookups = 0
+
+    @staticmethod
+    def _email_key(email: str) -> str:
+        # Igual que email=eq. en PostgREST: sin normalizar mayúsculas
+        return email
+
+    def _record(self, key: str, result: str):
+        self.lookups += 1
+        if result != MISS:
+            self.hits += 1
+        user_cache_requests_total.labels(key, result).inc()
+        user_cache_hit_ratio.set(self.hits / self.lookups)
+
+    def _get_fresh(self, user_id: str) -> Optional[dict]:
+        entry = self._users.get(user_id)
+        if entry is None:
+            return None
+        expires, user = entry
+        if expires < time.monotonic():
+            self.invalidate(user_id)
+            return None
+        self._users.move_to_end(user_id)
+        return user
+
+    def get_by_id(self, user_id: str) -> Tuple[str, Optional[dict]]:
+        """(resultado, copia de la fila); resultado es 'hit' o 'miss'"""
+        user = self._get_fresh(str(user_id))
+        self._record('id', HIT if user is not None else MISS)
+        return (HIT, dict(user)) if user is not None else (MISS, None)
+
+    def get_by_email(self, email: str) -> Tuple[str, Optional[dict]]:
+        """(resultado, copia de la fila); 'negative' si se sabe que el email no existe"""
+        key = self._email_key(email)
+        user_id = self._ids_by_email.get(key)
+        user = self._get_fresh(user_id) if user_id is not None else None
+        if user is not None:
+            self._record('email', HIT)
+            return HIT, dict(user)
+
+        expires = self._missing.get(key)
+        if expires is not None:
+            if expires >= time.monotonic():
+                self._record('email', NEGATIVE)
+                return NEGATIVE, None
+            del self._missing[key]
+        self._record('email', MISS)
+        return MISS, None
+
+    def put(self, user: dict):
+        user_id = str(user['id'])
+        self.invalidate(user_id)
+        self._users[user_id] = (time.monotonic() + self.ttl, dict(user))
+        if user.get('email'):
+            key = self._email_key(user['email'])
+            self._ids_by_email[key] = user_id
+            self._missing.pop(key, None)
+        while len(self._users) > self.max_size:
+            self.invalidate(next(iter(self._users)))
+        user_cache_size.set(len(self._users))
+
+    def put_missing(self, email: str):
+        key = self._email_key(email)
+        self._missing[key] = time.monotonic() + self.negative_ttl
+        self._missing.move_to_end(key)
+        while len(self._missing) > self.max_size:
+            self._missing.popitem(last=False)
+
+    def update(self, user_id: str, fields: dict):
+        """Aplica una escritura conocida sobre la entrada cacheada (si está)"""
+        entry = self._users.get(str(user_id))
+        if entry is not None:
+            entry[1].update(fields)
+
+    def invalidate(self, user_id: Optional[str] = None, email: Optional[str] = None):
+        if user_id is not None:
+            entry = self._users.pop(str(user_id), None)
+            if entry is not None and entry[1].get('email'):
+                self._ids_by_email.pop(self._email_key(entry[1]['email']), None)
+        if email is not None:
+            key = self._email_key(email)
+            self._missing.pop(key, None)
+            cached_id = self._ids_by_email.get(key)
+            if cached_id is not None:
+                self.invalidate(cached_id)
+        user_cache_size.set(len(self._users))
+
+    def clear(self):
+        self._users.clear()
+        self._ids_by_email.clear()
+        self._missing.clear()
+        user_cache_size.set(0)
+
+
+user_cache = UserCache()
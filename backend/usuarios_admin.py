@@ -5,15 +5,14 @@ Permite listar, editar, cambiar planes y desactivar usuarios
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, EmailStr
 from typing import Optional, List
-import requests
-import os
 from datetime import datetime
+from supabase_rest import supabase_rest
+from dataloader import clear_loader, load_one
+from auth import session_denylist
+from user_cache import user_cache
 
 router = APIRouter()
 
-SUPABASE_URL = os.environ.get('SUPABASE_URL')
-SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-
 
 class ActualizarUsuario(BaseModel):
     nombre_completo: Optional[str] = None
@@ -49,25 +48,19 @@ async def listar_usuarios(
         params = []
         
         if rol:
-            params.append(f"rol=eq.{rol}")
+            params.append(('rol', f'eq.{rol}'))
         
         if plan:
-            params.append(f"plan_actual=eq.{plan}")
+            params.append(('plan_actual', f'eq.{plan}'))
         
         # Para búsqueda, necesitamos hacer filtro en código porque Supabase REST API
         # tiene limitaciones con ILIKE en múltiples campos
-        query_string = "&".join(params) if params else ""
-        
-        url = f"{SUPABASE_URL}/rest/v1/users?{query_string}&order=created_at.desc&limit={limit}&offset={offset}"
+        params += [('order', 'created_at.desc'), ('limit', limit), ('offset', offset)]
         
-        response = requests.get(
-            url,
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'count=exact'
-            },
-            timeout=10
+        response = await supabase_rest.get(
+            'users',
+            params=params,
+            headers={'Prefer': 'count=exact'}
         )
         
         if response.status_code == 200:
@@ -112,29 +105,14 @@ async def obtener_usuario(user_id: str):
     Obtiene los detalles completos de un usuario específico
     """
     try:
-        response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
-        )
+        usuario = await load_one('users', user_id)
         
-        if response.status_code == 200:
-            usuarios = response.json()
-            if usuarios:
-                usuario = usuarios[0]
-                # Limpiar datos sensibles
-                usuario.pop('password_hash', None)
-                return usuario
-            else:
-                raise HTTPException(status_code=404, detail="Usuario no encontrado")
+        if usuario:
+            # Limpiar datos sensibles
+            usuario.pop('password_hash', None)
+            return usuario
         else:
-            raise HTTPException(
-                status_code=response.status_code,
-                detail=f"Error al obtener usuario: {response.text}"
-            )
+            raise HTTPException(status_code=404, detail="Usuario no encontrado")
             
     except HTTPException:
         raise
@@ -187,17 +165,17 @@ async def actualizar_usuario(user_id: str, datos: ActualizarUsuario):
         update_data['updated_at'] = datetime.now().isoformat()
         
         # Actualizar en Supabase
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest.patch(
+            'users',
+            params={'id': f'eq.{user_id}'},
             json=update_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
+        clear_loader('users', user_id)
+        user_cache.invalidate(user_id)
+        # Los tokens de sesión llevan rol y plan: invalidar los emitidos antes del cambio
+        if response.status_code == 200 and ('rol' in update_data or 'plan_actual' in update_data):
+            session_denylist.revoke_user(user_id)
         
         if response.status_code == 200:
             usuarios = response.json()
@@ -251,17 +229,16 @@ async def cambiar_plan_usuario(user_id: str, datos: CambiarPlan):
             update_data['rol'] = 'cliente_gratuito'
         
         # Actualizar en Supabase
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest.patch(
+            'users',
+            params={'id': f'eq.{user_id}'},
             json=update_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
+        clear_loader('users', user_id)
+        user_cache.invalidate(user_id)
+        if response.status_code == 200:
+            session_denylist.revoke_user(user_id)
         
         if response.status_code == 200:
             usuarios = response.json()
@@ -294,13 +271,9 @@ async def desactivar_usuario(user_id: str):
     """
     try:
         # Primero verificar que el usuario existe
-        check_response = requests.get(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}'
-            },
-            timeout=10
+        check_response = await supabase_rest.get(
+            'users',
+            params={'id': f'eq.{user_id}'}
         )
         
         if check_response.status_code == 200:
@@ -311,13 +284,9 @@ async def desactivar_usuario(user_id: str):
             # Verificar que no sea el último admin
             if usuarios[0].get('rol') == 'admin':
                 # Contar admins
-                admin_response = requests.get(
-                    f"{SUPABASE_URL}/rest/v1/users?rol=eq.admin",
-                    headers={
-                        'apikey': SUPABASE_KEY,
-                        'Authorization': f'Bearer {SUPABASE_KEY}'
-                    },
-                    timeout=10
+                admin_response = await supabase_rest.get(
+                    'users',
+                    params={'rol': 'eq.admin'}
                 )
                 
                 if admin_response.status_code == 200:
@@ -334,17 +303,16 @@ async def desactivar_usuario(user_id: str):
             'updated_at': datetime.now().isoformat()
         }
         
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest.patch(
+            'users',
+            params={'id': f'eq.{user_id}'},
             json=update_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
+        clear_loader('users', user_id)
+        user_cache.invalidate(user_id)
+        if response.status_code == 200:
+            session_denylist.revoke_user(user_id)
         
         if response.status_code == 200:
             return {
@@ -374,17 +342,14 @@ async def reactivar_usuario(user_id: str):
             'updated_at': datetime.now().isoformat()
         }
         
-        response = requests.patch(
-            f"{SUPABASE_URL}/rest/v1/users?id=eq.{user_id}",
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': SUPABASE_KEY,
-                'Authorization': f'Bearer {SUPABASE_KEY}',
-                'Prefer': 'return=representation'
-            },
+        response = await supabase_rest.patch(
+            'users',
+            params={'id': f'eq.{user_id}'},
             json=update_data,
-            timeout=10
+            headers={'Prefer': 'return=representation'}
         )
+        clear_loader('users', user_id)
+        user_cache.invalidate(user_id)
         
         if response.status_code == 200:
             usuarios = response.json()
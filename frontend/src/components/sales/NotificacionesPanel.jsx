@@ -9,6 +9,7 @@ import {
   Calendar
 } from 'lucide-react';
 import { Button } from '@/components/ui/button';
+import { fetchTodasLasPaginas } from '@/lib/paginacion';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -31,10 +32,7 @@ const NotificacionesPanel = () => {
       setLoading(true);
       
       // Obtener todas las oportunidades activas
-      const responseOpp = await fetch(`${API}/sales/oportunidades?estado=activo`);
-      if (!responseOpp.ok) return;
-      
-      const oportunidades = await responseOpp.json();
+      const oportunidades = await fetchTodasLasPaginas(`${API}/sales/oportunidades?estado=activo&vista=tarjeta&limit=500`);
       
       // Obtener todas las actividades
       const todasActividades = [];
@@ -78,7 +78,7 @@ const ETAPAS = [
   }
 ];
 
-const PipelineKanban = ({ oportunidades, onMoverOportunidad, onActualizar }) => {
+const PipelineKanban = ({ oportunidades, columnas, onMoverOportunidad, onActualizar, onCargarMas }) => {
   const [draggedItem, setDraggedItem] = useState(null);
   const [dragOverColumn, setDragOverColumn] = useState(null);
 
@@ -134,6 +134,9 @@ const PipelineKanban = ({ oportunidades, onMoverOportunidad, onActualizar }) =>
     return oportunidades.filter(opp => opp.etapa_pipeline === etapaId);
   };
 
+  // Totales del servidor (/sales/kanban): la columna solo trae las primeras tarjetas
+  const getColumna = (etapaId) => columnas?.find(c => c.etapa === etapaId);
+
   const calcularValorEtapa = (etapaId) => {
     const opps = getOportunidadesPorEtapa(etapaId);
     return opps.reduce((sum, opp) => sum + (opp.valor_estimado_usd || 0), 0);
@@ -145,7 +148,9 @@ const PipelineKanban = ({ oportunidades, onMoverOportunidad, onActualizar }) =>
         {ETAPAS.map((etapa) => {
           const Icon = etapa.icon;
           const oportunidadesEtapa = getOportunidadesPorEtapa(etapa.id);
-          const valorTotal = calcularValorEtapa(etapa.id);
+          const columna = getColumna(etapa.id);
+          const totalEtapa = columna ? columna.total : oportunidadesEtapa.length;
+          const valorTotal = columna ? columna.valor_total : calcularValorEtapa(etapa.id);
           
           return (
             <div
@@ -167,7 +172,7 @@ const PipelineKanban = ({ oportunidades, onMoverOportunidad, onActualizar }) =>
                     <h3 className="font-semibold text-gray-900">{etapa.nombre}</h3>
                   </div>
                   <span className="bg-white px-2 py-1 rounded-full text-xs font-medium text-gray-700">
-                    {oportunidadesEtapa.length}
+                    {totalEtapa}
                   </span>
                 </div>
                 <p className="text-xs text-gray-600 mb-2">{etapa.descripcion}</p>
@@ -197,6 +202,14 @@ const PipelineKanban = ({ oportunidades, onMoverOportunidad, onActualizar }) =>
                     />
                   ))
                 )}
+                {columna?.cursor && onCargarMas && (
+                  <button
+                    onClick={() => onCargarMas(etapa.id)}
+                    className="w-full py-2 text-sm font-medium text-gray-600 hover:text-gray-900 hover:bg-gray-100 rounded-lg transition-colors"
+                  >
+                    Cargar más ({totalEtapa - columna.tarjetas.length})
+                  </button>
+                )}
               </div>
             </div>
           );
@@ -0,0 +1,16 @@
+// Recorre un listado paginado por cursor (cabecera X-Next-Cursor) y junta todas las filas
+export async function fetchTodasLasPaginas(url, options = {}) {
+  const filas = [];
+  let cursor = null;
+  do {
+    const pagina = new URL(url, window.location.origin);
+    if (cursor) pagina.searchParams.set('cursor', cursor);
+    const response = await fetch(pagina, options);
+    if (!response.ok) {
+      throw new Error(`Error ${response.status} cargando ${pagina.pathname}`);
+    }
+    filas.push(...(await response.json()));
+    cursor = response.headers.get('X-Next-Cursor');
+  } while (cursor);
+  return filas;
+}
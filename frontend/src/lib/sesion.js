@@ -0,0 +1,35 @@
+// Adjunta el token de sesión (Authorization: Bearer) a todas las llamadas al
+// backend: las rutas de admin y ventas validan el rol con el token, sin
+// consultar la base. Si el backend responde 401 la sesión venció o fue
+// revocada: se borra y se vuelve al login.
+const API = `${process.env.REACT_APP_BACKEND_URL || ''}/api/`;
+const SESION_KEY = 'clarisa_session';
+
+const esLlamadaAlBackend = (input) => {
+  const url = input instanceof Request ? input.url : String(input);
+  return url.startsWith(API) || url.startsWith(new URL(API, window.location.origin).href);
+};
+
+export function instalarSesionEnFetch() {
+  const fetchOriginal = window.fetch.bind(window);
+
+  window.fetch = async (input, init = {}) => {
+    const token = localStorage.getItem(SESION_KEY);
+    if (!token || !esLlamadaAlBackend(input)) {
+      return fetchOriginal(input, init);
+    }
+
+    const headers = new Headers(init.headers || (input instanceof Request ? input.headers : undefined));
+    if (!headers.has('Authorization')) {
+      headers.set('Authorization', `Bearer ${token}`);
+    }
+    const response = await fetchOriginal(input, { ...init, headers });
+
+    if (response.status === 401 && localStorage.getItem(SESION_KEY) === token) {
+      localStorage.removeItem(SESION_KEY);
+      localStorage.removeItem('clarisa_user');
+      window.location.assign('/login');
+    }
+    return response;
+  };
+}
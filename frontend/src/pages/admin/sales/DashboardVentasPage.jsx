@@ -17,6 +17,7 @@ import MetricCard from '@/components/sales/MetricCard';
 import ConversionFunnel from '@/components/sales/ConversionFunnel';
 import PrioridadDistribution from '@/components/sales/PrioridadDistribution';
 import EtapasPipeline from '@/components/sales/EtapasPipeline';
+import { fetchTodasLasPaginas } from '@/lib/paginacion';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -43,11 +44,8 @@ const DashboardVentasPage = () => {
       }
 
       // Cargar todas las oportunidades para análisis
-      const responseOpp = await fetch(`${API}/sales/oportunidades`);
-      if (responseOpp.ok) {
-        const oppData = await responseOpp.json();
-        setOportunidades(oppData);
-      }
+      const oppData = await fetchTodasLasPaginas(`${API}/sales/oportunidades?vista=tarjeta&limit=500`);
+      setOportunidades(oppData);
 
     } catch (error) {
       console.error('Error cargando datos:', error);
@@ -18,10 +18,11 @@ import StatsCards from '@/components/sales/StatsCards';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
+const TARJETAS_POR_COLUMNA = 20;
 
 const PipelinePage = () => {
   const { userData } = useAuth();
-  const [oportunidades, setOportunidades] = useState([]);
+  const [columnas, setColumnas] = useState([]);
   const [stats, setStats] = useState(null);
   const [loading, setLoading] = useState(true);
   const [filtros, setFiltros] = useState({
@@ -38,16 +39,16 @@ const PipelinePage = () => {
     try {
       setLoading(true);
       
-      // Cargar oportunidades
-      const responseOpp = await fetch(`${API}/sales/oportunidades?estado=activo`, {
+      // Cargar tablero: primeras tarjetas, total y valor de cada etapa
+      const responseKanban = await fetch(`${API}/sales/kanban?por_columna=${TARJETAS_POR_COLUMNA}`, {
         headers: {
           'Content-Type': 'application/json',
         }
       });
       
-      if (responseOpp.ok) {
-        const data = await responseOpp.json();
-        setOportunidades(data);
+      if (responseKanban.ok) {
+        const kanban = await responseKanban.json();
+        setColumnas(kanban.columnas);
       }
 
       // Cargar estadísticas
@@ -94,6 +95,32 @@ const PipelinePage = () => {
     }
   };
 
+  const handleCargarMas = async (etapaId) => {
+    const columna = columnas.find(c => c.etapa === etapaId);
+    if (!columna?.cursor) return;
+    try {
+      const params = new URLSearchParams({
+        estado: 'activo',
+        etapa: etapaId,
+        vista: 'tarjeta',
+        limit: TARJETAS_POR_COLUMNA,
+        cursor: columna.cursor
+      });
+      const response = await fetch(`${API}/sales/oportunidades?${params}`);
+      if (!response.ok) throw new Error(`Error ${response.status}`);
+      const tarjetas = await response.json();
+      const cursor = response.headers.get('X-Next-Cursor');
+      setColumnas(prev => prev.map(c => (
+        c.etapa === etapaId ? { ...c, tarjetas: [...c.tarjetas, ...tarjetas], cursor } : c
+      )));
+    } catch (error) {
+      console.error('Error:', error);
+      toast.error('Error al cargar más oportunidades');
+    }
+  };
+
+  const oportunidades = columnas.flatMap(c => c.tarjetas);
+
   const oportunidadesFiltradas = oportunidades.filter(opp => {
     if (filtros.prioridad && opp.prioridad !== filtros.prioridad) return false;
     if (filtros.etapa && opp.etapa_pipeline !== filtros.etapa) return false;
@@ -193,8 +220,10 @@ const PipelinePage = () => {
         {/* Pipeline Kanban */}
         <PipelineKanban 
           oportunidades={oportunidadesFiltradas}
+          columnas={columnas}
           onMoverOportunidad={handleMoverOportunidad}
           onActualizar={cargarDatos}
+          onCargarMas={handleCargarMas}
         />
       </div>
     </AdminLayout>
@@ -0,0 +1,45 @@
+"""
+Configuración común de las pruebas
+Los módulos del backend se importan igual que en el servidor (backend/ en
+sys.path) y leen su configuración del entorno al importarse, así que aquí se
+fija un entorno sin servicios externos: Supabase lo reemplaza FakePostgrest y
+Mongo, mongomock-motor.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+for key, value in (('MONGO_URL', 'mongodb://localhost:27017'), ('DB_NAME', 'clarisa_test'),
+                   ('SUPABASE_URL', 'http://fake-supabase'), ('SUPABASE_KEY', 'test'),
+                   ('SUPABASE_SERVICE_KEY', 'test'), ('RATE_LIMIT_ENABLED', 'false'),
+                   ('BCRYPT_ROUNDS', '4'), ('SESSION_SECRET', 'test-secret')):
+    os.environ.setdefault(key, value)
+
+
+@pytest.fixture
+def fake():
+    """FakePostgrest vacío; cada prueba lo instala dentro de su propio event loop"""
+    from fake_postgrest import FakePostgrest
+    return FakePostgrest()
+
+
+async def cliente_rest(fake):
+    """SupabaseRestClient propio apuntando a `fake` (sin tocar los clientes compartidos)"""
+    from fake_postgrest import FAKE_BASE_URL
+    from supabase_rest import SupabaseRestClient
+    rest = SupabaseRestClient('test')
+    await rest.configure(base_url=FAKE_BASE_URL, transport=fake.transport())
+    return rest
+
+
+@pytest.fixture
+def admin_headers():
+    """Authorization de una sesión admin (rutas admin, sales y /diagnosticos)"""
+    from auth import generate_session_token
+    token = generate_session_token({'id': 'u-admin', 'email': 'admin@test.com', 'rol': 'admin'})
+    return {'Authorization': f'Bearer {token}'}
@@ -0,0 +1,64 @@
+import asyncio
+
+import httpx
+import pytest
+
+import sales
+import server
+from fake_postgrest import seed_demo_data
+from metrics import UPSTREAM_HEADER
+
+
+@pytest.fixture
+def demo(fake, monkeypatch):
+    monkeypatch.setattr(sales, '_actividad_rpc_disponible', True)
+    seed_demo_data(fake.store, usuarios=3, recursos=1, oportunidades=2, seed=2)
+    return fake
+
+
+def _crear(fake, headers: dict, sin_rpc: bool = False):
+    if sin_rpc:
+        # Base sin sales_schema.sql aplicado: la función no existe (404)
+        del fake.rpcs['registrar_actividad']
+    oportunidad = fake.store.tables['oportunidades'][0]
+
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=headers) as client:
+            creada = await client.post('/api/sales/actividades', json={
+                'oportunidad_id': oportunidad['id'], 'creado_por': fake.store.tables['users'][0]['id'],
+                'tipo': 'llamada', 'titulo': 'Seguimiento', 'fecha_programada': '2026-05-01T10:00:00',
+            })
+            detalle = await client.get(f"/api/sales/oportunidades/{oportunidad['id']}")
+            return creada, detalle
+
+    return asyncio.run(main())
+
+
+def _comparable(actividad: dict) -> dict:
+    return {k: v for k, v in actividad.items() if k not in ('id', 'created_at', 'updated_at', 'ultima_actividad')}
+
+
+def test_rpc_crea_y_actualiza_en_una_llamada(demo, admin_headers):
+    antes = len(demo.store.tables['actividades'])
+    creada, detalle = _crear(demo, admin_headers)
+    assert creada.status_code == 200
+    assert creada.headers[UPSTREAM_HEADER] == '1'
+    actividad = creada.json()
+    assert len(demo.store.tables['actividades']) == antes + 1
+    assert actividad['ultima_actividad'] is not None
+    assert detalle.json()['ultima_actividad'] == actividad['ultima_actividad']
+    assert actividad['fecha_programada'] == '2026-05-01T10:00:00'
+
+
+def test_sin_rpc_devuelve_la_misma_actividad(demo, admin_headers):
+    con_rpc, _ = _crear(demo, admin_headers)
+    sin_rpc, detalle = _crear(demo, admin_headers, sin_rpc=True)
+    assert sin_rpc.status_code == 200
+    assert sales._actividad_rpc_disponible is False
+    # El 404 del RPC, el insert y el PATCH de la oportunidad
+    assert sin_rpc.headers[UPSTREAM_HEADER] == '3'
+    assert set(sin_rpc.json()) == set(con_rpc.json())
+    assert _comparable(sin_rpc.json()) == _comparable(con_rpc.json())
+    assert detalle.json()['ultima_actividad'] == sin_rpc.json()['ultima_actividad']
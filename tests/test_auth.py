@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+from auth import generate_session_token, session_denylist
+from fake_postgrest import seed_demo_data
+from metrics import UPSTREAM_HEADER
+
+ADMIN = {'id': 'u-admin', 'email': 'admin@test.com', 'nombre_completo': 'Admin', 'rol': 'admin',
+         'plan_actual': 'pro'}
+CLIENTE = {'id': 'u-cliente', 'email': 'cliente@test.com', 'nombre_completo': 'Cliente',
+           'rol': 'cliente_gratuito', 'plan_actual': 'gratuito'}
+
+RUTAS_ADMIN = ['/api/sales/stats', '/api/admin/estadisticas/general', '/api/admin/usuarios']
+
+
+def _get(fake, path: str, user: dict = None) -> httpx.Response:
+    headers = {'Authorization': f'Bearer {generate_session_token(user)}'} if user else {}
+
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get(path, headers=headers)
+
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def demo(fake):
+    seed_demo_data(fake.store, usuarios=3, recursos=3, oportunidades=3)
+    return fake
+
+
+@pytest.mark.parametrize('path', RUTAS_ADMIN)
+def test_ruta_admin_sin_sesion_401(demo, path):
+    assert _get(demo, path).status_code == 401
+
+
+@pytest.mark.parametrize('path', RUTAS_ADMIN)
+def test_ruta_admin_con_cliente_403(demo, path):
+    assert _get(demo, path, CLIENTE).status_code == 403
+
+
+@pytest.mark.parametrize('path', RUTAS_ADMIN)
+def test_ruta_admin_con_admin_200(demo, path):
+    assert _get(demo, path, ADMIN).status_code == 200
+
+
+def test_me_desde_claims_sin_llamadas(fake):
+    response = _get(fake, '/api/auth/me', CLIENTE)
+    assert response.status_code == 200
+    assert response.headers[UPSTREAM_HEADER] == '0'
+    assert response.json() == {
+        'id': 'u-cliente', 'email': 'cliente@test.com', 'nombre_completo': 'Cliente',
+        'rol': 'cliente_gratuito', 'plan_actual': 'gratuito'
+    }
+
+
+def test_token_revocado_401(fake, monkeypatch):
+    monkeypatch.setattr(session_denylist, '_users', {})
+    user = dict(ADMIN, id='u-revocado')
+    token = generate_session_token(user)
+    session_denylist.revoke_user(user['id'])
+
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return await client.get('/api/sales/stats', headers={'Authorization': f'Bearer {token}'})
+
+    assert asyncio.run(main()).status_code == 401
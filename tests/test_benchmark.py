@@ -0,0 +1,78 @@
+import json
+
+import numpy as np
+import pytest
+
+import benchmark
+from benchmark import Recorder, compare_results, percentile
+
+
+def _corrida(latencias_ms: dict, upstream: int = 2, errores: dict = None) -> dict:
+    """Resultado con el mismo formato que `benchmark.py run -o`"""
+    recorder = Recorder()
+    for ruta, latencias in latencias_ms.items():
+        for n, ms in enumerate(latencias):
+            status = '500' if n < (errores or {}).get(ruta, 0) else '200'
+            recorder.record(ruta, ms / 1000, status, upstream)
+    return {'meta': {}, **recorder.summary(wall_time=10.0)}
+
+
+BASE = {'GET /api/recursos': list(range(10, 110)), 'POST /api/auth/login': [50.0] * 100}
+
+
+def _guardar(tmp_path, nombre: str, resultado: dict) -> str:
+    ruta = tmp_path / nombre
+    ruta.write_text(json.dumps(resultado))
+    return str(ruta)
+
+
+def test_percentil_igual_a_numpy():
+    valores = [float(v) for v in np.random.default_rng(0).exponential(30, 257)]
+    for pct in (50, 95, 99):
+        assert percentile(valores, pct) == pytest.approx(np.percentile(valores, pct))
+
+
+def test_regresion_de_p95_sale_con_codigo_1(tmp_path, capsys):
+    # Cola más lenta: solo el último 10 % de las peticiones empeora
+    lentas = {**BASE, 'GET /api/recursos': list(range(10, 100)) + [300] * 10}
+    base = _guardar(tmp_path, 'base.json', _corrida(BASE))
+    nuevo = _guardar(tmp_path, 'nuevo.json', _corrida(lentas))
+
+    assert benchmark.main(['compare', base, nuevo, '--threshold', '0.10']) == 1
+    salida = capsys.readouterr().out
+    assert 'GET /api/recursos: p95_ms' in salida
+    assert 'login' not in salida.split('regresiones:')[1]
+
+
+def test_dentro_del_umbral_sale_con_codigo_0(tmp_path, capsys):
+    # 5 % más lento con umbral del 10 %
+    algo_mas_lentas = {ruta: [ms * 1.05 for ms in lat] for ruta, lat in BASE.items()}
+    base = _guardar(tmp_path, 'base.json', _corrida(BASE))
+    nuevo = _guardar(tmp_path, 'nuevo.json', _corrida(algo_mas_lentas))
+
+    assert benchmark.main(['compare', base, nuevo, '--threshold', '0.10']) == 0
+    assert 'Sin regresiones' in capsys.readouterr().out
+    # Con un umbral más estricto el mismo par sí es regresión
+    assert benchmark.main(['compare', base, nuevo, '--threshold', '0.02']) == 1
+
+
+def test_ruido_de_pocos_ms_no_cuenta():
+    rapida = {'GET /api/salud': [1.0] * 100}
+    assert compare_results(_corrida(rapida), _corrida({'GET /api/salud': [1.5] * 100})) == []
+
+
+def test_errores_y_llamadas_upstream_son_regresiones():
+    regresiones = compare_results(_corrida(BASE), _corrida(BASE, upstream=3, errores={'POST /api/auth/login': 5}))
+    assert {(r['route'], r['metric']) for r in regresiones} == {
+        ('POST /api/auth/login', 'error_rate'),
+        ('GET /api/recursos', 'upstream_calls_mean'),
+        ('POST /api/auth/login', 'upstream_calls_mean'),
+    }
+
+
+def test_rutas_de_una_sola_corrida_no_cuentan(tmp_path, capsys):
+    solo_nueva = {**BASE, 'GET /api/nueva': [900.0] * 10}
+    base = _guardar(tmp_path, 'base.json', _corrida(BASE))
+    nuevo = _guardar(tmp_path, 'nuevo.json', _corrida(solo_nueva))
+    assert benchmark.main(['compare', base, nuevo]) == 0
+    assert 'solo en nuevo' in capsys.readouterr().out
@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from bulkhead import CRITICAL, LOW, NORMAL, Bulkhead, Overloaded, route_priority
+
+
+async def _ocupar(bulkhead: Bulkhead, liberar: asyncio.Event, orden: list, nombre: str, priority: int):
+    async with bulkhead.slot(priority):
+        orden.append(nombre)
+        await liberar.wait()
+
+
+async def _dejar_correr():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_cola_atiende_por_prioridad_y_orden_de_llegada():
+    async def main():
+        bulkhead = Bulkhead('test', max_concurrent=1, max_queue=10)
+        liberar, orden = asyncio.Event(), []
+        tareas = [asyncio.create_task(_ocupar(bulkhead, liberar, orden, 'primera', NORMAL))]
+        await _dejar_correr()
+        for nombre, priority in (('baja', LOW), ('normal', NORMAL), ('critica', CRITICAL), ('normal2', NORMAL)):
+            tareas.append(asyncio.create_task(_ocupar(bulkhead, liberar, orden, nombre, priority)))
+            await _dejar_correr()
+        liberar.set()
+        await asyncio.gather(*tareas)
+        assert bulkhead.active == 0
+        return orden
+
+    assert asyncio.run(main()) == ['primera', 'critica', 'normal', 'normal2', 'baja']
+
+
+def test_cola_llena_rechaza_con_503():
+    async def main():
+        # max_queue=4: LOW puede ocupar 2 lugares, NORMAL 3
+        bulkhead = Bulkhead('test', max_concurrent=1, max_queue=4)
+        liberar, orden = asyncio.Event(), []
+        tareas = [asyncio.create_task(_ocupar(bulkhead, liberar, orden, f'n{i}', NORMAL)) for i in range(4)]
+        await _dejar_correr()
+        assert len(bulkhead._waiters) == 3
+        with pytest.raises(Overloaded) as error:
+            async with bulkhead.slot(LOW):
+                pass
+        assert error.value.status_code == 503 and 'Retry-After' in error.value.headers
+        with pytest.raises(Overloaded):
+            async with bulkhead.slot(NORMAL):
+                pass
+        liberar.set()
+        await asyncio.gather(*tareas)
+
+    asyncio.run(main())
+
+
+def test_critica_desplaza_a_la_ultima_de_menor_prioridad():
+    async def main():
+        bulkhead = Bulkhead('test', max_concurrent=1, max_queue=2)
+        liberar, orden = asyncio.Event(), []
+        tareas = [asyncio.create_task(_ocupar(bulkhead, liberar, orden, 'primera', NORMAL))]
+        await _dejar_correr()
+        tareas += [asyncio.create_task(_ocupar(bulkhead, liberar, orden, n, p))
+                   for n, p in (('normal', NORMAL), ('baja', LOW))]
+        await _dejar_correr()
+        tareas.append(asyncio.create_task(_ocupar(bulkhead, liberar, orden, 'critica', CRITICAL)))
+        await _dejar_correr()
+        liberar.set()
+        return orden, await asyncio.gather(*tareas, return_exceptions=True)
+
+    orden, resultados = asyncio.run(main())
+    assert orden == ['primera', 'critica', 'normal']
+    assert isinstance(resultados[2], Overloaded)
+
+
+def test_espera_agotada_y_cancelacion_no_pierden_cupos():
+    async def main():
+        bulkhead = Bulkhead('test', max_concurrent=1, max_queue=5, queue_timeout=0.02)
+        liberar, orden = asyncio.Event(), []
+        ocupada = asyncio.create_task(_ocupar(bulkhead, liberar, orden, 'primera', NORMAL))
+        await _dejar_correr()
+        with pytest.raises(Overloaded):
+            async with bulkhead.slot(NORMAL):
+                pass
+        cancelada = asyncio.create_task(_ocupar(bulkhead, liberar, orden, 'cancelada', NORMAL))
+        await _dejar_correr()
+        cancelada.cancel()
+        await asyncio.gather(cancelada, return_exceptions=True)
+        assert bulkhead._waiters == []
+        liberar.set()
+        await ocupada
+        async with bulkhead.slot(NORMAL):
+            assert bulkhead.active == 1
+        assert bulkhead.active == 0
+
+    asyncio.run(main())
+
+
+def test_prioridad_por_ruta():
+    assert route_priority('POST', '/api/auth/login') == CRITICAL
+    assert route_priority('POST', '/api/diagnostico') == CRITICAL
+    assert route_priority('GET', '/api/diagnosticos') == NORMAL
+    assert route_priority('GET', '/api/admin/estadisticas/general') == LOW
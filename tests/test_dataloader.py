@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+import dataloader
+from dataloader import DataLoader
+from tests.conftest import cliente_rest
+
+
+def _sembrar(fake, n):
+    return fake.store.seed('recursos', [{'titulo': f'Recurso {i}'} for i in range(n)])
+
+
+def test_agrupa_busquedas_del_mismo_tick(fake):
+    recursos = _sembrar(fake, 5)
+
+    async def main():
+        loader = DataLoader(await cliente_rest(fake), 'recursos')
+        ids = [r['id'] for r in recursos] + [recursos[0]['id'], 'no-existe']
+        return await asyncio.gather(*(loader.load(i) for i in ids))
+
+    filas = asyncio.run(main())
+    assert [f['id'] for f in filas[:5]] == [r['id'] for r in recursos]
+    assert filas[5] is filas[0]
+    assert filas[6] is None
+    assert fake.calls[('GET', 'recursos')] == 1
+
+
+def test_cachea_y_clear_invalida(fake):
+    recurso = _sembrar(fake, 1)[0]
+
+    async def main():
+        loader = DataLoader(await cliente_rest(fake), 'recursos')
+        await loader.load(recurso['id'])
+        await loader.load(recurso['id'])
+        assert fake.calls[('GET', 'recursos')] == 1
+        loader.clear(recurso['id'])
+        await loader.load(recurso['id'])
+
+    asyncio.run(main())
+    assert fake.calls[('GET', 'recursos')] == 2
+
+
+def test_parte_en_lotes_de_max_batch_size(fake, monkeypatch):
+    monkeypatch.setattr(dataloader, 'MAX_BATCH_SIZE', 3)
+    recursos = _sembrar(fake, 7)
+
+    async def main():
+        loader = DataLoader(await cliente_rest(fake), 'recursos')
+        return await loader.load_many([r['id'] for r in recursos])
+
+    assert len(asyncio.run(main())) == 7
+    assert fake.calls[('GET', 'recursos')] == 3
+
+
+def test_error_propaga_y_no_queda_cacheado(fake):
+    async def main():
+        loader = DataLoader(await cliente_rest(fake), 'tabla_inexistente')
+        with pytest.raises(Exception):
+            await loader.load('1')
+        assert '1' not in loader._cache
+
+    asyncio.run(main())
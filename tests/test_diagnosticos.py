@@ -0,0 +1,79 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = AsyncMongoMockClient()['clarisa_test']
+    monkeypatch.setattr(server, 'db', db)
+    docs = [
+        {
+            'id': f'd{n:02d}', 'email': f'u{n % 3}@test.com',
+            # Pares con el mismo timestamp: el id desempata
+            'timestamp': f'2026-01-{1 + n // 2:02d}T00:00:00+00:00',
+            'scoring': {'arquetipo': {'codigo': 'A1' if n % 2 else 'C3'}},
+            'empresa': f'Empresa {n}',
+        }
+        for n in range(11)
+    ]
+    asyncio.run(db.diagnosticos.insert_many(docs))
+    return db
+
+
+def _get(headers: dict, **params) -> list:
+    async def main():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=headers) as client:
+            return await client.get('/api/diagnosticos', params=params)
+
+    return asyncio.run(main())
+
+
+def _orden_esperado() -> list:
+    return [f'd{n:02d}' for n in sorted(range(11), key=lambda n: (1 + n // 2, n), reverse=True)]
+
+
+def test_paginas_con_cursor_recorren_todo_sin_repetir(db, admin_headers):
+    ids, cursor, paginas = [], None, 0
+    while True:
+        params = {'limit': 4, **({'cursor': cursor} if cursor else {})}
+        response = _get(admin_headers, **params)
+        assert response.status_code == 200
+        ids += [d['id'] for d in response.json()]
+        paginas += 1
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            break
+    assert ids == _orden_esperado()
+    assert paginas == 3
+
+
+def test_ndjson_recorre_todas_las_paginas(db, admin_headers, monkeypatch):
+    monkeypatch.setattr(server, 'DIAGNOSTICOS_PAGE_MAX', 3)
+    response = _get(admin_headers, format='ndjson', fields='email')
+    assert response.headers['content-type'].startswith('application/x-ndjson')
+    filas = [json.loads(linea) for linea in response.text.splitlines()]
+    assert [f['id'] for f in filas] == _orden_esperado()
+    assert set(filas[0]) == {'id', 'timestamp', 'email'}
+
+
+def test_filtro_y_proyeccion(db, admin_headers):
+    response = _get(admin_headers, arquetipo='A1', fields='empresa,scoring.arquetipo.codigo')
+    filas = response.json()
+    assert [f['id'] for f in filas] == [i for i in _orden_esperado() if int(i[1:]) % 2]
+    assert set(filas[0]) == {'id', 'timestamp', 'empresa', 'scoring'}
+
+
+@pytest.mark.parametrize('params', [{'fields': 'email,$where'}, {'cursor': 'no-es-un-cursor'}])
+def test_parametros_invalidos_400(db, admin_headers, params):
+    assert _get(admin_headers, **params).status_code == 400
+
+
+def test_requiere_sesion_admin(db):
+    assert _get({}).status_code == 401
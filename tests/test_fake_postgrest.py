@@ -0,0 +1,188 @@
+import asyncio
+
+import httpx
+import pytest
+
+from fake_postgrest import FAKE_BASE_URL
+
+FILAS = [
+    {'id': 'a', 'nombre': 'Ana', 'edad': 30, 'activo': True, 'rol': 'admin', 'ciudad': 'Lima'},
+    {'id': 'b', 'nombre': 'Beto', 'edad': 25, 'activo': False, 'rol': 'cliente', 'ciudad': None},
+    {'id': 'c', 'nombre': 'Carla', 'edad': 30, 'activo': True, 'rol': 'cliente', 'ciudad': 'Quito'},
+    {'id': 'd', 'nombre': 'Dani', 'edad': 41, 'activo': True, 'rol': 'consultor', 'ciudad': 'Lima'},
+]
+
+
+@pytest.fixture
+def personas(fake):
+    fake.store.seed('personas', FILAS)
+    return fake
+
+
+def _pedir(fake, method: str, tabla: str = 'personas', **kwargs) -> httpx.Response:
+    async def main():
+        async with httpx.AsyncClient(transport=fake.transport(), base_url=FAKE_BASE_URL) as client:
+            return await client.request(method, f'{FAKE_BASE_URL}/{tabla}', **kwargs)
+    return asyncio.run(main())
+
+
+def _ids(fake, params) -> list:
+    response = _pedir(fake, 'GET', params=params)
+    assert response.status_code == 200
+    return [r['id'] for r in response.json()]
+
+
+@pytest.mark.parametrize('params, esperados', [
+    ({'rol': 'eq.cliente'}, ['b', 'c']),
+    ({'edad': 'eq.30'}, ['a', 'c']),
+    ({'activo': 'eq.false'}, ['b']),
+    ({'rol': 'neq.cliente'}, ['a', 'd']),
+    ({'edad': 'gte.30', 'rol': 'eq.cliente'}, ['c']),
+    ({'ciudad': 'is.null'}, ['b']),
+    ({'ciudad': 'not.is.null'}, ['a', 'c', 'd']),
+    ({'nombre': 'ilike.*A'}, ['a', 'c']),
+    ({'rol': 'in.(admin,consultor)'}, ['a', 'd']),
+    ({'edad': 'in.(25,41)'}, ['b', 'd']),
+    ({'rol': 'not.in.(admin,consultor)'}, ['b', 'c']),
+    ({'or': '(rol.eq.admin,edad.lt.30)'}, ['a', 'b']),
+    ({'or': '(rol.eq.admin,and(activo.is.true,ciudad.eq.Lima))'}, ['a', 'd']),
+    ({'and': '(edad.eq.30,or(ciudad.eq.Quito,rol.eq.consultor))'}, ['c']),
+])
+def test_filtros(personas, params, esperados):
+    assert _ids(personas, params) == esperados
+
+
+def test_columna_nula_no_cumple_comparaciones(personas):
+    # Como en SQL: NULL = x, NULL <> x y NOT (NULL IN ...) son NULL, la fila no sale
+    for filtro in ('eq.Lima', 'neq.Lima', 'not.eq.Lima', 'not.in.(Lima)', 'not.ilike.*a*'):
+        assert 'b' not in _ids(personas, {'ciudad': filtro})
+
+
+def test_operador_desconocido_400(personas):
+    response = _pedir(personas, 'GET', params={'edad': 'xx.3'})
+    assert response.status_code == 400
+    assert response.json()['code'] == 'PGRST100'
+
+
+def test_tabla_inexistente_404(fake):
+    response = _pedir(fake, 'GET', tabla='no_existe')
+    assert response.status_code == 404
+    assert response.json()['code'] == '42P01'
+
+
+@pytest.mark.parametrize('orden, esperados', [
+    ('edad', ['b', 'a', 'c', 'd']),
+    ('edad.desc', ['d', 'a', 'c', 'b']),
+    ('edad.desc,id.desc', ['d', 'c', 'a', 'b']),
+    # Postgres: ASC deja los NULL al final y DESC al principio
+    ('ciudad', ['a', 'd', 'c', 'b']),
+    ('ciudad.desc', ['b', 'c', 'a', 'd']),
+    ('ciudad.desc.nullslast', ['c', 'a', 'd', 'b']),
+    ('ciudad.asc.nullsfirst,id', ['b', 'a', 'd', 'c']),
+])
+def test_order(personas, orden, esperados):
+    assert _ids(personas, {'order': orden}) == esperados
+
+
+def test_limit_offset_y_select(personas):
+    response = _pedir(personas, 'GET', params={'order': 'id', 'limit': 2, 'offset': 1, 'select': 'id,edad'})
+    assert response.json() == [{'id': 'b', 'edad': 25}, {'id': 'c', 'edad': 30}]
+    # Sin count=exact PostgREST no calcula el total
+    assert response.headers['Content-Range'] == '1-2/*'
+
+
+@pytest.mark.parametrize('params, rango', [
+    ({'order': 'id'}, '0-3/4'),
+    ({'order': 'id', 'limit': 2}, '0-1/4'),
+    ({'order': 'id', 'limit': 2, 'offset': 3}, '3-3/4'),
+    ({'rol': 'eq.cliente', 'limit': 1}, '0-0/2'),
+    ({'rol': 'eq.nadie'}, '*/0'),
+])
+def test_count_exact_content_range(personas, params, rango):
+    response = _pedir(personas, 'GET', params=params, headers={'Prefer': 'count=exact'})
+    assert response.status_code == 200
+    assert response.headers['Content-Range'] == rango
+
+
+def test_head_solo_content_range(personas):
+    response = _pedir(personas, 'HEAD', params={'activo': 'is.true'}, headers={'Prefer': 'count=exact'})
+    assert response.status_code == 200
+    assert response.content == b''
+    assert response.headers['Content-Range'] == '0-2/3'
+
+
+def test_select_count(personas):
+    response = _pedir(personas, 'GET', params={'select': 'count', 'rol': 'eq.cliente'})
+    assert response.json() == [{'count': 2}]
+
+
+def test_insert_con_y_sin_representation(fake):
+    sin = _pedir(fake, 'POST', tabla='recursos_favoritos', json={'user_id': 'u1', 'recurso_id': 'r1'})
+    assert sin.status_code == 201
+    assert sin.content == b''
+
+    con = _pedir(fake, 'POST', tabla='recursos_favoritos', json=[{'user_id': 'u1', 'recurso_id': 'r2'}],
+                 headers={'Prefer': 'return=representation'})
+    assert con.status_code == 201
+    (fila,) = con.json()
+    assert fila['recurso_id'] == 'r2' and fila['id'] and fila['created_at']
+    assert len(fake.store.tables['recursos_favoritos']) == 2
+
+
+def test_insert_aplica_defaults_del_esquema(fake):
+    response = _pedir(fake, 'POST', tabla='notificaciones', json={'user_id': 'u1', 'titulo': 'Hola'},
+                      headers={'Prefer': 'return=representation'})
+    assert response.json()[0]['leida'] is False
+
+
+def test_unique_violado_409(fake):
+    datos = {'user_id': 'u1', 'recurso_id': 'r1'}
+    _pedir(fake, 'POST', tabla='recursos_favoritos', json=datos)
+    response = _pedir(fake, 'POST', tabla='recursos_favoritos', json=datos)
+    assert response.status_code == 409
+    assert response.json()['code'] == '23505'
+
+
+def test_upsert_merge_e_ignore(fake):
+    fake.store.seed('recursos_usuario', [{'user_id': 'u1', 'recurso_id': 'r1', 'calificacion': 3}])
+    merge = _pedir(fake, 'POST', tabla='recursos_usuario', params={'on_conflict': 'user_id,recurso_id'},
+                   json={'user_id': 'u1', 'recurso_id': 'r1', 'calificacion': 5},
+                   headers={'Prefer': 'resolution=merge-duplicates,return=representation'})
+    assert merge.status_code == 201
+    assert merge.json()[0]['calificacion'] == 5
+
+    ignore = _pedir(fake, 'POST', tabla='recursos_usuario', json={'user_id': 'u1', 'recurso_id': 'r1'},
+                    headers={'Prefer': 'resolution=ignore-duplicates,return=representation'})
+    assert ignore.json() == []
+    assert len(fake.store.tables['recursos_usuario']) == 1
+
+
+def test_patch_y_delete(personas):
+    sin = _pedir(personas, 'PATCH', params={'rol': 'eq.cliente'}, json={'activo': True})
+    assert sin.status_code == 204
+    assert sin.content == b''
+    assert _ids(personas, {'activo': 'is.true'}) == ['a', 'b', 'c', 'd']
+
+    con = _pedir(personas, 'PATCH', params={'id': 'eq.d'}, json={'edad': 42},
+                 headers={'Prefer': 'return=representation'})
+    assert con.status_code == 200
+    assert [(r['id'], r['edad']) for r in con.json()] == [('d', 42)]
+    # Sin filas afectadas PostgREST devuelve 200 con lista vacía, no 404
+    assert _pedir(personas, 'PATCH', params={'id': 'eq.z'}, json={'edad': 1},
+                  headers={'Prefer': 'return=representation'}).json() == []
+
+    borrado = _pedir(personas, 'DELETE', params={'edad': 'lt.30'})
+    assert borrado.status_code == 204
+    borrado = _pedir(personas, 'DELETE', params={'id': 'eq.a'}, headers={'Prefer': 'return=representation'})
+    assert [r['id'] for r in borrado.json()] == ['a']
+    assert _ids(personas, {'order': 'id'}) == ['c', 'd']
+
+
+def test_rpc_inexistente_404(fake):
+    async def main():
+        async with httpx.AsyncClient(transport=fake.transport(), base_url=FAKE_BASE_URL) as client:
+            return await client.post(f'{FAKE_BASE_URL}/rpc/no_existe', json={})
+
+    response = asyncio.run(main())
+    assert response.status_code == 404
+    assert response.json()['code'] == 'PGRST202'
@@ -0,0 +1,216 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import idempotency
+import server
+from idempotency import (
+    ClaveReutilizada,
+    EnvioEnProceso,
+    IdempotencyStore,
+    clave_por_cabecera,
+    clave_por_contenido,
+    huella_por_contenido,
+)
+
+RESPUESTA = {'id': 'd1', 'mensaje': 'ok'}
+
+
+@pytest.fixture
+def db():
+    return AsyncMongoMockClient()['clarisa_test']
+
+
+@pytest.fixture
+def store(db):
+    return IdempotencyStore(lambda: db)
+
+
+def test_claves_por_email_y_contenido():
+    assert clave_por_cabecera('A@test.com', 'k1') == clave_por_cabecera('a@test.com', 'k1')
+    assert clave_por_cabecera('a@test.com', 'k1') != clave_por_cabecera('b@test.com', 'k1')
+    assert clave_por_contenido('a@test.com', {'p1': 'x', 'p2': 'y'}) == clave_por_contenido('a@test.com', {'p2': 'y', 'p1': 'x'})
+    assert clave_por_contenido('a@test.com', {'p1': 'x'}) != clave_por_contenido('a@test.com', {'p1': 'z'})
+    assert huella_por_contenido({'p1': 'x', 'p2': 'y'}) == huella_por_contenido({'p2': 'y', 'p1': 'x'})
+    assert huella_por_contenido({'p1': 'x'}) != huella_por_contenido({'p1': 'z'})
+
+
+def test_repetido_devuelve_la_respuesta_original(store):
+    async def main():
+        assert await store.reservar('k', 'd1', 60) is None
+        await store.completar('k', RESPUESTA)
+        return await store.reservar('k', 'd2', 60)
+
+    assert asyncio.run(main()) == RESPUESTA
+
+
+def test_repetido_espera_al_original_en_curso(store):
+    async def main():
+        assert await store.reservar('k', 'd1', 60) is None
+
+        async def terminar():
+            await asyncio.sleep(0.1)
+            await store.completar('k', RESPUESTA)
+
+        _, repetido = await asyncio.gather(terminar(), store.reservar('k', 'd2', 60))
+        return repetido
+
+    assert asyncio.run(main()) == RESPUESTA
+
+
+def test_original_colgado_responde_409(store, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_SECONDS', 0.1)
+
+    async def main():
+        assert await store.reservar('k', 'd1', 60) is None
+        with pytest.raises(EnvioEnProceso) as error:
+            await store.reservar('k', 'd2', 60)
+        return error.value
+
+    error = asyncio.run(main())
+    assert error.status_code == 409 and error.headers['Retry-After'] == '2'
+
+
+def test_liberar_y_vencida_permiten_reprocesar(store):
+    async def main():
+        assert await store.reservar('k', 'd1', 60) is None
+        await store.liberar('k')
+        assert await store.reservar('k', 'd2', 60) is None
+        await store.completar('k', RESPUESTA)
+        # Completada no se libera: un error posterior no debe abrir la puerta a duplicados
+        await store.liberar('k')
+        assert await store.reservar('k', 'd3', 60) == RESPUESTA
+
+        await store.coleccion.update_one(
+            {'_id': 'k'}, {'$set': {'expira': datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        return await store.reservar('k', 'd4', 60), await store.coleccion.find_one({'_id': 'k'})
+
+    resultado, entrada = asyncio.run(main())
+    assert resultado is None
+    assert entrada['diagnostico_id'] == 'd4'
+
+
+def _envejecer(store, segundos: float):
+    return store.coleccion.update_one(
+        {'_id': 'k'}, {'$set': {'created_at': datetime.now(timezone.utc) - timedelta(seconds=segundos)}}
+    )
+
+
+def test_reserva_abandonada_se_toma_tras_el_lease(store, monkeypatch):
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_WAIT_SECONDS', 0.1)
+    monkeypatch.setattr(idempotency, 'IDEMPOTENCY_LEASE_SECONDS', 30)
+
+    async def main():
+        assert await store.reservar('k', 'd1', 3600) is None
+        # Dentro del lease sigue siendo del original
+        await _envejecer(store, 10)
+        with pytest.raises(EnvioEnProceso):
+            await store.reservar('k', 'd2', 3600)
+        # El original murió sin completar ni liberar
+        await _envejecer(store, 31)
+        tomas = await asyncio.gather(*(store.reservar('k', f'd{n}', 3600) for n in (3, 4)), return_exceptions=True)
+        return tomas, await store.coleccion.find_one({'_id': 'k'})
+
+    tomas, entrada = asyncio.run(main())
+    # Compare-and-set: solo uno de los reintentos concurrentes se queda con la clave
+    assert tomas.count(None) == 1
+    assert isinstance(tomas[1 - tomas.index(None)], EnvioEnProceso)
+    assert entrada['diagnostico_id'] == ('d3', 'd4')[tomas.index(None)]
+    assert entrada['estado'] == 'en_proceso'
+
+
+def test_misma_clave_con_otra_huella_422(store):
+    async def main():
+        assert await store.reservar('k', 'd1', 60, huella='h1') is None
+        with pytest.raises(ClaveReutilizada) as en_curso:
+            await store.reservar('k', 'd2', 60, huella='h2')
+        await store.completar('k', RESPUESTA)
+        with pytest.raises(ClaveReutilizada):
+            await store.reservar('k', 'd3', 60, huella='h2')
+        return en_curso.value, await store.reservar('k', 'd4', 60, huella='h1')
+
+    error, repetido = asyncio.run(main())
+    assert error.status_code == 422
+    assert repetido == RESPUESTA
+
+
+def _payload(email: str, **cambios) -> dict:
+    payload = {
+        'nombre_completo': 'Prueba', 'email': email, 'telefono': '+505 8888 0000',
+        'organizacion': 'Empresa', 'puesto': 'Gerente', 'pais': 'Nicaragua', 'departamento': 'Managua',
+        'anios_experiencia': '5-10', 'p1_sector': 'financiero', 'p2_tamano': 'grande',
+        'p3_motivacion': 'Aún estamos explorando', 'p4_plazo': 'Próximos 3-6 meses',
+        'p5_publica_info': 'No lo sé', 'p6_materialidad': 'Estamos en proceso de realizarlo',
+        'p7_familiaridad': 'Nulo: Estamos empezando desde cero', 'p8_riesgos_clima': 'No aplica a nuestro sector',
+        'p9_huella_carbono': 'No, pero sabemos cómo calcularlo', 'p10_liderazgo': 'Nadie formalmente asignado',
+        'p11_junta': 'No, no es prioridad aún para el nivel directivo',
+        'p12_personas_dedicadas': '1-2 personas con dedicación completa',
+        'p13_presupuesto': 'No, aún no hemos presupuestado nada', 'p14_recopilacion': 'No lo sé',
+        'p15_control_interno': 'No lo sé o no estoy seguro', 'p16_datos_auditables': 'No lo sé o no hemos evaluado esto',
+        'p17_rastreo_impacto': 'No lo hemos intentado o no sabemos cómo hacerlo',
+        'p18_obstaculo': 'Falta de recursos humanos o presupuesto', 'p19_apoyo_valioso': ['capacitacion'],
+        'p20_inversion': '10k_25k',
+    }
+    payload.update(cambios)
+    return payload
+
+
+def _enviar(db, monkeypatch, *envios) -> list:
+    monkeypatch.setattr(server, 'db', db)
+
+    async def main():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return [
+                await client.post('/api/diagnostico', json=payload, headers=headers)
+                for payload, headers in envios
+            ]
+
+    return asyncio.run(main())
+
+
+def test_misma_idempotency_key_guarda_un_solo_diagnostico(db, monkeypatch):
+    primero, repetido, cambiado, otro_email = _enviar(
+        db, monkeypatch,
+        (_payload('a@test.com'), {'Idempotency-Key': 'k1'}),
+        (_payload('a@test.com'), {'Idempotency-Key': 'k1'}),
+        (_payload('a@test.com', organizacion='Cambiada'), {'Idempotency-Key': 'k1'}),
+        (_payload('b@test.com'), {'Idempotency-Key': 'k1'}),
+    )
+    assert primero.status_code == repetido.status_code == otro_email.status_code == 200
+    assert repetido.json() == primero.json()
+    # Misma clave con otras respuestas: error del cliente, no un repetido
+    assert cambiado.status_code == 422
+    assert otro_email.json()['id'] != primero.json()['id']
+    assert asyncio.run(db.diagnosticos.count_documents({})) == 2
+
+
+def test_fallo_al_completar_libera_la_clave(db, monkeypatch):
+    async def falla(clave, respuesta):
+        raise RuntimeError('mongo caído')
+
+    monkeypatch.setattr(server.diagnostico_idempotencia, 'completar', falla)
+    primero, reintento = _enviar(
+        db, monkeypatch,
+        (_payload('a@test.com'), {'Idempotency-Key': 'k1'}),
+        (_payload('a@test.com'), {'Idempotency-Key': 'k1'}),
+    )
+    # Sin liberar, el reintento recibiría 409 hasta que la clave venza (24 h)
+    assert primero.status_code == reintento.status_code == 200
+    assert asyncio.run(db.diagnostico_idempotencia.count_documents({})) == 0
+
+
+def test_sin_cabecera_deduplica_por_contenido(db, monkeypatch):
+    primero, doble_clic, distinto = _enviar(
+        db, monkeypatch,
+        (_payload('a@test.com'), {}),
+        (_payload('a@test.com'), {}),
+        (_payload('a@test.com', p20_inversion='mas_50k'), {}),
+    )
+    assert doble_clic.json()['id'] == primero.json()['id']
+    assert distinto.json()['id'] != primero.json()['id']
+    assert asyncio.run(db.diagnosticos.count_documents({})) == 2
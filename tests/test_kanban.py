@@ -0,0 +1,79 @@
+import asyncio
+
+import httpx
+import pytest
+
+import sales
+import server
+from fake_postgrest import seed_demo_data
+from metrics import UPSTREAM_HEADER
+
+POR_COLUMNA = 3
+
+
+@pytest.fixture
+def demo(fake, monkeypatch):
+    monkeypatch.setattr(sales, '_kanban_rpc_disponible', True)
+    seed_demo_data(fake.store, usuarios=4, recursos=2, oportunidades=60, seed=11)
+    return fake
+
+
+def _kanban(fake, headers: dict, sin_rpc: bool = False):
+    if sin_rpc:
+        # Base sin sales_schema.sql aplicado: la función no existe (404)
+        del fake.rpcs['kanban_oportunidades']
+
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=headers) as client:
+            response = await client.get('/api/sales/kanban', params={'por_columna': POR_COLUMNA})
+            siguientes = {}
+            for columna in response.json()['columnas']:
+                if columna['cursor']:
+                    siguientes[columna['etapa']] = (await client.get('/api/sales/oportunidades', params={
+                        'estado': 'activo', 'etapa': columna['etapa'], 'vista': 'tarjeta',
+                        'limit': 100, 'cursor': columna['cursor'],
+                    })).json()
+            return response, siguientes
+
+    return asyncio.run(main())
+
+
+def _activas_por_etapa(fake) -> dict:
+    grupos = {}
+    for o in sorted(fake.store.tables['oportunidades'], key=lambda o: (o['fecha_creacion'], o['id']), reverse=True):
+        if o['estado'] == 'activo':
+            grupos.setdefault(o['etapa_pipeline'], []).append(o)
+    return grupos
+
+
+def test_kanban_por_rpc_en_una_llamada(demo, admin_headers):
+    response, siguientes = _kanban(demo, admin_headers)
+    assert response.status_code == 200
+    assert response.headers[UPSTREAM_HEADER] == '1'
+
+    grupos = _activas_por_etapa(demo)
+    kanban = response.json()
+    assert kanban['por_columna'] == POR_COLUMNA
+    assert [c['etapa'] for c in kanban['columnas']][:len(sales.ETAPAS_PIPELINE)] == list(sales.ETAPAS_PIPELINE)
+    for columna in kanban['columnas']:
+        filas = grupos.get(columna['etapa'], [])
+        assert columna['total'] == len(filas)
+        assert columna['valor_total'] == round(sum(o['valor_estimado_usd'] for o in filas), 2)
+        assert [t['id'] for t in columna['tarjetas']] == [o['id'] for o in filas[:POR_COLUMNA]]
+        assert 'notas' not in (columna['tarjetas'] or [{}])[0]
+        assert (columna['cursor'] is not None) == (len(filas) > POR_COLUMNA)
+        # El cursor sigue la columna donde la dejó el tablero
+        assert [o['id'] for o in siguientes.get(columna['etapa'], [])] == [o['id'] for o in filas[POR_COLUMNA:]]
+
+
+def test_sin_rpc_devuelve_lo_mismo(demo, admin_headers):
+    con_rpc, siguientes_rpc = _kanban(demo, admin_headers)
+    sin_rpc, siguientes = _kanban(demo, admin_headers, sin_rpc=True)
+    assert sin_rpc.status_code == 200
+    assert sin_rpc.json() == con_rpc.json()
+    assert siguientes == siguientes_rpc
+    assert sales._kanban_rpc_disponible is False
+    # El 404 del RPC, los agregados del pipeline y una página por etapa con oportunidades
+    assert int(sin_rpc.headers[UPSTREAM_HEADER]) == 2 + len(_activas_por_etapa(demo))
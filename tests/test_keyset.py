@@ -0,0 +1,98 @@
+import asyncio
+import base64
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import server
+from fake_postgrest import seed_demo_data
+from keyset import decode_cursor, decode_fecha_id_cursor, encode_cursor
+from metrics import UPSTREAM_HEADER
+
+FECHA = '2026-03-01T10:20:30.123456+00:00'
+ID = '0b8f7f2e-4c1a-4e8b-9d55-1f7a3c2b6e90'
+
+
+def _cursor_crudo(valor) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valor).encode()).decode().rstrip('=')
+
+
+def test_ida_y_vuelta():
+    cursor = encode_cursor(FECHA, ID)
+    assert '=' not in cursor
+    assert decode_cursor(cursor) == [FECHA, ID]
+    assert decode_fecha_id_cursor(cursor) == (FECHA, ID)
+
+
+def test_re_serializa_fecha_e_id():
+    assert decode_fecha_id_cursor(encode_cursor('2026-03-01T10:20:30Z', ID.upper())) == (
+        '2026-03-01T10:20:30+00:00', ID
+    )
+
+
+@pytest.mark.parametrize('cursor', [
+    'no-es-un-cursor',
+    _cursor_crudo({'fecha': FECHA}),
+    _cursor_crudo([FECHA]),
+    _cursor_crudo([FECHA, ID, 'extra']),
+    _cursor_crudo([FECHA, 7]),
+])
+def test_cursor_malformado_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('fecha, fila_id', [
+    ('ayer', ID),
+    (FECHA, 'no-es-uuid'),
+    # Inyección en el filtro or=(...) de PostgREST
+    (f'{FECHA}),estado.neq.(x', ID),
+    (FECHA, f'{ID}),or(id.not.is.null'),
+])
+def test_cursor_con_valores_invalidos_400(fecha, fila_id):
+    with pytest.raises(HTTPException) as error:
+        decode_fecha_id_cursor(encode_cursor(fecha, fila_id))
+    assert error.value.status_code == 400
+
+
+@pytest.fixture
+def demo(fake):
+    seed_demo_data(fake.store, usuarios=4, recursos=2, oportunidades=25, seed=5)
+    return fake
+
+
+def _paginas(fake, headers: dict, **params):
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=headers) as client:
+            respuestas, cursor = [], params.pop('cursor', None)
+            while True:
+                response = await client.get('/api/sales/oportunidades', params={
+                    **params, **({'cursor': cursor} if cursor else {})
+                })
+                respuestas.append(response)
+                cursor = response.headers.get('X-Next-Cursor')
+                if response.status_code != 200 or not cursor:
+                    return respuestas
+
+    return asyncio.run(main())
+
+
+def test_paginas_de_oportunidades_recorren_todo(demo, admin_headers):
+    respuestas = _paginas(demo, admin_headers, limit=7, vista='tarjeta')
+    assert [r.status_code for r in respuestas] == [200] * 4
+    assert respuestas[0].headers['X-Total-Count'] == '25'
+    ids = [o['id'] for r in respuestas for o in r.json()]
+    esperados = sorted(demo.store.tables['oportunidades'], key=lambda o: (o['fecha_creacion'], o['id']), reverse=True)
+    assert ids == [o['id'] for o in esperados]
+
+
+def test_cursor_inyectado_400_sin_llamar_a_supabase(demo, admin_headers):
+    cursor = encode_cursor(FECHA, f'{ID}),or(id.not.is.null')
+    (response,) = _paginas(demo, admin_headers, cursor=cursor)
+    assert response.status_code == 400
+    assert response.headers[UPSTREAM_HEADER] == '0'
@@ -0,0 +1,89 @@
+import asyncio
+
+import httpx
+
+from fake_postgrest import FakePostgrest
+from last_access import LastAccessBuffer
+from metrics import RequestStats, _request_stats, current_request_stats
+from supabase_rest import SupabaseRestClient
+from tests.conftest import cliente_rest
+
+
+def _ultimo_acceso(fake) -> dict:
+    return {u['id']: u.get('ultimo_acceso') for u in fake.store.tables['users']}
+
+
+def test_flush_escribe_el_acceso_mas_reciente_en_una_llamada(fake):
+    fake.store.seed('users', [{'id': 'u1', 'email': 'a@test.com'}, {'id': 'u2', 'email': 'b@test.com'}])
+
+    async def main():
+        buffer = LastAccessBuffer(await cliente_rest(fake), flush_seconds=60)
+        buffer.record('u1', '2026-01-02T00:00:00')
+        buffer.record('u1', '2026-01-01T00:00:00')
+        buffer.record('u2', '2026-01-03T00:00:00')
+        assert len(buffer) == 2
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(main())
+    assert len(buffer) == 0
+    assert _ultimo_acceso(fake) == {'u1': '2026-01-02T00:00:00', 'u2': '2026-01-03T00:00:00'}
+    assert sum(fake.calls.values()) == 1
+
+
+def test_error_conserva_el_lote():
+    async def main():
+        rest = SupabaseRestClient('test')
+        await rest.configure(
+            base_url='http://fake', transport=httpx.MockTransport(lambda request: httpx.Response(400))
+        )
+        buffer = LastAccessBuffer(rest, flush_seconds=60)
+        buffer.record('u1', '2026-01-01T00:00:00')
+        await buffer.flush()
+        pendientes = len(buffer)
+        buffer.record('u1', '2026-01-02T00:00:00')
+        await buffer.flush()
+        buffer._task.cancel()
+        return pendientes, buffer._pending
+
+    pendientes, pending = asyncio.run(main())
+    assert pendientes == 1
+    assert pending == {'u1': '2026-01-02T00:00:00'}
+
+
+def test_stop_durante_la_escritura_no_pierde_el_lote():
+    lento = FakePostgrest(latency=0.2)
+    lento.store.seed('users', [{'id': 'u1', 'email': 'a@test.com'}])
+
+    async def main():
+        buffer = LastAccessBuffer(await cliente_rest(lento), flush_seconds=0.01)
+        buffer.record('u1', '2026-01-01T00:00:00')
+        # El flush periódico queda esperando la respuesta
+        await asyncio.sleep(0.05)
+        assert len(buffer) == 0
+        await buffer.stop()
+        return buffer
+
+    buffer = asyncio.run(main())
+    assert len(buffer) == 0
+    assert _ultimo_acceso(lento) == {'u1': '2026-01-01T00:00:00'}
+
+
+def test_la_tarea_no_hereda_el_contexto_de_la_peticion(fake, monkeypatch):
+    vistos = []
+
+    async def main():
+        buffer = LastAccessBuffer(await cliente_rest(fake), flush_seconds=60)
+        monkeypatch.setattr(buffer, 'flush', lambda: _registrar(vistos))
+        _request_stats.set(RequestStats())
+        buffer.record('u1', '2026-01-01T00:00:00')
+        buffer._wakeup.set()
+        await asyncio.sleep(0.01)
+        buffer._task.cancel()
+
+    asyncio.run(main())
+    assert vistos == [None]
+
+
+async def _registrar(vistos: list):
+    vistos.append(current_request_stats())
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from metrics import MetricsMiddleware, UPSTREAM_HEADER, current_request_stats
+
+
+def _quemar_cpu(segundos: float):
+    fin = time.thread_time() + segundos
+    while time.thread_time() < fin:
+        pass
+
+
+async def _llamar(app, path: str) -> dict:
+    enviados = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        enviados.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': []}
+    await app(scope, receive, send)
+    return dict(enviados[0]['headers'])
+
+
+def test_cpu_del_handler_excluye_otras_peticiones():
+    stats = {}
+
+    async def app(scope, receive, send):
+        stats[scope['path']] = current_request_stats()
+        if scope['path'] == '/cpu':
+            for _ in range(5):
+                await asyncio.sleep(0)
+                _quemar_cpu(0.02)
+        else:
+            # Espera mientras /cpu ocupa el loop
+            await asyncio.sleep(0.15)
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def main():
+        middleware = MetricsMiddleware(app)
+        await asyncio.gather(_llamar(middleware, '/cpu'), _llamar(middleware, '/espera'))
+
+    asyncio.run(main())
+    assert stats['/cpu'].cpu_seconds >= 0.09
+    assert stats['/espera'].cpu_seconds < 0.02
+
+
+def test_cabecera_de_llamadas_upstream():
+    async def app(scope, receive, send):
+        current_request_stats().upstream_calls += 3
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    headers = asyncio.run(_llamar(MetricsMiddleware(app), '/x'))
+    assert headers[UPSTREAM_HEADER.lower().encode()] == b'3'
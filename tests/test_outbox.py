@@ -0,0 +1,150 @@
+import asyncio
+from datetime import timedelta
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from mongomock_motor import AsyncMongoMockClient
+
+import outbox as outbox_module
+from outbox import FALLIDO, HECHO, PENDIENTE, PROCESANDO, DiagnosticoOutbox, build_router
+
+
+class Pasos:
+    """Pasos falsos: cada uno falla las primeras `fallas[paso]` veces"""
+
+    def __init__(self, **fallas: int):
+        self.fallas = fallas
+        self.llamadas = {'oportunidad': 0, 'progreso': 0}
+
+    def paso(self, nombre: str):
+        async def ejecutar(entrada):
+            self.llamadas[nombre] += 1
+            if self.llamadas[nombre] <= self.fallas.get(nombre, 0):
+                raise outbox_module.PasoFallido(f'{nombre} caído')
+            return HECHO
+        return ejecutar
+
+
+@pytest.fixture
+def pasos(monkeypatch):
+    def instalar(**fallas):
+        pasos = Pasos(**fallas)
+        monkeypatch.setattr(outbox_module, 'PASOS', {n: pasos.paso(n) for n in pasos.llamadas})
+        return pasos
+    # Reintentos inmediatos para no esperar el backoff
+    monkeypatch.setattr(outbox_module, 'OUTBOX_RETRY_SECONDS', 0)
+    return instalar
+
+
+@pytest.fixture
+def outbox():
+    db = AsyncMongoMockClient()['clarisa_test']
+    return DiagnosticoOutbox(lambda: db, poll_seconds=0.05)
+
+
+def _diagnostico(n: int = 1) -> dict:
+    return {'id': f'd{n}', 'user_id': 'u1'}
+
+
+def test_ejecuta_los_pasos_y_marca_hecho(outbox, pasos):
+    instalados = pasos()
+
+    async def main():
+        await outbox.enqueue(_diagnostico(), 'u1')
+        await outbox.enqueue(_diagnostico(), 'u1')
+        await outbox.drain()
+        await outbox.stop()
+        return await outbox.coleccion.find_one({'_id': 'd1'})
+
+    entrada = asyncio.run(main())
+    assert entrada['estado'] == HECHO
+    assert entrada['pasos'] == {'oportunidad': HECHO, 'progreso': HECHO}
+    assert entrada['lease_hasta'] is None
+    assert instalados.llamadas == {'oportunidad': 1, 'progreso': 1}
+
+
+def test_reintento_no_repite_pasos_hechos(outbox, pasos):
+    instalados = pasos(progreso=2)
+
+    async def main():
+        await outbox.enqueue(_diagnostico(), 'u1')
+        await outbox.drain()
+        await outbox.stop()
+        return await outbox.coleccion.find_one({'_id': 'd1'})
+
+    entrada = asyncio.run(main())
+    assert entrada['estado'] == HECHO
+    assert entrada['intentos'] == 2
+    assert entrada['tomas'] == 3
+    assert entrada['ultimo_error'] == 'progreso: progreso caído'
+    assert instalados.llamadas == {'oportunidad': 1, 'progreso': 3}
+
+
+def test_agota_intentos_y_se_reintenta_desde_admin(outbox, pasos, monkeypatch):
+    monkeypatch.setattr(outbox_module, 'OUTBOX_MAX_ATTEMPTS', 2)
+    instalados = pasos(oportunidad=2)
+    app = FastAPI()
+    app.include_router(build_router(outbox), prefix='/api')
+
+    async def main():
+        await outbox.enqueue(_diagnostico(), 'u1')
+        await outbox.drain()
+        fallida = await outbox.coleccion.find_one({'_id': 'd1'})
+
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            listado = (await client.get('/api/admin/outbox')).json()
+            reintento = await client.post('/api/admin/outbox/d1/reintentar')
+            await outbox.drain()
+            otra = await client.post('/api/admin/outbox/d1/reintentar')
+        await outbox.stop()
+        return fallida, listado, reintento, otra, await outbox.coleccion.find_one({'_id': 'd1'})
+
+    fallida, listado, reintento, otra, final = asyncio.run(main())
+    assert fallida['estado'] == FALLIDO and fallida['intentos'] == 2
+    assert listado['resumen'][FALLIDO] == 1
+    assert [e['diagnostico_id'] for e in listado['entradas']] == ['d1']
+    assert reintento.status_code == 200
+    assert otra.status_code == 404
+    assert final['estado'] == HECHO
+    assert instalados.llamadas == {'oportunidad': 3, 'progreso': 1}
+
+
+def test_lease_vencido_se_vuelve_a_tomar(outbox, pasos):
+    instalados = pasos()
+
+    async def main():
+        ahora = outbox_module._ahora()
+        await outbox.coleccion.insert_one({
+            '_id': 'd1', 'user_id': 'u1', 'diagnostico': _diagnostico(),
+            'pasos': {'oportunidad': HECHO, 'progreso': PENDIENTE},
+            'estado': PROCESANDO, 'intentos': 0, 'tomas': 1, 'ultimo_error': None,
+            'proximo_intento': ahora - timedelta(minutes=5),
+            'lease_hasta': ahora - timedelta(seconds=1),
+            'created_at': ahora - timedelta(minutes=5), 'updated_at': ahora,
+        })
+        await outbox.start()
+        await outbox.drain()
+        await outbox.stop()
+        return await outbox.coleccion.find_one({'_id': 'd1'})
+
+    entrada = asyncio.run(main())
+    assert entrada['estado'] == HECHO and entrada['tomas'] == 2
+    assert instalados.llamadas == {'oportunidad': 0, 'progreso': 1}
+
+
+def test_stop_deja_lo_pendiente_en_mongo(outbox, pasos):
+    pasos()
+
+    async def main():
+        await outbox.coleccion.insert_one({
+            '_id': 'd1', 'user_id': 'u1', 'diagnostico': _diagnostico(),
+            'pasos': {'oportunidad': PENDIENTE, 'progreso': PENDIENTE}, 'estado': PENDIENTE,
+            'intentos': 0, 'tomas': 0, 'proximo_intento': outbox_module._ahora() + timedelta(hours=1),
+        })
+        await outbox.start()
+        await outbox.stop()
+        return await outbox.coleccion.find_one({'_id': 'd1'})
+
+    assert asyncio.run(main())['estado'] == PENDIENTE
@@ -0,0 +1,74 @@
+import asyncio
+
+import httpx
+import pytest
+
+import auth
+import server
+from passwords import PasswordHasher, bcrypt_cost, is_legacy_hash, legacy_sha256, needs_rehash
+from user_cache import UserCache
+
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(workers=1, rounds=4)
+    yield hasher
+    hasher.shutdown()
+
+
+def test_hash_y_verify_bcrypt(hasher):
+    async def main():
+        hashed = await hasher.hash('secreta')
+        return hashed, await hasher.verify('secreta', hashed), await hasher.verify('otra', hashed)
+
+    hashed, correcta, incorrecta = asyncio.run(main())
+    assert bcrypt_cost(hashed) == 4
+    assert correcta == (True, False)
+    assert incorrecta == (False, False)
+
+
+def test_costo_distinto_pide_rehash(hasher):
+    async def main():
+        otro_costo = PasswordHasher(workers=1, rounds=5)
+        try:
+            hashed = await otro_costo.hash('secreta')
+        finally:
+            otro_costo.shutdown()
+        return await hasher.verify('secreta', hashed)
+
+    assert asyncio.run(main()) == (True, True)
+
+
+def test_sha256_heredado_valida_y_pide_rehash(hasher):
+    hashed = legacy_sha256('secreta')
+    assert is_legacy_hash(hashed) and needs_rehash(hashed)
+    assert asyncio.run(hasher.verify('secreta', hashed)) == (True, True)
+    assert asyncio.run(hasher.verify('otra', hashed)) == (False, True)
+
+
+@pytest.mark.parametrize('hashed', ['', 'texto-plano', '$2b$xx$roto'])
+def test_hash_desconocido_no_valida(hasher, hashed):
+    assert asyncio.run(hasher.verify('secreta', hashed)) == (False, False)
+
+
+def test_login_reemplaza_hash_heredado(fake, monkeypatch):
+    monkeypatch.setattr(auth, 'user_cache', UserCache())
+    user = fake.store.seed('users', [{
+        'email': 'legado@test.com', 'password_hash': legacy_sha256('secreta'),
+        'nombre_completo': 'Legado', 'rol': 'cliente_gratuito'
+    }])[0]
+
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            primero = await client.post('/api/auth/login', json={'email': 'legado@test.com', 'password': 'secreta'})
+            auth.user_cache.clear()
+            segundo = await client.post('/api/auth/login', json={'email': 'legado@test.com', 'password': 'secreta'})
+            return primero, segundo
+
+    primero, segundo = asyncio.run(main())
+    assert primero.status_code == 200 and segundo.status_code == 200
+    stored = next(u for u in fake.store.tables['users'] if u['id'] == user['id'])
+    assert bcrypt_cost(stored['password_hash']) == auth.password_hasher.rounds
+    assert fake.calls[('PATCH', 'users')] == 1
@@ -0,0 +1,160 @@
+import asyncio
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from uuid import UUID
+
+import psycopg2
+import psycopg2.errors
+import pytest
+
+import pg_backend
+from pg_backend import PgPool, _jsonable, _select_sql
+
+
+def test_traduce_filtros_postgrest_a_sql():
+    query, values = _select_sql('users', [
+        ('rol', 'eq.admin'), ('created_at', 'gte.2026-01-01'), ('order', 'created_at.desc,id')
+    ])
+    assert query == (
+        'SELECT * FROM "users" WHERE "rol" = $1 AND "created_at" >= $2 '
+        'ORDER BY "created_at" DESC, "id" ASC'
+    )
+    assert values == ['admin', '2026-01-01']
+
+
+def test_identificadores_citados_y_operadores_desconocidos():
+    query, _ = _select_sql('users"; drop table users; --', [])
+    assert query == 'SELECT * FROM "users""; drop table users; --"'
+    with pytest.raises(ValueError):
+        _select_sql('users', [('email', 'ilike.%a%')])
+
+
+def test_misma_forma_que_postgrest():
+    assert _jsonable(Decimal('10.50')) == 10.5
+    assert _jsonable(date(2026, 1, 2)) == '2026-01-02'
+    assert _jsonable(datetime(2026, 1, 2, 3, 4)) == '2026-01-02T03:04:00'
+    assert _jsonable([UUID(int=1)]) == ['00000000-0000-0000-0000-000000000001']
+
+
+def test_pg_enabled_por_funcion(monkeypatch):
+    monkeypatch.setattr(pg_backend, 'DATABASE_URL', None)
+    monkeypatch.setattr(pg_backend, 'PG_BACKEND_FUNCTIONS', {'*'})
+    assert not pg_backend.pg_enabled('get_pipeline_stats')
+
+    monkeypatch.setattr(pg_backend, 'DATABASE_URL', 'postgresql://localhost/db')
+    monkeypatch.setattr(pg_backend, 'PG_BACKEND_FUNCTIONS', {'get_pipeline_stats'})
+    assert pg_backend.pg_enabled('get_pipeline_stats')
+    assert not pg_backend.pg_enabled('estadisticas_general')
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql: str, params=()):
+        comando, nombre = sql.split()[:2]
+        nombre = nombre.split('(')[0]
+        if self.conn.falla:
+            raise psycopg2.OperationalError('server closed the connection unexpectedly')
+        if comando == 'PREPARE':
+            self.conn.preparadas.add(nombre)
+            self.conn.pool.prepares += 1
+        elif nombre not in self.conn.preparadas:
+            # Lo que responde Postgres a un EXECUTE en una conexión nueva
+            raise psycopg2.errors.InvalidSqlStatementName(f'prepared statement "{nombre}" does not exist')
+
+    def fetchall(self):
+        return [{'n': 1}]
+
+
+class _Conexion:
+    def __init__(self, pool):
+        self.pool = pool
+        self.preparadas = set()
+        self.autocommit = False
+        self.closed = 0
+        self.falla = False
+
+    def cursor(self, cursor_factory=None):
+        return _Cursor(self)
+
+    def close(self):
+        self.closed = 1
+
+
+class _Pool:
+    """Mismo criterio que psycopg2.pool: cierra lo devuelto por encima de minconn"""
+
+    def __init__(self, minconn: int):
+        self.minconn = minconn
+        self.libres = []
+        self.abiertas = self.cerradas = self.prepares = 0
+        self.lock = threading.Lock()
+
+    def getconn(self):
+        with self.lock:
+            if self.libres:
+                return self.libres.pop()
+            self.abiertas += 1
+            return _Conexion(self)
+
+    def putconn(self, conn, close=False):
+        with self.lock:
+            if not close and len(self.libres) < self.minconn:
+                self.libres.append(conn)
+            else:
+                conn.close()
+                self.cerradas += 1
+
+
+def _pg_pool(minconn: int) -> PgPool:
+    pool = PgPool('postgresql://fake/db', minconn=minconn, maxconn=10)
+    pool._pool = _Pool(minconn)
+    return pool
+
+
+def test_por_defecto_el_pool_no_cierra_conexiones():
+    pool = PgPool('postgresql://fake/db')
+    assert pool.minconn == pool.maxconn == pg_backend.PG_POOL_MAX
+
+
+def test_conexion_cerrada_por_el_pool_se_vuelve_a_preparar():
+    pool = _pg_pool(minconn=0)
+    for _ in range(5):
+        # Cada conexión nueva puede reusar el id() de la anterior ya cerrada
+        assert pool._run('q', 'SELECT 1', ()) == [{'n': 1}]
+    assert pool._pool.abiertas == pool._pool.cerradas == pool._pool.prepares == 5
+    assert len(pool._prepared) == 0
+
+
+def test_conexion_rota_se_descarta_y_la_siguiente_prepara():
+    pool = _pg_pool(minconn=1)
+    pool._run('q', 'SELECT 1', ())
+    (conn,) = pool._pool.libres
+    conn.falla = True
+    with pytest.raises(psycopg2.OperationalError):
+        pool._run('q', 'SELECT 1', ())
+    assert conn.closed and conn not in pool._prepared
+    assert pool._run('q', 'SELECT 1', ()) == [{'n': 1}]
+    assert pool._pool.prepares == 2
+
+
+def test_fan_out_reusa_conexiones_preparadas():
+    pool = _pg_pool(minconn=10)
+
+    async def main():
+        for _ in range(3):
+            await asyncio.gather(*(pool.fetch(f'q{n}', 'SELECT 1', ()) for n in range(4)))
+
+    asyncio.run(main())
+    assert pool._pool.cerradas == 0
+    # Cada sentencia se prepara a lo sumo una vez por conexión abierta
+    assert pool._pool.prepares <= 4 * pool._pool.abiertas
+    assert sum(len(nombres) for nombres in pool._prepared.values()) == pool._pool.prepares
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+from fake_postgrest import FakePostgrest, seed_demo_data
+from metrics import UPSTREAM_HEADER
+from pipeline_stats import PipelineStats
+from tests.conftest import cliente_rest
+
+
+def _esperado(filas: list) -> dict:
+    """Los agregados calculados desde cero, como hacía get_pipeline_stats"""
+    stats = PipelineStats(rest=None)
+    stats._ready = True
+    for fila in filas:
+        stats.apply(fila)
+    return stats.snapshot()
+
+
+def _oportunidad(n: int, **cambios) -> dict:
+    return {'id': f'o{n}', 'estado': 'activo', 'etapa_pipeline': 'lead', 'prioridad': 'alta',
+            'valor_estimado_usd': 1000.0 * n, 'probabilidad_cierre': 50, **cambios}
+
+
+def test_snapshot_a_mano():
+    snapshot = _esperado([
+        _oportunidad(1), _oportunidad(2, etapa_pipeline='propuesta', prioridad='media'),
+        _oportunidad(3, estado='ganado'),
+    ])
+    assert snapshot == {
+        'total_oportunidades': 2,
+        'valor_total_pipeline_usd': 3000.0,
+        'valor_ponderado_usd': 1500.0,
+        'por_etapa': {'lead': 1, 'propuesta': 1},
+        'valor_por_etapa': {'lead': 1000.0, 'propuesta': 2000.0},
+        'por_prioridad': {'alta': 1, 'media': 1},
+    }
+
+
+def test_apply_ajusta_actualizaciones_y_cambios_de_estado():
+    stats = PipelineStats(rest=None)
+    stats._ready = True
+    filas = {n: _oportunidad(n) for n in range(1, 5)}
+    for fila in filas.values():
+        stats.apply(fila)
+
+    cambios = [
+        (1, {'etapa_pipeline': 'negociacion', 'valor_estimado_usd': 9000.0}),
+        (2, {'prioridad': 'baja', 'probabilidad_cierre': 90}),
+        (3, {'estado': 'perdido'}),
+        (4, {'estado': 'nutricion'}),
+        (4, {'estado': 'activo', 'valor_estimado_usd': None}),
+        (3, {'estado': 'perdido', 'notas': 'sigue cerrada'}),
+    ]
+    for n, cambio in cambios:
+        filas[n] = {**filas[n], **cambio}
+        stats.apply(filas[n])
+        assert stats.snapshot() == _esperado(filas.values())
+
+    assert stats.snapshot()['total_oportunidades'] == 3
+    assert stats.snapshot()['por_prioridad'] == {'alta': 2, 'baja': 1}
+
+
+def test_apply_antes_del_rebuild_se_ignora():
+    stats = PipelineStats(rest=None)
+    stats.apply(_oportunidad(1))
+    assert stats.snapshot()['total_oportunidades'] == 0
+
+
+def test_rebuild_conserva_lo_aplicado_mientras_consulta():
+    lento = FakePostgrest(latency=0.1)
+    lento.store.seed('oportunidades', [_oportunidad(1), _oportunidad(2)])
+
+    async def main():
+        stats = PipelineStats(await cliente_rest(lento))
+        rebuild = asyncio.ensure_future(stats.rebuild())
+        await asyncio.sleep(0.02)
+        # Actualización que Supabase devolvió después de que la consulta leyó la fila vieja
+        stats.apply(_oportunidad(2, estado='ganado'))
+        await rebuild
+        return stats.snapshot()
+
+    assert asyncio.run(main()) == _esperado([_oportunidad(1)])
+
+
+def test_rebuild_corrige_cambios_externos(fake):
+    fake.store.seed('oportunidades', [_oportunidad(1), _oportunidad(2)])
+
+    async def main():
+        stats = PipelineStats(await cliente_rest(fake))
+        antes = await stats.get()
+        fake.store.tables['oportunidades'][0]['estado'] = 'ganado'
+        await stats.rebuild()
+        await stats.stop()
+        return antes, stats.snapshot()
+
+    antes, despues = asyncio.run(main())
+    assert antes['total_oportunidades'] == 2
+    assert despues == _esperado([_oportunidad(2)])
+
+
+@pytest.fixture
+def demo(fake):
+    seed_demo_data(fake.store, usuarios=5, recursos=2, oportunidades=60, seed=3)
+    return fake
+
+
+def test_stats_del_servidor_siguen_los_patch_sin_llamadas(demo, admin_headers):
+    filas = demo.store.tables['oportunidades']
+    activa = next(o for o in filas if o['estado'] == 'activo')
+    otra = next(o for o in filas if o['estado'] == 'activo' and o['id'] != activa['id'])
+
+    async def main():
+        await demo.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=admin_headers) as client:
+            assert (await client.get('/api/sales/stats')).status_code == 200
+            for oportunidad_id, cambio in [
+                (activa['id'], {'etapa_pipeline': 'negociacion', 'valor_estimado_usd': 12345.0}),
+                (otra['id'], {'estado': 'ganado'}),
+            ]:
+                response = await client.patch(f'/api/sales/oportunidades/{oportunidad_id}', json=cambio)
+                assert response.status_code == 200
+            return await client.get('/api/sales/stats')
+
+    stats = asyncio.run(main())
+    assert stats.headers[UPSTREAM_HEADER] == '0'
+    assert stats.json() == _esperado(filas)
@@ -0,0 +1,35 @@
+import asyncio
+
+import httpx
+import pytest
+
+from metrics import UPSTREAM_HEADER
+from query_budget import QUERY_BUDGETS, SIZES, assert_query_budget, request_budgeted, upstream_calls
+
+
+@pytest.mark.parametrize('budget', QUERY_BUDGETS, ids=lambda b: f'{b.method} {b.route}')
+def test_endpoint_dentro_del_presupuesto(budget):
+    # Con dos tamaños de resultado: si las llamadas crecen con las filas hay un N+1
+    sizes = SIZES if budget.grow else SIZES[:1]
+
+    async def medir():
+        return [await request_budgeted(budget, size) for size in sizes]
+
+    llamadas = []
+    for size, response in zip(sizes, asyncio.run(medir())):
+        assert response.status_code < 400, f'HTTP {response.status_code} con {size} filas'
+        assert_query_budget(response, budget.method, budget.route)
+        llamadas.append(upstream_calls(response))
+    assert llamadas[-1] <= llamadas[0], f'N+1: {llamadas} llamadas con {list(sizes)} filas'
+
+
+def test_presupuesto_excedido_falla():
+    response = httpx.Response(200, headers={UPSTREAM_HEADER: '3'})
+    with pytest.raises(AssertionError, match='presupuesto 2'):
+        assert_query_budget(response, 'GET', '/api/favoritos/{user_id}')
+
+
+def test_ruta_sin_presupuesto_falla():
+    response = httpx.Response(200, headers={UPSTREAM_HEADER: '0'})
+    with pytest.raises(AssertionError, match='no tiene presupuesto'):
+        assert_query_budget(response, 'GET', '/api/no-existe')
@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+import pytest
+
+import rate_limit
+from rate_limit import RateLimitMiddleware, RateLimitRule, TokenBuckets, client_ip
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(rate_limit.time, 'monotonic', reloj)
+    return reloj
+
+
+def test_bucket_se_recarga_con_el_tiempo(reloj):
+    buckets = TokenBuckets()
+    for _ in range(3):
+        assert buckets.take(('k',), 3, 60) == 0
+    assert buckets.take(('k',), 3, 60) == pytest.approx(20)
+
+    reloj.ahora += 10
+    assert buckets.take(('k',), 3, 60) == pytest.approx(10)
+    reloj.ahora += 10
+    assert buckets.take(('k',), 3, 60) == 0
+
+    # La recarga no supera la capacidad
+    reloj.ahora += 3600
+    for _ in range(3):
+        assert buckets.take(('k',), 3, 60) == 0
+    assert buckets.take(('k',), 3, 60) > 0
+
+
+def test_lru_descarta_el_bucket_menos_usado(reloj):
+    buckets = TokenBuckets(max_buckets=2)
+    buckets.take(('a',), 1, 60)
+    buckets.take(('b',), 1, 60)
+    buckets.take(('a',), 1, 60)
+    buckets.take(('c',), 1, 60)
+
+    assert len(buckets) == 2
+    # 'a' sigue agotado; 'b' se descartó y vuelve lleno
+    assert buckets.take(('a',), 1, 60) > 0
+    assert buckets.take(('b',), 1, 60) == 0
+
+
+def test_take_all_no_consume_si_alguno_rechaza(reloj):
+    buckets = TokenBuckets()
+    assert buckets.take(('email',), 1, 60) == 0
+
+    waits = buckets.take_all([(('ip',), 2, 60), (('email',), 1, 60)])
+    assert waits[0] == 0 and waits[1] > 0
+    # La IP conserva sus dos tokens
+    assert buckets.take_all([(('ip',), 2, 60)]) == [0]
+    assert buckets.take_all([(('ip',), 2, 60)]) == [0]
+    assert buckets.take_all([(('ip',), 2, 60)])[0] > 0
+
+
+def _scope(xff: str = None) -> dict:
+    headers = [(b'x-forwarded-for', xff.encode())] if xff else []
+    return {'type': 'http', 'headers': headers, 'client': ('10.0.0.1', 5000)}
+
+
+def test_ip_del_cliente_por_defecto_ignora_x_forwarded_for():
+    assert rate_limit.RATE_LIMIT_PROXY_HOPS == 0
+    assert client_ip(_scope('1.1.1.1, 2.2.2.2')) == '10.0.0.1'
+
+
+def test_ip_del_cliente_detras_de_proxies(monkeypatch):
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_PROXY_HOPS', 1)
+    assert client_ip(_scope('1.1.1.1, 2.2.2.2')) == '2.2.2.2'
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_PROXY_HOPS', 2)
+    assert client_ip(_scope('1.1.1.1, 2.2.2.2')) == '1.1.1.1'
+    assert client_ip(_scope()) == '10.0.0.1'
+
+
+def test_middleware_responde_429_sin_gastar_el_cupo_de_la_ip(reloj, monkeypatch):
+    regla = RateLimitRule('login', 'POST', '/login', {'ip': (3, 60), 'email': (1, 60)})
+    monkeypatch.setattr(rate_limit, 'RATE_LIMIT_ENABLED', True)
+    monkeypatch.setattr(rate_limit, '_RULES_BY_ROUTE', {('POST', '/login'): regla})
+    atendidas = []
+
+    async def app(scope, receive, send):
+        atendidas.append(json.loads((await receive())['body']))
+        await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    middleware = RateLimitMiddleware(app, TokenBuckets())
+
+    async def login(email: str):
+        body = json.dumps({'email': email}).encode()
+        enviados = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        async def send(message):
+            enviados.append(message)
+
+        scope = dict(_scope(), method='POST', path='/login', query_string=b'')
+        await middleware(scope, receive, send)
+        return enviados[0]
+
+    async def main():
+        return [await login(email) for email in ['a@test.com', 'a@test.com', 'a@test.com', 'b@test.com', 'c@test.com']]
+
+    respuestas = asyncio.run(main())
+    assert [r['status'] for r in respuestas] == [200, 429, 429, 200, 200]
+    assert (b'retry-after', b'60') in respuestas[1]['headers']
+    assert atendidas == [{'email': 'a@test.com'}, {'email': 'b@test.com'}, {'email': 'c@test.com'}]
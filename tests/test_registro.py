@@ -0,0 +1,60 @@
+import asyncio
+import re
+from pathlib import Path
+
+import httpx
+import pytest
+
+import auth
+import server
+from user_cache import UserCache
+
+SCHEMA = Path(__file__).resolve().parents[1] / 'backend' / 'progreso_schema.sql'
+
+
+@pytest.fixture(autouse=True)
+def cache_limpia(monkeypatch):
+    monkeypatch.setattr(auth, 'user_cache', UserCache())
+
+
+def _registrar(fake, *emails: str) -> list:
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return [
+                await client.post('/api/auth/register', json={
+                    'email': email, 'password': 'password123', 'nombre_completo': 'Nuevo'
+                })
+                for email in emails
+            ]
+
+    return asyncio.run(main())
+
+
+def test_registro_crea_usuario_y_progreso_en_un_insert(fake):
+    (response,) = _registrar(fake, 'nuevo@test.com')
+    assert response.status_code == 200
+    user_id = response.json()['user']['id']
+    assert 'password_hash' not in response.json()['user']
+    assert [p['user_id'] for p in fake.store.tables['progreso_usuario']] == [user_id]
+    assert fake.calls == {('POST', 'users'): 1}
+
+
+def test_email_duplicado_400_sin_segundo_progreso(fake):
+    primero, segundo = _registrar(fake, 'nuevo@test.com', 'nuevo@test.com')
+    assert primero.status_code == 200
+    assert segundo.status_code == 400
+    assert len(fake.store.tables['users']) == 1
+    assert len(fake.store.tables['progreso_usuario']) == 1
+
+
+def test_trigger_de_progreso_corre_como_dueno():
+    """El INSERT llega con la anon key y progreso_usuario no tiene política de INSERT"""
+    sql = SCHEMA.read_text()
+    funcion = re.search(
+        r'CREATE OR REPLACE FUNCTION crear_progreso_nuevo_usuario\(\)(.*?)\$\$', sql, re.S
+    ).group(1)
+    assert 'SECURITY DEFINER' in funcion
+    assert 'SET search_path = public' in funcion
+    assert re.search(r'REVOKE EXECUTE ON FUNCTION crear_progreso_nuevo_usuario\(\) FROM PUBLIC', sql)
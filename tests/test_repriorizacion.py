@@ -0,0 +1,110 @@
+import asyncio
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+import repriorizacion
+from repriorizacion import PRIORIDADES, Tablas, calcular_lote, repriorizar_oportunidades
+from sales import (
+    ETAPAS_PIPELINE,
+    UMBRAL_NIVEL_ALTO,
+    UMBRAL_NIVEL_MEDIO,
+    calcular_prioridad,
+    calcular_probabilidad_inicial,
+    calcular_valor_estimado,
+)
+from tests.conftest import cliente_rest
+
+# Bordes de cada nivel y valores al azar
+PUNTOS = sorted({0, 1, UMBRAL_NIVEL_MEDIO - 1, UMBRAL_NIVEL_MEDIO, UMBRAL_NIVEL_ALTO - 1,
+                 UMBRAL_NIVEL_ALTO, 100, *random.Random(0).sample(range(101), 8)})
+ETAPAS = [str(e) for e in ETAPAS_PIPELINE] + ['en_nutricion', 'etapa_desconocida']
+
+
+def test_tablas_iguales_al_calculo_uno_a_uno():
+    tablas = Tablas()
+    combinaciones = list(itertools.product(PUNTOS, PUNTOS, PUNTOS, ETAPAS))
+    u, m, c = (np.array([x[i] for x in combinaciones]) for i in range(3))
+    etapas = [x[3] for x in combinaciones]
+    lote = calcular_lote(tablas, u, m, c, tablas.indice_etapas(etapas))
+
+    for n, (urg, mad, cap, etapa) in enumerate(combinaciones):
+        prioridad = calcular_prioridad(urg, mad, cap)
+        assert PRIORIDADES[lote['prioridad'][n]] == prioridad
+        assert lote['valor'][n] == calcular_valor_estimado(prioridad)
+        assert lote['probabilidad'][n] == calcular_probabilidad_inicial(prioridad, etapa)
+
+
+def _oportunidad(n: int, urgencia: int, etapa: str = 'nuevo_lead', **cambios) -> dict:
+    prioridad = calcular_prioridad(urgencia, urgencia, urgencia)
+    return {
+        'id': f'00000000-0000-4000-8000-{n:012d}', 'estado': 'activo', 'etapa_pipeline': etapa,
+        'scoring_urgencia': urgencia, 'scoring_madurez': urgencia, 'scoring_capacidad': urgencia,
+        'prioridad': prioridad, 'valor_estimado_usd': calcular_valor_estimado(prioridad),
+        'probabilidad_cierre': calcular_probabilidad_inicial(prioridad, etapa), **cambios,
+    }
+
+
+@pytest.fixture
+def pipeline(fake, monkeypatch):
+    # Umbrales viejos: la prioridad guardada ya no coincide con la que calcula sales.py
+    fake.store.seed('oportunidades', [
+        _oportunidad(1, 90, prioridad='C3'),
+        # Valor negociado por ventas: no es el de la tabla
+        _oportunidad(2, 90, prioridad='C3', valor_estimado_usd=123456.0, probabilidad_cierre=99),
+        _oportunidad(3, 10),
+        _oportunidad(4, 90, etapa='cerrado_ganado', prioridad='C3'),
+        _oportunidad(5, 90, prioridad='C3', estado='perdido'),
+    ])
+    monkeypatch.setattr(repriorizacion.pipeline_stats, '_ready', False)
+    return fake
+
+
+def _ejecutar(fake, **kwargs) -> dict:
+    async def main():
+        return await repriorizar_oportunidades(await cliente_rest(fake), batch_size=2, **kwargs)
+    return asyncio.run(main())
+
+
+def _fila(fake, n: int) -> dict:
+    return next(o for o in fake.store.tables['oportunidades'] if o['id'].endswith(f'{n:012d}'))
+
+
+def test_por_defecto_solo_prioridad_y_respeta_ediciones(pipeline):
+    resultado = _ejecutar(pipeline)
+    alta = calcular_prioridad(90, 90, 90)
+    assert resultado['leidas'] == 3
+    assert resultado['cambiadas'] == resultado['escritas'] == 2
+    assert resultado['transiciones'] == {('C3', alta): 2}
+    assert _fila(pipeline, 1)['prioridad'] == _fila(pipeline, 2)['prioridad'] == alta
+    assert _fila(pipeline, 2)['valor_estimado_usd'] == 123456.0
+    assert _fila(pipeline, 2)['probabilidad_cierre'] == 99
+    # Etapas cerradas y oportunidades no activas no se tocan
+    assert _fila(pipeline, 4)['prioridad'] == _fila(pipeline, 5)['prioridad'] == 'C3'
+
+
+def test_valor_y_probabilidad_solo_si_se_piden(pipeline):
+    resultado = _ejecutar(pipeline, campos=('prioridad', 'valor', 'probabilidad'))
+    assert resultado['cambiadas'] == 2
+    fila = _fila(pipeline, 2)
+    assert fila['valor_estimado_usd'] == calcular_valor_estimado(fila['prioridad'])
+    assert fila['probabilidad_cierre'] == calcular_probabilidad_inicial(fila['prioridad'], 'nuevo_lead')
+
+
+def test_dry_run_no_escribe(pipeline):
+    resultado = _ejecutar(pipeline, dry_run=True)
+    assert resultado['escritas'] == 0
+    assert [d['id'][-1] for d in resultado['diff']] == ['1', '2']
+    assert resultado['diff'][0]['prioridad'] == ('C3', calcular_prioridad(90, 90, 90))
+    assert _fila(pipeline, 1)['prioridad'] == 'C3'
+    assert pipeline.calls[('PATCH', 'oportunidades')] == 0
+
+
+def test_cli_por_defecto_solo_prioridad(monkeypatch):
+    recibidos = []
+    monkeypatch.setattr(repriorizacion, 'run', lambda args: recibidos.append(args.campos) or 0)
+    repriorizacion.main(['run'])
+    repriorizacion.main(['run', '--campos', 'prioridad,valor'])
+    assert recibidos == [('prioridad',), ('prioridad', 'valor')]
@@ -0,0 +1,143 @@
+import asyncio
+
+import httpx
+import pytest
+
+import resilience
+import supabase_rest
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, ResiliencePolicy, RetryBudget, SupabaseUnavailable
+from supabase_rest import SupabaseRestClient
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(resilience.time, 'monotonic', reloj)
+    return reloj
+
+
+def test_breaker_abre_tras_fallas_consecutivas(reloj):
+    breaker = CircuitBreaker('t', failures=3, reset_seconds=10)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(SupabaseUnavailable) as error:
+        breaker.before_call()
+    assert error.value.status_code == 503
+    assert error.value.headers['Retry-After'] == '10'
+
+
+def test_breaker_semiabierto_deja_una_sola_prueba(reloj):
+    breaker = CircuitBreaker('t', failures=1, reset_seconds=10)
+    breaker.record_failure()
+    reloj.ahora += 10
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(SupabaseUnavailable):
+        breaker.before_call()
+
+    # La prueba falla: vuelve a abrir por otros reset_seconds
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    reloj.ahora += 5
+    with pytest.raises(SupabaseUnavailable):
+        breaker.before_call()
+
+    reloj.ahora += 5
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+
+def test_breaker_permite_otra_prueba_si_la_anterior_nunca_termino(reloj):
+    breaker = CircuitBreaker('t', failures=1, reset_seconds=10)
+    breaker.record_failure()
+    reloj.ahora += 10
+    breaker.before_call()
+    reloj.ahora += 11
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_presupuesto_de_reintentos(reloj):
+    budget = RetryBudget(ratio=0.5, per_second=1, maximum=2)
+    assert budget.try_withdraw() and budget.try_withdraw()
+    assert not budget.try_withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.try_withdraw()
+    reloj.ahora += 1
+    assert budget.try_withdraw()
+    assert not budget.try_withdraw()
+
+
+def test_timeout_adaptativo_sigue_el_p99():
+    timeout = resilience.AdaptiveTimeout('t', ceiling=10)
+    for _ in range(32):
+        timeout.observe(0.5)
+    assert timeout.current == max(resilience.TIMEOUT_MIN, 0.5 * resilience.TIMEOUT_MULTIPLIER)
+    for _ in range(256):
+        timeout.observe(20)
+    assert timeout.current == 10
+
+
+def _cliente(monkeypatch, handler) -> SupabaseRestClient:
+    monkeypatch.setattr(supabase_rest, 'resilience_policy', ResiliencePolicy(timeout_ceiling=1))
+    rest = SupabaseRestClient('test', base_url='http://supabase/rest/v1')
+    rest._transport = httpx.MockTransport(handler)
+    return rest
+
+
+def test_reintenta_lecturas_y_no_escrituras(monkeypatch):
+    monkeypatch.setattr(resilience, 'RETRY_BACKOFF', 0)
+    llamadas = []
+
+    def handler(request):
+        llamadas.append(request.method)
+        return httpx.Response(503 if len(llamadas) == 1 else 200, json=[])
+
+    rest = _cliente(monkeypatch, handler)
+    assert asyncio.run(rest.get('tabla')).status_code == 200
+    assert llamadas == ['GET', 'GET']
+
+    llamadas.clear()
+    assert asyncio.run(rest.post('tabla', json={})).status_code == 503
+    assert llamadas == ['POST']
+
+
+def test_circuito_abierto_falla_sin_llamar(monkeypatch):
+    monkeypatch.setattr(resilience, 'RETRY_BACKOFF', 0)
+    llamadas = []
+
+    def handler(request):
+        llamadas.append(request.method)
+        return httpx.Response(503)
+
+    rest = _cliente(monkeypatch, handler)
+
+    async def main():
+        for _ in range(resilience.BREAKER_FAILURES):
+            await rest.post('caida', json={})
+        with pytest.raises(SupabaseUnavailable):
+            await rest.get('caida')
+        # Otras tablas siguen disponibles
+        await rest.post('otra', json={})
+
+    asyncio.run(main())
+    assert len(llamadas) == resilience.BREAKER_FAILURES + 1
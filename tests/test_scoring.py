@@ -0,0 +1,58 @@
+import json
+import random
+import shutil
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from scoring import PREGUNTAS, _TABLAS, calcular_scoring, calcular_scoring_lote, matriz_puntos, scorings_lote
+
+SCORING_JS = Path(__file__).resolve().parents[1] / 'frontend' / 'src' / 'utils' / 'scoring.js'
+
+NODE_SCRIPT = """
+import { readFileSync } from 'node:fs';
+import { calcularScoringCompleto } from './scoring.mjs';
+const casos = JSON.parse(readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(casos.map(calcularScoringCompleto)));
+"""
+
+
+def _respuestas(n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    casos = []
+    for _ in range(n):
+        caso = {}
+        for pregunta in PREGUNTAS:
+            opciones = list(_TABLAS[pregunta])
+            r = rng.random()
+            if r < 0.05:
+                continue  # sin responder
+            caso[pregunta] = 'respuesta desconocida' if r < 0.1 else rng.choice(opciones)
+        casos.append(caso)
+    return casos
+
+
+@pytest.fixture(scope='module')
+def casos():
+    # Respuestas máximas y vacías para cubrir los extremos de cada dimensión
+    maximas = {p: max(t, key=t.get) for p, t in _TABLAS.items()}
+    return [maximas, {}] + _respuestas(3000)
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='node no está instalado')
+def test_scoring_igual_al_del_frontend(casos, tmp_path):
+    shutil.copy(SCORING_JS, tmp_path / 'scoring.mjs')
+    (tmp_path / 'paridad.mjs').write_text(NODE_SCRIPT)
+    salida = subprocess.run(
+        ['node', str(tmp_path / 'paridad.mjs')], input=json.dumps(casos),
+        capture_output=True, text=True, check=True, timeout=60
+    )
+    esperado = json.loads(salida.stdout)
+    for caso, js in zip(casos, esperado):
+        assert calcular_scoring(caso) == js, caso
+    assert len({s['arquetipo']['codigo'] for s in esperado}) > 1
+
+
+def test_lote_igual_al_scoring_individual(casos):
+    assert scorings_lote(calcular_scoring_lote(matriz_puntos(casos))) == [calcular_scoring(c) for c in casos]
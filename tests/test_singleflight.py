@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from fake_postgrest import FakePostgrest
+from singleflight import SingleFlight
+from tests.conftest import cliente_rest
+
+
+def test_llamadas_concurrentes_comparten_resultado():
+    ejecuciones = []
+
+    async def lenta():
+        ejecuciones.append(1)
+        await asyncio.sleep(0.01)
+        return 'ok'
+
+    async def main():
+        flights = SingleFlight()
+        resultados = await asyncio.gather(*(flights.do('k', lenta) for _ in range(5)))
+        assert len(flights) == 0
+        # Terminada la llamada, la siguiente vuelve a ejecutarse
+        await flights.do('k', lenta)
+        return resultados
+
+    resultados = asyncio.run(main())
+    assert [r for r, _ in resultados] == ['ok'] * 5
+    assert sum(compartido for _, compartido in resultados) == 4
+    assert len(ejecuciones) == 2
+
+
+def test_excepcion_llega_a_todos():
+    async def falla():
+        await asyncio.sleep(0.01)
+        raise ValueError('boom')
+
+    async def main():
+        flights = SingleFlight()
+        return await asyncio.gather(*(flights.do('k', falla) for _ in range(3)), return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in asyncio.run(main()))
+
+
+def test_cancelar_al_iniciador_no_cancela_a_los_demas():
+    async def lenta():
+        await asyncio.sleep(0.02)
+        return 'ok'
+
+    async def main():
+        flights = SingleFlight()
+        primera = asyncio.create_task(flights.do('k', lenta))
+        await asyncio.sleep(0)
+        segunda = asyncio.create_task(flights.do('k', lenta))
+        await asyncio.sleep(0)
+        primera.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await primera
+        return await segunda
+
+    assert asyncio.run(main()) == ('ok', True)
+
+
+def test_cliente_rest_coalesce_lecturas_identicas():
+    fake = FakePostgrest(latency=0.02)
+    fake.store.seed('faqs', [{'pregunta': 'P', 'respuesta': 'R'}])
+
+    async def main():
+        rest = await cliente_rest(fake)
+        iguales = await asyncio.gather(*(rest.get('faqs', params={'select': 'id'}) for _ in range(4)))
+        distinta = await rest.get('faqs', params={'select': 'pregunta'})
+        return iguales, distinta
+
+    iguales, distinta = asyncio.run(main())
+    assert all(r.json() == iguales[0].json() for r in iguales)
+    assert distinta.status_code == 200
+    assert fake.calls[('GET', 'faqs')] == 2
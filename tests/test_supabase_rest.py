@@ -0,0 +1,276 @@
+import asyncio
+
+import httpx
+import pytest
+
+import server
+import supabase_rest
+from fake_postgrest import FAKE_BASE_URL, FakePostgrest
+from supabase_rest import supabase_request
+
+USUARIO = '00000000-0000-4000-8000-000000000001'
+OTRO = '00000000-0000-4000-8000-000000000002'
+RECURSO = '00000000-0000-4000-8000-0000000000aa'
+
+
+async def _con_transporte(handler):
+    await supabase_rest.supabase_rest_admin.configure(
+        base_url=FAKE_BASE_URL, transport=httpx.MockTransport(handler)
+    )
+
+
+# ============================================
+# supabase_request
+# ============================================
+
+def test_errores_http_devuelven_none(fake):
+    async def main():
+        await fake.install()
+        return (
+            # 404: la tabla no existe
+            await supabase_request('GET', 'no_existe'),
+            # 400: operador desconocido
+            await supabase_request('GET', 'users', params={'email': 'xx.a'}),
+            # 409: email duplicado
+            await supabase_request('POST', 'users', data={'email': 'a@test.com'}),
+        )
+
+    fake.store.seed('users', [{'email': 'a@test.com'}])
+    assert asyncio.run(main()) == (None, None, None)
+
+
+def test_error_de_red_devuelve_none():
+    def handler(request):
+        raise httpx.ConnectError('sin red', request=request)
+
+    async def main():
+        await _con_transporte(handler)
+        return await supabase_request('GET', 'users')
+
+    assert asyncio.run(main()) is None
+
+
+def test_delete_y_204_cuentan_como_exito(fake):
+    async def main():
+        await fake.install()
+        borrado = await supabase_request('DELETE', f'recursos?id=eq.{RECURSO}')
+        # PostgREST responde 204 sin cuerpo a un RPC void o sin return=representation
+        await _con_transporte(lambda request: httpx.Response(204))
+        return borrado, await supabase_request('PATCH', 'users?id=eq.x', data={'nombre': 'y'})
+
+    fake.store.seed('recursos', [{'id': RECURSO, 'titulo': 'Guía'}])
+    assert asyncio.run(main()) == ({'success': True}, {'success': True})
+    assert fake.store.tables['recursos'] == []
+
+
+def test_insert_devuelve_las_filas_creadas(fake):
+    async def main():
+        await fake.install()
+        return await supabase_request('POST', 'recursos_favoritos', data={'user_id': USUARIO, 'recurso_id': RECURSO})
+
+    (fila,) = asyncio.run(main())
+    assert fila['user_id'] == USUARIO and fila['id']
+    assert fake.store.tables['recursos_favoritos'] == [fila]
+
+
+def test_lecturas_identicas_concurrentes_en_una_llamada(monkeypatch):
+    fake = FakePostgrest(latency=0.02)
+    fake.store.seed('users', [{'id': USUARIO, 'email': 'a@test.com'}])
+    monkeypatch.setattr(supabase_rest, 'SUPABASE_SINGLEFLIGHT', True)
+
+    async def main():
+        await fake.install()
+        return await asyncio.gather(*(
+            supabase_request('GET', 'users', params={'id': f'eq.{USUARIO}'}) for _ in range(5)
+        ), supabase_request('GET', 'users', params={'id': f'eq.{OTRO}'}))
+
+    *iguales, otro = asyncio.run(main())
+    assert all(r == iguales[0] for r in iguales) and iguales[0][0]['email'] == 'a@test.com'
+    assert otro == []
+    assert fake.calls[('GET', 'users')] == 2
+
+
+# ============================================
+# Un handler por router
+# ============================================
+
+def _api(fake, pasos, headers: dict = None):
+    async def main():
+        await fake.install()
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test', headers=headers) as client:
+            return await pasos(client)
+
+    return asyncio.run(main())
+
+
+def test_recursos_calificar_inserta_y_luego_actualiza(fake):
+    async def pasos(client):
+        url = f'/api/recursos/{RECURSO}/calificar'
+        return [
+            await client.post(url, params={'user_id': USUARIO}, json={'calificacion': 4, 'comentario': 'Útil'}),
+            await client.post(url, params={'user_id': USUARIO}, json={'calificacion': 5}),
+            await client.post(url, params={'user_id': USUARIO}, json={'calificacion': 9}),
+        ]
+
+    primera, segunda, invalida = _api(fake, pasos)
+    assert primera.status_code == segunda.status_code == 200
+    assert primera.json() == {'success': True, 'message': 'Calificación guardada correctamente'}
+    assert invalida.status_code == 400
+    (fila,) = fake.store.tables['recursos_usuario']
+    assert fila['calificacion'] == 5
+    assert fake.calls[('POST', 'recursos_usuario')] == fake.calls[('PATCH', 'recursos_usuario')] == 1
+
+
+def test_admin_recursos_eliminar(fake, admin_headers):
+    fake.store.seed('recursos', [{'id': RECURSO, 'titulo': 'Guía'}])
+
+    async def pasos(client):
+        return (
+            await client.delete(f'/api/admin/recursos/{RECURSO}'),
+            await client.delete(f'/api/admin/recursos/{RECURSO}'),
+        )
+
+    borrado, de_nuevo = _api(fake, pasos, admin_headers)
+    assert borrado.status_code == 200
+    assert borrado.json() == {'success': True, 'message': 'Recurso eliminado correctamente'}
+    assert de_nuevo.status_code == 404
+    assert fake.store.tables['recursos'] == []
+
+
+def test_notificaciones_marcar_leida(fake):
+    (notificacion,) = fake.store.seed('notificaciones', [{'user_id': USUARIO, 'titulo': 'Hola'}])
+
+    async def pasos(client):
+        url = f"/api/notificaciones/{notificacion['id']}/marcar-leida"
+        return await client.post(url, params={'user_id': USUARIO}), await client.post(url, params={'user_id': OTRO})
+
+    propia, ajena = _api(fake, pasos)
+    assert propia.status_code == 200
+    assert propia.json() == {'success': True, 'message': 'Notificación marcada como leída'}
+    assert ajena.status_code == 404
+    assert notificacion['leida'] is True and notificacion['leida_at']
+
+
+def test_ayuda_ticket_crear_y_detalle(fake):
+    async def pasos(client):
+        creado = await client.post('/api/soporte/tickets', params={'user_id': USUARIO}, json={
+            'asunto': 'No puedo descargar', 'categoria': 'tecnico', 'descripcion': 'Error 500',
+        })
+        url = f"/api/soporte/tickets/{creado.json()['id']}"
+        return creado, await client.get(url, params={'user_id': USUARIO}), await client.get(url, params={'user_id': OTRO})
+
+    creado, detalle, ajeno = _api(fake, pasos)
+    assert creado.status_code == 200
+    assert creado.json()['estado'] == 'abierto' and creado.json()['prioridad'] == 'normal'
+    assert detalle.status_code == 200
+    assert detalle.json()['asunto'] == 'No puedo descargar' and detalle.json()['mensajes'] == []
+    assert ajeno.status_code == 403
+    assert [n['tipo'] for n in fake.store.tables['notificaciones']] == ['ticket_creado']
+
+
+def test_estadisticas_soporte(fake, admin_headers):
+    fake.store.seed('tickets', [
+        {'estado': 'abierto', 'prioridad': 'alta'},
+        {'estado': 'abierto', 'prioridad': 'normal'},
+        {'estado': 'cerrado', 'prioridad': 'normal', 'created_at': '2020-01-01T00:00:00'},
+    ])
+
+    response = _api(fake, lambda client: client.get('/api/admin/estadisticas/soporte'), admin_headers)
+    assert response.status_code == 200
+    assert response.json() == {
+        'total_tickets': 3,
+        'tickets_por_estado': {'abierto': 2, 'cerrado': 1},
+        'tickets_por_prioridad': {'alta': 1, 'normal': 2},
+        'tickets_mes': 2,
+    }
+
+
+def test_usuarios_admin_cambiar_plan(fake, admin_headers):
+    fake.store.seed('users', [{'id': USUARIO, 'email': 'a@test.com', 'rol': 'cliente_gratuito',
+                               'plan_actual': 'gratuito', 'password_hash': 'x'}])
+
+    async def pasos(client):
+        url = f'/api/admin/usuarios/{USUARIO}/cambiar-plan'
+        return (
+            await client.patch(url, json={'plan_actual': 'pro', 'suscripcion_activa': True}),
+            await client.patch(url, json={'plan_actual': 'oro', 'suscripcion_activa': True}),
+        )
+
+    cambiado, invalido = _api(fake, pasos, admin_headers)
+    assert cambiado.status_code == 200
+    body = cambiado.json()
+    assert body['message'] == 'Plan cambiado a pro exitosamente'
+    assert body['usuario']['rol'] == 'cliente_pagado' and body['usuario']['suscripcion_activa'] is True
+    assert 'password_hash' not in body['usuario']
+    assert invalido.status_code == 400
+
+
+def test_reportes_exportar_usuarios(fake, admin_headers):
+    fake.store.seed('users', [
+        {'email': 'a@test.com', 'rol': 'admin', 'created_at': '2026-01-01T00:00:00'},
+        {'email': 'b@test.com', 'rol': 'cliente_gratuito', 'created_at': '2026-01-02T00:00:00'},
+        {'email': 'c@test.com', 'rol': 'cliente_gratuito', 'created_at': '2026-01-03T00:00:00'},
+    ])
+
+    async def pasos(client):
+        url = '/api/admin/reportes/usuarios/export'
+        return (
+            await client.get(url, params={'rol': 'cliente_gratuito', 'formato': 'json'}),
+            await client.get(url),
+        )
+
+    json_, csv = _api(fake, pasos, admin_headers)
+    assert json_.status_code == csv.status_code == 200
+    assert [u['email'] for u in json_.json()] == ['c@test.com', 'b@test.com']
+    assert csv.headers['content-type'].startswith('text/csv')
+    assert len(csv.text.strip().splitlines()) == 4
+
+
+def test_gamificacion_logros_de_usuario(fake):
+    fake.store.seed('user_logros', [
+        {'user_id': USUARIO, 'logro_codigo': 'primer_recurso'},
+        {'user_id': USUARIO, 'logro_codigo': 'no_existe'},
+        {'user_id': OTRO, 'logro_codigo': 'primer_recurso'},
+    ])
+
+    response = _api(fake, lambda client: client.get(f'/api/gamificacion/usuario/{USUARIO}/logros'))
+    assert response.status_code == 200
+    body = response.json()
+    assert body['cantidad'] == 1
+    assert body['logros'][0]['logro_codigo'] == 'primer_recurso'
+    assert body['puntos_totales'] == body['logros'][0]['puntos']
+
+
+def test_favoritos_agregar_consultar_y_quitar(fake):
+    async def pasos(client):
+        datos = {'user_id': USUARIO, 'recurso_id': RECURSO}
+        return [
+            await client.post('/api/favoritos', json=datos),
+            await client.post('/api/favoritos', json=datos),
+            await client.get(f'/api/favoritos/{USUARIO}/check/{RECURSO}'),
+            await client.delete(f'/api/favoritos/{USUARIO}/{RECURSO}'),
+            await client.get(f'/api/favoritos/{USUARIO}/check/{RECURSO}'),
+        ]
+
+    agregado, repetido, es, quitado, ya_no = _api(fake, pasos)
+    assert [r.status_code for r in (agregado, repetido, es, quitado, ya_no)] == [200] * 5
+    assert agregado.json() == {'message': 'Recurso agregado a favoritos', 'agregado': True}
+    assert repetido.json()['agregado'] is False
+    assert es.json() == {'es_favorito': True}
+    assert quitado.json() == {'message': 'Recurso quitado de favoritos', 'eliminado': True}
+    assert ya_no.json() == {'es_favorito': False}
+
+
+def test_progreso_se_inicializa_al_consultar(fake):
+    response = _api(fake, lambda client: client.get(f'/api/progreso/{USUARIO}'))
+    assert response.status_code == 200
+    assert response.json()['user_id'] == USUARIO
+    assert response.json()['porcentaje_total'] == 0
+    assert len(fake.store.tables['progreso_usuario']) == 1
+
+
+@pytest.mark.parametrize('ruta', ['/api/admin/estadisticas/soporte', '/api/admin/reportes/usuarios/export'])
+def test_routers_admin_sin_sesion_401(fake, ruta):
+    response = _api(fake, lambda client: client.get(ruta))
+    assert response.status_code == 401
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import auth
+import user_cache as user_cache_module
+from user_cache import HIT, MISS, NEGATIVE, UserCache
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(user_cache_module.time, 'monotonic', reloj)
+    return reloj
+
+
+def _usuario(n: int) -> dict:
+    return {'id': f'u{n}', 'email': f'u{n}@test.com', 'password_hash': 'x'}
+
+
+def test_hit_por_id_y_email_devuelve_copias(reloj):
+    cache = UserCache()
+    cache.put(_usuario(1))
+
+    resultado, user = cache.get_by_id('u1')
+    assert resultado == HIT and user['email'] == 'u1@test.com'
+    user['password_hash'] = 'modificado'
+    assert cache.get_by_email('u1@test.com') == (HIT, _usuario(1))
+    assert cache.get_by_id('u2') == (MISS, None)
+
+
+def test_cache_negativa_expira(reloj):
+    cache = UserCache(negative_ttl=10)
+    cache.put_missing('nadie@test.com')
+    assert cache.get_by_email('nadie@test.com') == (NEGATIVE, None)
+
+    reloj.ahora += 11
+    assert cache.get_by_email('nadie@test.com') == (MISS, None)
+
+
+def test_put_reemplaza_la_entrada_negativa(reloj):
+    cache = UserCache()
+    cache.put_missing('u1@test.com')
+    cache.put(_usuario(1))
+    assert cache.get_by_email('u1@test.com')[0] == HIT
+
+
+def test_ttl_expira_entrada(reloj):
+    cache = UserCache(ttl=60)
+    cache.put(_usuario(1))
+    reloj.ahora += 61
+    assert cache.get_by_id('u1') == (MISS, None)
+    assert cache.get_by_email('u1@test.com') == (MISS, None)
+
+
+def test_lru_expulsa_el_menos_usado(reloj):
+    cache = UserCache(max_size=2)
+    cache.put(_usuario(1))
+    cache.put(_usuario(2))
+    cache.get_by_id('u1')
+    cache.put(_usuario(3))
+
+    assert cache.get_by_id('u2') == (MISS, None)
+    assert cache.get_by_email('u2@test.com') == (MISS, None)
+    assert cache.get_by_id('u1')[0] == HIT
+    assert cache.get_by_id('u3')[0] == HIT
+
+
+def test_invalidar_por_email_y_cambio_de_email(reloj):
+    cache = UserCache()
+    cache.put(_usuario(1))
+    cache.invalidate(email='u1@test.com')
+    assert cache.get_by_id('u1') == (MISS, None)
+
+    cache.put(_usuario(1))
+    cache.put(dict(_usuario(1), email='nuevo@test.com'))
+    assert cache.get_by_email('u1@test.com') == (MISS, None)
+    assert cache.get_by_email('nuevo@test.com')[0] == HIT
+
+
+def test_update_modifica_la_entrada(reloj):
+    cache = UserCache()
+    cache.put(_usuario(1))
+    cache.update('u1', {'password_hash': 'nuevo'})
+    assert cache.get_by_id('u1')[1]['password_hash'] == 'nuevo'
+
+
+def test_get_user_by_email_consulta_supabase_una_vez(fake, monkeypatch):
+    monkeypatch.setattr(auth, 'user_cache', UserCache())
+    fake.store.seed('users', [_usuario(1)])
+
+    async def main():
+        await fake.install()
+        for _ in range(3):
+            assert (await auth.get_user_by_email('u1@test.com'))['id'] == 'u1'
+            assert await auth.get_user_by_email('nadie@test.com') is None
+        assert (await auth.get_user_by_id('u1'))['email'] == 'u1@test.com'
+
+    asyncio.run(main())
+    assert fake.calls[('GET', 'users')] == 2